@@ -5,7 +5,7 @@ import time, random, copy
 from DIRAC import S_OK, S_ERROR, gLogger, gConfig
 from DIRAC.Core.DISET.RPCClient                     import RPCClient
 from DIRAC.Core.Utilities.ThreadSafe                import Synchronizer
-from DIRAC.Core.Utilities                           import DEncode
+from DIRAC.Core.Utilities                           import DEncode, Time
 from DIRAC.RequestManagementSystem.Client.Request   import Request
 from DIRAC.RequestManagementSystem.Client.Operation import Operation
 from DIRAC.RequestManagementSystem.Client.ReqClient import ReqClient
@@ -20,6 +20,8 @@ class DataStoreClient:
      - It allows to reduce the interactions with the server by building and list of
     pending Registers to be sent that are sent in a bundle using the commit method.
      - In case the DataStore is down Registers are sent as DISET requests.
+     - Optionally registers of the same type with the same keys falling in the same
+    time buckets are merged before being sent.
   """
   def __init__( self, setup = False, retryGraceTime = 0 ):
     self.__setup = setup
@@ -28,6 +30,18 @@ class DataStoreClient:
     self.__maxTimeRetrying = retryGraceTime
     self.__lastSuccessfulCommit = time.time()
     self.__failoverEnabled = not gConfig.getValue( '/LocalSite/DisableFailover', False )
+    self.__aggregate = gConfig.getValue( '/LocalSite/AggregateAccounting', False )
+    self.__aggregationGranularity = gConfig.getValue( '/LocalSite/AccountingAggregationGranularity', 0 )
+    self.__aggregatedPositions = {}
+
+  def setAggregation( self, enabled = True, granularity = 0 ):
+    """
+    Enable merging registers before commit. Registers of the same type with the same keys
+    whose start and end times fall in the same time slots of granularity seconds are merged.
+    By default the granularity is the smallest bucket length of the type
+    """
+    self.__aggregate = enabled
+    self.__aggregationGranularity = granularity
 
   def setRetryGraceTime( self, retryGraceTime ):
     """
@@ -58,9 +72,38 @@ class DataStoreClient:
       return retVal
     if gConfig.getValue( '/LocalSite/DisableAccounting', False ):
       return S_OK()
+    if self.__aggregate:
+      return self.__aggregateRegister( register )
     self.__registersList.append( copy.deepcopy( register.getValues() ) )
     return S_OK()
 
+  def __aggregateRegister( self, register ):
+    """
+    Merge a register with a pending one with the same keys in the same time slots:
+    values are summed, the start time is the earliest and the end time the latest
+    """
+    typeName, startTime, endTime, valuesList = register.getValues()
+    granularity = self.__aggregationGranularity
+    if not granularity:
+      granularity = min( [ bucket[1] for bucket in register.bucketsLength ] )
+    numKeys = len( register.keyFieldsList )
+    aggKey = ( typeName, tuple( valuesList[ :numKeys ] ),
+               int( Time.toEpoch( startTime ) ) / granularity,
+               int( Time.toEpoch( endTime ) ) / granularity )
+    if aggKey not in self.__aggregatedPositions:
+      self.__aggregatedPositions[ aggKey ] = len( self.__registersList )
+      self.__registersList.append( copy.deepcopy( register.getValues() ) )
+      return S_OK()
+    pending = self.__registersList[ self.__aggregatedPositions[ aggKey ] ]
+    pendingValues = pending[3]
+    for iPos in range( numKeys, len( valuesList ) ):
+      pendingValues[ iPos ] += valuesList[ iPos ]
+    self.__registersList[ self.__aggregatedPositions[ aggKey ] ] = ( typeName,
+                                                                     min( pending[1], startTime ),
+                                                                     max( pending[2], endTime ),
+                                                                     pendingValues )
+    return S_OK()
+
   def disableFailover( self ):
     self.__failoverEnabled = False
 
@@ -76,6 +119,8 @@ class DataStoreClient:
     """
     rpcClient = self.__getRPCClient()
     sent = 0
+    #Registers about to be sent can't be merged any more
+    self.__aggregatedPositions = {}
     while len( self.__registersList ) > 0:
       registersToSend = self.__registersList[ :self.__maxRecordsInABundle ]
       retVal = rpcClient.commitRegisters( registersToSend )
@@ -23,6 +23,8 @@ class BaseAccountingType:
                            ( 15552000, 86400 ), #>1w+1d <6m = 1d
                            ( 31104000, 604800 ), #>6m = 1w
                          ]
+    #List of ( ( keyField, ... ), timeGrain ) rollups the DB keeps for long range queries
+    self.rollups = []
     self.definitionKeyFields = []
     self.definitionAccountingFields = []
 
@@ -50,6 +52,12 @@ class BaseAccountingType:
     """
     return self.dataTimespan
 
+  def getRollups( self ):
+    """
+    Get the rollups to maintain for the type. Each rollup is a ( ( keyField, ... ), timeGrain ) tuple
+    """
+    return self.rollups
+
   def setStartTime( self, startTime = False ):
     """
     Give a start time for the report
@@ -36,6 +36,10 @@ class Job( BaseAccountingType ):
                            ( 86400 * 365, 86400 * 2 ), #<1y = 2d
                            ( 86400 * 600, 604800 ), #>1y = 1w
                          ]
+    self.rollups = [ ( ( 'Site', ), 86400 ),
+                     ( ( 'UserGroup', ), 86400 ),
+                     ( ( 'Site', 'FinalMajorStatus' ), 86400 )
+                   ]
 
     self.checkType()
     #Fill the site
@@ -0,0 +1,105 @@
+""" Test for the merging of the registers of the DataStoreClient before they are committed
+"""
+
+import datetime
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK
+from DIRAC.AccountingSystem.Client.DataStoreClient import DataStoreClient
+from DIRAC.AccountingSystem.Client.Types.DataOperation import DataOperation
+
+#At the start of a 15 minutes bucket
+START = datetime.datetime( 2014, 1, 1, 12, 0, 0 )
+
+def getRegister( start = 0, end = 0, destination = "SE1", transferSize = 10 ):
+  register = DataOperation()
+  register.setStartTime( START + datetime.timedelta( seconds = start ) )
+  register.setEndTime( START + datetime.timedelta( seconds = end ) )
+  register.setValuesFromDict( { 'OperationType' : 'putAndRegister',
+                                'User' : 'user',
+                                'ExecutionSite' : 'Site',
+                                'Source' : 'SE0',
+                                'Destination' : destination,
+                                'Protocol' : 'srm',
+                                'FinalStatus' : 'Successful',
+                                'TransferSize' : transferSize,
+                                'TransferTime' : 1.5,
+                                'RegistrationTime' : 0.5,
+                                'TransferOK' : 1,
+                                'TransferTotal' : 1,
+                                'RegistrationOK' : 1,
+                                'RegistrationTotal' : 1 } )
+  return register
+
+class DataStoreClientAggregationTestCase( unittest.TestCase ):
+  """ Registers added with the aggregation enabled and committed without a server
+  """
+  def setUp( self ):
+    self.client = DataStoreClient()
+    self.client.setAggregation()
+    self.rpcClient = MagicMock()
+    self.rpcClient.commitRegisters.return_value = S_OK()
+    self.client._DataStoreClient__getRPCClient = MagicMock( return_value = self.rpcClient )
+
+  def getRegisters( self ):
+    return self.client._DataStoreClient__registersList
+
+  def addRegisters( self, registers ):
+    for register in registers:
+      self.assertTrue( self.client.addRegister( register )[ 'OK' ] )
+
+  def test_merge( self ):
+    self.addRegisters( [ getRegister( 100, 200, transferSize = 10 ),
+                         getRegister( 50, 300, transferSize = 20 ),
+                         getRegister( 150, 250, transferSize = 30 ) ] )
+    registers = self.getRegisters()
+    self.assertEqual( len( registers ), 1 )
+    typeName, startTime, endTime, valuesList = registers[0]
+    self.assertEqual( typeName, 'DataOperation' )
+    self.assertEqual( startTime, START + datetime.timedelta( seconds = 50 ) )
+    self.assertEqual( endTime, START + datetime.timedelta( seconds = 300 ) )
+    self.assertEqual( valuesList, [ 'putAndRegister', 'user', 'Site', 'SE0', 'SE1', 'srm', 'Successful',
+                                    60, 4.5, 1.5, 3, 3, 3, 3 ] )
+
+  def test_noMerge( self ):
+    register = getRegister()
+    self.addRegisters( [ register,
+                         #Other keys
+                         getRegister( destination = "SE2" ),
+                         #Other start slot
+                         getRegister( -1, 0 ),
+                         #Other end slot
+                         getRegister( 0, 900 ) ] )
+    self.assertEqual( len( self.getRegisters() ), 4 )
+    #The added register is not modified by later merges
+    self.addRegisters( [ getRegister() ] )
+    self.assertEqual( len( self.getRegisters() ), 4 )
+    self.assertEqual( self.getRegisters()[0][3][7], 20 )
+    self.assertEqual( register.getValue( 'TransferSize' )[ 'Value' ], 10 )
+
+  def test_granularity( self ):
+    #The smallest bucket of DataOperation is 15 minutes
+    self.addRegisters( [ getRegister( 0, 0 ), getRegister( 899, 899 ), getRegister( 900, 900 ) ] )
+    self.assertEqual( len( self.getRegisters() ), 2 )
+    self.client.commit()
+    self.client.setAggregation( granularity = 3600 )
+    self.addRegisters( [ getRegister( 0, 0 ), getRegister( 899, 899 ), getRegister( 900, 900 ) ] )
+    self.assertEqual( len( self.getRegisters() ), 1 )
+
+  def test_commit( self ):
+    self.addRegisters( [ getRegister( transferSize = 10 ), getRegister( transferSize = 20 ) ] )
+    self.assertEqual( self.client.commit(), S_OK( 1 ) )
+    sent = self.rpcClient.commitRegisters.call_args[0][0]
+    self.assertEqual( self.client._DataStoreClient__aggregatedPositions, {} )
+    #Same slots as the sent register, a new register is pending
+    self.addRegisters( [ getRegister( transferSize = 40 ) ] )
+    self.assertEqual( [ values[3][7] for values in sent ], [ 30 ] )
+    self.assertEqual( [ values[3][7] for values in self.getRegisters() ], [ 40 ] )
+    self.assertEqual( self.client.commit(), S_OK( 1 ) )
+    self.assertEqual( [ values[3][7] for values in self.rpcClient.commitRegisters.call_args[0][0] ], [ 40 ] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( DataStoreClientAggregationTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -29,6 +29,7 @@ class AccountingDB( DB ):
     self.dbCatalog = {}
     self.dbBucketsLength = {}
     self.__keysCache = {}
+    self.__useRollups = self.getCSOption( "UseRollups", True )
     maxParallelInsertions = self.getCSOption( "ParallelRecordInsertions", 10 )
     self.__threadPool = ThreadPool( 1, maxParallelInsertions )
     self.__threadPool.daemonize()
@@ -139,6 +140,9 @@ class AccountingDB( DB ):
           self.dbCatalog[ typeName ][ 'dataTimespan' ] = typeClass().getDataTimespan()
           self.dbCatalog[ typeName ][ 'definition' ] = { 'keys' : definitionKeyFields,
                                                          'values' : definitionAccountingFields }
+          retVal = self.__registerRollups( typeName, typeClass().getRollups() )
+          if not retVal[ 'OK' ]:
+            self.log.error( "Can't register rollups", "%s: %s" % ( typeName, retVal[ 'Message' ] ) )
     return S_OK()
 
   def __loadCatalogFromDB( self ):
@@ -243,7 +247,8 @@ class AccountingDB( DB ):
     """
     self.log.verbose( "Adding to catalog type %s" % typeName, "with length %s" % str( bucketsLength ) )
     self.dbCatalog[ typeName ] = { 'keys' : keyFields , 'values' : valueFields,
-                                   'typeFields' : [], 'bucketFields' : [], 'dataTimespan' : 0 }
+                                   'typeFields' : [], 'bucketFields' : [], 'dataTimespan' : 0,
+                                   'rollups' : [] }
     self.dbCatalog[ typeName ][ 'typeFields' ].extend( keyFields )
     self.dbCatalog[ typeName ][ 'typeFields' ].extend( valueFields )
     self.dbCatalog[ typeName ][ 'bucketFields' ] = list( self.dbCatalog[ typeName ][ 'typeFields' ] )
@@ -387,6 +392,244 @@ class AccountingDB( DB ):
     self.log.info( "Registered type %s" % name )
     return S_OK( True )
 
+  def __registerRollups( self, typeName, rollups ):
+    """
+    Create the rollup tables for a type. A rollup keeps the buckets projected on a subset
+    of the keys and merged in buckets of at least timeGrain seconds
+    """
+    result = self.__loadTablesCreated()
+    if not result[ 'OK' ]:
+      return result
+    tablesInThere = result[ 'Value' ]
+    keyFields = self.dbCatalog[ typeName ][ 'keys' ]
+    rollupsList = []
+    tables = {}
+    for rollupKeys, timeGrain in rollups:
+      rollupKeys = list( rollupKeys )
+      missing = [ key for key in rollupKeys if key not in keyFields ]
+      if missing:
+        self.log.error( "Invalid rollup", "Keys %s are not defined for type %s" % ( ", ".join( missing ), typeName ) )
+        continue
+      timeGrain = int( timeGrain )
+      #A bucket shorter than the grain has to fall in a single rollup slot, otherwise the rollup
+      #would not match the proportional split the reports do on the raw buckets
+      untiled = [ str( bLength ) for _bTimespan, bLength in self.dbBucketsLength[ typeName ]
+                  if bLength < timeGrain and timeGrain % bLength ]
+      if untiled:
+        self.log.error( "Invalid rollup", "Bucket lengths %s of type %s do not divide the grain %s" % ( ", ".join( untiled ),
+                                                                                                      typeName, timeGrain ) )
+        continue
+      #Keep the keys in the same order as in the bucket table
+      rollupKeys = [ key for key in keyFields if key in rollupKeys ]
+      tableName = _getTableName( "rollup", typeName, "%s_%s" % ( "_".join( rollupKeys ), timeGrain ) )
+      if tableName not in tablesInThere:
+        if self.__readOnly:
+          self.log.notice( "ReadOnly mode: Skipping creation of rollup table %s" % tableName )
+          continue
+        fieldsDict = { 'startTime' : "INT UNSIGNED NOT NULL",
+                       'bucketLength' : "MEDIUMINT UNSIGNED NOT NULL",
+                       'entriesInBucket' : "DECIMAL(30,10) NOT NULL" }
+        for key in rollupKeys:
+          fieldsDict[ key ] = "INTEGER NOT NULL"
+        for value in self.dbCatalog[ typeName ][ 'values' ]:
+          fieldsDict[ value ] = "DECIMAL(30,10) NOT NULL"
+        tables[ tableName ] = { 'Fields' : fieldsDict,
+                                'Indexes' : { 'startTimeIndex' : [ 'startTime' ] },
+                                'UniqueIndexes' : { 'UniqueConstraint' : [ 'startTime', 'bucketLength' ] + rollupKeys }
+                              }
+      rollupsList.append( { 'keys' : rollupKeys, 'grain' : timeGrain, 'table' : tableName } )
+    if tables:
+      retVal = self._createTables( tables )
+      if not retVal[ 'OK' ]:
+        return retVal
+    self.dbCatalog[ typeName ][ 'rollups' ] = rollupsList
+    if tables:
+      self.log.info( "Filling new rollup tables for %s" % typeName )
+      return self.__rebuildRollups( typeName, [ rollup for rollup in rollupsList if rollup[ 'table' ] in tables ] )
+    return S_OK()
+
+  def __rebuildRollups( self, typeName, rollupsList = False, timeRanges = False ):
+    """
+    Regenerate the contents of the rollup tables of a type from its buckets. If a list of
+    ( startTime, endTime ) ranges is given only the rollup buckets overlapping them are regenerated
+    """
+    if rollupsList is False:
+      rollupsList = self.dbCatalog[ typeName ][ 'rollups' ]
+    if not rollupsList:
+      return S_OK()
+    bucketTableName = _getTableName( "bucket", typeName )
+    valueFields = self.dbCatalog[ typeName ][ 'values' ]
+    maxBucketLength = max( [ bLength for _bTimespan, bLength in self.dbBucketsLength[ typeName ] ] )
+    retVal = self._getConnection()
+    if not retVal[ 'OK' ]:
+      return retVal
+    connObj = retVal[ 'Value' ]
+    try:
+      for rollup in rollupsList:
+        startTimeTableField = "`%s`.`startTime`" % bucketTableName
+        lengthField = "GREATEST( %s, `%s`.`bucketLength` )" % ( rollup[ 'grain' ], bucketTableName )
+        slotField = "%s - ( %s %% %s )" % ( startTimeTableField, startTimeTableField, lengthField )
+        sqlFields = [ '`startTime`', '`bucketLength`', '`entriesInBucket`' ]
+        sqlSelectList = [ slotField,
+                          lengthField,
+                          "SUM( `%s`.`entriesInBucket` )" % bucketTableName ]
+        for key in rollup[ 'keys' ]:
+          sqlFields.append( "`%s`" % key )
+          sqlSelectList.append( "`%s`.`%s`" % ( bucketTableName, key ) )
+        for value in valueFields:
+          sqlFields.append( "`%s`" % value )
+          sqlSelectList.append( "SUM( `%s`.`%s` )" % ( bucketTableName, value ) )
+        cmd = "INSERT INTO `%s` ( %s ) SELECT %s FROM `%s`" % ( rollup[ 'table' ],
+                                                              ", ".join( sqlFields ),
+                                                              ", ".join( sqlSelectList ),
+                                                              bucketTableName )
+        delCmd = "DELETE FROM `%s`" % rollup[ 'table' ]
+        if timeRanges:
+          maxLength = max( rollup[ 'grain' ], maxBucketLength )
+          cmd += " WHERE %s" % _getRangesCondition( startTimeTableField, slotField, lengthField, timeRanges, maxLength )
+          delCmd += " WHERE %s" % _getRangesCondition( "`startTime`", "`startTime`", "`bucketLength`", timeRanges, maxLength )
+        cmd += " GROUP BY %s" % ", ".join( sqlSelectList[:2] + sqlSelectList[ 3 : 3 + len( rollup[ 'keys' ] ) ] )
+        self.log.info( "[ROLLUP] Rebuilding %s" % rollup[ 'table' ] )
+        retVal = self.__startTransaction( connObj )
+        if not retVal[ 'OK' ]:
+          return retVal
+        retVal = self._update( delCmd, conn = connObj )
+        if retVal[ 'OK' ]:
+          retVal = self._update( cmd, conn = connObj )
+        if not retVal[ 'OK' ]:
+          self.__rollbackTransaction( connObj )
+          self.log.error( "[ROLLUP] Cannot rebuild rollup", "%s: %s" % ( rollup[ 'table' ], retVal[ 'Message' ] ) )
+          return retVal
+        retVal = self.__commitTransaction( connObj )
+        if not retVal[ 'OK' ]:
+          return retVal
+    finally:
+      connObj.close()
+    return S_OK()
+
+  def __writeRollups( self, typeName, bucketsData, connObj = False ):
+    """
+    Add the contributions written to the buckets to the rollups. bucketsData is a dict
+    { ( startTime, bucketLength, keyValues ) : values + [ entries ] }
+    """
+    keyFields = self.dbCatalog[ typeName ][ 'keys' ]
+    valueFields = self.dbCatalog[ typeName ][ 'values' ]
+    for rollup in self.dbCatalog[ typeName ][ 'rollups' ]:
+      keyPositions = [ keyFields.index( key ) for key in rollup[ 'keys' ] ]
+      rollupData = {}
+      for bStartTime, bLength, keyValues in bucketsData:
+        rStartTime, rLength = _getRollupSlot( bStartTime, bLength, rollup[ 'grain' ] )
+        rollupKey = ( rStartTime, rLength, tuple( [ keyValues[ keyPos ] for keyPos in keyPositions ] ) )
+        bucketValues = bucketsData[ ( bStartTime, bLength, keyValues ) ]
+        if rollupKey not in rollupData:
+          rollupData[ rollupKey ] = [ 0.0 ] * len( bucketValues )
+        aggregated = rollupData[ rollupKey ]
+        for valPos in range( len( bucketValues ) ):
+          aggregated[ valPos ] += float( bucketValues[ valPos ] )
+      sqlFields = [ '`startTime`', '`bucketLength`', '`entriesInBucket`' ]
+      sqlFields.extend( [ "`%s`" % key for key in rollup[ 'keys' ] ] )
+      sqlUpData = [ "`entriesInBucket`=`entriesInBucket`+VALUES(`entriesInBucket`)" ]
+      for valueField in valueFields:
+        valueField = "`%s`" % valueField
+        sqlFields.append( valueField )
+        sqlUpData.append( "%s=%s+VALUES(%s)" % ( valueField, valueField, valueField ) )
+      valuesGroups = []
+      #Same order as the buckets to reduce dead locks
+      for rollupKey in sorted( rollupData ):
+        rStartTime, rLength, keyValues = rollupKey
+        rollupValues = rollupData[ rollupKey ]
+        sqlValues = [ rStartTime, rLength, "%.10f" % rollupValues[-1] ]
+        sqlValues.extend( keyValues )
+        sqlValues.extend( [ "%.10f" % value for value in rollupValues[:-1] ] )
+        valuesGroups.append( "( %s )" % ",".join( [ str( val ) for val in sqlValues ] ) )
+      if not valuesGroups:
+        continue
+      cmd = "INSERT INTO `%s` ( %s ) " % ( rollup[ 'table' ], ", ".join( sqlFields ) )
+      cmd += "VALUES %s " % ", ".join( valuesGroups )
+      cmd += "ON DUPLICATE KEY UPDATE %s" % ", ".join( sqlUpData )
+      retVal = self._update( cmd, conn = connObj )
+      if not retVal[ 'OK' ]:
+        return retVal
+    return S_OK()
+
+  def __extractFromRollups( self, typeName, buckets, keyValues, valuesList, numInsertions, connObj = False ):
+    """
+    Remove the contributions of a deleted record from the rollups
+    """
+    keyFields = self.dbCatalog[ typeName ][ 'keys' ]
+    valueFields = self.dbCatalog[ typeName ][ 'values' ]
+    for rollup in self.dbCatalog[ typeName ][ 'rollups' ]:
+      tableName = rollup[ 'table' ]
+      for bStartTime, bProportion, bLength in buckets:
+        rStartTime, rLength = _getRollupSlot( bStartTime, bLength, rollup[ 'grain' ] )
+        proportion = bProportion * numInsertions
+        sqlValList = []
+        for pos in range( len( valueFields ) ):
+          fullFieldName = "`%s`.`%s`" % ( tableName, valueFields[ pos ] )
+          sqlValList.append( "%s=GREATEST(0,%s-(%s*%s))" % ( fullFieldName, fullFieldName, valuesList[ pos ], proportion ) )
+        sqlValList.append( "`%s`.`entriesInBucket`=GREATEST(0,`%s`.`entriesInBucket`-(%s*%s))" % ( tableName,
+                                                                                                   tableName,
+                                                                                                   valuesList[-1],
+                                                                                                   proportion ) )
+        sqlCond = [ "`%s`.`startTime`='%s'" % ( tableName, rStartTime ),
+                    "`%s`.`bucketLength`='%s'" % ( tableName, rLength ) ]
+        for key in rollup[ 'keys' ]:
+          sqlCond.append( "`%s`.`%s` = %s" % ( tableName, key, keyValues[ keyFields.index( key ) ] ) )
+        cmd = "UPDATE `%s` SET %s WHERE %s" % ( tableName, ", ".join( sqlValList ), " AND ".join( sqlCond ) )
+        retVal = self._update( cmd, conn = connObj )
+        if not retVal[ 'OK' ]:
+          return retVal
+    return S_OK()
+
+  def __getTableForBucketQuery( self, typeName, startTime, endTime, selectFields, condDict, groupFields, orderFields ):
+    """
+    Choose the smallest table that can answer a query on the buckets. A rollup can be used if
+    it has all the keys the query refers to, if its buckets are not coarser than the ones
+    the reports will be normalized to and if it covers exactly the same time span
+    """
+    bucketTableName = _getTableName( "bucket", typeName )
+    rollupsList = self.dbCatalog[ typeName ][ 'rollups' ]
+    if not self.__useRollups or not rollupsList:
+      return bucketTableName
+    usedFields = set( selectFields[1] ) | set( condDict )
+    for preGenFields in ( groupFields, orderFields ):
+      if preGenFields:
+        usedFields.update( preGenFields[1] )
+    usedKeys = usedFields.intersection( self.dbCatalog[ typeName ][ 'keys' ] )
+    nowEpoch = int( Time.toEpoch( Time.dateTime() ) )
+    granularity = 0
+    if 'startTime' in usedFields:
+      granularity = self.calculateBucketLengthForTime( typeName, nowEpoch, startTime )
+    #Same alignment __queryType will use
+    startBucket = False
+    if startTime:
+      startBucket = self.calculateBuckets( typeName, startTime + 3600, startTime + 3600, nowEpoch )[0]
+    endBucket = False
+    if endTime:
+      endBucket = self.calculateBuckets( typeName, endTime + 3600, endTime + 3600, nowEpoch )[0]
+    candidates = []
+    for rollup in rollupsList:
+      grain = rollup[ 'grain' ]
+      if not usedKeys.issubset( rollup[ 'keys' ] ):
+        continue
+      if granularity and ( grain > granularity or granularity % grain ):
+        continue
+      if startBucket:
+        bStartTime, _bProportion, bLength = startBucket
+        if _getRollupSlot( bStartTime, bLength, grain )[0] != bStartTime:
+          continue
+      if endBucket:
+        bStartTime, _bProportion, bLength = endBucket
+        rStartTime, rLength = _getRollupSlot( bStartTime, bLength, grain )
+        if bStartTime + bLength < min( rStartTime + rLength, nowEpoch ):
+          continue
+      candidates.append( ( len( rollup[ 'keys' ] ), -grain, rollup[ 'table' ] ) )
+    if not candidates:
+      return bucketTableName
+    tableName = min( candidates )[2]
+    self.log.verbose( "Using rollup %s for query on %s" % ( tableName, typeName ) )
+    return tableName
+
   def getRegisteredTypes( self ):
     """
     Get list of registered types
@@ -454,6 +697,8 @@ class AccountingDB( DB ):
     tablesToDelete = []
     for keyField in self.dbCatalog[ typeName ][ 'keys' ]:
       tablesToDelete.append( "`%s`" % _getTableName( "key", typeName, keyField ) )
+    for rollup in self.dbCatalog[ typeName ][ 'rollups' ]:
+      tablesToDelete.append( "`%s`" % rollup[ 'table' ] )
     tablesToDelete.insert( 0, "`%s`" % _getTableName( "type", typeName ) )
     tablesToDelete.insert( 0, "`%s`" % _getTableName( "bucket", typeName ) )
     tablesToDelete.insert( 0, "`%s`" % _getTableName( "in", typeName ) )
@@ -609,9 +854,33 @@ class AccountingDB( DB ):
     Do the real insert and delete from the in buffer table
     """
     self.log.verbose( "Received bundle to process", "of %s elements" % len( recordTuples ) )
+    recordsPerType = {}
+    for record in recordTuples:
+      recordsPerType.setdefault( record[1], [] ).append( record )
+    for typeName in recordsPerType:
+      records = recordsPerType[ typeName ]
+      inTable = _getTableName( "in", typeName )
+      result = self.insertRecordBundleDirectly( typeName, [ ( record[2], record[3], list( record[4] ) )
+                                                            for record in records ] )
+      if not result[ 'OK' ]:
+        self.log.warn( "Can't insert bundle, inserting records one by one", result[ 'Message' ] )
+        self.__insertFromINTableOneByOne( records )
+        continue
+      idList = ", ".join( [ str( record[0] ) for record in records ] )
+      result = self._update( "DELETE FROM `%s` WHERE id in ( %s )" % ( inTable, idList ) )
+      if not result[ 'OK' ]:
+        self.log.error( "Can't delete rows from the IN table", result[ 'Message' ] )
+      now = Time.toEpoch()
+      for record in records:
+        gMonitor.addMark( "insertiontime", now - record[5] )
+
+  def __insertFromINTableOneByOne( self, recordTuples ):
+    """
+    Insert records from the in buffer table one at a time
+    """
     for record in recordTuples:
       iD, typeName, startTime, endTime, valuesList, insertionEpoch = record
-      result = self.insertRecordDirectly( typeName, startTime, endTime, valuesList )
+      result = self.insertRecordDirectly( typeName, startTime, endTime, list( valuesList ) )
       if not result[ 'OK' ]:
         self._update( "UPDATE `%s` SET taken=0 WHERE id=%s" % ( _getTableName( "in", typeName ), iD ) )
         self.log.error( "Can't insert row", result[ 'Message' ] )
@@ -621,6 +890,168 @@ class AccountingDB( DB ):
         self.log.error( "Can't delete row from the IN table", result[ 'Message' ] )
       gMonitor.addMark( "insertiontime", Time.toEpoch() - insertionEpoch )
 
+  def __addKeyValues( self, typeName, keyName, keyValues ):
+    """
+      Get the ids for a list of values of a key, inserting the ones that do not exist.
+      One query is done for all the values that are not in the cache
+      Returns S_OK( { value : id } )
+    """
+    if typeName not in self.__keysCache:
+      self.__keysCache[ typeName ] = {}
+    typeCache = self.__keysCache[ typeName ]
+    if keyName not in typeCache:
+      typeCache[ keyName ] = {}
+    keyCache = typeCache[ keyName ]
+    idsDict = {}
+    missing = set()
+    for keyValue in keyValues:
+      if keyValue in keyCache:
+        idsDict[ keyValue ] = keyCache[ keyValue ]
+      else:
+        missing.add( keyValue )
+    if not missing:
+      return S_OK( idsDict )
+    keyTable = _getTableName( "key", typeName, keyName )
+    retVal = self._escapeValues( list( missing ) )
+    if not retVal[ 'OK' ]:
+      return retVal
+    escapedValues = retVal[ 'Value' ]
+    for iteration in range( 2 ):
+      retVal = self._query( "SELECT `id`, `value` FROM `%s` WHERE `value` in ( %s )" % ( keyTable,
+                                                                                       ", ".join( escapedValues ) ) )
+      if not retVal[ 'OK' ]:
+        return retVal
+      for keyId, keyValue in retVal[ 'Value' ]:
+        if keyValue in missing:
+          keyCache[ keyValue ] = keyId
+          idsDict[ keyValue ] = keyId
+          missing.discard( keyValue )
+      if not missing or iteration > 0:
+        break
+      self.log.info( "Values %s for key %s didn't exist, inserting" % ( ", ".join( missing ), keyName ) )
+      retVal = self._escapeValues( list( missing ) )
+      if not retVal[ 'OK' ]:
+        return retVal
+      escapedValues = retVal[ 'Value' ]
+      retVal = self._update( "INSERT IGNORE INTO `%s` ( `id`, `value` ) VALUES %s" % ( keyTable,
+                                                                                      ", ".join( [ "( 0, %s )" % value
+                                                                                                   for value in escapedValues ] ) ) )
+      if not retVal[ 'OK' ]:
+        return retVal
+    #Values the DB considers equal to another one (collation) are resolved one by one
+    for keyValue in missing:
+      retVal = self.__addKeyValue( typeName, keyName, keyValue )
+      if not retVal[ 'OK' ]:
+        return retVal
+      idsDict[ keyValue ] = retVal[ 'Value' ]
+    return S_OK( idsDict )
+
+  def insertRecordBundleDirectly( self, typeName, recordsList ):
+    """
+    Add a list of ( startTime, endTime, valuesList ) records of the same type. Key ids are
+    resolved with one query per key, raw records go in one multi row insert and the
+    contributions to the buckets are aggregated before being written in one upsert
+    """
+    if self.__readOnly:
+      return S_ERROR( "ReadOnly mode enabled. No modification allowed" )
+    if not typeName in self.dbCatalog:
+      return S_ERROR( "Type %s has not been defined in the db" % typeName )
+    if not recordsList:
+      return S_OK()
+    self.log.info( "Adding bundle of records", "for type %s: %s records" % ( typeName, len( recordsList ) ) )
+    keyFields = self.dbCatalog[ typeName ][ 'keys' ]
+    numKeys = len( keyFields )
+    numFields = len( self.dbCatalog[ typeName ][ 'typeFields' ] ) - 2
+    for _startTime, _endTime, valuesList in recordsList:
+      if len( valuesList ) != numFields:
+        return S_ERROR( "Fields mismatch for record %s. %s fields and %s expected" % ( typeName,
+                                                                                       len( valuesList ),
+                                                                                       numFields ) )
+    #Discover key indexes
+    for keyPos in range( numKeys ):
+      for record in recordsList:
+        #Cast to string just in case and no more than 64 chars for keys
+        record[2][ keyPos ] = str( record[2][ keyPos ] )[:64]
+      retVal = self.__addKeyValues( typeName, keyFields[ keyPos ],
+                                    set( [ record[2][ keyPos ] for record in recordsList ] ) )
+      if not retVal[ 'OK' ]:
+        return retVal
+      idsDict = retVal[ 'Value' ]
+      for record in recordsList:
+        record[2][ keyPos ] = idsDict[ record[2][ keyPos ] ]
+    #Raw records and aggregated bucket contributions
+    nowEpoch = int( Time.toEpoch( Time.dateTime() ) )
+    sqlRows = []
+    bucketsData = {}
+    for startTime, endTime, valuesList in recordsList:
+      retVal = self._escapeValues( list( valuesList ) + [ startTime, endTime ] )
+      if not retVal[ 'OK' ]:
+        return retVal
+      sqlRows.append( "( %s )" % ", ".join( retVal[ 'Value' ] ) )
+      keyValues = tuple( valuesList[ :numKeys ] )
+      #HACK: One more value to split in the buckets to be able to count total entries
+      bucketValues = list( valuesList[ numKeys: ] ) + [ 1 ]
+      for bStartTime, bProportion, bLength in self.calculateBuckets( typeName, startTime, endTime, nowEpoch ):
+        bucketKey = ( bStartTime, bLength, keyValues )
+        if bucketKey not in bucketsData:
+          bucketsData[ bucketKey ] = [ 0.0 ] * len( bucketValues )
+        aggregated = bucketsData[ bucketKey ]
+        for valPos in range( len( bucketValues ) ):
+          aggregated[ valPos ] += float( bucketValues[ valPos ] ) * bProportion
+    gMonitor.addMark( "registeradded", len( recordsList ) )
+    gMonitor.addMark( "registeradded:%s" % typeName, len( recordsList ) )
+    retVal = self._getConnection()
+    if not retVal[ 'OK' ]:
+      return retVal
+    connObj = retVal[ 'Value' ]
+    cmd = "INSERT INTO `%s` ( %s ) VALUES %s" % ( _getTableName( "type", typeName ),
+                                                  ", ".join( [ "`%s`" % f for f in self.dbCatalog[ typeName ][ 'typeFields' ] ] ),
+                                                  ", ".join( sqlRows ) )
+    try:
+      for _i in range( max( 1, self.__deadLockRetries ) ):
+        retVal = self.__startTransaction( connObj )
+        if not retVal[ 'OK' ]:
+          return retVal
+        retVal = self._update( cmd, conn = connObj )
+        if retVal[ 'OK' ]:
+          retVal = self.__writeAggregatedBuckets( typeName, bucketsData, connObj = connObj )
+        if retVal[ 'OK' ]:
+          retVal = self.__writeRollups( typeName, bucketsData, connObj = connObj )
+        if retVal[ 'OK' ]:
+          return self.__commitTransaction( connObj )
+        self.__rollbackTransaction( connObj )
+        #If failed because of dead lock try restarting
+        if retVal[ 'Message' ].find( "try restarting transaction" ) == -1:
+          return retVal
+      return retVal
+    finally:
+      connObj.close()
+
+  def __writeAggregatedBuckets( self, typeName, bucketsData, connObj = False ):
+    """ Insert or update buckets from a dict { ( startTime, bucketLength, keyValues ) : values + [ entries ] }
+    """
+    sqlFields = [ '`startTime`', '`bucketLength`', '`entriesInBucket`' ]
+    for keyField in self.dbCatalog[ typeName ][ 'keys' ]:
+      sqlFields.append( "`%s`" % keyField )
+    sqlUpData = [ "`entriesInBucket`=`entriesInBucket`+VALUES(`entriesInBucket`)" ]
+    for valueField in self.dbCatalog[ typeName ][ 'values' ]:
+      valueField = "`%s`" % valueField
+      sqlFields.append( valueField )
+      sqlUpData.append( "%s=%s+VALUES(%s)" % ( valueField, valueField, valueField ) )
+    valuesGroups = []
+    #Always write the buckets in the same order to reduce dead locks
+    for bucketKey in sorted( bucketsData ):
+      bStartTime, bLength, keyValues = bucketKey
+      bucketValues = bucketsData[ bucketKey ]
+      sqlValues = [ bStartTime, bLength, "%.10f" % bucketValues[-1] ]
+      sqlValues.extend( keyValues )
+      sqlValues.extend( [ "%.10f" % value for value in bucketValues[:-1] ] )
+      valuesGroups.append( "( %s )" % ",".join( [ str( val ) for val in sqlValues ] ) )
+
+    cmd = "INSERT INTO `%s` ( %s ) " % ( _getTableName( "bucket", typeName ), ", ".join( sqlFields ) )
+    cmd += "VALUES %s " % ", ".join( valuesGroups )
+    cmd += "ON DUPLICATE KEY UPDATE %s" % ", ".join( sqlUpData )
+    return self._update( cmd, conn = connObj )
 
   def insertRecordDirectly( self, typeName, startTime, endTime, valuesList ):
     """
@@ -630,7 +1061,8 @@ class AccountingDB( DB ):
       return S_ERROR( "ReadOnly mode enabled. No modification allowed" )
     gMonitor.addMark( "registeradded", 1 )
     gMonitor.addMark( "registeradded:%s" % typeName, 1 )
-    self.log.info( "Adding record", "for type %s\n [%s -> %s]" % ( typeName, Time.fromEpoch( startTime ), Time.fromEpoch( endTime ) ) )
+    if self.log.isEnabledFor( 'INFO' ):
+      self.log.info( "Adding record", "for type %s\n [%s -> %s]" % ( typeName, Time.fromEpoch( startTime ), Time.fromEpoch( endTime ) ) )
     if not typeName in self.dbCatalog:
       return S_ERROR( "Type %s has not been defined in the db" % typeName )
     #Discover key indexes
@@ -640,7 +1072,7 @@ class AccountingDB( DB ):
       retVal = self.__addKeyValue( typeName, keyName, keyValue )
       if not retVal[ 'OK' ]:
         return retVal
-      self.log.verbose( "Value %s for key %s has id %s" % ( keyValue, keyName, retVal[ 'Value' ] ) )
+      self.log.verbose( "Value %s for key %s has id %s", keyValue, keyName, retVal[ 'Value' ] )
       valuesList[ keyPos ] = retVal[ 'Value' ]
     insertList = list( valuesList )
     insertList.append( startTime )
@@ -661,7 +1093,8 @@ class AccountingDB( DB ):
       retVal = self.__startTransaction( connObj )
       if not retVal[ 'OK' ]:
         return retVal
-      retVal = self.__splitInBuckets( typeName, startTime, endTime, valuesList, connObj = connObj )
+      retVal = self.__splitInBuckets( typeName, startTime, endTime, valuesList,
+                                      connObj = connObj, updateRollups = True )
       if not retVal[ 'OK' ]:
         self.__rollbackTransaction( connObj )
         return retVal
@@ -736,7 +1169,7 @@ class AccountingDB( DB ):
       return retVal
     return S_OK( numInsertions )
 
-  def __splitInBuckets( self, typeName, startTime, endTime, valuesList, connObj = False ):
+  def __splitInBuckets( self, typeName, startTime, endTime, valuesList, connObj = False, updateRollups = False ):
     """
     Bucketize a record
     """
@@ -747,7 +1180,13 @@ class AccountingDB( DB ):
     keyValues = valuesList[ :numKeys ]
     valuesList = valuesList[ numKeys: ]
     self.log.verbose( "Splitting entry", " in %s buckets" % len( buckets ) )
-    return self.__writeBuckets( typeName, buckets, keyValues, valuesList, connObj = connObj )
+    retVal = self.__writeBuckets( typeName, buckets, keyValues, valuesList, connObj = connObj )
+    if not retVal[ 'OK' ] or not updateRollups or not self.dbCatalog[ typeName ][ 'rollups' ]:
+      return retVal
+    bucketsData = {}
+    for bStartTime, bProportion, bLength in buckets:
+      bucketsData[ ( bStartTime, bLength, tuple( keyValues ) ) ] = [ float( value ) * bProportion for value in valuesList ]
+    return self.__writeRollups( typeName, bucketsData, connObj = connObj )
 
   def __deleteFromBuckets( self, typeName, startTime, endTime, valuesList, numInsertions, connObj = False ):
     """
@@ -778,7 +1217,7 @@ class AccountingDB( DB ):
         #If OK, break loop
         if retVal[ 'OK' ]:
           break
-    return S_OK()
+    return self.__extractFromRollups( typeName, buckets, keyValues, valuesList, numInsertions, connObj = connObj )
 
   def getBucketsDef( self, typeName ):
     return self.dbBucketsLength[ typeName ]
@@ -971,7 +1410,11 @@ class AccountingDB( DB ):
     """
     Execute a query over a main table
     """
-    tableName = _getTableName( tableType, typeName )
+    if tableType == "bucket":
+      tableName = self.__getTableForBucketQuery( typeName, startTime, endTime, selectFields,
+                                                 condDict, groupFields, orderFields )
+    else:
+      tableName = _getTableName( tableType, typeName )
     cmd = "SELECT"
     sqlLinkList = []
     #Check if groupFields and orderFields are in ( "%s", ( field1, ) ) form
@@ -1091,14 +1534,25 @@ class AccountingDB( DB ):
       if typeFilter and typeName.find( typeFilter ) == -1:
         self.log.info( "[COMPACT] Skipping %s" % typeName )
         continue
+      timeRanges = []
       if self.dbCatalog[ typeName ][ 'dataTimespan' ] > 0:
         self.log.info( "[COMPACT] Deleting records older that timespan for type %s" % typeName )
-        self.__deleteRecordsOlderThanDataTimespan( typeName )
+        timeRanges.extend( self.__deleteRecordsOlderThanDataTimespan( typeName ) )
       self.log.info( "[COMPACT] Compacting %s" % typeName )
       if slow:
-        self.__slowCompactBucketsForType( typeName )
+        result = self.__slowCompactBucketsForType( typeName )
+      else:
+        result = self.__compactBucketsForType( typeName )
+      #Only the rollup buckets of the time ranges that have been compacted need to be regenerated
+      if not result[ 'OK' ]:
+        timeRanges = False
+      elif timeRanges or result[ 'Value' ]:
+        timeRanges.extend( result[ 'Value' ] )
       else:
-        self.__compactBucketsForType( typeName )
+        continue
+      result = self.__rebuildRollups( typeName, timeRanges = timeRanges )
+      if not result[ 'OK' ]:
+        self.log.error( "[COMPACT] Cannot rebuild rollups", "%s: %s" % ( typeName, result[ 'Message' ] ) )
     self.log.info( "[COMPACT] Compaction finished" )
     self.__lastCompactionEpoch = int( Time.toEpoch() )
     gSynchro.lock()
@@ -1149,6 +1603,7 @@ class AccountingDB( DB ):
     Compact all buckets for a given type
     """
     nowEpoch = Time.toEpoch()
+    compactedRanges = []
     #retVal = self.__startTransaction( connObj )
     #if not retVal[ 'OK' ]:
     #  return retVal
@@ -1173,6 +1628,8 @@ class AccountingDB( DB ):
         #self.__rollbackTransaction( connObj )
         return retVal
       self.log.info( "[COMPACT] Compacting %s records %s seconds size for %s" % ( len( bucketsData ), bucketLength, typeName ) )
+      compactedRanges.append( ( min( [ record[-2] for record in bucketsData ] ),
+                                max( [ record[-1] for record in bucketsData ] ) + bucketLength ) )
       #Add data
       for record in bucketsData:
         startTime = record[-2]
@@ -1184,13 +1641,14 @@ class AccountingDB( DB ):
           self.log.error( "[COMPACT] Error while compacting data for record", "%s: %s" % ( typeName, retVal[ 'Value' ] ) )
       self.log.info( "[COMPACT] Finished compaction %d of %d" % ( bPos, len( self.dbBucketsLength[ typeName ] ) - 1 ) )
     #return self.__commitTransaction( connObj )
-    return S_OK()
+    return S_OK( compactedRanges )
 
   def __slowCompactBucketsForType( self, typeName ):
     """
     Compact all buckets for a given type
     """
     nowEpoch = Time.toEpoch()
+    compactedRanges = []
     for bPos in range( len( self.dbBucketsLength[ typeName ] ) - 1 ):
       self.log.info( "[COMPACT] Query %d of %d" % ( bPos, len( self.dbBucketsLength[ typeName ] ) - 1 ) )
       secondsLimit = self.dbBucketsLength[ typeName ][ bPos ][0]
@@ -1228,6 +1686,9 @@ class AccountingDB( DB ):
         deleteEndTime = time.time()
         self.log.info( "[COMPACT] Deleted %s out-of-bounds buckets (took %.2f secs)" % ( len( bucketsData ),
                                                                                          deleteEndTime - selectEndTime ) )
+        if bucketsData:
+          compactedRanges.append( ( min( [ record[-2] for record in bucketsData ] ),
+                                    max( [ record[-2] + record[-1] for record in bucketsData ] ) ) )
         #Add data
         for record in bucketsData:
           startTime = record[-2]
@@ -1242,7 +1703,7 @@ class AccountingDB( DB ):
                                                                                             insertElapsedTime / len( bucketsData ) ) )
       self.log.info( "[COMPACT] Finised compaction %d of %d" % ( bPos, len( self.dbBucketsLength[ typeName ] ) - 1 ) )
     #return self.__commitTransaction( connObj )
-    return S_OK()
+    return S_OK( compactedRanges )
 
   def __selectIndividualForCompactBuckets( self, typeName, timeLimit, bucketLength, nextBucketLength, querySize, connObj = False ):
     """
@@ -1295,18 +1756,24 @@ class AccountingDB( DB ):
   def __deleteRecordsOlderThanDataTimespan( self, typeName ):
     """
     IF types define dataTimespan, then records older than datatimespan seconds will be deleted
-    automatically
+    automatically. Returns the time ranges whose rollup buckets have been partially deleted
     """
     dataTimespan = self.dbCatalog[ typeName ][ 'dataTimespan' ]
     if dataTimespan < 86400 * 30:
-      return
-    for table, field in ( ( _getTableName( "type", typeName ), 'endTime' ),
-                          ( _getTableName( "bucket", typeName ), 'startTime + %s' % self.dbBucketsLength[ typeName ][-1][1] ) ):
+      return []
+    maxBucketLength = self.dbBucketsLength[ typeName ][-1][1]
+    timeLimit = int( Time.toEpoch() ) - dataTimespan
+    tablesToClean = [ ( _getTableName( "type", typeName ), 'endTime' ),
+                      ( _getTableName( "bucket", typeName ), 'startTime + %s' % maxBucketLength ) ]
+    #Rollup buckets whose buckets are all gone
+    for rollup in self.dbCatalog[ typeName ][ 'rollups' ]:
+      tablesToClean.append( ( rollup[ 'table' ], 'startTime + bucketLength + %s' % ( maxBucketLength - 1 ) ) )
+    for table, field in tablesToClean:
       self.log.info( "[COMPACT] Deleting old records for table %s" % table )
       deleteLimit = 100000
       deleted = deleteLimit
       while deleted >= deleteLimit:
-        sqlCmd = "DELETE FROM `%s` WHERE %s < UNIX_TIMESTAMP()-%d LIMIT %d" % ( table, field, dataTimespan, deleteLimit )
+        sqlCmd = "DELETE FROM `%s` WHERE %s < %d LIMIT %d" % ( table, field, timeLimit, deleteLimit )
         result = self._update( sqlCmd )
         if not result[ 'OK' ]:
           self.log.error( "[COMPACT] Cannot delete old records", "Table: %s Timespan: %s Error: %s" % ( table,
@@ -1316,6 +1783,10 @@ class AccountingDB( DB ):
         self.log.info( "[COMPACT] Deleted %d records for %s table" % ( result[ 'Value' ], table ) )
         deleted = result[ 'Value' ]
         time.sleep( 1 )
+    if not self.dbCatalog[ typeName ][ 'rollups' ]:
+      return []
+    bucketsLimit = timeLimit - maxBucketLength
+    return [ ( bucketsLimit - 1, bucketsLimit ) ]
 
   def regenerateBuckets( self, typeName ):
     if self.__readOnly:
@@ -1442,7 +1913,8 @@ class AccountingDB( DB ):
                                                                                                             blockAvg, queryAvg,
                                                                                                             expectedEnd ) )
     #return self.__commitTransaction( connObj )
-    return S_OK()
+    #All the buckets have been regenerated, so have to be the rollups
+    return self.__rebuildRollups( typeName )
 
 
   def __startTransaction( self, connObj ):
@@ -1457,13 +1929,34 @@ class AccountingDB( DB ):
 def _bucketizeDataField( dataField, bucketLength ):
   return "%s - ( %s %% %s )" % ( dataField, dataField, bucketLength )
 
+def _getRollupSlot( bucketStartTime, bucketLength, timeGrain ):
+  """
+  Get the ( startTime, bucketLength ) of the rollup bucket a bucket goes to
+  """
+  rollupLength = max( timeGrain, bucketLength )
+  return ( bucketStartTime - bucketStartTime % rollupLength, rollupLength )
+
+def _getRangesCondition( startTimeField, slotField, lengthField, timeRanges, maxLength ):
+  """
+  SQL condition selecting the rollup buckets overlapping any of the ( startTime, endTime ) ranges.
+  The rollup bucket a row goes to starts at slotField and lasts lengthField. The condition on
+  startTimeField, which is at most maxLength away from the slot, lets MySQL use the time index
+  """
+  sqlRanges = []
+  for rangeStart, rangeEnd in timeRanges:
+    sqlRanges.append( "( %s > %d AND %s < %d AND %s < %d AND %s + %s > %d )" % ( startTimeField, rangeStart - maxLength,
+                                                                                 startTimeField, rangeEnd + maxLength,
+                                                                                 slotField, rangeEnd,
+                                                                                 slotField, lengthField, rangeStart ) )
+  return "( %s )" % " OR ".join( sqlRanges )
+
 def _getTableName( tableType, typeName, keyName = None ):
   """
   Generate table name
   """
   if not keyName:
     return "ac_%s_%s" % ( tableType, typeName )
-  elif tableType == "key" :
+  elif tableType in ( "key", "rollup" ):
     return "ac_%s_%s_%s" % ( tableType, typeName, keyName )
   else:
     raise Exception( "Call to _getTableName with tableType as key but with no keyName" )
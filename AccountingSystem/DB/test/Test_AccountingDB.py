@@ -0,0 +1,341 @@
+""" Test for the rollup tables and the insertion of records of the AccountingDB, run against
+    an in memory sqlite DB
+"""
+
+import re
+import sqlite3
+import unittest
+
+from mock import MagicMock, patch
+
+from DIRAC import S_OK, S_ERROR
+from DIRAC.AccountingSystem.DB import AccountingDB as AccountingDBModule
+from DIRAC.AccountingSystem.DB.AccountingDB import AccountingDB
+from DIRAC.AccountingSystem.private.DBUtils import DBUtils
+
+DAY = 86400
+JOB_BUCKETS = [ ( DAY * 8, 3600 ), ( DAY * 35, 3600 * 4 ), ( DAY * 30 * 6, DAY ),
+                ( DAY * 365, DAY * 2 ), ( DAY * 600, 604800 ) ]
+WMSHISTORY_BUCKETS = [ ( DAY * 2, 900 ), ( DAY * 10, 9000 ), ( DAY * 35, 18000 ),
+                       ( DAY * 30 * 6, DAY ), ( DAY * 600, 604800 ) ]
+#Aligned to a week so that no bucket crosses the end of the tested period
+NOW = 3000 * 604800
+
+class FakeAccountingDB( AccountingDB ):
+  """ AccountingDB running its statements on sqlite
+  """
+  def __init__( self, bucketsLength ):
+    self.log = MagicMock()
+    self.maxBucketTime = 604800
+    self._AccountingDB__useRollups = True
+    self._AccountingDB__readOnly = False
+    self.dbCatalog = { 'Test' : { 'keys' : [ 'Site', 'User' ], 'values' : [ 'CPUTime' ], 'rollups' : [] } }
+    self.dbBucketsLength = { 'Test' : bucketsLength }
+    self.connection = sqlite3.connect( ':memory:' )
+    self.connection.create_function( 'GREATEST', 2, max )
+    self.connection.execute( 'CREATE TABLE `ac_bucket_Test` ( startTime INTEGER, bucketLength INTEGER, Site INTEGER,'
+                             ' User INTEGER, CPUTime REAL, entriesInBucket REAL )' )
+
+  def _getConnection( self ):
+    return S_OK( MagicMock() )
+
+  def _createTables( self, tableDict, force = False ):
+    for tableName, tableDef in tableDict.items():
+      sqlFields = [ "`%s` %s" % field for field in tableDef[ 'Fields' ].items() ]
+      sqlFields.append( "UNIQUE ( %s )" % ", ".join( tableDef[ 'UniqueIndexes' ][ 'UniqueConstraint' ] ) )
+      self.connection.execute( "CREATE TABLE `%s` ( %s )" % ( tableName, ", ".join( sqlFields ) ) )
+    return S_OK()
+
+  def _query( self, cmd, conn = False ):
+    if cmd in ( "START TRANSACTION", "COMMIT", "ROLLBACK" ):
+      return S_OK()
+    if cmd == "show tables":
+      cmd = "SELECT name FROM sqlite_master WHERE type = 'table'"
+    return S_OK( self.connection.execute( cmd ).fetchall() )
+
+  def _update( self, cmd, conn = False ):
+    return S_OK( self.connection.execute( cmd ).rowcount )
+
+  def addRecord( self, startTime, endTime, site, user, cpuTime ):
+    """ Bucketize a record as __writeBuckets does
+    """
+    for bStartTime, bProportion, bLength in self.calculateBuckets( 'Test', startTime, endTime, NOW ):
+      self.connection.execute( "INSERT INTO `ac_bucket_Test` VALUES ( ?, ?, ?, ?, ?, ? )",
+                               ( bStartTime, bLength, site, user, cpuTime * bProportion, bProportion ) )
+
+  def getSums( self, tableName, granularity ):
+    """ Sums per site and time slot as the reports compute them
+    """
+    rows = self._query( "SELECT Site, startTime, bucketLength, SUM( CPUTime ) FROM `%s` "
+                        "GROUP BY Site, startTime, bucketLength" % tableName )[ 'Value' ]
+    reporter = DBUtils( self, 'Setup' )
+    sums = {}
+    for site in set( [ row[0] for row in rows ] ):
+      siteSums = reporter._sumToGranularity( granularity, [ list( row[1:] ) for row in rows if row[0] == site ] )
+      for slot in siteSums:
+        sums[ ( site, slot ) ] = round( siteSums[ slot ][0], 4 )
+    return sums
+
+class FakeInsertionAccountingDB( FakeAccountingDB ):
+  """ AccountingDB with the type, key and IN tables, translating the MySQL upserts and
+      running the transactions on sqlite
+  """
+  def __init__( self, bucketsLength ):
+    FakeAccountingDB.__init__( self, bucketsLength )
+    self._AccountingDB__keysCache = {}
+    self._AccountingDB__deadLockRetries = 2
+    self.dbCatalog[ 'Test' ][ 'typeFields' ] = [ 'Site', 'User', 'CPUTime', 'startTime', 'endTime' ]
+    self.connection.isolation_level = None
+    self.inTransaction = False
+    self.commands = []
+    self.connection.execute( 'DROP TABLE `ac_bucket_Test`' )
+    self.connection.execute( 'CREATE TABLE `ac_bucket_Test` ( startTime INTEGER, bucketLength INTEGER, Site INTEGER,'
+                             ' User INTEGER, CPUTime REAL, entriesInBucket REAL,'
+                             ' UNIQUE ( startTime, bucketLength, Site, User ) )' )
+    self.connection.execute( 'CREATE TABLE `ac_type_Test` ( id INTEGER PRIMARY KEY, Site INTEGER, User INTEGER,'
+                             ' CPUTime REAL, startTime INTEGER, endTime INTEGER )' )
+    self.connection.execute( 'CREATE TABLE `ac_in_Test` ( id INTEGER PRIMARY KEY, taken INTEGER, takenSince TEXT,'
+                             ' Site TEXT, User TEXT, CPUTime REAL, startTime INTEGER, endTime INTEGER )' )
+    for keyName in ( 'Site', 'User' ):
+      self.connection.execute( 'CREATE TABLE `ac_key_Test_%s` ( id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                               ' value TEXT UNIQUE )' % keyName )
+
+  def _MySQL__escapeString( self, value ):
+    return S_OK( "'%s'" % str( value ).replace( "'", "''" ) )
+
+  def _query( self, cmd, conn = False ):
+    self.commands.append( cmd )
+    if cmd == "START TRANSACTION":
+      if not self.inTransaction:
+        self.connection.execute( "BEGIN" )
+        self.inTransaction = True
+      return S_OK()
+    if cmd in ( "COMMIT", "ROLLBACK" ):
+      if self.inTransaction:
+        self.connection.execute( cmd )
+        self.inTransaction = False
+      return S_OK()
+    return FakeAccountingDB._query( self, cmd, conn )
+
+  def _update( self, cmd, conn = False, debug = False ):
+    self.commands.append( cmd )
+    #Ids of the keys are generated
+    if cmd.find( "`ac_key_" ) > -1:
+      cmd = re.sub( r"\(\s*'?0'?\s*,", "( NULL,", cmd )
+    cmd = cmd.replace( "INSERT IGNORE", "INSERT OR IGNORE" )
+    if cmd.find( "ON DUPLICATE KEY UPDATE" ) > -1:
+      cmd = cmd.replace( "ON DUPLICATE KEY UPDATE", "ON CONFLICT DO UPDATE SET" )
+      cmd = re.sub( r"VALUES\((`\w+`)\)", r"excluded.\1", cmd )
+    try:
+      return S_OK( self.connection.execute( cmd ).rowcount )
+    except sqlite3.Error, excp:
+      return S_ERROR( str( excp ) )
+
+  def getTypeRows( self ):
+    """ Raw records with the values of the keys
+    """
+    return sorted( self._query( "SELECT s.value, u.value, t.CPUTime, t.startTime, t.endTime FROM `ac_type_Test` t, "
+                                "`ac_key_Test_Site` s, `ac_key_Test_User` u "
+                                "WHERE t.Site = s.id AND t.User = u.id" )[ 'Value' ] )
+
+  def getBuckets( self, tableName = 'ac_bucket_Test', keyFields = ( 'Site', 'User' ) ):
+    """ Buckets with the values of the keys
+    """
+    keyTables = ", ".join( [ "`ac_key_Test_%s` k%s" % ( keyName, keyName ) for keyName in keyFields ] )
+    keyValues = ", ".join( [ "k%s.value" % keyName for keyName in keyFields ] )
+    keyConds = " AND ".join( [ "b.%s = k%s.id" % ( keyName, keyName ) for keyName in keyFields ] )
+    rows = self._query( "SELECT b.startTime, b.bucketLength, %s, b.CPUTime, b.entriesInBucket FROM `%s` b, %s "
+                        "WHERE %s" % ( keyValues, tableName, keyTables, keyConds ) )[ 'Value' ]
+    return sorted( [ tuple( row[:-2] ) + ( round( row[-2], 6 ), round( row[-1], 6 ) ) for row in rows ] )
+
+def getRecords():
+  """ Records of several lengths, some of them in the same buckets
+  """
+  records = []
+  for iRecord in range( 40 ):
+    startTime = NOW - ( iRecord % 13 ) * DAY - ( iRecord % 5 ) * 5000 - 1234
+    endTime = startTime + ( iRecord % 4 ) * 3 * 3600
+    records.append( ( startTime, endTime, [ "S%s" % ( iRecord % 3 ), "u%s" % ( iRecord % 2 ), 100 * iRecord + 7 ] ) )
+  return records
+
+def fillRecords( accDB ):
+  for day in range( 1, 200, 3 ):
+    for hour in range( 0, 24, 5 ):
+      startTime = NOW - day * DAY + hour * 3600 + 1234
+      accDB.addRecord( startTime, startTime + 7 * 3600, day % 3, hour % 2, 1000 * hour + day )
+
+class RollupsTestCase( unittest.TestCase ):
+  """ Content of the rollups and choice of the table for the queries
+  """
+  def setUp( self ):
+    self.timePatch = patch.object( AccountingDBModule.Time, 'toEpoch', return_value = NOW )
+    self.timePatch.start()
+
+  def tearDown( self ):
+    self.timePatch.stop()
+
+  def getTable( self, accDB, startTime, endTime, groupFields ):
+    selectFields = ( ", ".join( [ "%s" ] * len( groupFields ) ) + ", SUM(%s)", groupFields + [ 'CPUTime' ] )
+    return accDB._AccountingDB__getTableForBucketQuery( 'Test', startTime, endTime, selectFields, {},
+                                                       ( ", ".join( [ "%s" ] * len( groupFields ) ), groupFields ),
+                                                       ( "%s", groupFields[:1] ) )
+
+  def test_rolledUpSums( self ):
+    accDB = FakeAccountingDB( JOB_BUCKETS )
+    fillRecords( accDB )
+    result = accDB._AccountingDB__registerRollups( 'Test', [ ( ( 'Site', ), DAY ) ] )
+    self.assertTrue( result[ 'OK' ] )
+    rollupTable = accDB.dbCatalog[ 'Test' ][ 'rollups' ][0][ 'table' ]
+    for granularity in ( DAY, DAY * 2, 604800 ):
+      self.assertEqual( accDB.getSums( rollupTable, granularity ), accDB.getSums( 'ac_bucket_Test', granularity ) )
+
+  def test_rebuildRange( self ):
+    accDB = FakeAccountingDB( JOB_BUCKETS )
+    fillRecords( accDB )
+    accDB._AccountingDB__registerRollups( 'Test', [ ( ( 'Site', ), DAY ) ] )
+    rollupTable = accDB.dbCatalog[ 'Test' ][ 'rollups' ][0][ 'table' ]
+    #Merge the 4h buckets of a day as the compaction does
+    dayStart = NOW - 10 * DAY
+    accDB._update( "INSERT INTO `ac_bucket_Test` SELECT %d, %d, Site, User, SUM( CPUTime ), SUM( entriesInBucket ) "
+                   "FROM `ac_bucket_Test` WHERE startTime >= %d AND startTime < %d "
+                   "GROUP BY Site, User" % ( dayStart, DAY, dayStart, dayStart + DAY ) )
+    accDB._update( "DELETE FROM `ac_bucket_Test` WHERE startTime >= %d AND startTime < %d AND bucketLength < %d" % ( dayStart,
+                                                                                                                 dayStart + DAY,
+                                                                                                                 DAY ) )
+    #And change a day out of the range to rebuild
+    accDB._update( "UPDATE `ac_bucket_Test` SET CPUTime = CPUTime + 1 WHERE startTime = %d" % ( NOW - 25 * DAY ) )
+    rollupBefore = accDB.getSums( rollupTable, DAY )
+    result = accDB._AccountingDB__rebuildRollups( 'Test', timeRanges = [ ( dayStart, dayStart + 6 * 3600 ) ] )
+    self.assertTrue( result[ 'OK' ] )
+    rollupAfter = accDB.getSums( rollupTable, DAY )
+    rawSums = accDB.getSums( 'ac_bucket_Test', DAY )
+    self.assertNotEqual( rollupAfter, rawSums )
+    for key in rawSums:
+      if key[1] == NOW - 25 * DAY:
+        self.assertEqual( rollupAfter[ key ], rollupBefore[ key ] )
+      else:
+        self.assertEqual( rollupAfter[ key ], rawSums[ key ] )
+    slots = accDB._query( "SELECT startTime, bucketLength FROM `%s` WHERE startTime = %d" % ( rollupTable, dayStart ) )
+    self.assertEqual( set( slots[ 'Value' ] ), set( [ ( dayStart, DAY ) ] ) )
+
+  def test_untiledGrain( self ):
+    accDB = FakeAccountingDB( WMSHISTORY_BUCKETS )
+    result = accDB._AccountingDB__registerRollups( 'Test', [ ( ( 'Site', ), DAY ), ( ( 'Site', ), 5 * DAY ) ] )
+    self.assertTrue( result[ 'OK' ] )
+    #9000 and 18000 do not divide a day, 2.5h and 5h buckets would straddle two rollup buckets
+    self.assertEqual( [ rollup[ 'grain' ] for rollup in accDB.dbCatalog[ 'Test' ][ 'rollups' ] ], [ 5 * DAY ] )
+    self.assertEqual( self.getTable( accDB, NOW - 100 * DAY, NOW, [ 'startTime', 'Site' ] ), 'ac_bucket_Test' )
+
+  def test_tableForQuery( self ):
+    accDB = FakeAccountingDB( JOB_BUCKETS )
+    accDB._AccountingDB__registerRollups( 'Test', [ ( ( 'Site', ), DAY ), ( ( 'Site', 'User' ), DAY ) ] )
+    siteRollup = 'ac_rollup_Test_Site_%s' % DAY
+    dayStart = NOW - 100 * DAY
+    self.assertEqual( self.getTable( accDB, dayStart, NOW, [ 'startTime', 'Site' ] ), siteRollup )
+    self.assertEqual( self.getTable( accDB, dayStart, NOW, [ 'startTime', 'User' ] ), 'ac_rollup_Test_Site_User_%s' % DAY )
+    #Hourly granularity
+    self.assertEqual( self.getTable( accDB, NOW - 2 * DAY, NOW, [ 'startTime', 'Site' ] ), 'ac_bucket_Test' )
+    #Ends in the middle of a rollup bucket
+    self.assertEqual( self.getTable( accDB, dayStart, NOW - 20 * DAY + 4 * 3600, [ 'startTime', 'Site' ] ), 'ac_bucket_Test' )
+    #Summaries do not need the granularity, only the alignment. The buckets queried start an hour
+    #after the requested time, as in __queryType
+    self.assertEqual( self.getTable( accDB, NOW - 2 * DAY - 3600, NOW, [ 'Site' ] ), siteRollup )
+    self.assertEqual( self.getTable( accDB, NOW - 2 * DAY, NOW, [ 'Site' ] ), 'ac_bucket_Test' )
+
+class InsertionTestCase( unittest.TestCase ):
+  """ Bundles of records, as inserted from the IN table
+  """
+  def setUp( self ):
+    for patcher in ( patch.object( AccountingDBModule.Time, 'toEpoch', return_value = NOW ),
+                     patch.object( AccountingDBModule, 'gMonitor', MagicMock() ) ):
+      patcher.start()
+      self.addCleanup( patcher.stop )
+
+  def getDB( self ):
+    accDB = FakeInsertionAccountingDB( JOB_BUCKETS )
+    self.assertTrue( accDB._AccountingDB__registerRollups( 'Test', [ ( ( 'Site', ), DAY ) ] )[ 'OK' ] )
+    return accDB
+
+  def getReference( self, records ):
+    accDB = self.getDB()
+    for startTime, endTime, valuesList in records:
+      self.assertTrue( accDB.insertRecordDirectly( 'Test', startTime, endTime, list( valuesList ) )[ 'OK' ] )
+    return accDB
+
+  def assertSameContents( self, accDB, refDB ):
+    rollupTable = accDB.dbCatalog[ 'Test' ][ 'rollups' ][0][ 'table' ]
+    self.assertEqual( accDB.getTypeRows(), refDB.getTypeRows() )
+    self.assertEqual( accDB.getBuckets(), refDB.getBuckets() )
+    self.assertEqual( accDB.getBuckets( rollupTable, ( 'Site', ) ), refDB.getBuckets( rollupTable, ( 'Site', ) ) )
+
+  def test_sameAsOneByOne( self ):
+    records = getRecords()
+    refDB = self.getReference( records )
+    accDB = self.getDB()
+    result = accDB.insertRecordBundleDirectly( 'Test', [ ( startTime, endTime, list( valuesList ) )
+                                                         for startTime, endTime, valuesList in records ] )
+    self.assertTrue( result[ 'OK' ] )
+    self.assertEqual( len( accDB.getTypeRows() ), len( records ) )
+    self.assertSameContents( accDB, refDB )
+    entries = accDB._query( "SELECT SUM( entriesInBucket ) FROM `ac_bucket_Test`" )[ 'Value' ][0][0]
+    self.assertAlmostEqual( entries, len( records ) )
+
+  def test_keyValues( self ):
+    accDB = self.getDB()
+    accDB._update( "INSERT INTO `ac_key_Test_Site` ( `id`, `value` ) VALUES ( 0, 'S1' )" )
+    accDB.commands = []
+    records = getRecords()
+    result = accDB.insertRecordBundleDirectly( 'Test', [ ( startTime, endTime, list( valuesList ) )
+                                                         for startTime, endTime, valuesList in records ] )
+    self.assertTrue( result[ 'OK' ] )
+    #One insertion per key with the missing values only
+    keyInserts = [ ( re.search( r"`(ac_key_\w+)`", cmd ).group( 1 ), sorted( re.findall( r"'(\w+)'", cmd ) ) )
+                   for cmd in accDB.commands if cmd.find( "INTO `ac_key_" ) > -1 ]
+    self.assertEqual( keyInserts, [ ( 'ac_key_Test_Site', [ 'S0', 'S2' ] ), ( 'ac_key_Test_User', [ 'u0', 'u1' ] ) ] )
+    self.assertEqual( sorted( accDB._query( "SELECT value FROM `ac_key_Test_Site`" )[ 'Value' ] ),
+                      [ ( 'S0', ), ( 'S1', ), ( 'S2', ) ] )
+    #Known values come from the cache
+    accDB.commands = []
+    result = accDB.insertRecordBundleDirectly( 'Test', [ ( startTime, endTime, list( valuesList ) )
+                                                         for startTime, endTime, valuesList in records ] )
+    self.assertTrue( result[ 'OK' ] )
+    self.assertEqual( [ cmd for cmd in accDB.commands if cmd.find( "`ac_key_" ) > -1 ], [] )
+    self.assertEqual( len( accDB.getTypeRows() ), 2 * len( records ) )
+
+  def getINRecords( self, accDB, records ):
+    inRecords = []
+    for iD in range( len( records ) ):
+      startTime, endTime, valuesList = records[ iD ]
+      accDB.connection.execute( "INSERT INTO `ac_in_Test` VALUES ( ?, 1, '', ?, ?, ?, ?, ? )",
+                                tuple( [ iD + 1 ] + valuesList[:3] + [ startTime, endTime ] ) )
+      inRecords.append( ( iD + 1, 'Test', startTime, endTime, list( valuesList ), NOW ) )
+    return inRecords
+
+  def test_fallback( self ):
+    records = getRecords()[:10]
+    goodRecords = records[:4] + records[5:]
+    refDB = self.getReference( goodRecords )
+    #A record with a missing value makes the bundle fail
+    accDB = self.getDB()
+    inRecords = self.getINRecords( accDB, records )
+    inRecords[4] = inRecords[4][:4] + ( inRecords[4][4][:2], NOW )
+    accDB._AccountingDB__insertFromINTable( inRecords )
+    self.assertSameContents( accDB, refDB )
+    self.assertEqual( accDB._query( "SELECT id, taken FROM `ac_in_Test`" )[ 'Value' ], [ ( 5, 0 ) ] )
+
+  def test_rollback( self ):
+    records = getRecords()[:10]
+    refDB = self.getReference( records )
+    #The raw records of a bundle failing while writing the buckets are not kept
+    accDB = self.getDB()
+    accDB._AccountingDB__writeAggregatedBuckets = MagicMock( return_value = S_ERROR( "Lost connection" ) )
+    inRecords = self.getINRecords( accDB, records )
+    accDB._AccountingDB__insertFromINTable( inRecords )
+    self.assertEqual( len( accDB.getTypeRows() ), len( records ) )
+    self.assertSameContents( accDB, refDB )
+    self.assertEqual( accDB._query( "SELECT id, taken FROM `ac_in_Test`" )[ 'Value' ], [] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( RollupsTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( InsertionTestCase ) )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -17,6 +17,9 @@ class DataStoreHandler( RequestHandler ):
     multiPath = PathFinder.getDatabaseSection( "Accounting/MultiDB" )
     cls.__acDB = MultiAccountingDB( multiPath )
     cls.__acDB.autoCompactDB()
+    #Only one clone process loads the pending records, otherwise they could be inserted twice
+    if cls.srv_getCloneId() > 0:
+      return S_OK()
     result = cls.__acDB.markAllPendingRecordsAsNotTaken()
     if not result[ 'OK' ]:
       return result
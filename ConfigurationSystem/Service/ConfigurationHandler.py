@@ -31,6 +31,22 @@ class ConfigurationHandler( RequestHandler ):
       retDict[ 'data' ] = gServiceInterface.getCompressedConfigurationData()
     return S_OK( retDict )
 
+  types_getCompressedModificationsIfNewer = [ types.StringType ]
+  def export_getCompressedModificationsIfNewer( self, sClientVersion ):
+    """
+    Same as getCompressedDataIfNewer but sending only the modifications since the client
+    version when the server still has it. The whole data is sent otherwise
+    """
+    sVersion = gServiceInterface.getVersion()
+    retDict = { 'newestVersion' : sVersion }
+    if sClientVersion < sVersion:
+      result = gServiceInterface.getCompressedModifications( sClientVersion )
+      if result[ 'OK' ]:
+        retDict[ 'newestVersion' ], retDict[ 'modifications' ] = result[ 'Value' ]
+      else:
+        retDict[ 'data' ] = gServiceInterface.getCompressedConfigurationData()
+    return S_OK( retDict )
+
   types_publishSlaveServer = [ types.StringType ]
   def export_publishSlaveServer( self, sURL ):
     gServiceInterface.publishSlaveServer( sURL )
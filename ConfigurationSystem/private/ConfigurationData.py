@@ -7,7 +7,7 @@ import zipfile
 import threading, thread
 import time
 import DIRAC
-from DIRAC.Core.Utilities import List, Time
+from DIRAC.Core.Utilities import List, Time, DEncode
 from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
 from DIRAC.Core.Utilities.CFG import CFG
 from DIRAC.Core.Utilities.LockRing import LockRing
@@ -15,6 +15,9 @@ from DIRAC.FrameworkSystem.Client.Logger import gLogger
 
 class ConfigurationData:
 
+  #Versions of the remote CFG kept by services to send only the modifications to their clients
+  __maxVersionsKept = 10
+
   def __init__( self, loadDefaultCFG = True ):
     lr = LockRing()
     self.threadingEvent = lr.getEvent()
@@ -22,6 +25,12 @@ class ConfigurationData:
     self.threadingLock = lr.getLock()
     self.runningThreadsNumber = 0
     self.compressedConfigurationData = ""
+    #( merged CFG, { option path : value } ) to look up the options without walking the CFG
+    self.__mergedIndex = ( None, {} )
+    #[ ( version, compressed remote CFG ), ... ] from the oldest to the newest
+    self.__versionsHistory = []
+    #( oldest version, newest version ) -> compressed modifications
+    self.__modificationsCache = {}
     self.configurationPath = "/DIRAC/Configuration"
     self.backupsDir = os.path.join( DIRAC.rootPath, "etc", "csbackup" )
     self._isService = False
@@ -55,7 +64,41 @@ class ConfigurationData:
     if remoteServers:
       self.remoteServerList.extend( List.fromChar( remoteServers, "," ) )
     self.remoteServerList = List.uniqueElements( self.remoteServerList )
-    self.compressedConfigurationData = zlib.compress( str( self.remoteCFG ), 9 )
+    if self._isService:
+      self.compressedConfigurationData = zlib.compress( str( self.remoteCFG ), 9 )
+      self.__recordVersion()
+    else:
+      #Only services send it, compress it when needed
+      self.compressedConfigurationData = None
+
+  def __recordVersion( self ):
+    version = self.getVersion()
+    history = [ entry for entry in self.__versionsHistory if entry[0] != version ]
+    history.append( ( version, self.compressedConfigurationData ) )
+    self.__versionsHistory = history[ -self.__maxVersionsKept: ]
+
+  def __indexCFG( self, cfg, parentPath, index ):
+    for option in cfg.listOptions():
+      index[ "%s/%s" % ( parentPath, option ) ] = cfg[ option ]
+    for section in cfg.listSections():
+      self.__indexCFG( cfg[ section ], "%s/%s" % ( parentPath, section ), index )
+    return index
+
+  def __getMergedIndex( self ):
+    """
+    Get the { option path : value } of the merged CFG. It is rebuilt on the
+    first lookup after every sync and replaced in one go, so readers need no lock
+    """
+    mergedCFG = self.mergedCFG
+    indexCFG, index = self.__mergedIndex
+    if indexCFG is not mergedCFG:
+      self.dangerZoneStart()
+      try:
+        index = self.__indexCFG( mergedCFG, "", {} )
+      finally:
+        self.dangerZoneEnd()
+      self.__mergedIndex = ( mergedCFG, index )
+    return index
 
   def loadFile( self, fileName ):
     try:
@@ -143,8 +186,13 @@ class ConfigurationData:
     return self.dangerZoneEnd( None )
 
   def extractOptionFromCFG( self, path, cfg = False, disableDangerZones = False ):
-    if not cfg:
-      cfg = self.mergedCFG
+    if not cfg or cfg is self.mergedCFG:
+      index = self.__getMergedIndex()
+      try:
+        return index[ path ]
+      except KeyError:
+        normPath = "/%s" % "/".join( [ level.strip() for level in path.split( "/" ) if level.strip() != "" ] )
+        return index.get( normPath )
     if not disableDangerZones:
       self.dangerZoneStart()
     try:
@@ -284,8 +332,60 @@ class ConfigurationData:
     self.sync()
 
   def getCompressedData( self ):
+    if self.compressedConfigurationData is None:
+      self.compressedConfigurationData = zlib.compress( str( self.remoteCFG ), 9 )
     return self.compressedConfigurationData
 
+  def getCompressedModifications( self, fromVersion ):
+    """
+    Get ( newest version, compressed modifications ) to go from fromVersion to the
+    newest version of the remote CFG. Only the last versions are known
+    """
+    history = self.__versionsHistory
+    if not history:
+      return S_ERROR( "No versions are kept" )
+    newestVersion, newestData = history[-1]
+    cacheKey = ( fromVersion, newestVersion )
+    if cacheKey in self.__modificationsCache:
+      return S_OK( ( newestVersion, self.__modificationsCache[ cacheKey ] ) )
+    for version, data in history:
+      if version == fromVersion:
+        break
+    else:
+      return S_ERROR( "Version %s is not kept" % fromVersion )
+    try:
+      oldCFG = CFG().loadFromBuffer( zlib.decompress( data ) )
+      newCFG = CFG().loadFromBuffer( zlib.decompress( newestData ) )
+      compressedModifications = zlib.compress( DEncode.encode( oldCFG.getModifications( newCFG ) ), 9 )
+    except Exception, e:
+      return S_ERROR( "Cannot get the modifications since version %s: %s" % ( fromVersion, str( e ) ) )
+    #Only the modifications to the newest version are useful
+    self.__modificationsCache = dict( [ ( cKey, self.__modificationsCache[ cKey ] ) for cKey in self.__modificationsCache
+                                        if cKey[1] == newestVersion ] )
+    self.__modificationsCache[ cacheKey ] = compressedModifications
+    return S_OK( ( newestVersion, compressedModifications ) )
+
+  def applyRemoteModifications( self, compressedModifications, newVersion ):
+    """
+    Update the remote CFG with the modifications sent by a server up to newVersion
+    """
+    try:
+      modList = DEncode.decode( zlib.decompress( compressedModifications ) )[0]
+      remoteCFG = self.remoteCFG.clone()
+      result = remoteCFG.applyModifications( modList )
+    except Exception, e:
+      return S_ERROR( "Cannot apply the modifications: %s" % str( e ) )
+    if not result[ 'OK' ]:
+      return result
+    version = self.getVersion( remoteCFG )
+    if version != newVersion:
+      return S_ERROR( "Modifications lead to version %s instead of %s" % ( version, newVersion ) )
+    self.lock()
+    self.remoteCFG = remoteCFG
+    self.unlock()
+    self.sync()
+    return S_OK()
+
   def isMaster( self ):
     value = self.extractOptionFromCFG( "%s/Master" % self.configurationPath,
                                             self.localCFG )
@@ -299,6 +399,7 @@ class ConfigurationData:
 
   def setAsService( self ):
     self._isService = True
+    self.sync()
 
   def isService( self ):
     return self._isService
@@ -12,15 +12,34 @@ from DIRAC.Core.Utilities import List, LockRing
 from DIRAC.Core.Utilities.EventDispatcher import gEventDispatcher
 from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
 
+#Servers not sending the modifications only
+gServersWithoutModifications = set()
+
 def _updateFromRemoteLocation( serviceClient ):
   gLogger.debug( "", "Trying to refresh from %s" % serviceClient.serviceURL )
   localVersion = gConfigurationData.getVersion()
-  retVal = serviceClient.getCompressedDataIfNewer( localVersion )
+  retVal = S_ERROR( "Unknown method" )
+  if serviceClient.serviceURL not in gServersWithoutModifications:
+    retVal = serviceClient.getCompressedModificationsIfNewer( localVersion )
+    if not retVal[ 'OK' ] and retVal[ 'Message' ].find( "Unknown method" ) > -1:
+      #Old server
+      gServersWithoutModifications.add( serviceClient.serviceURL )
+  if not retVal[ 'OK' ] and retVal[ 'Message' ].find( "Unknown method" ) > -1:
+    retVal = serviceClient.getCompressedDataIfNewer( localVersion )
   if retVal[ 'OK' ]:
     dataDict = retVal[ 'Value' ]
     if localVersion < dataDict[ 'newestVersion' ] :
       gLogger.debug( "New version available", "Updating to version %s..." % dataDict[ 'newestVersion' ] )
-      gConfigurationData.loadRemoteCFGFromCompressedMem( dataDict[ 'data' ] )
+      if 'modifications' in dataDict:
+        result = gConfigurationData.applyRemoteModifications( dataDict[ 'modifications' ], dataDict[ 'newestVersion' ] )
+        if not result[ 'OK' ]:
+          gLogger.warn( "Cannot apply the configuration modifications, getting the whole data", result[ 'Message' ] )
+          retVal = serviceClient.getCompressedDataIfNewer( localVersion )
+          if not retVal[ 'OK' ]:
+            return retVal
+          dataDict = retVal[ 'Value' ]
+      if 'data' in dataDict:
+        gConfigurationData.loadRemoteCFGFromCompressedMem( dataDict[ 'data' ] )
       gLogger.debug( "Updated to version %s" % gConfigurationData.getVersion() )
       gEventDispatcher.triggerEvent( "CSNewVersion", dataDict[ 'newestVersion' ], threaded = True )
     return S_OK()
@@ -159,6 +159,9 @@ class ServiceInterface( threading.Thread ):
   def getCompressedConfigurationData( self ):
     return gConfigurationData.getCompressedData()
 
+  def getCompressedModifications( self, fromVersion ):
+    return gConfigurationData.getCompressedModifications( fromVersion )
+
   def getVersion( self ):
     return gConfigurationData.getVersion()
 
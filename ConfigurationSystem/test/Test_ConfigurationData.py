@@ -0,0 +1,48 @@
+""" Test for the option index and the modifications sent between configuration servers
+"""
+
+import unittest
+
+from DIRAC.Core.Utilities.CFG import CFG
+from DIRAC.ConfigurationSystem.private.ConfigurationData import ConfigurationData
+
+class ConfigurationDataTestCase( unittest.TestCase ):
+  """ Lookups and delta updates on ConfigurationData objects not bound to any file
+  """
+  def setUp( self ):
+    self.server = ConfigurationData( False )
+    self.server.setAsService()
+    self.server.loadRemoteCFGFromMem( "DIRAC\n{\n  Configuration\n  {\n    Version = 1\n  }\n}\n"
+                                      "Systems\n{\n  WMS\n  {\n    Port = 9130\n    # comment\n    Host = a\n  }\n}\n" )
+
+  def test_lookup( self ):
+    self.assertEqual( self.server.extractOptionFromCFG( "/Systems/WMS/Port" ), "9130" )
+    self.assertEqual( self.server.extractOptionFromCFG( "Systems//WMS/ Port " ), "9130" )
+    self.assertEqual( self.server.extractOptionFromCFG( "/Systems/WMS" ), None )
+    self.assertEqual( self.server.extractOptionFromCFG( "/Systems/WMS/Missing" ), None )
+    self.server.setOptionInCFG( "/Systems/WMS/Port", "9131" )
+    self.assertEqual( self.server.extractOptionFromCFG( "/Systems/WMS/Port" ), "9131" )
+
+  def test_modifications( self ):
+    client = ConfigurationData( False )
+    client.loadRemoteCFGFromCompressedMem( self.server.getCompressedData() )
+    newCFG = self.server.getRemoteCFG().clone()
+    newCFG.setOption( "DIRAC/Configuration/Version", "2" )
+    newCFG[ "Systems" ][ "WMS" ].setOption( "Host", "b", "new comment" )
+    newCFG[ "Systems" ].createNewSection( "DMS", "", CFG().loadFromBuffer( "Port = 9140\n" ) )
+    newCFG[ "Systems" ][ "WMS" ].deleteKey( "Port" )
+    self.server.setRemoteCFG( newCFG )
+    self.assertFalse( self.server.getCompressedModifications( "0.5" )[ 'OK' ] )
+    newestVersion, modifications = self.server.getCompressedModifications( "1" )[ 'Value' ]
+    self.assertEqual( newestVersion, "2" )
+    self.assertTrue( client.applyRemoteModifications( modifications, "2" )[ 'OK' ] )
+    self.assertEqual( str( client.getRemoteCFG() ), str( self.server.getRemoteCFG() ) )
+    self.assertEqual( client.extractOptionFromCFG( "/Systems/DMS/Port" ), "9140" )
+    self.assertEqual( client.extractOptionFromCFG( "/Systems/WMS/Port" ), None )
+    #Applied to a different version the result is not the expected one
+    self.assertFalse( client.applyRemoteModifications( modifications, "2" )[ 'OK' ] )
+    self.assertEqual( client.getVersion(), "2" )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( ConfigurationDataTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -12,6 +12,9 @@ class ExecutorMindHandler( RequestHandler ):
   MSG_DEFINITIONS = { 'ProcessTask' : { 'taskId' : ( types.IntType, types.LongType ),
                                         'taskStub' : types.StringType,
                                         'eType' : types.StringType },
+                      'ProcessTasks' : { 'taskIds' : types.ListType,
+                                         'taskStubs' : types.ListType,
+                                         'eType' : types.StringType },
                       'TaskDone' : { 'taskId' : ( types.IntType, types.LongType ),
                                      'taskStub' : types.StringType },
                       'TaskFreeze' : { 'taskId' : ( types.IntType, types.LongType ),
@@ -23,12 +26,15 @@ class ExecutorMindHandler( RequestHandler ):
                                       'eType' : types.StringType},
                       'ExecutorError' : { 'taskId': ( types.IntType, types.LongType ),
                                           'errorMsg' : types.StringType,
-                                          'eType' : types.StringType } }
+                                          'eType' : types.StringType },
+                      #[ ( TaskDone|TaskFreeze|TaskError, taskId, taskStub, freezeTime or errorMsg ), ... ]
+                      'TasksProcessed' : { 'results' : types.ListType } }
 
   class MindCallbacks( ExecutorDispatcherCallbacks ):
 
-    def __init__( self, sendTaskCB, dispatchCB, disconnectCB, taskProcCB, taskFreezeCB, taskErrCB ):
+    def __init__( self, sendTaskCB, sendTasksCB, dispatchCB, disconnectCB, taskProcCB, taskFreezeCB, taskErrCB ):
       self.__sendTaskCB = sendTaskCB
+      self.__sendTasksCB = sendTasksCB
       self.__dispatchCB = dispatchCB
       self.__disconnectCB = disconnectCB
       self.__taskProcDB = taskProcCB
@@ -39,6 +45,9 @@ class ExecutorMindHandler( RequestHandler ):
     def cbSendTask( self, taskId, taskObj, eId, eType ):
       return self.__sendTaskCB( taskId, taskObj, eId, eType )
 
+    def cbSendTasks( self, tasksList, eId, eType ):
+      return self.__sendTasksCB( tasksList, eId, eType )
+
     def cbDispatch( self, taskId, taskObj, pathExecuted ):
       return self.__dispatchCB( taskId, taskObj, pathExecuted )
 
@@ -63,6 +72,7 @@ class ExecutorMindHandler( RequestHandler ):
     gLogger.notice( "Initializing Executor dispatcher" )
     cls.__eDispatch = ExecutorDispatcher( cls.srv_getMonitor() )
     cls.__callbacks = ExecutorMindHandler.MindCallbacks( cls.__sendTask,
+                                                         cls.__sendTasks,
                                                          cls.exec_dispatch,
                                                          cls.__execDisconnected,
                                                          cls.exec_taskProcessed,
@@ -82,7 +92,7 @@ class ExecutorMindHandler( RequestHandler ):
     cls.__allowedClients = aClients
 
   @classmethod
-  def __sendTask( self, taskId, taskObj, eId, eType ):
+  def __prepareTask( self, taskId, taskObj, eId ):
     try:
       result = self.exec_prepareToSend( taskId, taskObj, eId )
       if not result[ 'OK' ]:
@@ -97,6 +107,11 @@ class ExecutorMindHandler( RequestHandler ):
       return S_ERROR( "Cannot serialize task %s: %s" % ( taskId, str( excp ) ) )
     if not isReturnStructure( result ):
       raise Exception( "exec_serializeTask does not return a return structure" )
+    return result
+
+  @classmethod
+  def __sendTask( self, taskId, taskObj, eId, eType ):
+    result = self.__prepareTask( taskId, taskObj, eId )
     if not result[ 'OK' ]:
       return result
     taskStub = result[ 'Value' ]
@@ -109,6 +124,32 @@ class ExecutorMindHandler( RequestHandler ):
     msgObj.eType = eType
     return self.srv_msgSend( eId, msgObj )
 
+  @classmethod
+  def __sendTasks( self, tasksList, eId, eType ):
+    taskIds = []
+    taskStubs = []
+    notSent = {}
+    for taskId, taskObj in tasksList:
+      result = self.__prepareTask( taskId, taskObj, eId )
+      if not result[ 'OK' ]:
+        notSent[ taskId ] = result[ 'Message' ]
+        continue
+      taskIds.append( taskId )
+      taskStubs.append( result[ 'Value' ] )
+    if not taskIds:
+      return S_OK( notSent )
+    result = self.srv_msgCreate( "ProcessTasks" )
+    if not result[ 'OK' ]:
+      return result
+    msgObj = result[ 'Value' ]
+    msgObj.taskIds = taskIds
+    msgObj.taskStubs = taskStubs
+    msgObj.eType = eType
+    result = self.srv_msgSend( eId, msgObj )
+    if not result[ 'OK' ]:
+      return result
+    return S_OK( notSent )
+
   @classmethod
   def __execDisconnected( cls, trid ):
     result = cls.srv_disconnectClient( trid )
@@ -134,7 +175,8 @@ class ExecutorMindHandler( RequestHandler ):
       numTasks = max( 1, int( kwargs[ 'maxTasks' ] ) )
     except:
       numTasks = 1
-    self.__eDispatch.addExecutor( trid, kwargs[ 'executorTypes' ] )
+    batchTasks = 'batchTasks' in kwargs and kwargs[ 'batchTasks' ]
+    self.__eDispatch.addExecutor( trid, kwargs[ 'executorTypes' ], numTasks, batchTasks )
     return self.exec_executorConnected( trid, kwargs[ 'executorTypes' ] )
 
   auth_conn_drop = [ 'all' ]
@@ -142,62 +184,80 @@ class ExecutorMindHandler( RequestHandler ):
     self.__eDispatch.removeExecutor( trid )
     return S_OK()
 
-  auth_msg_TaskDone = [ 'all' ]
-  def msg_TaskDone( self, msgObj ):
-    taskId = msgObj.taskId
+  def __deserializeTask( self, taskId, taskStub ):
     try:
-      result = self.exec_deserializeTask( msgObj.taskStub )
+      result = self.exec_deserializeTask( taskStub )
     except Exception, excp:
       gLogger.exception( "Exception while deserializing task %s" % taskId )
       return S_ERROR( "Cannot deserialize task %s: %s" % ( taskId, str( excp ) ) )
     if not isReturnStructure( result ):
       raise Exception( "exec_deserializeTask does not return a return structure" )
+    return result
+
+  def __taskDone( self, taskId, taskStub ):
+    result = self.__deserializeTask( taskId, taskStub )
     if not result[ 'OK' ]:
       return result
     taskObj = result[ 'Value' ]
-    result = self.__eDispatch.taskProcessed( self.srv_getTransportID(), msgObj.taskId, taskObj )
+    result = self.__eDispatch.taskProcessed( self.srv_getTransportID(), taskId, taskObj )
     if not result[ 'OK' ]:
       gLogger.error( "There was a problem processing task", "%s: %s" % ( taskId, result[ 'Message' ] ) )
     return S_OK()
 
-  auth_msg_TaskFreeze = [ 'all' ]
-  def msg_TaskFreeze( self, msgObj ):
-    taskId = msgObj.taskId
-    try:
-      result = self.exec_deserializeTask( msgObj.taskStub )
-    except Exception, excp:
-      gLogger.exception( "Exception while deserializing task %s" % taskId )
-      return S_ERROR( "Cannot deserialize task %s: %s" % ( taskId, str( excp ) ) )
-    if not isReturnStructure( result ):
-      raise Exception( "exec_deserializeTask does not return a return structure" )
+  def __taskFreeze( self, taskId, taskStub, freezeTime ):
+    result = self.__deserializeTask( taskId, taskStub )
     if not result[ 'OK' ]:
       return result
     taskObj = result[ 'Value' ]
-    result = self.__eDispatch.freezeTask( self.srv_getTransportID(), msgObj.taskId,
-                                          msgObj.freezeTime, taskObj )
+    result = self.__eDispatch.freezeTask( self.srv_getTransportID(), taskId, freezeTime, taskObj )
     if not result[ 'OK' ]:
       gLogger.error( "There was a problem freezing task", "%s: %s" % ( taskId, result[ 'Message' ] ) )
     return S_OK()
 
-  auth_msg_TaskError = [ 'all' ]
-  def msg_TaskError( self, msgObj ):
-    taskId = msgObj.taskId
-    try:
-      result = self.exec_deserializeTask( msgObj.taskStub )
-    except Exception, excp:
-      gLogger.exception( "Exception while deserializing task %s" % taskId )
-      return S_ERROR( "Cannot deserialize task %s: %s" % ( taskId, str( excp ) ) )
-    if not isReturnStructure( result ):
-      raise Exception( "exec_deserializeTask does not return a return structure" )
+  def __taskError( self, taskId, taskStub, errorMsg ):
+    result = self.__deserializeTask( taskId, taskStub )
     if not result[ 'OK' ]:
       return result
     taskObj = result[ 'Value' ]
     #TODO: Check the executor has privileges over the task
-    self.__eDispatch.removeTask( msgObj.taskId )
+    self.__eDispatch.removeTask( taskId )
     try:
-      self.exec_taskError( msgObj.taskId, taskObj, msgObj.errorMsg )
+      self.exec_taskError( taskId, taskObj, errorMsg )
     except:
-      gLogger.exception( "Exception when processing task %s" % msgObj.taskId )
+      gLogger.exception( "Exception when processing task %s" % taskId )
+    return S_OK()
+
+  auth_msg_TaskDone = [ 'all' ]
+  def msg_TaskDone( self, msgObj ):
+    return self.__taskDone( msgObj.taskId, msgObj.taskStub )
+
+  auth_msg_TaskFreeze = [ 'all' ]
+  def msg_TaskFreeze( self, msgObj ):
+    return self.__taskFreeze( msgObj.taskId, msgObj.taskStub, msgObj.freezeTime )
+
+  auth_msg_TaskError = [ 'all' ]
+  def msg_TaskError( self, msgObj ):
+    return self.__taskError( msgObj.taskId, msgObj.taskStub, msgObj.errorMsg )
+
+  auth_msg_TasksProcessed = [ 'all' ]
+  def msg_TasksProcessed( self, msgObj ):
+    trid = self.srv_getTransportID()
+    #Send the next batch once all the results are in
+    self.__eDispatch.holdExecutor( trid )
+    try:
+      for msgName, taskId, taskStub, extra in msgObj.results:
+        if msgName == "TaskDone":
+          result = self.__taskDone( taskId, taskStub )
+        elif msgName == "TaskFreeze":
+          result = self.__taskFreeze( taskId, taskStub, extra )
+        elif msgName == "TaskError":
+          result = self.__taskError( taskId, taskStub, extra )
+        else:
+          result = S_ERROR( "Unknown result %s" % msgName )
+        if not result[ 'OK' ]:
+          gLogger.error( "Could not process result of task", "%s: %s" % ( taskId, result[ 'Message' ] ) )
+    finally:
+      self.__eDispatch.releaseExecutor( trid )
     return S_OK()
 
   auth_msg_ExecutorError = [ 'all' ]
@@ -36,6 +36,7 @@ class ExecutorModule( object ):
                                                        *exeName.split( "/" ) )
     cls.__defaults[ 'ReconnectRetries' ] = 10
     cls.__defaults[ 'ReconnectSleep' ] = 5
+    cls.__defaults[ 'MaxTasks' ] = 1
     cls.__defaults[ 'shifterProxy' ] = ''
     cls.__defaults[ 'shifterProxyLocation' ] = os.path.join( cls.__defaults[ 'WorkDirectory' ],
                                                              '.shifterCred' )
@@ -132,8 +133,6 @@ class ExecutorModule( object ):
 
   def _ex_processTask( self, taskId, taskStub ):
     self.__properties[ 'shifterProxy' ] = self.ex_getOption( 'shifterProxy' )
-    self.__freezeTime = 0
-    self.__fastTrackEnabled = True
     self.log.verbose( "Task %s: Received" % str( taskId ) )
     result = self.__deserialize( taskId, taskStub )
     if not result[ 'OK' ]:
@@ -144,6 +143,38 @@ class ExecutorModule( object ):
     result = self.__installShifterProxy()
     if not result[ 'OK' ]:
       return result
+    return self.__processTaskObj( taskId, taskObj )
+
+  def _ex_processTasks( self, tasksList ):
+    """
+    Process a list of ( taskId, taskStub ) received in one message. Return the
+    list of results in the same order, as _ex_processTask returns them
+    """
+    self.__properties[ 'shifterProxy' ] = self.ex_getOption( 'shifterProxy' )
+    results = {}
+    taskObjs = []
+    for taskId, taskStub in tasksList:
+      self.log.verbose( "Task %s: Received" % str( taskId ) )
+      result = self.__deserialize( taskId, taskStub )
+      if not result[ 'OK' ]:
+        self.log.error( "Can not deserialize task", "Task %s: %s" % ( str( taskId ), result[ 'Message' ] ) )
+        results[ taskId ] = result
+      else:
+        taskObjs.append( ( taskId, result[ 'Value' ] ) )
+    #Shifter proxy once for all the tasks
+    if taskObjs:
+      result = self.__installShifterProxy()
+      if not result[ 'OK' ]:
+        for taskId, taskObj in taskObjs:
+          results[ taskId ] = result
+        taskObjs = []
+    for taskId, taskObj in taskObjs:
+      results[ taskId ] = self.__processTaskObj( taskId, taskObj )
+    return [ results[ taskId ] for taskId, taskStub in tasksList ]
+
+  def __processTaskObj( self, taskId, taskObj ):
+    self.__freezeTime = 0
+    self.__fastTrackEnabled = True
     #Execute!
     result = self.processTask( taskId, taskObj )
     if not isReturnStructure( result ):
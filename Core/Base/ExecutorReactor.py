@@ -66,9 +66,11 @@ class ExecutorReactor( object ):
     def connect( self ):
       self.__msgClient = MessageClient( self.__mindName )
       self.__msgClient.subscribeToMessage( 'ProcessTask', self.__processTask )
+      self.__msgClient.subscribeToMessage( 'ProcessTasks', self.__processTasks )
       self.__msgClient.subscribeToDisconnect( self.__disconnected )
       result = self.__msgClient.connect( executorTypes = list( self.__modules.keys() ),
                                          maxTasks = self.__maxTasks,
+                                         batchTasks = True,
                                          extraArgs = self.__extraArgs )
       if result[ 'OK' ]:
         self.__aliveLock.alive()
@@ -81,6 +83,7 @@ class ExecutorReactor( object ):
         gLogger.notice( "Trying to reconnect to %s" % self.__mindName )
         result = self.__msgClient.connect( executorTypes = list( self.__modules.keys() ),
                                            maxTasks = self.__maxTasks,
+                                           batchTasks = True,
                                            extraArgs = self.__extraArgs )
 
         if result[ 'OK' ]:
@@ -154,6 +157,45 @@ class ExecutorReactor( object ):
         msgObj.freezeTime = extra
       return self.__msgClient.sendMessage( msgObj )
 
+    def __processTasks( self, msgObj ):
+      eType = msgObj.eType
+      taskIds = msgObj.taskIds
+
+      result = self.__modulesProcess( eType, zip( taskIds, msgObj.taskStubs ) )
+      if not result[ 'OK' ]:
+        return self.__sendExecutorError( eType, taskIds[0], result[ 'Message' ] )
+      taskResults = result[ 'Value' ]
+
+      result = self.__msgClient.createMessage( "TasksProcessed" )
+      if not result[ 'OK' ]:
+        return self.__sendExecutorError( eType, taskIds[0], "Can't generate TasksProcessed message: %s" % result[ 'Message' ] )
+      gLogger.verbose( "Tasks %s: Sending results" % taskIds )
+      msgObj = result[ 'Value' ]
+      msgObj.results = taskResults
+      return self.__msgClient.sendMessage( msgObj )
+
+    def __modulesProcess( self, eType, tasksList ):
+      result = self.__getInstance( eType )
+      if not result[ 'OK' ]:
+        return result
+      modInstance = result[ 'Value' ]
+      try:
+        results = modInstance._ex_processTasks( tasksList )
+      except Exception, excp:
+        gLogger.exception( "Error while processing tasks %s" % [ taskId for taskId, taskStub in tasksList ] )
+        return S_ERROR( "Error processing tasks: %s" % excp )
+
+      self.__storeInstance( eType, modInstance )
+
+      taskResults = []
+      for ( taskId, taskStub ), result in zip( tasksList, results ):
+        result = self.__processResult( eType, taskId, taskStub, result )
+        if not result[ 'OK' ]:
+          return result
+        msgName, taskStub, extra = result[ 'Value' ]
+        taskResults.append( ( msgName, taskId, taskStub, extra ) )
+      return S_OK( taskResults )
+
 
     def __moduleProcess( self, eType, taskId, taskStub, fastTrackLevel = 0 ):
       result = self.__getInstance( eType )
@@ -168,6 +210,9 @@ class ExecutorReactor( object ):
 
       self.__storeInstance( eType, modInstance )
 
+      return self.__processResult( eType, taskId, taskStub, result, fastTrackLevel )
+
+    def __processResult( self, eType, taskId, taskStub, result, fastTrackLevel = 0 ):
       if not result[ 'OK' ]:
         return S_OK( ( 'TaskError', taskStub, "Error: %s" % result[ 'Message' ] ) )
       taskStub, freezeTime, fastTrackType = result[ 'Value' ]
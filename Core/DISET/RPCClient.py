@@ -20,6 +20,49 @@ class _MagicMethod( object ):
   def __str__( self ):
     return "<RPCClient method %s>" % self.__remoteFuncName
 
+class RPCBatch( object ):
+  """
+  Collect RPCs to send them to the service in one round trip
+
+    batch = RPCClient( "WorkloadManagement/JobStateUpdate" ).batch()
+    batch.setJobStatus( jobID1, 'Running', '', 'source' )
+    batch.setJobStatus( jobID2, 'Running', '', 'source' )
+    result = batch.execute()
+
+  execute returns S_OK with the list of S_OK/S_ERROR results in the order
+  the calls were made. It can also be used as a context manager, in which
+  case the calls are executed on exit and the result is kept in batch.result
+  """
+
+  def __init__( self, innerRPCClient ):
+    self.__innerRPCClient = innerRPCClient
+    self.__calls = []
+    self.result = None
+
+  def __addCall( self, sFunctionName, args ):
+    self.__calls.append( ( sFunctionName, args ) )
+    return len( self.__calls ) - 1
+
+  def __getattr__( self, attrName ):
+    return _MagicMethod( self.__addCall, attrName )
+
+  def __len__( self ):
+    return len( self.__calls )
+
+  def execute( self ):
+    calls = self.__calls
+    self.__calls = []
+    self.result = self.__innerRPCClient.executeRPCs( calls )
+    return self.result
+
+  def __enter__( self ):
+    return self
+
+  def __exit__( self, excType, excValue, traceback ):
+    if excType is None:
+      self.execute()
+    return False
+
 class RPCClient( object ):
 
   def __init__( self, *args, **kwargs ):
@@ -35,6 +78,18 @@ class RPCClient( object ):
     retVal = self.__innerRPCClient.executeRPC( sFunctionName, args )
     return retVal
 
+  def batch( self ):
+    """
+    Get an RPCBatch to send several calls to the service in one round trip
+    """
+    return RPCBatch( self.__innerRPCClient )
+
+  def executeRPCs( self, rpcList ):
+    """
+    Execute a list of ( functionName, args ) calls in one round trip
+    """
+    return self.__innerRPCClient.executeRPCs( rpcList )
+
   def __getattr__( self, attrName ):
     """
     Function for emulating the existance of functions
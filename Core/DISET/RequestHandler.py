@@ -155,7 +155,18 @@ class RequestHandler( object ):
     if "transfer_%s" % sDirection not in dir( self ):
       self.__trPool.send( self.__trid, S_ERROR( "Service can't transfer files %s" % sDirection ) )
       return
-    retVal = self.__trPool.send( self.__trid, S_OK( "Accepted" ) )
+    #Accept windowed transfers if the client proposed them
+    transferWindow = 0
+    if sDirection != "listBulk":
+      try:
+        transferWindow = min( int( retVal.get( 'TransferWindow', 0 ) ),
+                              int( self.srv_getCSOption( "MaxTransferWindow", 16 ) ) )
+      except ( TypeError, ValueError ):
+        transferWindow = 0
+    acceptMsg = S_OK( "Accepted" )
+    if transferWindow > 0:
+      acceptMsg[ 'TransferWindow' ] = transferWindow
+    retVal = self.__trPool.send( self.__trid, acceptMsg )
     if not retVal[ 'OK' ]:
       return retVal
     self.__logRemoteQuery( "FileTransfer/%s" % sDirection, fileInfo )
@@ -164,6 +175,7 @@ class RequestHandler( object ):
     try:
       try:
         fileHelper = FileHelper( self.__trPool.get( self.__trid ) )
+        fileHelper.setTransferWindow( transferWindow )
         if sDirection == "fromClient":
           fileHelper.setDirection( "fromClient" )
           uRetVal = self.transfer_fromClient( fileInfo[0], fileInfo[1], fileInfo[2], fileHelper )
@@ -229,7 +241,31 @@ class RequestHandler( object ):
     self.__logRemoteQuery( "RPC/%s" % method, args )
     return self.__RPCCallFunction( method, args )
 
-  def __RPCCallFunction( self, method, args ):
+  def _rh_executeRPC( self, method, args, listenToTransport = True ):
+    """
+    Execute one RPC with already received arguments and return its result
+    without sending it. Used to serve batches of RPCs
+
+    @type method: string
+    @param method: Method to execute
+    @type args: tuple
+    @param args: Arguments of the method
+    @type listenToTransport: boolean
+    @param listenToTransport: Register the transport in the message broker while executing
+    @return: S_OK/S_ERROR
+    """
+    self.serviceInfoDict[ 'actionTuple' ] = ( 'RPC', method )
+    startTime = time.time()
+    self.__logRemoteQuery( "RPC/%s" % method, args )
+    retVal = self.__RPCCallFunction( method, args, listenToTransport )
+    if not isReturnStructure( retVal ):
+      message = "Method %s for action RPC does not return a S_OK/S_ERROR!" % method
+      gLogger.error( message )
+      retVal = S_ERROR( message )
+    self.__logRemoteQueryResponse( retVal, time.time() - startTime )
+    return retVal
+
+  def __RPCCallFunction( self, method, args, listenToTransport = True ):
     realMethod = "export_%s" % method
     gLogger.debug( "RPC to %s" % realMethod )
     try:
@@ -240,16 +276,18 @@ class RequestHandler( object ):
     if not dRetVal[ 'OK' ]:
       return dRetVal
     self.__lockManager.lock( "RPC/%s" % method )
-    self.__msgBroker.addTransportId( self.__trid,
-                                     self.serviceInfoDict[ 'serviceName' ],
-                                     idleRead = True )
+    if listenToTransport:
+      self.__msgBroker.addTransportId( self.__trid,
+                                       self.serviceInfoDict[ 'serviceName' ],
+                                       idleRead = True )
     try:
       try:
         uReturnValue = oMethod( *args )
         return uReturnValue
       finally:
         self.__lockManager.unlock( "RPC/%s" % method )
-        self.__msgBroker.removeTransport( self.__trid, closeTransport = False )
+        if listenToTransport:
+          self.__msgBroker.removeTransport( self.__trid, closeTransport = False )
     except Exception, v:
       gLogger.exception( "Uncaught exception when serving RPC", "Function %s" % method )
       return S_ERROR( "Server error while serving %s: %s" % ( method, str( v ) ) )
@@ -538,6 +576,22 @@ class RequestHandler( object ):
   def srv_getServiceName( cls ):
     return cls.__srvInfoDict[ 'serviceName' ]
 
+  @classmethod
+  def srv_getCloneId( cls ):
+    """
+    Get the id of the process serving the service, from 0 to srv_getNumClones() - 1.
+    Class level state is not shared between the clone processes, work that has to
+    be done once per service (cleanups, periodic tasks...) can be kept to clone 0
+    """
+    return cls.__srvInfoDict.get( 'cloneId', 0 )
+
+  @classmethod
+  def srv_getNumClones( cls ):
+    """
+    Get the number of processes serving the service
+    """
+    return cls.__srvInfoDict.get( 'numClones', 1 )
+
   @classmethod
   def srv_getMonitor( cls ):
     return cls.__monitor
@@ -1,8 +1,12 @@
 
+import os
+import sys
 import types
 import select
 import time
+import signal
 import socket
+import threading
 
 try:
   import multiprocessing
@@ -20,11 +24,24 @@ from DIRAC.ConfigurationSystem.Client.Helpers import Registry
 from DIRAC.ConfigurationSystem.Client import PathFinder
 
 class ServiceReactor:
+  """ Accept the connections of a set of services and hand them to their thread pools.
+
+      Services with CloneProcesses > 1 are served by that many forked processes
+      sharing the listening socket, each one with its own handler initialization
+      and thread pool. The main process only supervises them: it restarts the ones
+      that die, restarts all of them one by one on SIGHUP and reports their
+      aggregated connections and queries.
+  """
 
   __transportExtraKeywords = { 'SSLSessionTimeout' : False, 
                                'IgnoreCRLs': False, 
                                'PacketTimeout': 'timeout' }
 
+  #Exit code of the clones that could not initialize their service
+  CLONE_INIT_FAILED = 3
+  #Seconds a clone waits for the queries being served when it is stopped
+  CLONE_STOP_TIME = 60
+
   def __init__( self ):
     self.__services = {}
     self.__alive = True
@@ -35,6 +52,14 @@ class ServiceReactor:
     self.__maxFD = 0
     self.__listeningConnections = {}
     self.__stats = ReactorStats()
+    #svcName -> number of clone processes serving it
+    self.__cloneProcesses = {}
+    #( svcName, cloneId ) -> ( process, stats slot )
+    self.__clones = {}
+    #Replaced clones still finishing their queries
+    self.__stoppingClones = []
+    self.__restartClones = False
+    self.__cloneCounts = {}
 
   def initialize( self, servicesList ):
     try:
@@ -51,11 +76,23 @@ class ServiceReactor:
 
     for serviceName in self.__serviceModules:
       self.__services[ serviceName ] = Service( self.__serviceModules[ serviceName ] )
+      clones = self.__services[ serviceName ].getConfig().getCloneProcesses()
+      if clones > 1:
+        if multiprocessing:
+          self.__cloneProcesses[ serviceName ] = clones
+        else:
+          gLogger.warn( "multiprocessing is not available. %s will be served by one process" % serviceName )
 
     #Loop again to include the GW in case there is one (included in the __init__)
     for serviceName in self.__services:
-      gLogger.info( "Initializing %s" % serviceName )
-      result = self.__services[ serviceName ].initialize()
+      if serviceName in self.__cloneProcesses:
+        #Each clone initializes the service after the fork
+        gLogger.info( "%s will be served by %s processes" % ( serviceName, self.__cloneProcesses[ serviceName ] ) )
+        result = self.__services[ serviceName ].initializeMonitoring()
+      else:
+        gLogger.info( "Initializing %s" % serviceName )
+        self.__services[ serviceName ].setQueryCallback( self.__stats.queryServed )
+        result = self.__services[ serviceName ].initialize()
       if not result[ 'OK' ]:
         return result
     return S_OK()
@@ -108,72 +145,173 @@ class ServiceReactor:
       return result
     for svcName in self.__listeningConnections:
       gLogger.always( "Listening at %s" % self.__services[ svcName ].getConfig().getURL() )
-    #Multiple clones not yet working. Disabled by default
-    if False and multiprocessing:
-      for svcName in self.__listeningConnections:
-        clones = self.__services[ svcName ].getConfig().getCloneProcesses()
-        for i in range( 1, clones ):
-          p = multiprocessing.Process( target = self.__startCloneProcess, args = ( svcName, i ) )
-          p.start()
-          gLogger.always( "Started clone process %s for %s" % ( i, svcName ) )
+    servedServices = [ svcName for svcName in self.__listeningConnections if svcName not in self.__cloneProcesses ]
+    if not self.__cloneProcesses:
+      while self.__alive:
+        self.__acceptIncomingConnection( servedServices )
+      return S_OK()
+    self.__startClones()
+    signal.signal( signal.SIGTERM, self.__stopSignal )
+    signal.signal( signal.SIGINT, self.__stopSignal )
+    signal.signal( signal.SIGHUP, self.__restartSignal )
+    result = S_OK()
     while self.__alive:
-      self.__acceptIncomingConnection()
+      self.__acceptIncomingConnection( servedServices, timeout = 1 )
+      result = self.__checkClones()
+      if not result[ 'OK' ]:
+        break
+    self.__stopClones()
+    self.__closeListeningConnections()
+    return result
+
+  def __stopSignal( self, signum, frame ):
+    self.__alive = False
+
+  def __restartSignal( self, signum, frame ):
+    self.__restartClones = True
+
+  def __startClones( self ):
+    slotServices = []
+    for svcName in self.__cloneProcesses:
+      for cloneId in range( self.__cloneProcesses[ svcName ] ):
+        slotServices.append( svcName )
+        self.__clones[ ( svcName, cloneId ) ] = ( None, len( slotServices ) )
+      self.__cloneCounts[ svcName ] = ( 0, 0 )
+    self.__stats.allocateSlots( slotServices )
+    for cloneKey in self.__clones:
+      self.__startClone( cloneKey )
+
+  def __startClone( self, cloneKey ):
+    svcName, cloneId = cloneKey
+    slot = self.__clones[ cloneKey ][1]
+    proc = multiprocessing.Process( target = self.__runClone, args = ( svcName, cloneId, slot ) )
+    proc.start()
+    self.__clones[ cloneKey ] = ( proc, slot )
+    gLogger.always( "Started clone process %s for %s" % ( cloneId, svcName ), "pid %s" % proc.pid )
+
+  def __checkClones( self ):
+    """
+    Restart the clones that died, replace all of them if asked to and report their activity
+    """
+    for cloneKey in self.__clones:
+      proc = self.__clones[ cloneKey ][0]
+      if proc.is_alive():
+        continue
+      if proc.exitcode == self.CLONE_INIT_FAILED:
+        return S_ERROR( "Clone process %s of %s could not initialize the service" % ( cloneKey[1], cloneKey[0] ) )
+      gLogger.error( "Clone process %s of %s died" % ( cloneKey[1], cloneKey[0] ), "exit code %s" % proc.exitcode )
+      self.__startClone( cloneKey )
+    if self.__restartClones:
+      self.__restartClones = False
+      gLogger.always( "Restarting the clone processes" )
+      for cloneKey in self.__clones:
+        #The new clone starts accepting before the old one stops
+        oldProc = self.__clones[ cloneKey ][0]
+        self.__startClone( cloneKey )
+        oldProc.terminate()
+        self.__stoppingClones.append( oldProc )
+    self.__stoppingClones = [ proc for proc in self.__stoppingClones if proc.is_alive() ]
+    for svcName in self.__cloneCounts:
+      counts = self.__stats.getCounts( svcName )
+      lastCounts = self.__cloneCounts[ svcName ]
+      self.__services[ svcName ].addCloneMarks( counts[0] - lastCounts[0], counts[1] - lastCounts[1] )
+      self.__cloneCounts[ svcName ] = counts
+    return S_OK()
+
+  def __stopClones( self ):
+    procs = [ self.__clones[ cloneKey ][0] for cloneKey in self.__clones ] + self.__stoppingClones
+    for proc in procs:
+      if proc.is_alive():
+        proc.terminate()
+    limit = time.time() + self.CLONE_STOP_TIME + 10
+    for proc in procs:
+      proc.join( max( 0, limit - time.time() ) )
+      if proc.is_alive():
+        gLogger.warn( "Clone process %s did not stop in time. Killing it" % proc.pid )
+        os.kill( proc.pid, signal.SIGKILL )
+        proc.join()
+    self.__clones = {}
+    self.__stoppingClones = []
 
   #This function runs in a different process
-  def __startCloneProcess( self, svcName, i ):
-    self.__services[ svcName ].setCloneProcessId( i )
-    self.__alive = i
+  def __runClone( self, svcName, cloneId, slot ):
+    signal.signal( signal.SIGTERM, self.__stopSignal )
+    #Interrupting and restarting is up to the main process
+    signal.signal( signal.SIGINT, signal.SIG_IGN )
+    signal.signal( signal.SIGHUP, signal.SIG_IGN )
+    self.__cloneProcesses = {}
+    self.__clones = {}
+    self.__stoppingClones = []
+    self.__stats.setSlot( slot )
+    service = self.__services[ svcName ]
+    service.setCloneProcessId( cloneId, self.__stats.getNumSlots( svcName ) )
+    service.setQueryCallback( self.__stats.queryServed )
+    result = service.initialize()
+    if not result[ 'OK' ]:
+      gLogger.fatal( "Clone process %s of %s could not initialize the service" % ( cloneId, svcName ), result[ 'Message' ] )
+      sys.exit( self.CLONE_INIT_FAILED )
     while self.__alive:
-      self.__acceptIncomingConnection( svcName )
-
-  def __getListeningSocketsList( self, svcName = False ):
-    if svcName:
-      sockets = [ self.__listeningConnections[ svcName ][ 'socket' ] ]
-    else:
-      sockets = []
-      for svcName in self.__listeningConnections:
-        sockets.append( self.__listeningConnections[ svcName ][ 'socket' ] )
-    return sockets
-
-  def __acceptIncomingConnection( self, svcName = False ):
-    sockets = self.__getListeningSocketsList( svcName )
+      self.__acceptIncomingConnection( [ svcName ] )
+    #Let the queries being served finish
+    limit = time.time() + self.CLONE_STOP_TIME
+    while service.isBusy() and time.time() < limit:
+      time.sleep( 0.5 )
+    gLogger.always( "Clone process %s of %s stopped" % ( cloneId, svcName ) )
+
+  def __getListeningSocketsList( self, servicesList ):
+    return [ self.__listeningConnections[ svcName ][ 'socket' ] for svcName in servicesList ]
+
+  def __acceptIncomingConnection( self, servicesList, timeout = 10 ):
+    sockets = self.__getListeningSocketsList( servicesList )
     while self.__alive:
       try:
-        inList, outList, exList = select.select( sockets, [], [], 10 )
-        if len( inList ) == 0:
-          return
-        for inSocket in inList:
-          for svcName in self.__listeningConnections:
-            if inSocket == self.__listeningConnections[ svcName ][ 'socket' ]:
-              retVal = self.__listeningConnections[ svcName ][ 'transport' ].acceptConnection()
-              if not retVal[ 'OK' ]:
-                gLogger.warn( "Error while accepting a connection: ", retVal[ 'Message' ] )
-                return
-              clientTransport = retVal[ 'Value' ]
-      except socket.error:
+        inList, outList, exList = select.select( sockets, [], [], timeout )
+      except ( select.error, socket.error ):
+        #Interrupted by a signal
         return
-      self.__maxFD = max( self.__maxFD, clientTransport.oSocket.fileno() )
-      #Is it banned?
-      clientIP = clientTransport.getRemoteAddress()[0]
-      if clientIP in Registry.getBannedIPs():
-        gLogger.warn( "Client connected from banned ip %s" % clientIP )
-        clientTransport.close()
-        continue
-      #Handle connection
-      self.__stats.connectionStablished()
-      self.__services[ svcName ].handleConnection( clientTransport )
+      if len( inList ) == 0:
+        return
+      for inSocket in inList:
+        for svcName in servicesList:
+          if inSocket == self.__listeningConnections[ svcName ][ 'socket' ]:
+            self.__handleConnection( svcName )
       #Renew context?
       now = time.time()
       renewed = False
-      for svcName in self.__listeningConnections:
+      for svcName in servicesList:
          tr = self.__listeningConnections[ svcName ][ 'transport' ]
          if now - tr.latestServerRenewTime() > self.__services[ svcName ].getConfig().getContextLifeTime():
            result = tr.renewServerContext()
            if result[ 'OK' ]:
              renewed = True
+      if self.__cloneProcesses:
+        #Let the main process look after the clones
+        return
       if renewed:
-        sockets = self.__getListeningSocketsList()
+        sockets = self.__getListeningSocketsList( servicesList )
 
+  def __handleConnection( self, svcName ):
+    #All the clones are woken up by a new connection but only one gets it, the others
+    #wait in accept for the next one unless a signal interrupts them
+    try:
+      retVal = self.__listeningConnections[ svcName ][ 'transport' ].acceptConnection()
+    except Exception, e:
+      gLogger.verbose( "Connection not accepted: %s" % str( e ) )
+      return
+    if not retVal[ 'OK' ]:
+      gLogger.warn( "Error while accepting a connection: ", retVal[ 'Message' ] )
+      return
+    clientTransport = retVal[ 'Value' ]
+    self.__maxFD = max( self.__maxFD, clientTransport.oSocket.fileno() )
+    #Is it banned?
+    clientIP = clientTransport.getRemoteAddress()[0]
+    if clientIP in Registry.getBannedIPs():
+      gLogger.warn( "Client connected from banned ip %s" % clientIP )
+      clientTransport.close()
+      return
+    #Handle connection
+    self.__stats.connectionStablished()
+    self.__services[ svcName ].handleConnection( clientTransport )
 
   def __closeListeningConnections( self ):
     for svcName in self.__listeningConnections:
@@ -183,16 +321,64 @@ class ServiceReactor:
 
 
 class ReactorStats:
+  """ Connections and queries served by the reactor. Once the slots of the clones
+      are allocated the counters live in shared memory, one pair per process, so
+      the main process can add them up
+  """
 
   def __init__( self ):
-    self.__connections = 0
-    self.__established = 0
     self.__startTime = Time.dateTime()
+    self.__lock = threading.Lock()
+    #Slot 0 belongs to the main process, the rest to the clones of each service
+    self.__slotServices = [ False ]
+    self.__counters = [ 0, 0 ]
+    self.__slot = 0
 
-  def connectionStablished( self ):
-    self.__connections += 1
+  def allocateSlots( self, slotServices ):
+    """
+    Move the counters to shared memory with one slot per clone process.
+    slotServices is the service served by each clone slot, starting at slot 1
+    """
+    counters = multiprocessing.Array( 'L', 2 * ( len( slotServices ) + 1 ), lock = False )
+    counters[0] = self.__counters[0]
+    counters[1] = self.__counters[1]
+    self.__counters = counters
+    self.__slotServices = [ False ] + list( slotServices )
+
+  def setSlot( self, slot ):
+    """
+    Count in a slot. Only one process at a time is expected to use it
+    """
+    self.__slot = slot
+
+  def getNumSlots( self, svcName ):
+    return self.__slotServices.count( svcName )
 
+  def __increment( self, offset ):
+    self.__lock.acquire()
+    try:
+      self.__counters[ 2 * self.__slot + offset ] += 1
+    finally:
+      self.__lock.release()
 
+  def connectionStablished( self ):
+    self.__increment( 0 )
 
+  def queryServed( self ):
+    self.__increment( 1 )
 
+  def getCounts( self, svcName = False ):
+    """
+    Get ( connections, queries ) of the clones of a service or of all the processes
+    """
+    connections = 0
+    queries = 0
+    for slot in range( len( self.__slotServices ) ):
+      if svcName and self.__slotServices[ slot ] != svcName:
+        continue
+      connections += self.__counters[ 2 * slot ]
+      queries += self.__counters[ 2 * slot + 1 ]
+    return ( connections, queries )
 
+  def getStartTime( self ):
+    return self.__startTime
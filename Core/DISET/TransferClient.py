@@ -9,7 +9,7 @@ from DIRAC.Core.Utilities import File
 
 class TransferClient( BaseClient ):
 
-  def _sendTransferHeader( self, actionName, fileInfo ):
+  def _sendTransferHeader( self, actionName, fileInfo, transferWindow = 0 ):
     """
     Send the header of the transfer
 
@@ -17,6 +17,9 @@ class TransferClient( BaseClient ):
     @param actionName: Action to execute
     @type fileInfo: tuple
     @param fileInfo: Information of the target file/bulk
+    @type transferWindow: integer
+    @param transferWindow: Windowed transfer to propose to the server. The window
+                           accepted by the server is returned in the TransferWindow key
     @return: S_OK/S_ERROR
     """
     retVal = self._connect()
@@ -28,13 +31,19 @@ class TransferClient( BaseClient ):
       retVal = self._proposeAction( transport, ( "FileTransfer", actionName ) )
       if not retVal[ 'OK' ]:
         return retVal
-      retVal = transport.sendData( S_OK( fileInfo ) )
+      header = S_OK( fileInfo )
+      if transferWindow:
+        header[ 'TransferWindow' ] = transferWindow
+      retVal = transport.sendData( header )
       if not retVal[ 'OK' ]:
         return retVal
       retVal = transport.receiveData()
       if not retVal[ 'OK' ]:
         return retVal
-      return S_OK( ( trid, transport ) )
+      #Servers not knowing about windowed transfers don't send back any window
+      result = S_OK( ( trid, transport ) )
+      result[ 'TransferWindow' ] = min( transferWindow, retVal.get( 'TransferWindow', 0 ) )
+      return result
     except Exception, e:
       self._disconnect( trid )
       return S_ERROR( "Cound not request transfer: %s" % str( e ) )
@@ -58,12 +67,14 @@ class TransferClient( BaseClient ):
     if not retVal[ 'OK' ]:
       return retVal
     fd = retVal[ 'Value' ]
-    retVal = self._sendTransferHeader( "FromClient", ( fileId, token, File.getSize( filename ) ) )
+    retVal = self._sendTransferHeader( "FromClient", ( fileId, token, File.getSize( filename ) ),
+                                       FileHelper.defaultTransferWindow )
     if not retVal[ 'OK' ]:
       return retVal
     trid, transport = retVal[ 'Value' ]
     try:
       fileHelper.setTransport( transport )
+      fileHelper.setTransferWindow( retVal[ 'TransferWindow' ] )
       retVal = fileHelper.FDToNetwork( fd )
       if not retVal[ 'OK' ]:
         return retVal
@@ -92,12 +103,14 @@ class TransferClient( BaseClient ):
       return retVal
     dS = retVal[ 'Value' ]
     closeAfterUse = retVal[ 'closeAfterUse' ]
-    retVal = self._sendTransferHeader( "ToClient", ( fileId, token ) )
+    retVal = self._sendTransferHeader( "ToClient", ( fileId, token ),
+                                       FileHelper.defaultTransferWindow )
     if not retVal[ 'OK' ]:
       return retVal
     trid, transport = retVal[ 'Value' ]
     try:
       fileHelper.setTransport( transport )
+      fileHelper.setTransferWindow( retVal[ 'TransferWindow' ] )
       retVal = fileHelper.networkToDataSink( dS )
       if not retVal[ 'OK' ]:
         return retVal
@@ -138,16 +151,19 @@ class TransferClient( BaseClient ):
       bulkId = "%s.tar.bz2" % bulkId
     else:
       bulkId = "%s.tar" % bulkId
-    retVal = self._sendTransferHeader( "BulkFromClient", ( bulkId, token, bulkSize ) )
+    retVal = self._sendTransferHeader( "BulkFromClient", ( bulkId, token, bulkSize ),
+                                       FileHelper.defaultTransferWindow )
     if not retVal[ 'OK' ]:
       return retVal
     trid, transport = retVal[ 'Value' ]
     try:
       fileHelper = FileHelper( transport )
+      fileHelper.setTransferWindow( retVal[ 'TransferWindow' ] )
       retVal = fileHelper.bulkToNetwork( fileList, compress, onthefly )
       if not retVal[ 'OK' ]:
         return retVal
-      retVal = transport.receiveData()      return retVal
+      retVal = transport.receiveData()
+      return retVal
     finally:
       self._disconnect( trid )
 
@@ -171,12 +187,14 @@ class TransferClient( BaseClient ):
       bulkId = "%s.tar.bz2" % bulkId
     else:
       bulkId = "%s.tar" % bulkId
-    retVal = self._sendTransferHeader( "BulkToClient", ( bulkId, token ) )
+    retVal = self._sendTransferHeader( "BulkToClient", ( bulkId, token ),
+                                       FileHelper.defaultTransferWindow )
     if not retVal[ 'OK' ]:
       return retVal
     trid, transport = retVal[ 'Value' ]
     try:
       fileHelper = FileHelper( transport )
+      fileHelper.setTransferWindow( retVal[ 'TransferWindow' ] )
       retVal = fileHelper.networkToBulk( destDir, compress )
       if not retVal[ 'OK' ]:
         return retVal
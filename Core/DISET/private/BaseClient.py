@@ -1,9 +1,14 @@
 # $HeadURL$
 __RCSID__ = "$Id$"
 
+import os
 import time
 import types
 import thread
+try:
+  from hashlib import md5
+except:
+  from md5 import md5
 import DIRAC
 from DIRAC.Core.DISET.private.Protocols import gProtocolDict
 from DIRAC.FrameworkSystem.Client.Logger import gLogger
@@ -13,6 +18,7 @@ from DIRAC.ConfigurationSystem.Client.Config import gConfig
 from DIRAC.ConfigurationSystem.Client.PathFinder import getServiceURL
 from DIRAC.Core.Security import CS
 from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
+from DIRAC.Core.DISET.private.ConnectionPool import getGlobalConnectionPool
 from DIRAC.Core.DISET.ThreadConfig import ThreadConfig
 
 class BaseClient:
@@ -32,6 +38,7 @@ class BaseClient:
   KW_PROXY_CHAIN = "proxyChain"
   KW_SKIP_CA_CHECK = "skipCACheck"
   KW_KEEP_ALIVE_LAPSE = "keepAliveLapse"
+  KW_PERSISTENT_CONNECTION = "persistentConnection"
 
   __threadConfig = ThreadConfig()
 
@@ -52,7 +59,7 @@ class BaseClient:
     for initFunc in ( self.__discoverSetup, self.__discoverVO, self.__discoverTimeout,
                       self.__discoverURL, self.__discoverCredentialsToUse,
                       self.__checkTransportSanity,
-                      self.__setKeepAliveLapse ):
+                      self.__setKeepAliveLapse, self.__discoverPersistentConnection ):
       result = initFunc()
       if not result[ 'OK' ] and self.__initStatus[ 'OK' ]:
         self.__initStatus = result
@@ -270,16 +277,24 @@ and this is thread %s
   def _disconnect( self, trid ):
     getGlobalTransportPool().close( trid )
 
-  def _proposeAction( self, transport, action ):
+  def _proposeAction( self, transport, action, keepConnected = False ):
     if not self.__initStatus[ 'OK' ]:
       return self.__initStatus
     stConnectionInfo = ( ( self.__URLTuple[3], self.setup, self.vo ),
                          action,
                          self.__extraCredentials )
+    if keepConnected:
+      #Ask the server to keep the connection open after the action. Old servers ignore it
+      stConnectionInfo += ( { 'keepConnected' : True }, )
+    numReceived = transport.numReceivedMessages
     retVal = transport.sendData( S_OK( stConnectionInfo ) )
     if not retVal[ 'OK' ]:
+      retVal[ 'noServerReply' ] = True
       return retVal
     serverReturn = transport.receiveData()
+    if not serverReturn[ 'OK' ] and transport.numReceivedMessages == numReceived:
+      #The error comes from the transport, the server did not answer the proposal
+      serverReturn[ 'noServerReply' ] = True
     #TODO: Check if delegation is required
     if serverReturn[ 'OK' ] and 'Value' in serverReturn and type( serverReturn[ 'Value' ] ) == types.DictType:
       gLogger.debug( "There is a server requirement" )
@@ -321,6 +336,50 @@ and this is thread %s
     self.kwargs[ self.KW_KEEP_ALIVE_LAPSE ] = kaa
     return S_OK()
 
+  def __discoverPersistentConnection( self ):
+    if self.KW_PERSISTENT_CONNECTION in self.kwargs:
+      persistent = self.kwargs[ self.KW_PERSISTENT_CONNECTION ]
+      if type( persistent ) in types.StringTypes:
+        persistent = persistent.lower() in ( "true", "yes", "y", "1" )
+    else:
+      persistent = gConfig.getValue( "/DIRAC/PersistentConnections", False )
+    self.__persistentConnection = persistent
+    return S_OK()
+
+  def _getConnectionKey( self ):
+    """
+    Key identifying the connections that can be shared between clients:
+    same service URL, setup, VO, credentials and extra credentials
+    """
+    credKey = [ self.kwargs.get( kw, None ) for kw in ( self.KW_USE_CERTIFICATES,
+                                                        self.KW_PROXY_LOCATION,
+                                                        self.KW_SKIP_CA_CHECK,
+                                                        self.KW_TIMEOUT ) ]
+    if self.KW_PROXY_STRING in self.kwargs:
+      credKey.append( md5( self.kwargs[ self.KW_PROXY_STRING ] ).hexdigest() )
+    else:
+      credKey.append( os.environ.get( "X509_USER_PROXY", "" ) )
+    return ( self.serviceURL, self.setup, self.vo, self.__extraCredentials, tuple( credKey ) )
+
+  def _usePersistentConnection( self ):
+    return self.__initStatus[ 'OK' ] and self.__persistentConnection
+
+  def _getPooledConnection( self ):
+    """
+    Get an already authenticated connection from the persistent connection pool.
+    Returns S_OK( ( trid, transport ) ) or S_OK( None ) if there's none available
+    """
+    self.__discoverExtraCredentials()
+    if not self._usePersistentConnection():
+      return S_OK( None )
+    return S_OK( getGlobalConnectionPool().get( self._getConnectionKey() ) )
+
+  def _releaseConnection( self, trid, idleTimeout ):
+    """
+    Return a connection to the persistent connection pool
+    """
+    getGlobalConnectionPool().release( self._getConnectionKey(), trid, idleTimeout )
+
   def _getBaseStub( self ):
     newKwargs = dict( self.kwargs )
     #Set DN
@@ -0,0 +1,125 @@
+# $HeadURL$
+__RCSID__ = "$Id$"
+
+import time
+import threading
+from DIRAC import gLogger
+from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
+from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
+
+class ConnectionPool:
+  """
+  Keeps authenticated client transports that the server agreed to keep open
+  so that consecutive RPCs to the same service can reuse them.
+
+  Connections are indexed by a key built by the client out of the service URL,
+  the credentials, the extra credentials and the setup. A connection is handed
+  to only one client at a time and returned to the pool once the RPC is done.
+  Transports stay registered in the global TransportPool, which takes care of
+  sending keep alives while they are idle.
+  """
+
+  def __init__( self, maxIdlePerKey = 5, logger = False ):
+    if logger:
+      self.log = logger
+    else:
+      self.log = gLogger
+    self.__maxIdlePerKey = maxIdlePerKey
+    self.__modLock = threading.Lock()
+    self.__idle = {}
+    self.__stats = { 'hits' : 0, 'misses' : 0 }
+    result = gThreadScheduler.addPeriodicTask( 5, self.__purgeExpired )
+    if not result[ 'OK' ]:
+      self.log.fatal( "Cannot add task to thread scheduler", result[ 'Message' ] )
+
+  def get( self, connKey ):
+    """
+    Get an idle connection for a given key. Returns ( trid, transport ) or None
+    """
+    trPool = getGlobalTransportPool()
+    now = time.time()
+    toClose = []
+    found = None
+    self.__modLock.acquire()
+    try:
+      connList = self.__idle.get( connKey, [] )
+      while connList:
+        trid, expiration = connList.pop()
+        transport = trPool.get( trid )
+        if not transport:
+          continue
+        if expiration < now:
+          toClose.append( trid )
+          continue
+        found = ( trid, transport )
+        break
+      if not connList and connKey in self.__idle:
+        del( self.__idle[ connKey ] )
+      if found:
+        self.__stats[ 'hits' ] += 1
+      else:
+        self.__stats[ 'misses' ] += 1
+    finally:
+      self.__modLock.release()
+    for trid in toClose:
+      trPool.close( trid )
+    return found
+
+  def release( self, connKey, trid, idleTimeout ):
+    """
+    Give back a connection to the pool. idleTimeout is the time the server will wait
+    for the next proposal, keep a margin to avoid sending to a closing connection
+    """
+    idleTimeout = idleTimeout - 1
+    if idleTimeout <= 0:
+      getGlobalTransportPool().close( trid )
+      return
+    self.__modLock.acquire()
+    try:
+      connList = self.__idle.setdefault( connKey, [] )
+      if len( connList ) < self.__maxIdlePerKey:
+        connList.append( ( trid, time.time() + idleTimeout ) )
+        return
+    finally:
+      self.__modLock.release()
+    getGlobalTransportPool().close( trid )
+
+  def getStats( self ):
+    self.__modLock.acquire()
+    try:
+      stats = dict( self.__stats )
+      stats[ 'idle' ] = sum( [ len( self.__idle[ connKey ] ) for connKey in self.__idle ] )
+    finally:
+      self.__modLock.release()
+    return stats
+
+  def __purgeExpired( self ):
+    now = time.time()
+    toClose = []
+    self.__modLock.acquire()
+    try:
+      for connKey in list( self.__idle ):
+        alive = []
+        for trid, expiration in self.__idle[ connKey ]:
+          if expiration < now:
+            toClose.append( trid )
+          else:
+            alive.append( ( trid, expiration ) )
+        if alive:
+          self.__idle[ connKey ] = alive
+        else:
+          del( self.__idle[ connKey ] )
+    finally:
+      self.__modLock.release()
+    trPool = getGlobalTransportPool()
+    for trid in toClose:
+      self.log.debug( "Closing idle persistent connection %s" % trid )
+      trPool.close( trid )
+
+gConnectionPool = None
+
+def getGlobalConnectionPool():
+  global gConnectionPool
+  if not gConnectionPool:
+    gConnectionPool = ConnectionPool()
+  return gConnectionPool
@@ -21,6 +21,8 @@ class FileHelper:
 
   __validDirections = ( "toClient", "fromClient", 'receive', 'send' )
   __directionsMapping = { 'toClient' : 'send', 'fromClient' : 'receive' }
+  # Max number of unacknowledged packets proposed by clients for windowed transfers
+  defaultTransferWindow = 8
 
   def __init__( self, oTransport = None, checkSum = True ):
     self.oTransport = oTransport
@@ -31,6 +33,9 @@ class FileHelper:
     self.direction = False
     self.packetSize = 1048576
     self.__fileBytes = 0
+    self.__transferWindow = 0
+    self.__unackedPackets = 0
+    self.__receivedPackets = 0
     self.__log = gLogger.getSubLogger( "FileHelper" )
 
   def disableCheckSum( self ):
@@ -42,6 +47,23 @@ class FileHelper:
   def setTransport( self, oTransport ):
     self.oTransport = oTransport
 
+  def setTransferWindow( self, window ):
+    """
+    Set the number of packets that can be sent without waiting for an acknowledgement.
+    Both peers have to agree on the window. With a window packets are sent as raw
+    frames instead of DEncoded structures. 0 means stop and wait for each packet
+    """
+    try:
+      self.__transferWindow = max( 0, int( window ) )
+    except ( TypeError, ValueError ):
+      self.__transferWindow = 0
+
+  def getTransferWindow( self ):
+    return self.__transferWindow
+
+  def __getAckInterval( self ):
+    return max( 1, self.__transferWindow / 2 )
+
   def setDirection( self, direction ):
     if direction in FileHelper.__validDirections:
       if direction in FileHelper.__directionsMapping:
@@ -58,17 +80,72 @@ class FileHelper:
   def sendData( self, sBuffer ):
     if self.__checkMD5:
       self.__oMD5.update( sBuffer )
+    if self.__transferWindow:
+      return self.__sendWindowedData( sBuffer )
     retVal = self.oTransport.sendData( S_OK( ( True, sBuffer ) ) )
     if not retVal[ 'OK' ]:
       return retVal
     retVal = self.oTransport.receiveData()
     return retVal
 
+  def __sendWindowedData( self, sBuffer ):
+    retVal = self.oTransport.sendRawFrame( sBuffer )
+    if not retVal[ 'OK' ]:
+      return retVal
+    self.__unackedPackets += 1
+    if self.__unackedPackets < self.__transferWindow:
+      return S_OK()
+    #Window is full, wait for the receiver to acknowledge some packets
+    retVal = self.__receiveAck()
+    if not retVal[ 'OK' ] or not retVal.get( 'AbortTransfer' ):
+      return retVal
+    #The receiver does not want more data. Close the stream properly
+    result = self.sendEOF()
+    if not result[ 'OK' ]:
+      return result
+    return retVal
+
+  def __receiveAck( self ):
+    """
+    Receive a message from the receiving side of a windowed transfer
+    """
+    retVal = self.oTransport.receiveData()
+    if not retVal[ 'OK' ]:
+      return retVal
+    if retVal.get( 'AbortTransfer' ) or retVal.get( 'TransferEnd' ):
+      return retVal
+    try:
+      self.__unackedPackets -= int( retVal[ 'Value' ] )
+    except ( TypeError, ValueError ):
+      return S_ERROR( "Invalid transfer acknowledgement received" )
+    return S_OK()
+
+  def __waitForTransferEnd( self ):
+    """
+    Consume the pending acknowledgements of a windowed transfer until the receiver
+    confirms the end of the transfer
+    """
+    while True:
+      retVal = self.__receiveAck()
+      if not retVal[ 'OK' ] or retVal.get( 'TransferEnd' ):
+        break
+    self.__unackedPackets = 0
+    return retVal
+
+  def __sendTransferEnd( self ):
+    endMsg = S_OK()
+    endMsg[ 'TransferEnd' ] = True
+    return self.oTransport.sendData( endMsg )
+
   def sendEOF( self ):
     retVal = self.oTransport.sendData( S_OK( ( False, self.__oMD5.hexdigest() ) ) )
     if not retVal[ 'OK' ]:
       return retVal
     self.__finishedTransmission()
+    if self.__transferWindow:
+      retVal = self.__waitForTransferEnd()
+      if not retVal[ 'OK' ]:
+        return retVal
     return S_OK()
 
   def sendError( self, errorMsg ):
@@ -79,9 +156,17 @@ class FileHelper:
     return S_OK()
 
   def receiveData( self, maxBufferSize = 0 ):
-    retVal = self.oTransport.receiveData( maxBufferSize = maxBufferSize )
+    if self.__transferWindow:
+      retVal = self.oTransport.receiveRawFrame( maxBufferSize = maxBufferSize )
+      if retVal[ 'OK' ] and retVal.get( 'RawFrame' ):
+        return self.__receivedWindowedData( retVal[ 'Value' ] )
+    else:
+      retVal = self.oTransport.receiveData( maxBufferSize = maxBufferSize )
     if 'AbortTransfer' in retVal and retVal[ 'AbortTransfer' ]:
-      self.oTransport.sendData( S_OK() )
+      if self.__transferWindow:
+        self.__sendTransferEnd()
+      else:
+        self.oTransport.sendData( S_OK() )
       self.__finishedTransmission()
       self.bReceivedEOF = True
       return S_OK( '' )
@@ -96,20 +181,53 @@ class FileHelper:
       self.bReceivedEOF = True
       if self.__checkMD5 and not self.__oMD5.hexdigest() == stBuffer[1]:
         self.bErrorInMD5 = True
+      if self.__transferWindow:
+        self.__sendTransferEnd()
       self.__finishedTransmission()
       return S_OK( "" )
     return S_OK( stBuffer[1] )
 
+  def __receivedWindowedData( self, sBuffer ):
+    if self.__checkMD5:
+      self.__oMD5.update( sBuffer )
+    self.__receivedPackets += 1
+    ackInterval = self.__getAckInterval()
+    if self.__receivedPackets % ackInterval == 0:
+      retVal = self.oTransport.sendData( S_OK( ackInterval ) )
+      if not retVal[ 'OK' ]:
+        return retVal
+    return S_OK( sBuffer )
+
   def receivedEOF( self ):
     return self.bReceivedEOF
 
   def markAsTransferred( self ):
     if not self.bFinishedTransmission:
-      if self.direction == "receive":
+      if self.direction == "receive" and self.__transferWindow:
+        abortTrans = S_OK()
+        abortTrans[ 'AbortTransfer' ] = True
+        self.oTransport.sendData( abortTrans )
+        #Discard the packets already on the wire until the sender closes the stream
+        while True:
+          retVal = self.oTransport.receiveRawFrame()
+          if not retVal[ 'OK' ]:
+            break
+          if not retVal.get( 'RawFrame' ):
+            if retVal.get( 'AbortTransfer' ) or not retVal[ 'Value' ][0]:
+              self.__sendTransferEnd()
+            break
+      elif self.direction == "receive":
         self.oTransport.receiveData()
         abortTrans = S_OK()
         abortTrans[ 'AbortTransfer' ] = True
         self.oTransport.sendData( abortTrans )
+      elif self.__transferWindow:
+        abortTrans = S_OK( ( False, "" ) )
+        abortTrans[ 'AbortTransfer' ] = True
+        retVal = self.oTransport.sendData( abortTrans )
+        if not retVal[ 'OK' ]:
+          return retVal
+        self.__waitForTransferEnd()
       else:
         abortTrans = S_OK( ( False, "" ) )
         abortTrans[ 'AbortTransfer' ] = True
@@ -166,7 +284,9 @@ class FileHelper:
           self.sendError( "Exceeded maximum file size" )
           return S_ERROR( "Received file exceeded maximum size of %s bytes" % ( maxFileSize ) )
         dataSink.write( strBuffer )
-        result = self.receiveData( maxBufferSize = ( maxFileSize - len( strBuffer ) ) )
+        #No single packet can be bigger than the file. The size of the file is checked above
+        #so that the sender is told to stop
+        result = self.receiveData( maxBufferSize = maxFileSize )
         if not result[ 'OK' ]:
           return result
         strBuffer = result[ 'Value' ]
@@ -201,7 +321,9 @@ class FileHelper:
           self.__log.verbose( "Transfer aborted" )
           return S_OK()
         ioffset += iPacketSize
-      self.sendEOF()
+      result = self.sendEOF()
+      if not result[ 'OK' ]:
+        return result
     except Exception, e:
       return S_ERROR( "Error while sending string: %s" % str( e ) )
     try:
@@ -226,7 +348,9 @@ class FileHelper:
           return S_OK()
         sentBytes += len( sBuffer )
         sBuffer = os.read( iFD, iPacketSize )
-      self.sendEOF()
+      result = self.sendEOF()
+      if not result[ 'OK' ]:
+        return result
     except Exception, e:
       gLogger.exception( "Error while sending file" )
       return S_ERROR( "Error while sending file: %s" % str( e ) )
@@ -258,7 +382,9 @@ class FileHelper:
           return S_OK()
         sentBytes += len( sBuffer )
         sBuffer = dataSource.read( iPacketSize )
-      self.sendEOF()
+      result = self.sendEOF()
+      if not result[ 'OK' ]:
+        return result
     except Exception, e:
       gLogger.exception( "Error while sending file" )
       return S_ERROR( "Error while sending file: %s" % str( e ) )
@@ -9,31 +9,78 @@ from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
 class InnerRPCClient( BaseClient ):
 
   __retry = 0
-  
+
   def executeRPC( self, functionName, args ):
     stub = ( self._getBaseStub(), functionName, args )
-    retVal = self._connect()
-    if not retVal[ 'OK' ]:
+    retVal = self.__executeAction( ( "RPC", functionName ), args )
+    if type( retVal ) == types.DictType:
       retVal[ 'rpcStub' ] = stub
+    return retVal
+
+  def executeRPCs( self, rpcList ):
+    """
+    Execute a list of ( functionName, args ) RPCs in one round trip. Returns
+    S_OK with the list of results in the same order. Servers not supporting
+    batches get the calls one by one
+    """
+    rpcList = [ ( functionName, tuple( args ) ) for functionName, args in rpcList ]
+    if not rpcList:
+      return S_OK( [] )
+    baseStub = self._getBaseStub()
+    retVal = self.__executeAction( ( "BatchRPC", "%s calls" % len( rpcList ) ), rpcList )
+    if not retVal[ 'OK' ]:
+      if retVal.get( 'unknownAction' ):
+        return S_OK( [ self.executeRPC( functionName, args ) for functionName, args in rpcList ] )
+      return retVal
+    results = retVal[ 'Value' ]
+    if type( results ) != types.ListType or len( results ) != len( rpcList ):
+      return S_ERROR( "Invalid batch RPC response" )
+    for iPos in range( len( results ) ):
+      if type( results[ iPos ] ) == types.DictType:
+        results[ iPos ][ 'rpcStub' ] = ( baseStub, rpcList[ iPos ][0], rpcList[ iPos ][1] )
+    return S_OK( results )
+
+  def __executeAction( self, action, args ):
+    pooled = False
+    retVal = self._getPooledConnection()
+    if retVal[ 'OK' ] and retVal[ 'Value' ]:
+      pooled = True
+    else:
+      retVal = self._connect()
+    if not retVal[ 'OK' ]:
       return retVal
     trid, transport = retVal[ 'Value' ]
+    idleTimeout = 0
     try:
-      retVal = self._proposeAction( transport, ( "RPC", functionName ) )
+      retVal = self._proposeAction( transport, action,
+                                    keepConnected = self._usePersistentConnection() )
       if not retVal[ 'OK' ]:
+        if pooled and retVal.get( 'noServerReply' ):
+          #The server may have dropped the idle connection. Nothing has been executed yet
+          return self.__executeAction( action, args )
+        if retVal[ 'Message' ].find( "is not a known action type" ) > -1:
+          retVal[ 'unknownAction' ] = True
+          return retVal
         if self.__retry < 3:
           self.__retry += 1
-          return self.executeRPC( functionName, args )
+          return self.__executeAction( action, args )
         else:
-          retVal[ 'rpcStub' ] = stub
           return retVal
+      serverInfo = retVal.get( 'Value' )
+      if type( serverInfo ) == types.DictType and 'keepConnected' in serverInfo:
+        idleTimeout = serverInfo[ 'keepConnected' ]
 
       retVal = transport.sendData( S_OK( args ) )
       if not retVal[ 'OK' ]:
+        idleTimeout = 0
         return retVal
       receivedData = transport.receiveData()
-      if type( receivedData ) == types.DictType:
-        receivedData[ 'rpcStub' ] = stub
+      #Only reuse connections that are known to be in a clean state
+      if type( receivedData ) != types.DictType or not receivedData.get( 'OK' ):
+        idleTimeout = 0
       return receivedData
     finally:
-      self._disconnect( trid )
-
+      if idleTimeout > 0:
+        self._releaseConnection( trid, idleTimeout )
+      else:
+        self._disconnect( trid )
@@ -1,6 +1,8 @@
 
 import os
 import time
+import select
+import types
 import DIRAC
 import threading
 from DIRAC import gConfig, gLogger, S_OK, S_ERROR, gMonitor
@@ -24,7 +26,8 @@ class Service:
   SVC_VALID_ACTIONS = { 'RPC' : 'export',
                         'FileTransfer': 'transfer',
                         'Message' : 'msg',
-                        'Connection' : 'Message' }
+                        'Connection' : 'Message',
+                        'BatchRPC' : 'RPC' }
   SVC_SECLOG_CLIENT = SecurityLogClient()
 
   def __init__( self, serviceData ):
@@ -44,12 +47,27 @@ class Service:
     self._authMgr = AuthManager( "%s/Authorization" % PathFinder.getServiceSection( serviceData[ 'loadName' ] ) )
     self._transportPool = getGlobalTransportPool()
     self.__cloneId = 0
+    self.__numClones = 1
+    self.__queryCallback = False
     self.__maxFD = 0
 
-  def setCloneProcessId( self, cloneId ):
+  def setCloneProcessId( self, cloneId, numClones = 1 ):
+    """
+    Set the clone id of the process serving the service out of the numClones ones.
+    Must be called before initialize() in the clone processes
+    """
     self.__cloneId = cloneId
+    self.__numClones = numClones
+    #The monitoring client inherited from the main process may already be registered as it
+    self._monitor.resetRegistration()
     self._monitor.setComponentName( "%s-Clone:%s" % ( self._name, cloneId ) )
 
+  def setQueryCallback( self, callback ):
+    """
+    Function to call every time a query is served
+    """
+    self.__queryCallback = callback
+
   def _isMetaAction( self, action ):
     referedAction = Service.SVC_VALID_ACTIONS[ action ]
     if referedAction in Service.SVC_VALID_ACTIONS:
@@ -81,7 +99,9 @@ class Service:
                               'URL' : self._cfg.getURL(),
                               'messageSender' : MessageSender( self._name, self._msgBroker ),
                               'validNames' : self._validNames,
-                              'csPaths' : [ PathFinder.getServiceSection( svcName ) for svcName in self._validNames ]
+                              'csPaths' : [ PathFinder.getServiceSection( svcName ) for svcName in self._validNames ],
+                              'cloneId' : self.__cloneId,
+                              'numClones' : self.__numClones
                              }
     #Call static initialization function
     try:
@@ -116,6 +136,35 @@ class Service:
 
     return S_OK()
 
+  def initializeMonitoring( self ):
+    """
+    Initialize only the monitoring of the service. Used by the process that
+    forks the clones to report the activity of all of them
+    """
+    self._url = self._cfg.getURL()
+    if not self._url:
+      return S_ERROR( "Could not build service URL for %s" % self._name )
+    result = self._loadHandlerInit()
+    if not result[ 'OK' ]:
+      return result
+    self._handler = result[ 'Value' ]
+    return self._initMonitoring()
+
+  def addCloneMarks( self, connections, queries ):
+    """
+    Report the connections and queries served by the clones since the last call
+    """
+    if connections:
+      self._monitor.addMark( "Connections", connections )
+    if queries:
+      self._monitor.addMark( "Queries", queries )
+
+  def isBusy( self ):
+    """
+    Is any query being served or waiting to be served?
+    """
+    return self._threadPool.isWorking()
+
   def _discoverHandlerLocation( self ):
     handlerLocation = self._cfg.getHandlerLocation()
     if handlerLocation:
@@ -233,7 +282,10 @@ class Service:
   def _initMonitoring( self ):
     #Init extra bits of monitoring
     self._monitor.setComponentType( MonitoringClient.COMPONENT_SERVICE )
-    self._monitor.setComponentName( self._name )
+    if self.__numClones > 1:
+      self._monitor.setComponentName( "%s-Clone:%s" % ( self._name, self.__cloneId ) )
+    else:
+      self._monitor.setComponentName( self._name )
     self._monitor.setComponentLocation( self._cfg.getURL() )
     self._monitor.initialize()
     self._monitor.registerActivity( "Connections", "Connections received", "Framework", "connections", MonitoringClient.OP_RATE )
@@ -256,6 +308,8 @@ class Service:
         value = 'unset'
       self._monitor.setComponentExtraParam( prop[1], value )
     for secondaryName in self._cfg.registerAlsoAs():
+      if secondaryName in self._validNames:
+        continue
       gLogger.info( "Registering %s also as %s" % ( self._name, secondaryName ) )
       self._validNames.append( secondaryName )
     return S_OK()
@@ -283,6 +337,7 @@ class Service:
   def _processInThread( self, clientTransport ):
     self.__maxFD = max( self.__maxFD, clientTransport.oSocket.fileno() )
     self._lockManager.lockGlobal()
+    globalLocked = True
     try:
       monReport = self.__startReportToMonitoring()
     except Exception, e:
@@ -300,31 +355,100 @@ class Service:
       trid = self._transportPool.add( clientTransport )
       if not trid:
         return
-      #Receive and check proposal
-      result = self._receiveAndCheckProposal( trid )
-      if not result[ 'OK' ]:
-        self._transportPool.sendAndClose( trid, result )
-        return
-      proposalTuple = result[ 'Value' ]
-      #Instantiate handler
-      result = self._instantiateHandler( trid, proposalTuple )
-      if not result[ 'OK' ]:
-        self._transportPool.sendAndClose( trid, result )
-        return
-      handlerObj = result[ 'Value' ]
-      #Execute the action
-      result = self._processProposal( trid, proposalTuple, handlerObj )
-      #Close the connection if required
-      if result[ 'closeTransport' ] or not result[ 'OK' ]:
-        if not result[ 'OK' ]:
-          gLogger.error( "Error processing proposal", result[ 'Message' ] )
-        self._transportPool.close( trid )
-      return result
+      #Serve proposals until the client or the server decide to close the connection
+      while True:
+        result = self._processNextProposal( trid )
+        if not result[ 'OK' ] or result[ 'closeTransport' ]:
+          return result
+        if not result[ 'keepConnected' ]:
+          return result
+        #An idle client does not hold a query slot while it is waited for
+        self._lockManager.unlockGlobal()
+        globalLocked = False
+        if not self.__waitForNextProposal( trid ):
+          self._transportPool.close( trid )
+          return result
+        self._lockManager.lockGlobal()
+        globalLocked = True
+        self.__markQuery()
     finally:
-      self._lockManager.unlockGlobal()
+      if globalLocked:
+        self._lockManager.unlockGlobal()
       if monReport:
         self.__endReportToMonitoring( *monReport )
 
+  def _processNextProposal( self, trid ):
+    #Receive and check proposal
+    result = self._receiveAndCheckProposal( trid )
+    if not result[ 'OK' ]:
+      self._transportPool.sendAndClose( trid, result )
+      return result
+    proposalTuple = result[ 'Value' ]
+    #Instantiate handler
+    result = self._instantiateHandler( trid, proposalTuple )
+    if not result[ 'OK' ]:
+      self._transportPool.sendAndClose( trid, result )
+      return result
+    handlerObj = result[ 'Value' ]
+    keepConnected = self._acceptPersistentConnection( proposalTuple )
+    #Execute the action
+    result = self._processProposal( trid, proposalTuple, handlerObj, keepConnected )
+    #Close the connection if required
+    if result[ 'closeTransport' ] or not result[ 'OK' ]:
+      if not result[ 'OK' ]:
+        gLogger.error( "Error processing proposal", result[ 'Message' ] )
+      self._transportPool.close( trid )
+    result[ 'keepConnected' ] = keepConnected
+    return result
+
+  def _acceptPersistentConnection( self, proposalTuple ):
+    """
+    Check if the client asked to keep the connection open after an RPC and
+    if there are enough free threads to afford it
+    """
+    if len( proposalTuple ) < 4 or type( proposalTuple[3] ) != types.DictType:
+      return False
+    if not proposalTuple[3].get( 'keepConnected' ) or proposalTuple[1][0] not in ( 'RPC', 'BatchRPC' ):
+      return False
+    if self._cfg.getPersistentConnectionTimeout() <= 0:
+      return False
+    return self._threadPool.pendingJobs() == 0
+
+  def __waitForNextProposal( self, trid ):
+    """
+    Wait for the client to send a new proposal on a persistent connection.
+    Give up if the connection stays idle for too long or there are queries waiting for a thread
+    """
+    clientTransport = self._transportPool.get( trid )
+    if not clientTransport:
+      return False
+    oSocket = clientTransport.getSocket()
+    timeLeft = self._cfg.getPersistentConnectionTimeout()
+    while timeLeft > 0:
+      dataReady = bool( clientTransport.byteStream )
+      if not dataReady:
+        try:
+          dataReady = oSocket.pending() > 0
+        except AttributeError:
+          pass
+      if not dataReady:
+        try:
+          inList, dummy, dummy = select.select( [ oSocket ], [], [], min( 1, timeLeft ) )
+        except Exception:
+          return False
+        timeLeft -= 1
+        dataReady = bool( inList )
+      if dataReady:
+        #Read the proposal so it's waiting for _receiveAndCheckProposal
+        result = self._transportPool.receive( trid, 1024, blockAfterKeepAlive = False, idleReceive = True )
+        if not result[ 'OK' ]:
+          gLogger.debug( "Persistent connection closed", result[ 'Message' ] )
+          return False
+        if 'keepAlive' not in result:
+          return True
+      elif self._threadPool.pendingJobs() > 0:
+        return False
+    return False
 
   def _createIdentityString( self, credDict, clientTransport = None ):
     if 'username' in credDict:
@@ -446,9 +570,12 @@ class Service:
       return S_ERROR( "Server error while loading handler" )
     return S_OK( handlerInstance )
 
-  def _processProposal( self, trid, proposalTuple, handlerObj ):
+  def _processProposal( self, trid, proposalTuple, handlerObj, keepConnected = False ):
     #Notify the client we're ready to execute the action
-    retVal = self._transportPool.send( trid, S_OK() )
+    if keepConnected:
+      retVal = self._transportPool.send( trid, S_OK( { 'keepConnected' : self._cfg.getPersistentConnectionTimeout() } ) )
+    else:
+      retVal = self._transportPool.send( trid, S_OK() )
     if not retVal[ 'OK' ]:
       return retVal
 
@@ -476,7 +603,7 @@ class Service:
       if not result[ 'OK' ]:
         self._msgBroker.removeTransport( trid )
 
-    result[ 'closeTransport' ] = not messageConnection or not result[ 'OK' ]
+    result[ 'closeTransport' ] = not ( messageConnection or keepConnected ) or not result[ 'OK' ]
     return result
 
   def _mbConnect( self, trid, handlerObj = None ):
@@ -489,11 +616,103 @@ class Service:
 
   def _executeAction( self, trid, proposalTuple, handlerObj ):
     try:
+      if proposalTuple[1][0] == 'BatchRPC':
+        return self._executeBatchRPC( trid, proposalTuple, handlerObj )
       return handlerObj._rh_executeAction( proposalTuple )
     except Exception, e:
       gLogger.exception( "Exception while executing handler action" )
       return S_ERROR( "Server error while executing action: %s" % str( e ) )
 
+  def _executeBatchRPC( self, trid, proposalTuple, handlerObj ):
+    """
+    Execute a list of ( method, args ) RPCs sent in one proposal and send back
+    the list of results in the same order. Each method is authorized on its own
+    """
+    retVal = self._transportPool.receive( trid )
+    if not retVal[ 'OK' ]:
+      return retVal
+    rpcList = retVal[ 'Value' ]
+    if type( rpcList ) not in ( types.ListType, types.TupleType ):
+      return self._transportPool.send( trid, S_ERROR( "Batch RPC expects a list of calls" ) )
+    maxCalls = self._cfg.getMaxBatchRPCCalls()
+    if len( rpcList ) > maxCalls:
+      return self._transportPool.send( trid, S_ERROR( "Batch RPC can contain at most %s calls" % maxCalls ) )
+    clientTransport = self._transportPool.get( trid )
+    if not clientTransport:
+      return S_ERROR( "Client disconnected" )
+    credDict = clientTransport.getConnectingCredentials()
+    #Check all the calls before executing any of them
+    results = [ None ] * len( rpcList )
+    pendingCalls = []
+    for iPos in range( len( rpcList ) ):
+      rpcCall = rpcList[ iPos ]
+      if type( rpcCall ) not in ( types.ListType, types.TupleType ) or len( rpcCall ) != 2 or \
+         type( rpcCall[0] ) != types.StringType or type( rpcCall[1] ) not in ( types.ListType, types.TupleType ):
+        results[ iPos ] = S_ERROR( "Invalid RPC call description" )
+        continue
+      result = self._authorizeProposal( ( 'RPC', rpcCall[0] ), trid, credDict )
+      if not result[ 'OK' ]:
+        results[ iPos ] = result
+        continue
+      pendingCalls.append( ( iPos, rpcCall[0], tuple( rpcCall[1] ) ) )
+    self._msgBroker.addTransportId( trid, self._name, idleRead = True )
+    try:
+      self.__runBatchCalls( trid, proposalTuple, handlerObj, pendingCalls, results )
+    finally:
+      self._msgBroker.removeTransport( trid, closeTransport = False )
+    return self._transportPool.send( trid, S_OK( results ) )
+
+  def __runBatchCalls( self, trid, proposalTuple, handlerObj, pendingCalls, results ):
+    """
+    Run the calls of a batch. If BatchRPCThreads is greater than one, helper jobs
+    are queued in the service thread pool. The calling thread also consumes calls
+    so the batch finishes even if no helper gets a free thread.
+    """
+    callsLock = threading.Condition()
+    pendingCalls.reverse()
+    running = [ 0 ]
+
+    def consumeCalls( handler = None ):
+      if not handler:
+        result = self._instantiateHandler( trid, proposalTuple )
+        if not result[ 'OK' ]:
+          return
+        handler = result[ 'Value' ]
+      while True:
+        callsLock.acquire()
+        try:
+          if not pendingCalls:
+            return
+          iPos, method, args = pendingCalls.pop()
+          running[0] += 1
+        finally:
+          callsLock.release()
+        try:
+          try:
+            results[ iPos ] = handler._rh_executeRPC( method, args, listenToTransport = False )
+          except Exception, e:
+            gLogger.exception( "Exception while executing batch RPC", method )
+            results[ iPos ] = S_ERROR( "Server error while executing %s: %s" % ( method, str( e ) ) )
+        finally:
+          callsLock.acquire()
+          running[0] -= 1
+          callsLock.notifyAll()
+          callsLock.release()
+
+    numHelpers = min( self._cfg.getBatchRPCThreads(), len( pendingCalls ) ) - 1
+    for i in range( numHelpers ):
+      result = self._threadPool.generateJobAndQueueIt( consumeCalls, blocking = False )
+      if not result[ 'OK' ]:
+        break
+    consumeCalls( handlerObj )
+    #Wait for the calls being executed by the helpers
+    callsLock.acquire()
+    try:
+      while running[0]:
+        callsLock.wait( 1 )
+    finally:
+      callsLock.release()
+
   def _mbReceivedMsg( self, trid, msgObj ):
     result = self._authorizeProposal( ( 'Message', msgObj.getName() ),
                                       trid,
@@ -514,8 +733,13 @@ class Service:
     return handlerObj._rh_executeConnectionCallback( 'drop' )
 
 
-  def __startReportToMonitoring( self ):
+  def __markQuery( self ):
     self._monitor.addMark( "Queries" )
+    if self.__queryCallback:
+      self.__queryCallback()
+
+  def __startReportToMonitoring( self ):
+    self.__markQuery()
     now = time.time()
     stats = os.times()
     cpuTime = stats[0] + stats[2]
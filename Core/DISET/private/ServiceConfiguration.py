@@ -80,6 +80,24 @@ class ServiceConfiguration:
     except:
       return 15
 
+  def getPersistentConnectionTimeout( self ):
+    try:
+      return int( self.getOption( "PersistentConnectionTimeout" ) )
+    except:
+      return 10
+
+  def getMaxBatchRPCCalls( self ):
+    try:
+      return int( self.getOption( "MaxBatchRPCCalls" ) )
+    except:
+      return 1000
+
+  def getBatchRPCThreads( self ):
+    try:
+      return max( 1, int( self.getOption( "BatchRPCThreads" ) ) )
+    except:
+      return 1
+
   def getCloneProcesses( self ):
     try:
       return int( self.getOption( "CloneProcesses" ) )
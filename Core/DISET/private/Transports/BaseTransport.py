@@ -3,7 +3,6 @@ __RCSID__ = "$Id$"
 
 import time
 import select
-import cStringIO
 try:
   from hashlib import md5
 except:
@@ -19,6 +18,7 @@ class BaseTransport:
   iListenQueueSize = 5
   iReadTimeout = 600
   keepAliveMagic = "dka"
+  rawFrameMagic = "drf"
 
   def __init__( self, stServerAddress, bServerMode = False, **kwargs ):
     self.bServerMode = bServerMode
@@ -32,6 +32,8 @@ class BaseTransport:
     self.startedKeepAlives = set()
     self.keepAliveId = md5( str( stServerAddress ) + str( bServerMode ) ).hexdigest()
     self.receivedMessages = []
+    #Messages received and decoded from the peer
+    self.numReceivedMessages = 0
     self.sentKeepAlives = 0
     self.waitingForKeepAlivePong = False
     self.__keepAliveLapse = 0
@@ -121,6 +123,16 @@ class BaseTransport:
       dataToSend = "%s%s:%s" % ( prefix, len( sCodedData ), sCodedData )
     else:
       dataToSend = "%s:%s" % ( len( sCodedData ), sCodedData )
+    return self.__sendBytes( dataToSend )
+
+  def sendRawFrame( self, sBuffer ):
+    """
+    Send a buffer as is, prefixed only by the raw frame magic and its length
+    """
+    self.__updateLastActionTimestamp()
+    return self.__sendBytes( "%s%s:%s" % ( BaseTransport.rawFrameMagic, len( sBuffer ), sBuffer ) )
+
+  def __sendBytes( self, dataToSend ):
     for index in range( 0, len( dataToSend ), self.packetSize ):
       bytesToSend = min( self.packetSize, len( dataToSend ) - index )
       packSentBytes = 0
@@ -175,40 +187,41 @@ class BaseTransport:
       #From here it must be a real message!
       #Process the size and remove the msg length from the bytestream
       pkgSize = int( self.byteStream[ :iSeparatorPosition ] )
-      pkgData = self.byteStream[ iSeparatorPosition + 1: ]
-      readSize = len( pkgData )
+      pkgStart = iSeparatorPosition + 1
+      readSize = len( self.byteStream ) - pkgStart
       if readSize >= pkgSize:
-        #If we already have all the data we need
-        data = pkgData[ :pkgSize ]
-        self.byteStream = pkgData[ pkgSize: ]
+        #If we already have all the data we need decode it in place
+        byteStream = self.byteStream
+        self.byteStream = byteStream[ pkgStart + pkgSize: ]
+        try:
+          data, pkgEnd = DEncode.decode( byteStream, pkgStart )
+          if pkgEnd != pkgStart + pkgSize:
+            raise ValueError( "Message length mismatch" )
+        except Exception, e:
+          return S_ERROR( "Could not decode received data: %s" % str( e ) )
       else:
-        #If we still need to read stuff
-        pkgMem = cStringIO.StringIO()
-        pkgMem.write( pkgData )
-        #Receive while there's still data to be received
-        while readSize < pkgSize:
-          retVal = self._read( pkgSize - readSize, skipReadyCheck = True )
-          if not retVal[ 'OK' ]:
-            return retVal
-          if not retVal[ 'Value' ]:
-            return S_ERROR( "Peer closed connection" )
-          rcvData = retVal[ 'Value' ]
-          readSize += len( rcvData )
-          pkgMem.write( rcvData )
-          if maxBufferSize and readSize > maxBufferSize:
-            return S_ERROR( "Read limit exceeded (%s chars)" % maxBufferSize )
-        #Data is here! take it out from the bytestream, dencode and return
-        if readSize == pkgSize:
-          data = pkgMem.getvalue()
+        #If we still need to read stuff decode it as it arrives
+        decoder = DEncode.StreamDecoder()
+        try:
+          decoder.feed( self.byteStream[ pkgStart: ] )
           self.byteStream = ""
-        else: #readSize > pkgSize:
-          pkgMem.seek( 0, 0 )
-          data = pkgMem.read( pkgSize )
-          self.byteStream = pkgMem.read()
-      try:
-        data = DEncode.decode( data )[0]
-      except Exception, e:
-        return S_ERROR( "Could not decode received data: %s" % str( e ) )
+          #Receive while there's still data to be received
+          while readSize < pkgSize:
+            retVal = self._read( pkgSize - readSize, skipReadyCheck = True )
+            if not retVal[ 'OK' ]:
+              return retVal
+            if not retVal[ 'Value' ]:
+              return S_ERROR( "Peer closed connection" )
+            rcvData = retVal[ 'Value' ]
+            readSize += len( rcvData )
+            if maxBufferSize and readSize > maxBufferSize:
+              return S_ERROR( "Read limit exceeded (%s chars)" % maxBufferSize )
+            decoder.feed( rcvData )
+          #Data is here! get the decoded object
+          data = decoder.finish()
+        except ValueError, e:
+          return S_ERROR( "Could not decode received data: %s" % str( e ) )
+      self.numReceivedMessages += 1
       if idleReceive:
         self.receivedMessages.append( data )
         return S_OK()
@@ -217,6 +230,65 @@ class BaseTransport:
       gLogger.exception( "Network error while receiving data" )
       return S_ERROR( "Network error while receiving data: %s" % str( e ) )
 
+  def receiveRawFrame( self, maxBufferSize = 0 ):
+    """
+    Receive the next raw frame. If the next message in the stream is not a raw
+    frame it is received and decoded as usual. Raw frames are flagged with the
+    RawFrame key in the returned structure
+    """
+    self.__updateLastActionTimestamp()
+    if self.receivedMessages:
+      return self.receiveData( maxBufferSize )
+    maxBufferSize = max( maxBufferSize, 0 )
+    magicLen = len( BaseTransport.rawFrameMagic )
+    try:
+      while len( self.byteStream ) < magicLen:
+        retVal = self._read( 16384 )
+        if not retVal[ 'OK' ]:
+          return retVal
+        if not retVal[ 'Value' ]:
+          return S_ERROR( "Peer closed connection" )
+        self.byteStream += retVal[ 'Value' ]
+      if self.byteStream.find( BaseTransport.rawFrameMagic, 0, magicLen ) != 0:
+        return self.receiveData( maxBufferSize )
+      iSeparatorPosition = self.byteStream.find( ":", magicLen, magicLen + 10 )
+      while iSeparatorPosition == -1:
+        if len( self.byteStream ) > magicLen + 10:
+          return S_ERROR( "Invalid raw frame header" )
+        retVal = self._read( 16384 )
+        if not retVal[ 'OK' ]:
+          return retVal
+        if not retVal[ 'Value' ]:
+          return S_ERROR( "Peer closed connection" )
+        self.byteStream += retVal[ 'Value' ]
+        iSeparatorPosition = self.byteStream.find( ":", magicLen, magicLen + 10 )
+      pkgSize = int( self.byteStream[ magicLen:iSeparatorPosition ] )
+      if maxBufferSize and pkgSize > maxBufferSize:
+        return S_ERROR( "Read limit exceeded (%s chars)" % maxBufferSize )
+      pkgStart = iSeparatorPosition + 1
+      readSize = len( self.byteStream ) - pkgStart
+      if readSize >= pkgSize:
+        data = self.byteStream[ pkgStart : pkgStart + pkgSize ]
+        self.byteStream = self.byteStream[ pkgStart + pkgSize: ]
+      else:
+        chunks = [ self.byteStream[ pkgStart: ] ]
+        self.byteStream = ""
+        while readSize < pkgSize:
+          retVal = self._read( pkgSize - readSize, skipReadyCheck = True )
+          if not retVal[ 'OK' ]:
+            return retVal
+          if not retVal[ 'Value' ]:
+            return S_ERROR( "Peer closed connection" )
+          chunks.append( retVal[ 'Value' ] )
+          readSize += len( retVal[ 'Value' ] )
+        data = "".join( chunks )
+      result = S_OK( data )
+      result[ 'RawFrame' ] = True
+      return result
+    except Exception, e:
+      gLogger.exception( "Network error while receiving raw frame" )
+      return S_ERROR( "Network error while receiving data: %s" % str( e ) )
+
   def __processKeepAlive( self, maxBufferSize, blockAfterKeepAlive = True ):
     gLogger.debug( "Received Keep Alive" )
     #Next message down the stream will be the ka data
@@ -1,12 +1,15 @@
 # $HeadURL$
 __RCSID__ = "$Id$"
 
+import threading
 import GSI
 
 class SessionManager:
 
-  def __init__( self ):
+  def __init__( self, maxSessions = 1000 ):
     self.sessionsDict = {}
+    self.__maxSessions = maxSessions
+    self.__lock = threading.Lock()
 
   def __generateSession( self ):
     return GSI.SSL.Session()
@@ -23,6 +26,17 @@ class SessionManager:
     self.sessionsDict[ sessionId ].free()
 
   def set( self, sessionId, sessionObject ):
-    self.sessionsDict[ sessionId ] = sessionObject
-
-gSessionManager = SessionManager()
\ No newline at end of file
+    self.__lock.acquire()
+    try:
+      if sessionId not in self.sessionsDict and len( self.sessionsDict ) >= self.__maxSessions:
+        #Forget the expired sessions, or all of them if none expired
+        sessionsDict = dict( [ ( sId, self.sessionsDict[ sId ] ) for sId in self.sessionsDict
+                               if self.sessionsDict[ sId ].valid() ] )
+        if len( sessionsDict ) >= self.__maxSessions:
+          sessionsDict = {}
+        self.sessionsDict = sessionsDict
+      self.sessionsDict[ sessionId ] = sessionObject
+    finally:
+      self.__lock.release()
+
+gSessionManager = SessionManager()
@@ -4,6 +4,10 @@ __RCSID__ = "$Id$"
 import time
 import copy
 import os.path
+try:
+  import hashlib as md5
+except:
+  import md5
 import GSI
 from DIRAC.Core.Utilities.ReturnValues import S_ERROR, S_OK
 from DIRAC.Core.Utilities.Network import checkHostsMatch
@@ -19,10 +23,15 @@ class SocketInfo:
   __cachedCAsCRLs = False
   __cachedCAsCRLsLastLoaded = 0
   __cachedCAsCRLsLoadLock = LockRing().getLock()
-
+  #Client contexts ready to use keyed by credentials and options, see __getContextKey
+  __cachedContexts = {}
+  __cachedContextsTick = 0
+  __cachedContextsMaxSize = 100
+  __cachedContextsLock = LockRing().getLock()
 
   def __init__( self, infoDict, sslContext = None ):
     self.__retry = 0
+    self.__caLoadTime = 0
     self.infoDict = infoDict
     if sslContext:
       self.sslContext = sslContext
@@ -185,6 +194,8 @@ class SocketInfo:
         SocketInfo.__cachedCAsCRLs = ( [ casDict[k][1] for k in casDict ],
                                        [ crlsDict[k][1] for k in crlsDict ] )
         SocketInfo.__cachedCAsCRLsLastLoaded = time.time()
+        #Contexts with the old CAs and CRLs can't be reused
+        SocketInfo.__clearCachedContexts()
     except:
       gLogger.exception( "ASD" )
     finally:
@@ -199,6 +210,75 @@ class SocketInfo:
       caStore.add_crl( crl )
     return S_OK( caStore )
 
+  @classmethod
+  def __clearCachedContexts( cls ):
+    cls.__cachedContextsLock.acquire()
+    try:
+      cls.__cachedContexts = {}
+    finally:
+      cls.__cachedContextsLock.release()
+
+  def __fileStamp( self, filePath ):
+    """
+    Identify the contents of a file without reading it
+    """
+    try:
+      fileStat = os.stat( filePath )
+    except OSError:
+      return ( filePath, )
+    return ( filePath, fileStat.st_ino, fileStat.st_size, fileStat.st_mtime )
+
+  def __getContextKey( self, credentials ):
+    """
+    Key of the client context for the credentials and the SSL options. Server
+    contexts are not shared
+    """
+    if not self.__getValue( 'clientMode', False ):
+      return False
+    options = tuple( [ self.__getValue( optName, False ) for optName in ( 'sslMethod', 'sslCiphers', 'skipCACheck',
+                                                                           'gsiEnable', 'IgnoreCRLs' ) ] )
+    return ( credentials, options )
+
+  def __useCachedContext( self, contextKey ):
+    """
+    Reuse the context loaded with the same credentials if the CAs are still fresh
+    """
+    if not contextKey:
+      return False
+    checkCAs = not self.__getValue( 'skipCACheck', False )
+    if checkCAs and time.time() - SocketInfo.__cachedCAsCRLsLastLoaded > 900:
+      #Let __getCAStore reload them
+      return False
+    SocketInfo.__cachedContextsLock.acquire()
+    try:
+      if contextKey not in SocketInfo.__cachedContexts:
+        return False
+      entry = SocketInfo.__cachedContexts[ contextKey ]
+      if checkCAs and entry[1] != SocketInfo.__cachedCAsCRLsLastLoaded:
+        del( SocketInfo.__cachedContexts[ contextKey ] )
+        return False
+      SocketInfo.__cachedContextsTick += 1
+      entry[2] = SocketInfo.__cachedContextsTick
+      self.sslContext = entry[0]
+      return True
+    finally:
+      SocketInfo.__cachedContextsLock.release()
+
+  def __cacheContext( self, contextKey ):
+    if not contextKey:
+      return
+    SocketInfo.__cachedContextsLock.acquire()
+    try:
+      cachedContexts = SocketInfo.__cachedContexts
+      if len( cachedContexts ) >= SocketInfo.__cachedContextsMaxSize:
+        byAge = sorted( cachedContexts, key = lambda cKey: cachedContexts[ cKey ][2] )
+        for cKey in byAge[ : max( 1, SocketInfo.__cachedContextsMaxSize / 10 ) ]:
+          del( cachedContexts[ cKey ] )
+      SocketInfo.__cachedContextsTick += 1
+      cachedContexts[ contextKey ] = [ self.sslContext, self.__caLoadTime, SocketInfo.__cachedContextsTick ]
+    finally:
+      SocketInfo.__cachedContextsLock.release()
+
 
   def __createContext( self ):
     clientContext = self.__getValue( 'clientMode', False )
@@ -234,6 +314,7 @@ class SocketInfo:
       if not result[ 'OK' ]:
         return result
       caStore = result[ 'Value' ]
+      self.__caLoadTime = SocketInfo.__cachedCAsCRLsLastLoaded
       self.sslContext.set_cert_store( caStore )
     else:
       self.sslContext.set_verify( GSI.SSL.VERIFY_NONE, None, gsiEnable ) # Demand a certificate
@@ -245,6 +326,9 @@ class SocketInfo:
       return S_ERROR( "No valid certificate or key found" )
     self.setLocalCredentialsLocation( certKeyTuple )
     gLogger.debug( "Using certificate %s\nUsing key %s" % certKeyTuple )
+    contextKey = self.__getContextKey( ( self.__fileStamp( certKeyTuple[0] ), self.__fileStamp( certKeyTuple[1] ) ) )
+    if self.__useCachedContext( contextKey ):
+      return S_OK()
     retVal = self.__createContext()
     if not retVal[ 'OK' ]:
       return retVal
@@ -252,6 +336,7 @@ class SocketInfo:
     self.sslContext.set_verify_depth( 50 )
     self.sslContext.use_certificate_chain_file( certKeyTuple[0] )
     self.sslContext.use_privatekey_file( certKeyTuple[1] )
+    self.__cacheContext( contextKey )
     return S_OK()
 
   def __generateContextWithProxy( self ):
@@ -265,22 +350,30 @@ class SocketInfo:
         return S_ERROR( "No valid proxy found" )
     self.setLocalCredentialsLocation( ( proxyPath, proxyPath ) )
     gLogger.debug( "Using proxy %s" % proxyPath )
+    contextKey = self.__getContextKey( self.__fileStamp( proxyPath ) )
+    if self.__useCachedContext( contextKey ):
+      return S_OK()
     retVal = self.__createContext()
     if not retVal[ 'OK' ]:
       return retVal
     self.sslContext.use_certificate_chain_file( proxyPath )
     self.sslContext.use_privatekey_file( proxyPath )
+    self.__cacheContext( contextKey )
     return S_OK()
 
   def __generateContextWithProxyString( self ):
     proxyString = self.infoDict[ 'proxyString' ]
     self.setLocalCredentialsLocation( ( proxyString, proxyString ) )
     gLogger.debug( "Using string proxy" )
+    contextKey = self.__getContextKey( md5.md5( proxyString ).hexdigest() )
+    if self.__useCachedContext( contextKey ):
+      return S_OK()
     retVal = self.__createContext()
     if not retVal[ 'OK' ]:
       return retVal
     self.sslContext.use_certificate_chain_string( proxyString )
     self.sslContext.use_privatekey_string( proxyString )
+    self.__cacheContext( contextKey )
     return S_OK()
 
   def __generateServerContext( self ):
@@ -0,0 +1,120 @@
+""" Test for the persistent connection pool and the retries of the RPC client on pooled connections
+"""
+
+import socket
+import unittest
+
+from mock import MagicMock, patch
+
+from DIRAC import S_OK, S_ERROR
+from DIRAC.Core.DISET.private import ConnectionPool as ConnectionPoolModule
+from DIRAC.Core.DISET.private.ConnectionPool import ConnectionPool
+from DIRAC.Core.DISET.private.InnerRPCClient import InnerRPCClient
+from DIRAC.Core.DISET.private.Transports.PlainTransport import PlainTransport
+
+class ConnectionPoolTestCase( unittest.TestCase ):
+  """ Reuse and expiration of the idle connections
+  """
+  def setUp( self ):
+    self.trPool = MagicMock()
+    self.trPool.get.side_effect = lambda trid: "transport-%s" % trid
+    patcher = patch.object( ConnectionPoolModule, 'getGlobalTransportPool', return_value = self.trPool )
+    patcher.start()
+    self.addCleanup( patcher.stop )
+    self.pool = ConnectionPool()
+
+  def test_reuse( self ):
+    self.assertEqual( self.pool.get( "key" ), None )
+    self.pool.release( "key", "trid1", 10 )
+    self.assertEqual( self.pool.get( "otherKey" ), None )
+    self.assertEqual( self.pool.get( "key" ), ( "trid1", "transport-trid1" ) )
+    #A connection is handed to one client at a time
+    self.assertEqual( self.pool.get( "key" ), None )
+    self.assertEqual( self.pool.getStats(), { 'hits' : 1, 'misses' : 3, 'idle' : 0 } )
+    self.assertFalse( self.trPool.close.called )
+
+  def test_expiry( self ):
+    with patch.object( ConnectionPoolModule.time, 'time', return_value = 1000 ):
+      self.pool.release( "key", "trid1", 10 )
+      #Too short to be kept with the safety margin
+      self.pool.release( "key", "trid2", 1 )
+    self.trPool.close.assert_called_once_with( "trid2" )
+    with patch.object( ConnectionPoolModule.time, 'time', return_value = 1010 ):
+      self.assertEqual( self.pool.get( "key" ), None )
+    self.trPool.close.assert_called_with( "trid1" )
+
+  def test_maxIdle( self ):
+    pool = ConnectionPool( maxIdlePerKey = 1 )
+    pool.release( "key", "trid1", 10 )
+    pool.release( "key", "trid2", 10 )
+    self.trPool.close.assert_called_once_with( "trid2" )
+
+class FakeRPCClient( InnerRPCClient ):
+  """ RPC client without any configuration discovery
+  """
+  def __init__( self ):
+    pass
+
+class PooledRetryTestCase( unittest.TestCase ):
+  """ Only a pooled connection the server did not answer on is retried on a new one
+  """
+  def getClient( self, proposalResults ):
+    client = FakeRPCClient()
+    #No more generic retries
+    client._InnerRPCClient__retry = 3
+    pooledTransport = MagicMock()
+    newTransport = MagicMock()
+    newTransport.receiveData.return_value = S_OK( "result" )
+    client._getPooledConnection = MagicMock( side_effect = [ S_OK( ( "pooled", pooledTransport ) ), S_OK( None ) ] )
+    client._connect = MagicMock( return_value = S_OK( ( "new", newTransport ) ) )
+    client._usePersistentConnection = MagicMock( return_value = True )
+    client._proposeAction = MagicMock( side_effect = proposalResults )
+    client._releaseConnection = MagicMock()
+    client._disconnect = MagicMock()
+    return client
+
+  def test_staleConnection( self ):
+    stale = S_ERROR( "Peer closed connection" )
+    stale[ 'noServerReply' ] = True
+    client = self.getClient( [ stale, S_OK( { 'keepConnected' : 10 } ) ] )
+    result = client._InnerRPCClient__executeAction( ( "RPC", "ping" ), () )
+    self.assertEqual( result, S_OK( "result" ) )
+    self.assertEqual( client._connect.call_count, 1 )
+    client._disconnect.assert_called_once_with( "pooled" )
+    client._releaseConnection.assert_called_once_with( "new", 10 )
+
+  def test_rejection( self ):
+    client = self.getClient( [ S_ERROR( "Unauthorized query" ) ] )
+    result = client._InnerRPCClient__executeAction( ( "RPC", "ping" ), () )
+    self.assertEqual( result[ 'Message' ], "Unauthorized query" )
+    self.assertFalse( client._connect.called )
+    client._disconnect.assert_called_once_with( "pooled" )
+
+  def test_noServerReply( self ):
+    client = FakeRPCClient()
+    client._BaseClient__initStatus = S_OK()
+    client._BaseClient__URLTuple = ( "dips", "localhost", 9135, "Framework/Test" )
+    client._BaseClient__extraCredentials = ""
+    client.setup = "Setup"
+    client.vo = "vo"
+    for serverReply, noServerReply in ( ( None, True ), ( S_ERROR( "Unauthorized query" ), False ) ):
+      transports = []
+      for oSocket in socket.socketpair():
+        transport = PlainTransport( "", timeout = 20 )
+        transport.setClientSocket( oSocket )
+        transports.append( transport )
+      #The server either rejects the proposal or has closed the idle connection
+      if serverReply:
+        transports[1].sendData( serverReply )
+      else:
+        transports[1].close()
+      result = client._proposeAction( transports[0], ( "RPC", "ping" ), keepConnected = True )
+      for transport in transports:
+        transport.close()
+      self.assertFalse( result[ 'OK' ] )
+      self.assertEqual( result.get( 'noServerReply', False ), noServerReply )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( ConnectionPoolTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( PooledRetryTestCase ) )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,239 @@
+""" Test for the stop and wait and the windowed file transfers of the FileHelper over a socket pair
+"""
+
+import socket
+import threading
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK
+from DIRAC.Core.DISET.private.FileHelper import FileHelper
+from DIRAC.Core.DISET.private.Transports.PlainTransport import PlainTransport
+from DIRAC.Core.DISET.RequestHandler import RequestHandler
+from DIRAC.Core.DISET.TransferClient import TransferClient
+
+PACKET_SIZE = 1000
+
+def getTransports():
+  """ Two connected transports that give up after a while instead of blocking forever
+  """
+  transports = []
+  for oSocket in socket.socketpair():
+    transport = PlainTransport( "", timeout = 20 )
+    transport.setClientSocket( oSocket )
+    transports.append( transport )
+  return transports
+
+def getData( size ):
+  return ( "".join( [ chr( i ) for i in range( 256 ) ] ) * ( size / 256 + 1 ) )[ :size ]
+
+class InThread( threading.Thread ):
+  """ Run a function in a thread and keep its result
+  """
+  def __init__( self, function, *args ):
+    threading.Thread.__init__( self )
+    self.function = function
+    self.args = args
+    self.result = None
+    self.setDaemon( True )
+    self.start()
+
+  def run( self ):
+    self.result = self.function( *self.args )
+
+  def getResult( self ):
+    self.join( 30 )
+    return self.result
+
+class FileHelperTestCase( unittest.TestCase ):
+  """ Transfers between two FileHelpers
+  """
+  def setUp( self ):
+    self.transports = getTransports()
+
+  def tearDown( self ):
+    for transport in self.transports:
+      transport.close()
+
+  def getHelpers( self, senderWindow, receiverWindow = None ):
+    if receiverWindow is None:
+      receiverWindow = senderWindow
+    sender = FileHelper( self.transports[0] )
+    sender.packetSize = PACKET_SIZE
+    sender.setDirection( "send" )
+    sender.setTransferWindow( senderWindow )
+    receiver = FileHelper( self.transports[1] )
+    receiver.setDirection( "receive" )
+    receiver.setTransferWindow( receiverWindow )
+    return sender, receiver
+
+  def assertCleanStream( self ):
+    """ Nothing of the transfer is left in the stream in any direction
+    """
+    for fromTransport, toTransport in ( self.transports, reversed( self.transports ) ):
+      self.assertTrue( fromTransport.sendData( S_OK( "next" ) )[ 'OK' ] )
+      self.assertEqual( toTransport.receiveData(), S_OK( "next" ) )
+
+  def test_transfer( self ):
+    for window in range( 17 ):
+      for size in ( 0, 1, 8192, 51203 ):
+        sender, receiver = self.getHelpers( window )
+        data = getData( size )
+        sendThread = InThread( sender.BufferToNetwork, data )
+        result = receiver.networkToString()
+        self.assertEqual( result, S_OK( data ), "window %s, size %s" % ( window, size ) )
+        self.assertTrue( sendThread.getResult()[ 'OK' ] )
+        self.assertEqual( sender.getTransferedBytes(), size )
+        self.assertEqual( receiver.getTransferedBytes(), size )
+        self.assertTrue( sender.finishedTransmission() )
+        self.assertTrue( receiver.finishedTransmission() )
+        self.assertCleanStream()
+
+  def test_receiverAbort( self ):
+    for window in ( 0, 1, 2, 3, 8, 16 ):
+      sender, receiver = self.getHelpers( window )
+      sendThread = InThread( sender.BufferToNetwork, getData( 51203 ) )
+      for i in range( 3 ):
+        self.assertEqual( receiver.receiveData(), S_OK( getData( 51203 )[ i * PACKET_SIZE:( i + 1 ) * PACKET_SIZE ] ) )
+      receiver.markAsTransferred()
+      self.assertTrue( sendThread.getResult()[ 'OK' ], "window %s" % window )
+      self.assertTrue( receiver.finishedTransmission() )
+      self.assertCleanStream()
+
+  def __sendAndAbort( self, sender, data ):
+    for i in range( 0, len( data ), PACKET_SIZE ):
+      result = sender.sendData( data[ i:i + PACKET_SIZE ] )
+      if not result[ 'OK' ]:
+        return result
+    return sender.markAsTransferred()
+
+  def test_senderAbort( self ):
+    data = getData( 3 * PACKET_SIZE )
+    for window in ( 0, 1, 2, 3, 8, 16 ):
+      sender, receiver = self.getHelpers( window )
+      sendThread = InThread( self.__sendAndAbort, sender, data )
+      #The receiver gets what was sent before the abort
+      self.assertEqual( receiver.networkToString(), S_OK( data ), "window %s" % window )
+      sendThread.getResult()
+      self.assertTrue( sender.finishedTransmission() )
+      self.assertCleanStream()
+
+  def test_maxFileSize( self ):
+    for window in ( 0, 1, 8, 16 ):
+      for maxFileSize in ( 1500, 2500, 51202 ):
+        sender, receiver = self.getHelpers( window )
+        sendThread = InThread( sender.BufferToNetwork, getData( 51203 ) )
+        result = receiver.networkToString( maxFileSize = maxFileSize )
+        self.assertFalse( result[ 'OK' ], "window %s, max size %s" % ( window, maxFileSize ) )
+        self.assertTrue( "maximum size" in result[ 'Message' ], result[ 'Message' ] )
+        #The sender is told to stop, or finds the error as the reply to the transfer if it already sent everything
+        result = sendThread.getResult()
+        if result[ 'OK' ]:
+          result = self.transports[0].receiveData()
+        self.assertFalse( result[ 'OK' ], "window %s, max size %s" % ( window, maxFileSize ) )
+        self.assertTrue( "maximum file size" in result[ 'Message' ], result[ 'Message' ] )
+        self.tearDown()
+        self.setUp()
+
+class FakeTransferClient( TransferClient ):
+  """ TransferClient using an already connected transport
+  """
+  def __init__( self, transport ):
+    self.transport = transport
+
+  def _connect( self ):
+    return S_OK( ( 1, self.transport ) )
+
+  def _proposeAction( self, transport, action ):
+    return S_OK()
+
+  def _disconnect( self, trid ):
+    pass
+
+class FakeHandler( RequestHandler ):
+  """ Handler recording the window its file helpers were given
+  """
+  def __init__( self, maxTransferWindow ):
+    self.maxTransferWindow = maxTransferWindow
+    self.transferWindows = []
+
+  def srv_getCSOption( self, optionName, defaultValue = False ):
+    if optionName == "MaxTransferWindow" and self.maxTransferWindow is not None:
+      return self.maxTransferWindow
+    return defaultValue
+
+  def transfer_toClient( self, fileId, token, fileHelper ):
+    self.transferWindows.append( fileHelper.getTransferWindow() )
+    return fileHelper.BufferToNetwork( getData( 8192 ) )
+
+def getHandler( transport, maxTransferWindow = None ):
+  """ Handler serving transfers through the given transport
+  """
+  handler = FakeHandler( maxTransferWindow )
+  trPool = MagicMock()
+  trPool.receive.side_effect = lambda trid: transport.receiveData()
+  trPool.send.side_effect = lambda trid, data: transport.sendData( data )
+  trPool.get.return_value = transport
+  handler._RequestHandler__trPool = trPool
+  handler._RequestHandler__trid = 1
+  handler._RequestHandler__lockManager = MagicMock()
+  handler._RequestHandler__logRemoteQuery = MagicMock()
+  return handler
+
+class NegotiationTestCase( unittest.TestCase ):
+  """ Agreeing on the window of a transfer between the TransferClient and the RequestHandler
+  """
+  def setUp( self ):
+    self.transports = getTransports()
+
+  def tearDown( self ):
+    for transport in self.transports:
+      transport.close()
+
+  def receiveFile( self, clientWindow, maxTransferWindow = None ):
+    handler = getHandler( self.transports[1], maxTransferWindow )
+    serveThread = InThread( handler._RequestHandler__doFileTransfer, "ToClient" )
+    client = FakeTransferClient( self.transports[0] )
+    result = client._sendTransferHeader( "ToClient", ( "fileId", "token" ), clientWindow )
+    self.assertTrue( result[ 'OK' ] )
+    fileHelper = FileHelper( self.transports[0] )
+    fileHelper.setTransferWindow( result[ 'TransferWindow' ] )
+    self.assertEqual( fileHelper.networkToString(), S_OK( getData( 8192 ) ) )
+    self.assertTrue( serveThread.getResult()[ 'OK' ] )
+    return result[ 'TransferWindow' ], handler.transferWindows[0]
+
+  def test_negotiation( self ):
+    self.assertEqual( self.receiveFile( FileHelper.defaultTransferWindow ), ( 8, 8 ) )
+    self.assertEqual( self.receiveFile( 32 ), ( 16, 16 ) )
+    self.assertEqual( self.receiveFile( 8, maxTransferWindow = 4 ), ( 4, 4 ) )
+    #Windowed transfers disabled in the service
+    self.assertEqual( self.receiveFile( 8, maxTransferWindow = 0 ), ( 0, 0 ) )
+
+  def test_legacyFallback( self ):
+    #Client not proposing any window
+    self.assertEqual( self.receiveFile( 0 ), ( 0, 0 ) )
+    #Server not knowing about windows: the header is accepted without echoing any window back
+    serverTransport = self.transports[1]
+    def legacyServer():
+      header = serverTransport.receiveData()
+      serverTransport.sendData( S_OK( "Accepted" ) )
+      fileHelper = FileHelper( serverTransport )
+      fileHelper.setDirection( "send" )
+      fileHelper.packetSize = PACKET_SIZE
+      return header, fileHelper.BufferToNetwork( getData( 8192 ) )
+    serveThread = InThread( legacyServer )
+    client = FakeTransferClient( self.transports[0] )
+    result = client._sendTransferHeader( "ToClient", ( "fileId", "token" ), 8 )
+    self.assertEqual( result[ 'TransferWindow' ], 0 )
+    fileHelper = FileHelper( self.transports[0] )
+    fileHelper.setTransferWindow( result[ 'TransferWindow' ] )
+    self.assertEqual( fileHelper.networkToString(), S_OK( getData( 8192 ) ) )
+    header, sendResult = serveThread.getResult()
+    self.assertEqual( header[ 'TransferWindow' ], 8 )
+    self.assertTrue( sendResult[ 'OK' ] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( FileHelperTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( NegotiationTestCase ) )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,118 @@
+""" Test for the counters and the supervision of the clone processes of the ServiceReactor
+"""
+
+import unittest
+
+from mock import MagicMock, patch
+
+from DIRAC.Core.DISET import ServiceReactor as ServiceReactorModule
+from DIRAC.Core.DISET.ServiceReactor import ServiceReactor, ReactorStats
+
+class FakeProcess( object ):
+  """ multiprocessing.Process that never runs its target
+  """
+  started = []
+
+  def __init__( self, target, args ):
+    self.args = args
+    self.pid = len( FakeProcess.started ) + 1000
+    self.alive = False
+    self.exitcode = None
+    self.terminated = False
+
+  def start( self ):
+    self.alive = True
+    FakeProcess.started.append( self )
+
+  def is_alive( self ):
+    return self.alive
+
+  def terminate( self ):
+    self.terminated = True
+
+  def die( self, exitcode ):
+    self.alive = False
+    self.exitcode = exitcode
+
+class ReactorStatsTestCase( unittest.TestCase ):
+  """ Counters of the main process and of the clone slots
+  """
+  def test_slots( self ):
+    stats = ReactorStats()
+    stats.connectionStablished()
+    stats.queryServed()
+    stats.allocateSlots( [ 'A', 'A', 'B' ] )
+    self.assertEqual( stats.getNumSlots( 'A' ), 2 )
+    self.assertEqual( stats.getNumSlots( 'C' ), 0 )
+    #Counted before the allocation, still in the slot of the main process
+    self.assertEqual( stats.getCounts(), ( 1, 1 ) )
+    stats.setSlot( 1 )
+    stats.queryServed()
+    stats.setSlot( 2 )
+    stats.connectionStablished()
+    stats.queryServed()
+    stats.setSlot( 3 )
+    stats.connectionStablished()
+    self.assertEqual( stats.getCounts( 'A' ), ( 1, 2 ) )
+    self.assertEqual( stats.getCounts( 'B' ), ( 1, 0 ) )
+    self.assertEqual( stats.getCounts(), ( 3, 3 ) )
+
+class CloneSupervisionTestCase( unittest.TestCase ):
+  """ Restarting the clones of a service with fake processes
+  """
+  def setUp( self ):
+    FakeProcess.started = []
+    self.processPatch = patch.object( ServiceReactorModule.multiprocessing, 'Process', FakeProcess )
+    self.processPatch.start()
+    self.reactor = ServiceReactor()
+    self.service = MagicMock()
+    self.reactor._ServiceReactor__services = { 'Svc' : self.service }
+    self.reactor._ServiceReactor__cloneProcesses = { 'Svc' : 2 }
+    self.reactor._ServiceReactor__startClones()
+    self.checkClones = self.reactor._ServiceReactor__checkClones
+
+  def tearDown( self ):
+    self.processPatch.stop()
+
+  def test_restart( self ):
+    self.assertEqual( len( FakeProcess.started ), 2 )
+    self.assertEqual( sorted( [ proc.args[1:] for proc in FakeProcess.started ] ), [ ( 0, 1 ), ( 1, 2 ) ] )
+    self.assertTrue( self.checkClones()[ 'OK' ] )
+    self.assertEqual( len( FakeProcess.started ), 2 )
+    dead = FakeProcess.started[0]
+    dead.die( -9 )
+    self.assertTrue( self.checkClones()[ 'OK' ] )
+    self.assertEqual( len( FakeProcess.started ), 3 )
+    #The new process takes the clone id and the stats slot of the dead one
+    self.assertEqual( FakeProcess.started[2].args, dead.args )
+    #SIGHUP replaces all of them, the old ones are stopped after the new ones start
+    self.reactor._ServiceReactor__restartClones = True
+    self.assertTrue( self.checkClones()[ 'OK' ] )
+    self.assertEqual( len( FakeProcess.started ), 5 )
+    self.assertTrue( FakeProcess.started[1].terminated )
+    self.assertTrue( FakeProcess.started[2].terminated )
+    self.assertFalse( FakeProcess.started[3].terminated )
+
+  def test_initFailed( self ):
+    FakeProcess.started[1].die( ServiceReactor.CLONE_INIT_FAILED )
+    result = self.checkClones()
+    self.assertFalse( result[ 'OK' ] )
+    self.assertEqual( len( FakeProcess.started ), 2 )
+
+  def test_marks( self ):
+    stats = self.reactor._ServiceReactor__stats
+    stats.setSlot( 1 )
+    stats.connectionStablished()
+    stats.queryServed()
+    stats.queryServed()
+    self.checkClones()
+    self.service.addCloneMarks.assert_called_with( 1, 2 )
+    stats.queryServed()
+    self.checkClones()
+    #Only what was served since the previous check is reported
+    self.service.addCloneMarks.assert_called_with( 0, 1 )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( ReactorStatsTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( CloneSupervisionTestCase ) )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
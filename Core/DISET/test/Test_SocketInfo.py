@@ -0,0 +1,113 @@
+""" Test for the cache of client SSL contexts and the bounded SSL session manager, with a stubbed GSI
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock, patch
+
+from DIRAC.Core.DISET.private.Transports.SSL import SocketInfo as SocketInfoModule
+from DIRAC.Core.DISET.private.Transports.SSL.SocketInfo import SocketInfo
+from DIRAC.Core.DISET.private.Transports.SSL.SessionManager import SessionManager
+
+class SocketInfoContextCacheTestCase( unittest.TestCase ):
+  """ Client contexts are reused while the credentials and the CAs do not change
+  """
+  def setUp( self ):
+    self.tmpDir = tempfile.mkdtemp()
+    self.casDir = os.path.join( self.tmpDir, "certificates" )
+    os.mkdir( self.casDir )
+    self.proxyPath = os.path.join( self.tmpDir, "proxy" )
+    self.writeFile( self.proxyPath, "proxy" )
+    self.gsi = MagicMock()
+    #A new context object per context built
+    self.gsi.SSL.Context.side_effect = lambda method: MagicMock()
+    for patcher in ( patch.object( SocketInfoModule, 'GSI', self.gsi ),
+                     patch.object( SocketInfoModule.Locations, 'getCAsLocation', return_value = self.casDir ) ):
+      patcher.start()
+      self.addCleanup( patcher.stop )
+    SocketInfo._SocketInfo__cachedContexts = {}
+    SocketInfo._SocketInfo__cachedCAsCRLs = False
+    SocketInfo._SocketInfo__cachedCAsCRLsLastLoaded = 0
+
+  def tearDown( self ):
+    shutil.rmtree( self.tmpDir )
+    SocketInfo._SocketInfo__cachedContexts = {}
+
+  def writeFile( self, filePath, contents ):
+    fd = open( filePath, "w" )
+    fd.write( contents )
+    fd.close()
+
+  def getContext( self, proxyPath = None ):
+    return SocketInfo( { 'clientMode' : True, 'proxyLocation' : proxyPath or self.proxyPath } ).getSSLContext()
+
+  def test_sameKey( self ):
+    context = self.getContext()
+    self.assertTrue( context is self.getContext() )
+    self.assertEqual( self.gsi.SSL.Context.call_count, 1 )
+    context.use_certificate_chain_file.assert_called_once_with( self.proxyPath )
+    #Other SSL options do not share the context
+    otherContext = SocketInfo( { 'clientMode' : True, 'proxyLocation' : self.proxyPath,
+                                 'skipCACheck' : True } ).getSSLContext()
+    self.assertFalse( otherContext is context )
+
+  def test_newCredentials( self ):
+    context = self.getContext()
+    #Renewed proxy in place
+    fileStat = os.stat( self.proxyPath )
+    os.utime( self.proxyPath, ( fileStat.st_atime, fileStat.st_mtime + 10 ) )
+    newContext = self.getContext()
+    self.assertFalse( newContext is context )
+    self.assertTrue( newContext is self.getContext() )
+    self.assertEqual( self.gsi.SSL.Context.call_count, 2 )
+
+  def test_caReload( self ):
+    context = self.getContext()
+    otherProxyPath = os.path.join( self.tmpDir, "otherProxy" )
+    self.writeFile( otherProxyPath, "otherProxy" )
+    otherContext = self.getContext( otherProxyPath )
+    self.assertEqual( len( SocketInfo._SocketInfo__cachedContexts ), 2 )
+    #CAs and CRLs too old, the next context reloads them
+    SocketInfo._SocketInfo__cachedCAsCRLsLastLoaded -= 1000
+    newContext = self.getContext()
+    self.assertFalse( newContext is context )
+    self.assertEqual( len( SocketInfo._SocketInfo__cachedContexts ), 1 )
+    self.assertFalse( self.getContext( otherProxyPath ) is otherContext )
+    self.assertEqual( self.gsi.SSL.Context.call_count, 4 )
+
+class FakeSession( object ):
+  """ SSL session with a settable validity
+  """
+  def __init__( self, valid = True ):
+    self.isValid = valid
+
+  def valid( self ):
+    return self.isValid
+
+class SessionManagerTestCase( unittest.TestCase ):
+  """ Eviction of the sessions once the manager is full
+  """
+  def test_eviction( self ):
+    manager = SessionManager( maxSessions = 3 )
+    manager.set( "s1", FakeSession() )
+    manager.set( "s2", FakeSession( valid = False ) )
+    manager.set( "s3", FakeSession() )
+    #Replacing a known session does not evict anything
+    manager.set( "s3", FakeSession() )
+    self.assertEqual( sorted( manager.sessionsDict ), [ "s1", "s2", "s3" ] )
+    #Full, the expired session goes
+    manager.set( "s4", FakeSession() )
+    self.assertEqual( sorted( manager.sessionsDict ), [ "s1", "s3", "s4" ] )
+    self.assertTrue( manager.isValid( "s4" ) )
+    self.assertFalse( manager.isValid( "s2" ) )
+    #Full of valid sessions, all of them go
+    manager.set( "s5", FakeSession() )
+    self.assertEqual( sorted( manager.sessionsDict ), [ "s5" ] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( SocketInfoContextCacheTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( SessionManagerTestCase ) )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
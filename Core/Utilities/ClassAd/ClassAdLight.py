@@ -4,100 +4,175 @@
 
 """ ClassAd Class - a light purely Python representation of the
     Condor ClassAd library.
+
+    JDLs are split at every ; and the pieces are only joined again when a
+    string, list or sub JDL was left open. The attributes of the last parsed
+    JDLs are kept in a cache keyed by the JDL and bounded by their total length,
+    so the same JDL going
+    through the several stages of a job submission is only analysed once per
+    process.
 """
 
 __RCSID__ = "$Id$"
 
+import re
+import threading
+
+class ClassAdParseCache( object ):
+  """ Cache of the attributes of the last parsed JDLs, bounded by the total length of the JDLs
+      and dropping the least recently used ones
+  """
+
+  def __init__( self, maxLength = 10 * 1024 * 1024 ):
+    self.maxLength = maxLength
+    self.__lock = threading.Lock()
+    # JDL -> [ contents, last use ]
+    self.__cache = {}
+    self.__length = 0
+    self.__tick = 0
+
+  def get( self, jdl ):
+    """ Get a copy of the attributes of a JDL or None if it is not cached
+    """
+    self.__lock.acquire()
+    try:
+      entry = self.__cache.get( jdl )
+      if entry is None:
+        return None
+      self.__tick += 1
+      entry[1] = self.__tick
+      return dict( entry[0] )
+    finally:
+      self.__lock.release()
+
+  def add( self, jdl, contents ):
+    # The attributes take about as much memory as the JDL they come from
+    if len( jdl ) > self.maxLength:
+      return
+    self.__lock.acquire()
+    try:
+      if jdl in self.__cache:
+        self.__length -= len( jdl )
+        del self.__cache[ jdl ]
+      if self.__length + len( jdl ) > self.maxLength:
+        # Make room for a tenth of the cache at once
+        byAge = sorted( self.__cache, key = lambda cKey: self.__cache[ cKey ][1] )
+        for cKey in byAge:
+          if self.__length + len( jdl ) <= self.maxLength - self.maxLength / 10:
+            break
+          self.__length -= len( cKey )
+          del self.__cache[ cKey ]
+      self.__tick += 1
+      self.__cache[ jdl ] = [ dict( contents ), self.__tick ]
+      self.__length += len( jdl )
+    finally:
+      self.__lock.release()
+
+  def clear( self ):
+    self.__lock.acquire()
+    try:
+      self.__cache = {}
+      self.__length = 0
+    finally:
+      self.__lock.release()
+
+gClassAdParseCache = ClassAdParseCache()
+
 class ClassAd:
 
+  # Rest of a string up to its closing quote, possibly with escaped characters
+  __stringEnd = re.compile( r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL )
+
   def __init__( self, jdl ):
     """ClassAd constructor from a JDL string
     """
     self.contents = {}
-    result = self.__analyse_jdl( jdl )
+    result = gClassAdParseCache.get( jdl )
+    if result is None:
+      result = self.__analyse_jdl( jdl )
+      gClassAdParseCache.add( jdl, result )
     if result:
       self.contents = result
 
-  def __analyse_jdl( self, jdl, index = 0 ):
-    """Analyse one [] jdl enclosure
+  def __analyse_jdl( self, jdl ):
+    """Analyse one [] jdl enclosure in a single pass
     """
-
     jdl = jdl.strip()
-
-    # Strip all the blanks first
-    #temp = jdl.replace(' ','').replace('\n','')
-    temp = jdl
-
     result = {}
 
-    if temp[0] != '[' or temp[-1] != ']':
+    if not jdl or jdl[0] != '[' or jdl[-1] != ']':
       print "Invalid JDL: it should start with [ and end with ]"
       return result
 
-    # Parse the jdl string now
-    body = temp[1:-1]
-    index = 0
-    namemode = 1
-    valuemode = 0
-    while index < len( body ):
-      if namemode:
-        ind = body.find( "=", index )
-        if ind != -1:
-          name = body[index:ind]
-          index = ind + 1
-          valuemode = 1
-          namemode = 0
-        else:
-          break
-      elif valuemode:
-        ind1 = body.find( "[", index )
-        ind2 = body.find( ";", index )
-        if ind1 != -1 and ind1 < ind2:
-          value, newind = self.__find_subjdl( body, ind1 )
-        elif ind1 == -1 and ind2 == -1:
-          value = body[index:]
-          newind = len( body )
-        else:
-          if index == ind2:
-            return {}
-          else:
-            value = body[index:ind2]
-            newind = ind2 + 1
-
-        result[name.strip()] = value.strip().replace( '\n', '' )
-        index = newind
-        valuemode = 0
-        namemode = 1
+    # Usually every ; ends a value. The pieces of a value holding a ; in a string,
+    # list or sub JDL are joined back until nothing is left open
+    pieces = jdl[1:-1].split( ';' )
+    numPieces = len( pieces )
+    iPiece = 0
+    while iPiece < numPieces:
+      name, equal, value = pieces[iPiece].partition( '=' )
+      iPiece += 1
+      # Skip anything not assigned
+      if not equal:
+        continue
+      # A ; right after the = makes the whole JDL invalid, blank values are kept as ''
+      if not value and iPiece < numPieces:
+        return {}
+      # Most values are a single string, a list of strings or have no string at all
+      stripped = value.strip()
+      if '"' not in stripped:
+        closed = ( '[' not in stripped and '{' not in stripped ) or \
+                 stripped.count( '[' ) + stripped.count( '{' ) <= stripped.count( ']' ) + stripped.count( '}' )
+      elif stripped[0] == '"':
+        closed = stripped.find( '"', 1 ) == len( stripped ) - 1 and '\\' not in stripped
+      else:
+        closed = stripped[0] == '{' and stripped[-1] == '}' and stripped.count( '{' ) == 1 and \
+                 stripped.count( '}' ) == 1 and not stripped.count( '"' ) % 2 and \
+                 '[' not in stripped and '\\' not in stripped
+      if not closed:
+        inString, depth = self.__scan( value, False, 0 )
+        if inString or depth > 0:
+          valuePieces = [ value ]
+          while ( inString or depth > 0 ) and iPiece < numPieces:
+            valuePieces.append( pieces[iPiece] )
+            inString, depth = self.__scan( pieces[iPiece], inString, depth )
+            iPiece += 1
+          stripped = ';'.join( valuePieces ).strip()
+      result[name.strip()] = stripped.replace( '\n', '' )
 
     return result
 
-  def __find_subjdl( self, body, index ):
-    """ Find a full [] enclosure starting from index
+  def __scan( self, text, inString, depth ):
+    """ Follow the strings and the nesting of lists and sub JDLs through a piece of a value,
+        starting inside a string or not and at the given depth. Return the state at its end
     """
-    result = ''
-    if body[index] != '[':
-      return ( result, 0 )
-
-    depth = 0
-    ind = index
-    while ( depth < 10 ):
-      ind1 = body.find( ']', ind + 1 )
-      ind2 = body.find( '[', ind + 1 )
-      if ind2 != -1 and ind2 < ind1:
-        depth += 1
-        ind = ind2
+    if '\\' not in text:
+      # Without escaped characters every quote opens or closes a string
+      parts = text.split( '"' )
+      if inString:
+        outside = ''.join( parts[1::2] )
+      else:
+        outside = ''.join( parts[::2] )
+      depth += outside.count( '[' ) + outside.count( '{' ) - outside.count( ']' ) - outside.count( '}' )
+      return inString != ( len( parts ) % 2 == 0 ), depth
+    index = 0
+    while True:
+      if inString:
+        match = self.__stringEnd.match( text, index )
+        if not match:
+          return True, depth
+        index = match.end()
+        inString = False
+      quote = text.find( '"', index )
+      if quote == -1:
+        segment = text[index:]
       else:
-        if depth > 0:
-          depth -= 1
-          ind = ind1
-        else:
-          result = body[index:ind1 + 1]
-          if body[ind1 + 1] == ";":
-            return ( result, ind1 + 2 )
-          else:
-            return result, 0
-
-    return result, 0
+        segment = text[index:quote]
+      depth += segment.count( '[' ) + segment.count( '{' ) - segment.count( ']' ) - segment.count( '}' )
+      if quote == -1:
+        return False, depth
+      index = quote + 1
+      inString = True
 
   def insertAttributeInt( self, name, attribute ):
     """Insert a named integer attribute
@@ -247,27 +322,25 @@ class ClassAd:
     """Convert the JDL description into a string
     """
 
-    result = ''
+    result = []
     for name, value in self.contents.items():
       if value[0:1] == "{":
-        result = result + 4 * ' ' + name + " = \n"
-        result = result + 8 * ' ' + '{\n'
-        strings = value[1:-1].split( ',' )
-        for st in strings:
-          result = result + 12 * ' ' + st.strip() + ',\n'
-        result = result[:-2] + '\n' + 8 * ' ' + '};\n'
+        result.append( 4 * ' ' + name + " = \n" )
+        result.append( 8 * ' ' + '{\n' )
+        strings = [ 12 * ' ' + st.strip() for st in value[1:-1].split( ',' ) ]
+        result.append( ',\n'.join( strings ) + '\n' + 8 * ' ' + '};\n' )
       elif value[0:1] == "[":
         tempad = ClassAd( value )
         tempjdl = tempad.asJDL() + ';'
         lines = tempjdl.split( '\n' )
-        result = result + 4 * ' ' + name + " = \n"
+        result.append( 4 * ' ' + name + " = \n" )
         for line in lines:
-          result = result + 8 * ' ' + line + '\n'
+          result.append( 8 * ' ' + line + '\n' )
 
       else:
-        result = result + 4 * ' ' + name + ' = ' + str( value ) + ';\n'
+        result.append( 4 * ' ' + name + ' = ' + str( value ) + ';\n' )
 
-    return "[ \n" + result[:-1] + "\n]"
+    return "[ \n" + "".join( result )[:-1] + "\n]"
 
   def getAttributeString( self, name ):
     """ Get String type attribute value
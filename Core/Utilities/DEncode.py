@@ -223,22 +223,265 @@ g_dDecodeFunctions[ "d" ] = decodeDict
 
 #Encode function
 def encode( uObject ):
-  try:
-    eList = []
-    #print "ENCODE FUNCTION : %s" % g_dEncodeFunctions[ type( uObject ) ]
-    g_dEncodeFunctions[ type( uObject ) ]( uObject, eList )
-    return "".join( eList )
-  except Exception:
-    raise
+  eList = []
+  g_dEncodeFunctions[ type( uObject ) ]( uObject, eList )
+  return "".join( eList )
+
+#
+# Fast decoding. The per type functions above define the wire format and are kept
+# as the reference implementation. Containers are the bulk of any DIRAC payload so
+# the fast versions decode strings and ints inline instead of dispatching a
+# function call per element.
+#
+
+g_dFastDecodeFunctions = dict( g_dDecodeFunctions )
 
-def decode( data ):
+def fastDecodeList( data, i ):
+  oL = []
+  append = oL.append
+  index = data.index
+  i += 1
+  while True:
+    c = data[ i ]
+    if c == "s":
+      colon = index( ":", i + 1 )
+      i = colon + 1 + int( data[ i + 1 : colon ] )
+      append( data[ colon + 1 : i ] )
+    elif c == "i":
+      end = index( "e", i + 1 )
+      append( int( data[ i + 1 : end ] ) )
+      i = end + 1
+    elif c == "e":
+      return ( oL, i + 1 )
+    else:
+      value, i = g_dFastDecodeFunctions[ c ]( data, i )
+      append( value )
+
+def fastDecodeTuple( data, i ):
+  oL, i = fastDecodeList( data, i )
+  return ( tuple( oL ), i )
+
+def fastDecodeDict( data, i ):
+  oD = {}
+  index = data.index
+  i += 1
+  while True:
+    c = data[ i ]
+    if c == "s":
+      colon = index( ":", i + 1 )
+      i = colon + 1 + int( data[ i + 1 : colon ] )
+      key = data[ colon + 1 : i ]
+    elif c == "e":
+      return ( oD, i + 1 )
+    else:
+      key, i = g_dFastDecodeFunctions[ c ]( data, i )
+    c = data[ i ]
+    if c == "s":
+      colon = index( ":", i + 1 )
+      i = colon + 1 + int( data[ i + 1 : colon ] )
+      oD[ key ] = data[ colon + 1 : i ]
+    elif c == "i":
+      end = index( "e", i + 1 )
+      oD[ key ] = int( data[ i + 1 : end ] )
+      i = end + 1
+    else:
+      oD[ key ], i = g_dFastDecodeFunctions[ c ]( data, i )
+
+g_dFastDecodeFunctions[ "l" ] = fastDecodeList
+g_dFastDecodeFunctions[ "t" ] = fastDecodeTuple
+g_dFastDecodeFunctions[ "d" ] = fastDecodeDict
+
+def decode( data, offset = 0 ):
+  """
+  Decode the object starting at offset. Decoding from an offset in a bigger buffer
+  avoids having to slice it first. Returns ( decodedObject, positionAfterObject )
+  """
   if not data:
     return data
-  try:
-    #print "DECODE FUNCTION : %s" % g_dDecodeFunctions[ sStream [ iIndex ] ]
-    return g_dDecodeFunctions[ data[ 0 ] ]( data, 0 )
-  except Exception:
-    raise
+  return g_dFastDecodeFunctions[ data[ offset ] ]( data, offset )
+
+#
+# Incremental decoding
+#
+
+class _NoKey( object ):
+  pass
+
+_NOKEY = _NoKey()
+_INCOMPLETE = _NoKey()
+
+def _buildDateTime( dataType, tupleObject ):
+  if dataType == 'a':
+    return datetime.datetime( *tupleObject )
+  elif dataType == 'd':
+    return datetime.date( *tupleObject )
+  elif dataType == 't':
+    return datetime.time( *tupleObject )
+  raise Exception( "Unexpected type %s while decoding a datetime object" % dataType )
+
+def _decodeStream( data, i, stack, final ):
+  """
+  Decode data starting at position i without copying it.
+
+  stack keeps the containers under construction as [ type, container, dictKey ]
+  so decoding can be resumed when more data arrives. If final is False an
+  incomplete token stops the decoding and ( startOfToken, _INCOMPLETE ) is
+  returned. Otherwise ( decodedObject, positionAfterObject ) is returned.
+  """
+  dataLen = len( data )
+  index = data.index
+  while i < dataLen:
+    start = i
+    c = data[ i ]
+    try:
+      if c == "s" or c == "u":
+        colon = index( ":", i + 1 )
+        i = colon + 1 + int( data[ i + 1 : colon ] )
+        if i > dataLen:
+          raise IndexError( "Truncated string" )
+        value = data[ colon + 1 : i ]
+        if c == "u":
+          value = unicode( value, 'utf-8' )
+      elif c == "i":
+        end = index( "e", i + 1 )
+        value = int( data[ i + 1 : end ] )
+        i = end + 1
+      elif c == "l" or c == "t":
+        stack.append( [ c, [], _NOKEY ] )
+        i += 1
+        continue
+      elif c == "d":
+        stack.append( [ c, {}, _NOKEY ] )
+        i += 1
+        continue
+      elif c == "e":
+        if not stack:
+          raise ValueError( "Unexpected end of container at position %s" % i )
+        cType, value, dummy = stack.pop()
+        if cType == "t":
+          value = tuple( value )
+        i += 1
+      elif c == "n":
+        value = None
+        i += 1
+      elif c == "b":
+        value = data[ i + 1 ] != "0"
+        i += 2
+      elif c == "f":
+        end = index( "e", i + 1 )
+        if end + 1 < dataLen and data[ end + 1 ] in ( "+", "-" ):
+          eI = end
+          end = index( "e", end + 1 )
+          value = float( data[ i + 1 : eI ] ) * 10 ** int( data[ eI + 1 : end ] )
+        elif end + 1 == dataLen and not final:
+          #Can't know yet if an exponent follows
+          raise IndexError( "Truncated float" )
+        else:
+          value = float( data[ i + 1 : end ] )
+        i = end + 1
+      elif c == "I":
+        end = index( "e", i + 1 )
+        value = long( data[ i + 1 : end ] )
+        i = end + 1
+      elif c == "z":
+        stack.append( [ "z%s" % data[ i + 1 ], None, _NOKEY ] )
+        i += 2
+        continue
+      else:
+        raise ValueError( "Unknown type identifier %s at position %s" % ( c, i ) )
+    except ( ValueError, IndexError ):
+      if final:
+        raise
+      return ( start, _INCOMPLETE )
+    #Store the value in its container
+    while stack:
+      frame = stack[-1]
+      cType = frame[0]
+      if cType == "d":
+        if frame[2] is _NOKEY:
+          frame[2] = value
+        else:
+          frame[1][ frame[2] ] = value
+          frame[2] = _NOKEY
+        break
+      elif cType == "l" or cType == "t":
+        frame[1].append( value )
+        break
+      else:
+        stack.pop()
+        value = _buildDateTime( cType[1], value )
+    else:
+      return ( value, i )
+  if final:
+    raise ValueError( "Unexpected end of data" )
+  return ( i, _INCOMPLETE )
+
+class StreamDecoder( object ):
+  """
+  Incremental decoder. Data can be fed chunk by chunk as it arrives and only
+  the part that has not been decoded yet is kept in memory.
+  """
+
+  def __init__( self ):
+    self.__stack = []
+    self.__chunks = []
+    self.__bufferedBytes = 0
+    self.__neededBytes = 1
+    self.__result = _INCOMPLETE
+
+  def feed( self, data ):
+    if not data:
+      return
+    if self.__result is not _INCOMPLETE:
+      raise ValueError( "Received data after the end of the encoded object" )
+    self.__chunks.append( data )
+    self.__bufferedBytes += len( data )
+    #Don't retry the decoding until there is enough data for the pending token
+    if self.__bufferedBytes >= self.__neededBytes:
+      self.__process( False )
+
+  def isComplete( self ):
+    return self.__result is not _INCOMPLETE
+
+  def finish( self ):
+    """
+    No more data will arrive. Returns the decoded object
+    """
+    if self.__result is _INCOMPLETE:
+      self.__process( True )
+    if self.__chunks:
+      raise ValueError( "%s bytes of trailing data after the encoded object" % self.__bufferedBytes )
+    return self.__result
+
+  def __process( self, final ):
+    if len( self.__chunks ) == 1:
+      data = self.__chunks[0]
+    else:
+      data = "".join( self.__chunks )
+    if not data:
+      if final:
+        raise ValueError( "Unexpected end of data" )
+      return
+    value, pos = _decodeStream( data, 0, self.__stack, final )
+    if pos is not _INCOMPLETE:
+      self.__result = value
+      pending = data[ pos: ]
+    else:
+      pending = data[ value: ]
+    if pending:
+      self.__chunks = [ pending ]
+    else:
+      self.__chunks = []
+    self.__bufferedBytes = len( pending )
+    self.__neededBytes = self.__bufferedBytes + 1
+    #For strings we know how much data is needed before trying again
+    if pending and pending[0] in ( "s", "u" ):
+      colon = pending.find( ":", 1, 22 )
+      if colon > -1:
+        try:
+          self.__neededBytes = colon + 1 + int( pending[ 1 : colon ] )
+        except ValueError:
+          pass
 
 
 if __name__ == "__main__":
@@ -247,5 +490,3 @@ if __name__ == "__main__":
   gData = encode( gObject )
   print "Encoded: %s" % gData
   print "Decoded: %s, [%s]" % decode( gData )
-
-
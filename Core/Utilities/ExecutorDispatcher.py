@@ -1,5 +1,5 @@
 
-import threading, time, types
+import threading, time, types, collections
 from DIRAC import S_OK, S_ERROR, gLogger
 from DIRAC.Core.Utilities.ReturnValues import isReturnStructure
 from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
@@ -88,11 +88,13 @@ class ExecutorState:
       pass
     return execs
 
-  def getIdleExecutor( self, eType ):
+  def getIdleExecutor( self, eType, skipIds = () ):
     idleId = None
     maxFreeSlots = 0
     try:
       for eId in self.__typeToId[ eType ]:
+        if eId in skipIds:
+          continue
         freeSlots = self.freeSlots( eId )
         if freeSlots > maxFreeSlots:
           maxFreeSlots = freeSlots
@@ -134,6 +136,12 @@ class ExecutorState:
       self.__lock.release()
 
 class ExecutorQueues:
+  """ Waiting queues of tasks per executor type
+
+      Queues are deques of ( push number, taskId ). Deleted tasks are only
+      removed from the task index and their stale entries are skipped when
+      popping, so every operation takes constant time.
+  """
 
   def __init__( self, log = False ):
     if log:
@@ -142,13 +150,16 @@ class ExecutorQueues:
       self.__log = gLogger
     self.__lock = threading.Lock()
     self.__queues = {}
+    self.__queueSize = {}
     self.__lastUse = {}
+    #taskId -> ( eType, push number )
     self.__taskInQueue = {}
+    self.__pushCounter = 0
 
   def _internals( self ):
-    return { 'queues' : dict( self.__queues ),
+    return { 'queues' : self.getState(),
              'lastUse' : dict( self.__lastUse ),
-             'taskInQueue' : dict( self.__taskInQueue ),
+             'taskInQueue' : dict( [ ( taskId, self.__taskInQueue[ taskId ][0] ) for taskId in self.__taskInQueue ] ),
              'locked' : self.__lock.locked() }
 
   def getExecutorList( self ):
@@ -159,52 +170,78 @@ class ExecutorQueues:
     self.__lock.acquire()
     try:
       if taskId in self.__taskInQueue:
-        if self.__taskInQueue[ taskId ] != eType:
+        if self.__taskInQueue[ taskId ][0] != eType:
           errMsg = "Task %s cannot be queued because it's already queued for %s" % ( taskId,
-                                                                                    self.__taskInQueue[ taskId ] )
+                                                                                    self.__taskInQueue[ taskId ][0] )
           self.__log.fatal( errMsg )
           return 0
         else:
-          return len( self.__queues[ eType ] )
+          return self.__queueSize[ eType ]
       if eType not in self.__queues:
-        self.__queues[ eType ] = []
+        self.__queues[ eType ] = collections.deque()
+        self.__queueSize[ eType ] = 0
       self.__lastUse[ eType ] = time.time()
+      self.__pushCounter += 1
       if ahead:
-        self.__queues[ eType ].insert( 0, taskId )
+        self.__queues[ eType ].appendleft( ( self.__pushCounter, taskId ) )
       else:
-        self.__queues[ eType ].append( taskId )
-      self.__taskInQueue[ taskId ] = eType
-      return len( self.__queues[ eType ] )
+        self.__queues[ eType ].append( ( self.__pushCounter, taskId ) )
+      self.__taskInQueue[ taskId ] = ( eType, self.__pushCounter )
+      self.__queueSize[ eType ] += 1
+      return self.__queueSize[ eType ]
     finally:
       self.__lock.release()
 
-  def popTask( self, eTypes ):
+  def __popFromQueue( self, eType ):
+    queue = self.__queues[ eType ]
+    while queue:
+      pushNumber, taskId = queue.popleft()
+      #Skip entries of tasks deleted or queued again since
+      if self.__taskInQueue.get( taskId ) == ( eType, pushNumber ):
+        del( self.__taskInQueue[ taskId ] )
+        self.__queueSize[ eType ] -= 1
+        return taskId
+    return None
+
+  def popTasks( self, eTypes, numTasks = 1 ):
+    """
+    Pop up to numTasks tasks waiting for the first of eTypes having any.
+    Return ( [ taskId, ... ], eType ) or None if there are no tasks
+    """
     if type( eTypes ) not in ( types.ListType, types.TupleType ):
       eTypes = [ eTypes ]
     self.__lock.acquire()
-    for eType in eTypes:
-      try:
-        taskId = self.__queues[ eType ].pop( 0 )
-        del( self.__taskInQueue[ taskId ] )
-        #Found! release and return!
-        self.__lock.release()
+    try:
+      for eType in eTypes:
+        if not self.__queueSize.get( eType ):
+          continue
+        taskIds = []
+        while len( taskIds ) < numTasks:
+          taskId = self.__popFromQueue( eType )
+          if taskId == None:
+            break
+          taskIds.append( taskId )
         self.__lastUse[ eType ] = time.time()
-        self.__log.verbose( "Popped task %s from executor %s waiting queue" % ( taskId, eType ) )
-        return ( taskId, eType )
-      except IndexError:
-        continue
-      except KeyError:
-        continue
-    self.__lock.release()
-    #Not found. release and return None
+        self.__log.verbose( "Popped tasks %s from executor %s waiting queue" % ( taskIds, eType ) )
+        return ( taskIds, eType )
+    finally:
+      self.__lock.release()
+    #Not found
     return None
 
+  def popTask( self, eTypes ):
+    pData = self.popTasks( eTypes )
+    if pData == None:
+      return None
+    return ( pData[0][0], pData[1] )
+
   def getState( self ):
     self.__lock.acquire()
     try:
       qInfo = {}
       for qName in self.__queues:
-        qInfo[ qName ] = list( self.__queues[ qName ] )
+        qInfo[ qName ] = [ taskId for pushNumber, taskId in self.__queues[ qName ]
+                           if self.__taskInQueue.get( taskId ) == ( qName, pushNumber ) ]
     finally:
       self.__lock.release()
     return qInfo
@@ -214,16 +251,16 @@ class ExecutorQueues:
     self.__lock.acquire()
     try:
       try:
-        eType = self.__taskInQueue[ taskId ]
-        del( self.__taskInQueue[ taskId ] )
-        self.__lastUse[ eType ] = time.time()
+        eType = self.__taskInQueue.pop( taskId )[0]
       except KeyError:
         return False
-      try:
-        iPos = self.__queues[ eType ].index( taskId )
-      except ValueError:
-        return False
-      del( self.__queues[ eType ][ iPos ] )
+      self.__lastUse[ eType ] = time.time()
+      self.__queueSize[ eType ] -= 1
+      queue = self.__queues[ eType ]
+      #Drop the stale entries once they are most of the queue
+      if len( queue ) > 1000 and len( queue ) > 2 * self.__queueSize[ eType ]:
+        self.__queues[ eType ] = collections.deque( [ ( pushNumber, qTaskId ) for pushNumber, qTaskId in queue
+                                                      if self.__taskInQueue.get( qTaskId ) == ( eType, pushNumber ) ] )
       return True
     finally:
       self.__lock.release()
@@ -232,7 +269,7 @@ class ExecutorQueues:
     self.__lock.acquire()
     try:
       try:
-        return len( self.__queues[ eType ] )
+        return self.__queueSize[ eType ]
       except KeyError:
         return 0
     finally:
@@ -246,6 +283,13 @@ class ExecutorDispatcherCallbacks:
   def cbSendTask( self, taskId, taskObj, eId, eType ):
     return S_ERROR( "No send task callback defined" )
 
+  def cbSendTasks( self, tasksList, eId, eType ):
+    """
+    Send a list of ( taskId, taskObj ) in one go. Return S_OK( { taskId : errorMsg } )
+    with the tasks that could not be sent
+    """
+    return S_ERROR( "No send tasks callback defined" )
+
   def cbDisconectExecutor( self, eId ):
     return S_ERROR( "No disconnect callback defined" )
 
@@ -291,6 +335,11 @@ class ExecutorDispatcher:
     self.__tasksLock = threading.Lock()
     self.__freezerLock = threading.Lock()
     self.__tasks = {}
+    #Executors getting several tasks per message
+    self.__batchExecs = set()
+    #Executors not to be sent tasks for now -> number of holds
+    self.__heldExecs = {}
+    self.__heldLock = threading.Lock()
     self.__log = gLogger.getSubLogger( "ExecMind" )
     self.__taskFreezer = []
     self.__queues = ExecutorQueues( self.__log )
@@ -325,6 +374,8 @@ class ExecutorDispatcher:
   def _internals( self ):
     return { 'idMap' : dict( self.__idMap ),
              'execTypes' : dict( self.__execTypes ),
+             'batchExecs' : list( self.__batchExecs ),
+             'heldExecs' : dict( self.__heldExecs ),
              'tasks' : sorted( self.__tasks ),
              'freezer' : list( self.__taskFreezer ),
              'queues' : self.__queues._internals(),
@@ -354,7 +405,7 @@ class ExecutorDispatcher:
         pass
     self.__monitor.addMark( "executors", len( self.__idMap ) )
 
-  def addExecutor( self, eId, eTypes, maxTasks = 1 ):
+  def addExecutor( self, eId, eTypes, maxTasks = 1, batchTasks = False ):
     self.__log.verbose( "Adding new %s executor to the pool %s" % ( eId, ", ".join ( eTypes ) ) )
     self.__executorsLock.acquire()
     try:
@@ -364,6 +415,8 @@ class ExecutorDispatcher:
         eTypes = [ eTypes ]
       self.__idMap[ eId ] = list( eTypes )
       self.__states.addExecutor( eId, eTypes, maxTasks )
+      if batchTasks and maxTasks > 1:
+        self.__batchExecs.add( eId )
       for eType in eTypes:
         if eType not in self.__execTypes:
           self.__execTypes[ eType ] = 0
@@ -387,6 +440,7 @@ class ExecutorDispatcher:
       if eId not in self.__idMap:
         return
       eTypes = self.__idMap.pop( eId )
+      self.__batchExecs.discard( eId )
       for eType in eTypes:
         self.__execTypes[ eType ] -= 1
       tasksInExec = self.__states.removeExecutor( eId )
@@ -735,12 +789,38 @@ class ExecutorDispatcher:
       return S_OK()
     return self.__dispatchTask( taskId )
 
+  def holdExecutor( self, eId ):
+    """
+    Do not send tasks to an executor until it's released. Used while
+    processing the results of a batch to send the next batch in one go
+    """
+    self.__heldLock.acquire()
+    try:
+      self.__heldExecs[ eId ] = self.__heldExecs.get( eId, 0 ) + 1
+    finally:
+      self.__heldLock.release()
+
+  def releaseExecutor( self, eId ):
+    self.__heldLock.acquire()
+    try:
+      try:
+        self.__heldExecs[ eId ] -= 1
+        if self.__heldExecs[ eId ] > 0:
+          return S_OK()
+        del( self.__heldExecs[ eId ] )
+      except KeyError:
+        pass
+    finally:
+      self.__heldLock.release()
+    return self.__sendTaskToExecutor( eId, checkIdle = True )
+
   def __fillExecutors( self, eType, defrozeIfNeeded = True ):
     if defrozeIfNeeded:
       self.__log.verbose( "Unfreezing tasks for %s" % eType )
       self.__unfreezeTasks( eType )
     self.__log.verbose( "Filling %s executors" % eType )
-    eId = self.__states.getIdleExecutor( eType )
+    #Held executors are filled when they are released
+    eId = self.__states.getIdleExecutor( eType, self.__heldExecs )
     processedTasks = set()
     while eId:
       result = self.__sendTaskToExecutor( eId, eType )
@@ -750,12 +830,15 @@ class ExecutorDispatcher:
         if not result[ 'Value' ]:
           #No more tasks for eType
           break
-        self.__log.verbose( "Task %s was sent to %s" % ( result[ 'Value'], eId ) )
-      eId = self.__states.getIdleExecutor( eType )
+        self.__log.verbose( "Tasks %s were sent to %s" % ( result[ 'Value'], eId ) )
+      eId = self.__states.getIdleExecutor( eType, self.__heldExecs )
     self.__log.verbose( "No more idle executors for %s" % eType )
 
   def __sendTaskToExecutor( self, eId, eTypes = False, checkIdle = False ):
-    if checkIdle and self.__states.freeSlots( eId ) == 0:
+    freeSlots = self.__states.freeSlots( eId )
+    if checkIdle and freeSlots == 0:
+      return S_OK()
+    if eId in self.__heldExecs:
       return S_OK()
     try:
       searchTypes = list( reversed( self.__idMap[ eId ] ) )
@@ -771,19 +854,35 @@ class ExecutorDispatcher:
         except ValueError:
           pass
         searchTypes.append( eType )
-    pData = self.__queues.popTask( searchTypes ) 
+    numTasks = 1
+    if eId in self.__batchExecs:
+      numTasks = max( 1, freeSlots )
+    pData = self.__queues.popTasks( searchTypes, numTasks )
     if pData == None:
       self.__log.verbose( "No more tasks for %s" % eTypes )
       return S_OK()
-    taskId, eType = pData
-    self.__log.verbose( "Sending task %s to %s=%s" % ( taskId, eType, eId ) )
-    self.__states.addTask( eId, taskId )
-    result = self.__msgTaskToExecutor( taskId, eId, eType )
+    taskIds, eType = pData
+    self.__log.verbose( "Sending tasks %s to %s=%s" % ( taskIds, eType, eId ) )
+    for taskId in taskIds:
+      self.__states.addTask( eId, taskId )
+    if len( taskIds ) == 1:
+      result = self.__msgTaskToExecutor( taskIds[0], eId, eType )
+    else:
+      result = self.__msgTasksToExecutor( taskIds, eId, eType )
     if not result[ 'OK' ]:
-      self.__queues.pushTask( eType, taskId, ahead = True )
-      self.__states.removeTask( taskId )
+      for taskId in reversed( taskIds ):
+        if taskId in self.__tasks:
+          self.__queues.pushTask( eType, taskId, ahead = True )
+        self.__states.removeTask( taskId )
       return result
-    return S_OK( taskId )
+    if len( taskIds ) > 1 and result[ 'Value' ]:
+      #Retry later the tasks of the batch that could not be sent
+      notSent = result[ 'Value' ]
+      for taskId in notSent:
+        self.__states.removeTask( taskId, eId )
+        self.__freezeTask( taskId, notSent[ taskId ], eType = eType )
+      taskIds = [ taskId for taskId in taskIds if taskId not in notSent ]
+    return S_OK( taskIds )
 
   def __msgTaskToExecutor( self, taskId, eId, eType ):
     try:
@@ -806,6 +905,30 @@ class ExecutorDispatcher:
     self.removeExecutor( eId )
     return S_ERROR( "Exception while sending task to executor" )
 
+  def __msgTasksToExecutor( self, taskIds, eId, eType ):
+    tasksList = []
+    for taskId in taskIds:
+      try:
+        eTask = self.__tasks[ taskId ]
+      except KeyError:
+        #Deleted while waiting, don't requeue it
+        self.__states.removeTask( taskId )
+        continue
+      eTask.sendTime = time.time()
+      tasksList.append( ( taskId, eTask.taskObj ) )
+    if not tasksList:
+      return S_OK()
+    try:
+      result = self.__cbHolder.cbSendTasks( tasksList, eId, eType )
+    except:
+      self.__log.exception( "Exception while sending tasks to executor" )
+      return S_ERROR( "Exception while sending tasks to executor" )
+    if isReturnStructure( result ):
+      return result
+    errMsg = "Send tasks callback did not send back an S_OK/S_ERROR structure"
+    self.__log.fatal( errMsg )
+    return S_ERROR( errMsg )
+
 if __name__ == "__main__":
   def testExecState():
     execState = ExecutorState()
@@ -831,15 +954,16 @@ if __name__ == "__main__":
     print "DONE IN"
     print eQ.pushTask( "type0", "t01" ) == 3
     print eQ.getState()
-    print eQ.popTask( "type0" ) == "t00"
+    print eQ.popTask( "type0" ) == ( "t00", "type0" )
     print eQ.pushTask( "type0", "t00", ahead = True ) == 3
-    print eQ.popTask( "type0" ) == "t00"
+    print eQ.popTask( "type0" ) == ( "t00", "type0" )
     print eQ.deleteTask( "t01" ) == True
     print eQ.getState()
     print eQ.deleteTask( "t02" )
     print eQ.getState()
-    for i in range( 3 ):
-        print eQ.popTask( "type1" ) == "t1%s" % i
+    print eQ.waitingTasks( "type0" ) == 0
+    print eQ.popTasks( "type1", 2 ) == ( [ "t10", "t11" ], "type1" )
+    print eQ.popTask( "type1" ) == ( "t12", "type1" )
     print eQ._internals()
 
   testExecQueues()
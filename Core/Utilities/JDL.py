@@ -1,10 +1,15 @@
 # $HeadURL$
 __RCSID__ = "$Id$"
 
+import re
+
 from DIRAC import S_OK, S_ERROR
 from DIRAC.Core.Utilities.CFG import CFG
 from DIRAC.Core.Utilities import List
 
+# Characters changing the state of the JDL parser, anything else is copied to the current key or value
+g_jdlSpecialChars = re.compile( r'[;\[=\]"]' )
+
 def loadJDLAsCFG( jdl ):
   """
   Load a JDL as CFG
@@ -12,28 +17,14 @@ def loadJDLAsCFG( jdl ):
   def cleanValue( value ):
     value = value.strip()
     if value[0] == '"':
-      entries = []
-      iPos = 1
-      current = ""
-      state = "in"
-      while iPos < len( value ):
-        if value[ iPos ] == '"':
-          if state == "in":
-            entries.append( current )
-            current = ""
-            state = "out"
-          elif state == "out":
-            current = current.strip()
-            if current not in ( ",", ):
-              return S_ERROR( "value seems a list but is not separated in commas" )
-            current = ""
-            state = "in"
-        else:
-          current += value[ iPos ]
-        iPos += 1
-      if state == "in":
+      # Strings are at the even positions, what separates them at the odd ones
+      pieces = value[1:].split( '"' )
+      for separator in pieces[1:-1:2]:
+        if separator.strip() != ",":
+          return S_ERROR( "value seems a list but is not separated in commas" )
+      if len( pieces ) % 2:
         return S_ERROR( 'value is opened with " but is not closed' )
-      return S_OK( ", ".join ( entries ) )
+      return S_OK( ", ".join ( pieces[::2] ) )
     else:
       return S_OK( value.replace( '"', '' ) )
 
@@ -77,6 +68,21 @@ def loadJDLAsCFG( jdl ):
   insideLiteral = False
   cfg = CFG()
   while iPos < len( jdl ):
+    # Copy the text up to the next special character at once
+    if insideLiteral:
+      nextPos = jdl.find( '"', iPos )
+    else:
+      match = g_jdlSpecialChars.search( jdl, iPos )
+      nextPos = match.start() if match else -1
+    if nextPos == -1:
+      nextPos = len( jdl )
+    if nextPos > iPos:
+      if action == "key":
+        key += jdl[ iPos : nextPos ]
+      else:
+        value += jdl[ iPos : nextPos ]
+      iPos = nextPos
+      continue
     char = jdl[ iPos ]
     if char == ";" and not insideLiteral:
       if key.strip():
@@ -139,7 +139,8 @@ class ThreadScheduler:
   def __createExecutorIfNeeded( self ):
     if not self.__createReactorThread:
       return
-    if self.__thId:
+    #The thread does not survive a fork, the child has to start its own
+    if self.__thId and self.__thId.isAlive():
       return
     self.__thId = threading.Thread( target = self.__executorThread )
     self.__thId.setDaemon( True )
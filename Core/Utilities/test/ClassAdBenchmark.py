@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+""" :mod: ClassAdBenchmark
+    =======================
+
+    .. module: ClassAdBenchmark
+    :synopsis: compare the JDL parsers on parametric job descriptions
+
+    Expands a parametric production like JDL into one JDL per parameter, as
+    the JobManager does, and parses them with the previous find based ClassAd
+    parser, the single pass one, the single pass one going through the parse
+    cache and the JDL to CFG loader used by the JobManifest.
+"""
+
+__RCSID__ = "$Id $"
+
+import sys
+import time
+from DIRAC.Core.Utilities.ClassAd.ClassAdLight import ClassAd, gClassAdParseCache
+from DIRAC.Core.Utilities.JDL import loadJDLAsCFG
+
+JDL_TEMPLATE = """[
+    Origin = "DIRAC";
+    Executable = "$DIRACROOT/scripts/dirac-jobexec";
+    StdError = "std.err";
+    LogLevel = "info";
+    StdOutput = "std.out";
+    JobName = "00012345_%n";
+    Priority = "1";
+    InputSandbox =
+        {
+            "jobDescription.xml",
+            "LFN:/lhcb/user/s/someone/sandbox/options.py"
+        };
+    Arguments = "jobDescription.xml -o LogLevel=info -p ParametricInputData=%s";
+    JobGroup = "00012345";
+    OutputSandbox =
+        {
+            "Script1_CodeOutput.log",
+            "std.err",
+            "std.out"
+        };
+    InputData = %s;
+    JobType = "User";
+    Site = "ANY";
+    BannedSites =
+        {
+            "LCG.Broken.org",
+            "LCG.Draining.org"
+        };
+    MaxCPUTime = "86400";
+    OwnerGroup = "lhcb_user";
+    Platform = "x86_64-slc6";
+    Parameters = PARAMETERS;
+]"""
+
+def legacyAnalyse( jdl ):
+  """ The find based parser of the previous ClassAd versions
+  """
+  def findSubJDL( body, index ):
+    depth = 0
+    ind = index
+    while depth < 10:
+      ind1 = body.find( ']', ind + 1 )
+      ind2 = body.find( '[', ind + 1 )
+      if ind2 != -1 and ind2 < ind1:
+        depth += 1
+        ind = ind2
+      elif depth > 0:
+        depth -= 1
+        ind = ind1
+      else:
+        if body[ind1 + 1] == ";":
+          return body[index:ind1 + 1], ind1 + 2
+        return body[index:ind1 + 1], 0
+    return '', 0
+
+  jdl = jdl.strip()
+  result = {}
+  if jdl[0] != '[' or jdl[-1] != ']':
+    return result
+  body = jdl[1:-1]
+  index = 0
+  while index < len( body ):
+    ind = body.find( "=", index )
+    if ind == -1:
+      break
+    name = body[index:ind]
+    index = ind + 1
+    ind1 = body.find( "[", index )
+    ind2 = body.find( ";", index )
+    if ind1 != -1 and ind1 < ind2:
+      value, newind = findSubJDL( body, ind1 )
+    elif ind1 == -1 and ind2 == -1:
+      value = body[index:]
+      newind = len( body )
+    elif index == ind2:
+      return {}
+    else:
+      value = body[index:ind2]
+      newind = ind2 + 1
+    result[name.strip()] = value.strip().replace( '\n', '' )
+    index = newind
+  return result
+
+def parametricJDLs( numJobs ):
+  parameters = []
+  for i in xrange( numJobs ):
+    lfns = [ "LFN:/lhcb/LHCb/Collision12/BHADRON.MDST/00020198/0000/00020198_%08d_1.bhadron.mdst" % ( i * 3 + j )
+             for j in range( 3 ) ]
+    parameters.append( "{%s}" % ",".join( lfns ) )
+  template = JDL_TEMPLATE.replace( 'PARAMETERS', "{%s}" % ",".join( parameters ) )
+  templateAd = ClassAd( template )
+  jdls = []
+  nParam = len( parameters ) - 1
+  for n, p in enumerate( templateAd.getListFromExpression( 'Parameters' ) ):
+    jobAd = ClassAd( '[]' )
+    for name, value in templateAd.contents.items():
+      jobAd.contents[name] = value.replace( '%s', p ).replace( '%n', str( n ).zfill( len( str( nParam ) ) ) )
+    jobAd.deleteAttribute( 'Parameters' )
+    jobAd.insertAttributeInt( 'Parameter', p )
+    jobAd.insertAttributeInt( 'ParameterNumber', n )
+    jdls.append( jobAd.asJDL() )
+  return jdls
+
+def parseLegacy( jdls ):
+  for jdl in jdls:
+    legacyAnalyse( jdl )
+
+def parseSinglePass( jdls ):
+  gClassAdParseCache.clear()
+  for jdl in jdls:
+    ClassAd( jdl )
+
+def parseCached( jdls ):
+  for jdl in jdls:
+    ClassAd( jdl )
+
+def loadAsCFG( jdls ):
+  for jdl in jdls:
+    loadJDLAsCFG( jdl )
+
+def timeIt( func, arg, repeat ):
+  best = None
+  for dummy in range( repeat ):
+    start = time.time()
+    func( arg )
+    elapsed = time.time() - start
+    if best is None or elapsed < best:
+      best = elapsed
+  return best
+
+def runBenchmark( numJobs = 1000, repeat = 3 ):
+  jdls = parametricJDLs( numJobs )
+  for jdl in jdls:
+    if legacyAnalyse( jdl ) != ClassAd( jdl ).contents:
+      print "Parsers disagree on\n%s" % jdl
+      return 1
+  gClassAdParseCache.maxLength = max( gClassAdParseCache.maxLength, sum( [ len( jdl ) for jdl in jdls ] ) )
+  print "%d JDLs of %d bytes on average" % ( len( jdls ), sum( [ len( jdl ) for jdl in jdls ] ) / len( jdls ) )
+  print "%-12s %10s %10s %10s %10s" % ( "", "legacy", "one pass", "cached", "as CFG" )
+  print "%-12s %10.3f %10.3f %10.3f %10.3f" % ( "seconds", timeIt( parseLegacy, jdls, repeat ),
+                                               timeIt( parseSinglePass, jdls, repeat ),
+                                               timeIt( parseCached, jdls, repeat ),
+                                               timeIt( loadAsCFG, jdls, repeat ) )
+  return 0
+
+if __name__ == "__main__":
+  numJobs = 1000
+  if len( sys.argv ) > 1:
+    numJobs = int( sys.argv[1] )
+  sys.exit( runBenchmark( numJobs ) )
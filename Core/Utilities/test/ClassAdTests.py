@@ -0,0 +1,98 @@
+""" :mod: ClassAdTests
+    =======================
+
+    .. module: ClassAdTests
+    :synopsis: test cases for the JDL parsers
+
+    test cases for the ClassAd parser and parse cache and the JDL to CFG loader
+"""
+
+__RCSID__ = "$Id $"
+
+## imports
+import unittest
+## SUT
+from DIRAC.Core.Utilities.ClassAd.ClassAdLight import ClassAd, ClassAdParseCache, gClassAdParseCache
+from DIRAC.Core.Utilities.JDL import loadJDLAsCFG
+
+########################################################################
+class ClassAdTestCase( unittest.TestCase ):
+  """
+  .. class:: ClassAdTestCase
+  """
+
+  def setUp( self ):
+    gClassAdParseCache.clear()
+
+  def test_parse( self ):
+    """ strings, lists and sub JDLs holding separators """
+    jdl = """[
+    Executable = "dirac-jobexec";
+    Arguments = "-o LogLevel=info; -p a=[1]";
+    InputSandbox =
+        {
+            "a.txt",
+            "b;c.txt"
+        };
+    Parameters = {{LFN:/a,LFN:/b},{LFN:/c}};
+    Sub = [ A = 1; B = "x" ];;
+    Requirements = other.Site == "X" && other.CPU > 3;
+    Priority = 1
+]"""
+    classAd = ClassAd( jdl )
+    self.assertEqual( classAd.contents, { 'Executable' : '"dirac-jobexec"',
+                                          'Arguments' : '"-o LogLevel=info; -p a=[1]"',
+                                          'InputSandbox' : '{            "a.txt",            "b;c.txt"        }',
+                                          'Parameters' : '{{LFN:/a,LFN:/b},{LFN:/c}}',
+                                          'Sub' : '[ A = 1; B = "x" ]',
+                                          'Requirements' : 'other.Site == "X" && other.CPU > 3',
+                                          'Priority' : '1' } )
+    self.assertEqual( classAd.getListFromExpression( 'InputSandbox' ), [ 'a.txt', 'b;c.txt' ] )
+    self.assertEqual( classAd.getDictionaryFromSubJDL( 'Sub' ), { 'A' : '1', 'B' : 'x' } )
+    self.assertEqual( ClassAd( classAd.asJDL() ).getListFromExpression( 'InputSandbox' ), [ 'a.txt', 'b;c.txt' ] )
+    #Escaped quotes, lists of strings with brackets and unbalanced closers
+    classAd = ClassAd( r'[ A = "x\";y"; B = { "[;", "}" }; C = {1,2}]; D = 2 ]' )
+    self.assertEqual( classAd.contents, { 'A' : r'"x\";y"', 'B' : '{ "[;", "}" }',
+                                          'C' : '{1,2}]', 'D' : '2' } )
+    self.assertEqual( ClassAd( "[]" ).contents, {} )
+    self.assertFalse( ClassAd( "Executable = 1;" ).isOK() )
+    self.assertFalse( ClassAd( '[ Executable = "a"; Name=; ]' ).isOK() )
+    self.assertFalse( ClassAd( '[ Executable = "a"; Name =; ]' ).isOK() )
+    self.assertEqual( ClassAd( '[ Name = ; Other = 1 ]' ).contents, { 'Name' : '', 'Other' : '1' } )
+    self.assertEqual( ClassAd( '[ Other = 1; Name = ; ]' ).contents, { 'Name' : '', 'Other' : '1' } )
+
+  def test_cache( self ):
+    """ cached attributes are copies """
+    jdl = '[ Executable = "a"; Priority = 1 ]'
+    classAd = ClassAd( jdl )
+    classAd.insertAttributeInt( 'Priority', 2 )
+    self.assertEqual( ClassAd( jdl ).getAttributeInt( 'Priority' ), 1 )
+    #Bounded by the total length of the JDLs
+    cache = ClassAdParseCache( maxLength = 10 )
+    for i in range( 10 ):
+      cache.add( str( i ), { 'i' : i } )
+    cache.get( "0" )
+    cache.add( "new", {} )
+    self.assertEqual( cache.get( "0" ), { 'i' : 0 } )
+    for i in range( 1, 5 ):
+      self.assertEqual( cache.get( str( i ) ), None )
+    self.assertEqual( cache.get( "5" ), { 'i' : 5 } )
+    self.assertEqual( cache.get( "new" ), {} )
+    cache.add( "x" * 11, {} )
+    self.assertEqual( cache.get( "x" * 11 ), None )
+    self.assertEqual( cache.get( "new" ), {} )
+
+  def test_loadJDLAsCFG( self ):
+    """ string values and lists """
+    result = loadJDLAsCFG( '[ Executable = "a;b"; InputData = { "/a", "/b" }; Sites = "S1", "S2"; Sub = [ A = 1 ]; ]' )
+    self.assertTrue( result[ 'OK' ] )
+    cfg = result[ 'Value' ][0]
+    self.assertEqual( cfg[ 'Executable' ], 'a;b' )
+    self.assertEqual( cfg[ 'InputData' ], '/a, /b' )
+    self.assertEqual( cfg[ 'Sites' ], 'S1, S2' )
+    self.assertEqual( cfg[ 'Sub' ][ 'A' ], '1' )
+    self.assertFalse( loadJDLAsCFG( '[ Sites = "S1" "S2"; ]' )[ 'OK' ] )
+
+if __name__ == "__main__":
+  testSuite = unittest.defaultTestLoader.loadTestsFromTestCase( ClassAdTestCase )
+  unittest.TextTestRunner( verbosity = 3 ).run( testSuite )
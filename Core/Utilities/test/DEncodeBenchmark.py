@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+""" :mod: DEncodeBenchmark
+    =======================
+
+    .. module: DEncodeBenchmark
+    :synopsis: compare the reference and fast DEncode codecs
+
+    Encodes and decodes payloads shaped like the ones DIRAC services return
+    (getReplicas for many LFNs, accounting report data, JDL attribute dicts)
+    with the reference per type functions, the fast decoder and the
+    incremental decoder fed in network sized chunks.
+"""
+
+__RCSID__ = "$Id $"
+
+import sys
+import time
+import datetime
+from DIRAC.Core.Utilities import DEncode
+
+def referenceEncode( uObject ):
+  eList = []
+  DEncode.g_dEncodeFunctions[ type( uObject ) ]( uObject, eList )
+  return "".join( eList )
+
+def referenceDecode( data ):
+  return DEncode.g_dDecodeFunctions[ data[0] ]( data, 0 )
+
+def streamDecode( data, chunkSize = 16384 ):
+  decoder = DEncode.StreamDecoder()
+  for i in xrange( 0, len( data ), chunkSize ):
+    decoder.feed( data[ i : i + chunkSize ] )
+  return decoder.finish()
+
+def replicasPayload( numLFNs ):
+  successful = {}
+  for i in xrange( numLFNs ):
+    lfn = "/lhcb/MC/2012/ALLSTREAMS.DST/00012345/0000/00012345_%08d_1.allstreams.dst" % i
+    successful[ lfn ] = { 'CERN-DST' : "srm://srm-eoslhcb.cern.ch/eos/lhcb/grid/prod%s" % lfn,
+                          'GRIDKA-DST' : "srm://gridka-dcache.fzk.de/pnfs/gridka.de/lhcb%s" % lfn }
+  return { 'OK' : True, 'Value' : { 'Successful' : successful, 'Failed' : {} } }
+
+def accountingPayload( numRecords ):
+  startTime = datetime.datetime( 2013, 1, 1 )
+  records = []
+  for i in xrange( numRecords ):
+    records.append( ( 'Job', startTime + datetime.timedelta( seconds = i ), startTime,
+                      [ 'user%s' % ( i % 50 ), 'lhcb_user', 'LCG.Site%s.ch' % ( i % 100 ), 'MCSimulation',
+                        'Done', 12345 + i, 3.5 * i, 7200.0, 1.0, 2 ] ) )
+  return { 'OK' : True, 'Value' : records }
+
+def jdlPayload( numJobs ):
+  jobs = {}
+  for i in xrange( numJobs ):
+    jobs[ i ] = { 'JobName' : 'Job_%s' % i, 'Executable' : 'dirac-jobexec', 'CPUTime' : 86400,
+                  'InputData' : [ '/lhcb/data/file_%s_%s' % ( i, j ) for j in range( 5 ) ],
+                  'Site' : 'ANY', 'Priority' : 1, 'Status' : 'Waiting' }
+  return { 'OK' : True, 'Value' : jobs }
+
+def timeIt( func, arg, repeat ):
+  best = None
+  for dummy in range( repeat ):
+    start = time.time()
+    func( arg )
+    elapsed = time.time() - start
+    if best is None or elapsed < best:
+      best = elapsed
+  return best
+
+def runBenchmark( size = 100000, repeat = 3 ):
+  payloads = [ ( "getReplicas", replicasPayload( size ) ),
+               ( "accounting", accountingPayload( size ) ),
+               ( "jobs", jdlPayload( size / 10 ) ) ]
+  print "%-12s %10s %10s %10s %10s %10s %10s" % ( "payload", "MB", "ref enc", "enc",
+                                                  "ref dec", "dec", "stream dec" )
+  for name, payload in payloads:
+    data = DEncode.encode( payload )
+    if data != referenceEncode( payload ) or DEncode.decode( data )[0] != referenceDecode( data )[0]:
+      print "Codecs disagree for %s payload!" % name
+      return 1
+    print "%-12s %10.2f %10.3f %10.3f %10.3f %10.3f %10.3f" % ( name, len( data ) / 1048576.,
+                                                           timeIt( referenceEncode, payload, repeat ),
+                                                           timeIt( DEncode.encode, payload, repeat ),
+                                                           timeIt( referenceDecode, data, repeat ),
+                                                           timeIt( DEncode.decode, data, repeat ),
+                                                           timeIt( streamDecode, data, repeat ) )
+  return 0
+
+if __name__ == "__main__":
+  size = 100000
+  if len( sys.argv ) > 1:
+    size = int( sys.argv[1] )
+  sys.exit( runBenchmark( size ) )
@@ -0,0 +1,89 @@
+""" :mod: DEncodeTests
+    =======================
+
+    .. module: DEncodeTests
+    :synopsis: test cases for DEncode
+
+    test cases for DEncode fast and incremental decoders
+"""
+
+__RCSID__ = "$Id $"
+
+## imports
+import datetime
+import unittest
+## SUT
+from DIRAC.Core.Utilities import DEncode
+
+def referenceEncode( uObject ):
+  eList = []
+  DEncode.g_dEncodeFunctions[ type( uObject ) ]( uObject, eList )
+  return "".join( eList )
+
+def referenceDecode( data ):
+  return DEncode.g_dDecodeFunctions[ data[0] ]( data, 0 )
+
+########################################################################
+class DEncodeTestCase( unittest.TestCase ):
+  """
+  .. class:: DEncodeTestCase
+
+  """
+
+  def setUp( self ):
+    self.objects = [ 1, -3, 2L ** 70, 1.5, 2.0 * 10 ** 20, 2.0 * 10 ** -10, True, False, None,
+                     "", "some string", u"\xe9t\xe9", [], (), {},
+                     datetime.datetime( 2013, 2, 3, 4, 5, 6, 7 ), datetime.date( 2013, 2, 3 ),
+                     datetime.time( 4, 5, 6 ),
+                     { 'OK' : True, 'Value' : { 'Successful' : { '/lfn/a' : { 'SE' : 'pfn' } },
+                                                'Failed' : { '/lfn/b' : 'No such file' } } },
+                     [ ( 'Job', 1, 'LCG.CERN.ch', 3.5, None ), [ [ 1, [ 2, [ "x" ] ] ] ] ],
+                     { 2 : "3", True : ( 3, None ), 2.0 * 10 ** 20 : 2.0 * 10 ** -10 } ]
+
+  def test01_encode( self ):
+    """ same wire format as the reference implementation """
+    for uObject in self.objects:
+      self.assertEqual( DEncode.encode( uObject ), referenceEncode( uObject ) )
+
+  def test02_decode( self ):
+    """ fast decode """
+    for uObject in self.objects:
+      data = DEncode.encode( uObject )
+      self.assertEqual( DEncode.decode( data ), ( uObject, len( data ) ) )
+      self.assertEqual( DEncode.decode( data ), referenceDecode( data ) )
+
+  def test03_decodeFromOffset( self ):
+    """ decode from an offset inside a bigger buffer """
+    data = DEncode.encode( self.objects[-2] )
+    buf = "%s:%sTRAILING" % ( len( data ), data )
+    offset = buf.index( ":" ) + 1
+    self.assertEqual( DEncode.decode( buf, offset ), ( self.objects[-2], offset + len( data ) ) )
+
+  def test04_streamDecoder( self ):
+    """ incremental decode with any chunk size """
+    for uObject in self.objects:
+      data = DEncode.encode( uObject )
+      for chunkSize in ( 1, 2, 3, 7, 1024 ):
+        decoder = DEncode.StreamDecoder()
+        for i in range( 0, len( data ), chunkSize ):
+          decoder.feed( data[ i : i + chunkSize ] )
+        self.assertEqual( decoder.finish(), uObject )
+
+  def test05_streamDecoderErrors( self ):
+    """ truncated and trailing data """
+    data = DEncode.encode( self.objects[-3] )
+    decoder = DEncode.StreamDecoder()
+    decoder.feed( data[:-1] )
+    self.assertFalse( decoder.isComplete() )
+    self.assertRaises( ValueError, decoder.finish )
+    decoder = DEncode.StreamDecoder()
+    decoder.feed( data + "i1e" )
+    self.assertTrue( decoder.isComplete() )
+    self.assertRaises( ValueError, decoder.finish )
+
+
+## test execution
+if __name__ == "__main__":
+  TESTLOADER = unittest.TestLoader()
+  SUITE = TESTLOADER.loadTestsFromTestCase( DEncodeTestCase )
+  unittest.TextTestRunner( verbosity = 3 ).run( SUITE )
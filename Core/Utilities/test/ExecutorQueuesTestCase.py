@@ -0,0 +1,82 @@
+""" Test for the waiting queues and the batch sending of the ExecutorDispatcher
+"""
+
+import unittest
+
+from DIRAC import S_OK
+from DIRAC.Core.Utilities.ExecutorDispatcher import ExecutorQueues, ExecutorDispatcher, ExecutorDispatcherCallbacks
+
+class SendCallbacks( ExecutorDispatcherCallbacks ):
+
+  def __init__( self ):
+    self.sent = []
+
+  def cbDispatch( self, taskId, taskObj, pathExecuted ):
+    if pathExecuted:
+      return S_OK()
+    return S_OK( "type0" )
+
+  def cbSendTask( self, taskId, taskObj, eId, eType ):
+    self.sent.append( ( eId, [ taskId ] ) )
+    return S_OK()
+
+  def cbSendTasks( self, tasksList, eId, eType ):
+    self.sent.append( ( eId, [ taskId for taskId, taskObj in tasksList ] ) )
+    return S_OK( {} )
+
+class ExecutorQueuesTestCase( unittest.TestCase ):
+  """ Queue operations and dispatching to an executor taking several tasks per message
+  """
+
+  def test_queues( self ):
+    eQ = ExecutorQueues()
+    for i in range( 3 ):
+      self.assertEqual( eQ.pushTask( "type0", i ), i + 1 )
+    self.assertEqual( eQ.pushTask( "type0", 1 ), 3 )
+    self.assertEqual( eQ.pushTask( "type1", 1 ), 0 )
+    self.assertEqual( eQ.popTask( "type0" ), ( 0, "type0" ) )
+    self.assertEqual( eQ.pushTask( "type0", 0, ahead = True ), 3 )
+    self.assertTrue( eQ.deleteTask( 1 ) )
+    self.assertFalse( eQ.deleteTask( 1 ) )
+    #Queued again after being deleted, it goes to the end
+    self.assertEqual( eQ.pushTask( "type0", 1 ), 3 )
+    self.assertEqual( eQ.getState(), { "type0" : [ 0, 2, 1 ] } )
+    self.assertEqual( eQ.popTasks( [ "type1", "type0" ], 2 ), ( [ 0, 2 ], "type0" ) )
+    self.assertEqual( eQ.waitingTasks( "type0" ), 1 )
+    self.assertEqual( eQ.popTasks( "type0", 2 ), ( [ 1 ], "type0" ) )
+    self.assertEqual( eQ.popTask( "type0" ), None )
+
+  def test_batches( self ):
+    eDispatch = ExecutorDispatcher()
+    callbacks = SendCallbacks()
+    eDispatch.setCallbacks( callbacks )
+    eDispatch.holdExecutor( "exec" )
+    eDispatch.addExecutor( "exec", [ "type0" ], 3, batchTasks = True )
+    for i in range( 5 ):
+      eDispatch.addTask( i, "task%s" % i )
+    self.assertEqual( callbacks.sent, [] )
+    eDispatch.releaseExecutor( "exec" )
+    self.assertEqual( callbacks.sent, [ ( "exec", [ 0, 1, 2 ] ) ] )
+    eDispatch.holdExecutor( "exec" )
+    eDispatch.taskProcessed( "exec", 0 )
+    eDispatch.taskProcessed( "exec", 1 )
+    eDispatch.releaseExecutor( "exec" )
+    self.assertEqual( callbacks.sent[1:], [ ( "exec", [ 3, 4 ] ) ] )
+
+  def test_heldExecutor( self ):
+    eDispatch = ExecutorDispatcher()
+    callbacks = SendCallbacks()
+    eDispatch.setCallbacks( callbacks )
+    eDispatch.addExecutor( "A", [ "type0" ], 4, batchTasks = True )
+    eDispatch.addExecutor( "B", [ "type0" ], 2, batchTasks = True )
+    #A has the most free slots but it is held, B gets the tasks meanwhile
+    eDispatch.holdExecutor( "A" )
+    for i in range( 6 ):
+      eDispatch.addTask( i, "task%s" % i )
+    self.assertEqual( callbacks.sent, [ ( "B", [ 0 ] ), ( "B", [ 1 ] ) ] )
+    eDispatch.releaseExecutor( "A" )
+    self.assertEqual( callbacks.sent[2:], [ ( "A", [ 2, 3, 4, 5 ] ) ] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( ExecutorQueuesTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,167 @@
+########################################################################
+# $HeadURL$
+########################################################################
+
+""" DIRAC FileCatalog bounded cache of directory paths and identifiers
+"""
+
+__RCSID__ = "$Id$"
+
+import threading
+import time
+
+class DirectoryCache:
+  """ Thread safe cache of path <-> DirID associations and of the DirIDs of the
+      parent hierarchy of the directories. When the cache is full the least
+      recently used entries are dropped. Entries expire after lifetime seconds
+      so that changes done by other catalog instances are eventually seen
+  """
+
+  def __init__( self, maxSize = 10000, lifetime = 600 ):
+    self.maxSize = maxSize
+    self.lifetime = lifetime
+    self.__lock = threading.Lock()
+    self.__tick = 0
+    # path -> [ dirID, last access tick, expiration time ]
+    self.__paths = {}
+    # dirID -> path
+    self.__ids = {}
+    # path -> list of the DirIDs of the parent hierarchy
+    self.__pathIDs = {}
+
+  def __touch( self, entry ):
+    self.__tick += 1
+    entry[1] = self.__tick
+
+  def __getEntry( self, path ):
+    entry = self.__paths.get( path )
+    if entry and self.lifetime and entry[2] < time.time():
+      self.__drop( path )
+      return None
+    return entry
+
+  def getDirID( self, path ):
+    """ Get the DirID of a path or None if it is not cached
+    """
+    self.__lock.acquire()
+    try:
+      entry = self.__getEntry( path )
+      if not entry or not entry[0]:
+        return None
+      self.__touch( entry )
+      return entry[0]
+    finally:
+      self.__lock.release()
+
+  def getPath( self, dirID ):
+    """ Get the path of a DirID or None if it is not cached
+    """
+    self.__lock.acquire()
+    try:
+      path = self.__ids.get( dirID )
+      if path is None:
+        return None
+      entry = self.__getEntry( path )
+      if not entry:
+        return None
+      self.__touch( entry )
+      return path
+    finally:
+      self.__lock.release()
+
+  def getPathIDs( self, path ):
+    """ Get the DirIDs of the parent hierarchy of a path or None if it is not cached
+    """
+    self.__lock.acquire()
+    try:
+      pathIDs = self.__pathIDs.get( path )
+      if pathIDs is None or not self.__getEntry( path ):
+        return None
+      self.__touch( self.__paths[ path ] )
+      return list( pathIDs )
+    finally:
+      self.__lock.release()
+
+  def add( self, path, dirID, pathIDs = None ):
+    """ Cache the DirID of a path and optionally the DirIDs of its parent hierarchy
+    """
+    if not self.maxSize or not ( dirID or pathIDs ):
+      return
+    self.__lock.acquire()
+    try:
+      entry = self.__paths.get( path )
+      if entry and dirID and entry[0] and entry[0] != dirID:
+        self.__drop( path )
+        entry = None
+      if not entry:
+        entry = [ 0, 0, time.time() + self.lifetime ]
+        self.__paths[ path ] = entry
+      if dirID and not entry[0]:
+        oldPath = self.__ids.get( dirID )
+        if oldPath is not None:
+          self.__drop( oldPath )
+        entry[0] = dirID
+        self.__ids[ dirID ] = path
+      self.__touch( entry )
+      if pathIDs is not None:
+        self.__pathIDs[ path ] = list( pathIDs )
+      if len( self.__paths ) > self.maxSize:
+        self.__evict()
+    finally:
+      self.__lock.release()
+
+  def removePath( self, path ):
+    """ Forget a path, all the directories below it and the hierarchies containing it
+    """
+    prefix = path.rstrip( '/' ) + '/'
+    self.__lock.acquire()
+    try:
+      for cachedPath in [ cPath for cPath in self.__paths if cPath == path or cPath.startswith( prefix ) ]:
+        self.__drop( cachedPath )
+    finally:
+      self.__lock.release()
+
+  def removeDirID( self, dirID ):
+    """ Forget a DirID and everything cached below it
+    """
+    self.__lock.acquire()
+    try:
+      path = self.__ids.get( dirID )
+    finally:
+      self.__lock.release()
+    if path is not None:
+      self.removePath( path )
+    else:
+      # The path is not known, drop the hierarchies referring to the DirID
+      self.__lock.acquire()
+      try:
+        for cachedPath in [ cPath for cPath in self.__pathIDs if dirID in self.__pathIDs[ cPath ] ]:
+          self.__drop( cachedPath )
+      finally:
+        self.__lock.release()
+
+  def clear( self ):
+    self.__lock.acquire()
+    try:
+      self.__paths = {}
+      self.__ids = {}
+      self.__pathIDs = {}
+    finally:
+      self.__lock.release()
+
+  def getSize( self ):
+    return len( self.__paths )
+
+  def __drop( self, path ):
+    entry = self.__paths.pop( path, None )
+    if entry and self.__ids.get( entry[0] ) == path:
+      del self.__ids[ entry[0] ]
+    self.__pathIDs.pop( path, None )
+
+  def __evict( self ):
+    """ Drop the least recently used tenth of the entries
+    """
+    toDrop = len( self.__paths ) - self.maxSize + max( 1, self.maxSize / 10 )
+    byAge = sorted( self.__paths, key = lambda cPath: self.__paths[ cPath ][1] )
+    for path in byAge[ :toDrop ]:
+      self.__drop( path )
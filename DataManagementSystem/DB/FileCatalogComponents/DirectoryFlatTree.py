@@ -89,12 +89,17 @@ class DirectoryFlatTree(DirectoryTreeBase):
     return S_OK({'Successful':successful,'Failed':res['Value']['Failed']})
 
   def findDir(self,path):
+    dirID = self._getCachedDirID(path)
+    if dirID:
+      return S_OK(dirID)
     res = self.__findDirs([path])
     if not res['OK']:
       return res
     if not res['Value']:
       return S_OK(0)
-    return S_OK(res['Value'].keys()[0])
+    dirID = res['Value'].keys()[0]
+    self._cacheDir(path,dirID)
+    return S_OK(dirID)
   
   def removeDir(self,path):
     """ Remove directory """
@@ -105,7 +110,9 @@ class DirectoryFlatTree(DirectoryTreeBase):
       return S_OK()
     dirID = res['Value']
     req = "DELETE FROM DirectoryInfo WHERE DirID=%d" % dirID
-    return self.db._update(req)
+    res = self.db._update(req)
+    self._invalidateCachedDir(path)
+    return res
 
 
  
@@ -138,6 +145,8 @@ class DirectoryFlatTree(DirectoryTreeBase):
     if not result['OK']:
       self.removeDir(path)
       return S_ERROR('Failed to create directory %s' % path)
+    self._invalidateCachedDir(path)
+    self._cacheDir(path,result['lastRowId'])
     return S_OK(result['lastRowId'])
 
   def makeDir(self,path):
@@ -152,6 +161,8 @@ class DirectoryFlatTree(DirectoryTreeBase):
     result = self.db._insert('DirectoryInfo',names,values)
     if not result['OK']:
       return result
+    self._invalidateCachedDir(path)
+    self._cacheDir(path,result['lastRowId'])
     return S_OK(result['lastRowId'])
 
   def existsDir(self,path):
@@ -184,12 +195,16 @@ class DirectoryFlatTree(DirectoryTreeBase):
 
   def getDirectoryPath(self,dirID):
     """ Get directory name by directory ID """
+    dirPath = self._getCachedPath(int(dirID))
+    if dirPath is not None:
+      return S_OK(dirPath)
     req = "SELECT DirName FROM DirectoryInfo WHERE DirID=%d" % int(dirID)
     result = self.db._query(req)
     if not result['OK']:
       return result
     if not result['Value']:
       return S_ERROR('Directory with id %d not found' % int(dirID) )
+    self._cacheDir(result['Value'][0][0],int(dirID))
     return S_OK(result['Value'][0][0])
 
   def getDirectoryName(self,dirID):
@@ -201,6 +216,9 @@ class DirectoryFlatTree(DirectoryTreeBase):
 
   def getPathIDs(self,path):
     """ Get IDs of all the directories in the parent hierarchy """    
+    pathIDs = self._getCachedPathIDs(path)
+    if pathIDs is not None:
+      return S_OK(pathIDs)
     elements = path.split('/')
     pelements = []
     dPath = ''
@@ -215,7 +233,9 @@ class DirectoryFlatTree(DirectoryTreeBase):
       return result
     if not result['Value']:
       return S_ERROR('Directory %s not found' % path)
-    return S_OK([ x[0] for x in result['Value'] ])
+    pathIDs = [ x[0] for x in result['Value'] ]
+    self._cacheDir(path,None,pathIDs)
+    return S_OK(pathIDs)
 
   def getChildren(self,path):
     """ Get child directory IDs for the given directory  """  
@@ -34,6 +34,11 @@ class DirectoryLevelTree(DirectoryTreeBase):
     """
     
     dpath = os.path.normpath( path )    
+    dirID = self._getCachedDirID( dpath )
+    if dirID:
+      res = S_OK( dirID )
+      res['Level'] = self.__getLevel( dpath )
+      return res
     req = "SELECT DirID,Level from FC_DirectoryLevelTree WHERE DirName='%s'" % dpath
     result = self.db._query(req,connection)
     if not result['OK']:
@@ -44,21 +49,41 @@ class DirectoryLevelTree(DirectoryTreeBase):
     
     res = S_OK(result['Value'][0][0])  
     res['Level'] = result['Value'][0][1]
+    self._cacheDir( dpath, res['Value'] )
     return res
   
   def findDirs( self, paths, connection=False ):
     """ Find DirIDs for the given path list
     """
-    dpaths = ','.join( [ "'"+os.path.normpath( path )+"'" for path in paths ] )
+    dirDict = {}
+    toQuery = []
+    for path in paths:
+      dpath = os.path.normpath( path )
+      dirID = self._getCachedDirID( dpath )
+      if dirID:
+        dirDict[dpath] = dirID
+      else:
+        toQuery.append( dpath )
+    if not toQuery:
+      return S_OK( dirDict )
+
+    dpaths = ','.join( [ "'"+dpath+"'" for dpath in toQuery ] )
     req = "SELECT DirName,DirID from FC_DirectoryLevelTree WHERE DirName in (%s)" % dpaths
     result = self.db._query(req,connection)
     if not result['OK']:
       return result
-    dirDict = {}
     for dirName, dirID in result['Value']:
       dirDict[dirName] = dirID
+      self._cacheDir( dirName, dirID )
 
     return S_OK( dirDict )
+
+  def __getLevel( self, dpath ):
+    """ Level of a normalized directory path, the root directory is at level 0
+    """
+    if dpath == '/':
+      return 0
+    return len( dpath[1:].split( '/' ) )
   
   def removeDir(self,path):
     """ Remove directory
@@ -75,6 +100,7 @@ class DirectoryLevelTree(DirectoryTreeBase):
     dirID = result['Value']
     req = "DELETE FROM FC_DirectoryLevelTree WHERE DirID=%d" % dirID
     result = self.db._update(req)
+    self._invalidateCachedDir( os.path.normpath( path ) )
     result['DirID'] = dirID
     return result
 
@@ -182,6 +208,8 @@ class DirectoryLevelTree(DirectoryTreeBase):
     else:
       result = self.db._query( "ROLLBACK;", conn )
       
+    self._invalidateCachedDir( os.path.normpath( path ) )
+    self._cacheDir( os.path.normpath( path ), dirID )
     result = S_OK(dirID)
     result['NewDirectory'] = True
     return result  
@@ -231,6 +259,9 @@ class DirectoryLevelTree(DirectoryTreeBase):
   def getDirectoryPath(self,dirID):
     """ Get directory name by directory ID
     """
+    dirPath = self._getCachedPath( int(dirID) )
+    if dirPath is not None:
+      return S_OK(dirPath)
     req = "SELECT DirName FROM FC_DirectoryLevelTree WHERE DirID=%d" % int(dirID)
     result = self.db._query(req)
     if not result['OK']:
@@ -238,6 +269,7 @@ class DirectoryLevelTree(DirectoryTreeBase):
     if not result['Value']:
       return S_ERROR('Directory with id %d not found' % int(dirID) )
     
+    self._cacheDir( result['Value'][0][0], int(dirID) )
     return S_OK(result['Value'][0][0])
 
   def getDirectoryPaths(self,dirIDList):
@@ -250,18 +282,29 @@ class DirectoryLevelTree(DirectoryTreeBase):
     if not dirs:
       return S_OK( {} )
       
-    dirListString = ','.join( [ str( d ) for d in dirs ] )
+    resultDict = {}
+    toQuery = []
+    for dirID in dirs:
+      dirPath = self._getCachedPath( int( dirID ) )
+      if dirPath is not None:
+        resultDict[int( dirID )] = dirPath
+      else:
+        toQuery.append( dirID )
+    if not toQuery:
+      return S_OK( resultDict )
+
+    dirListString = ','.join( [ str( d ) for d in toQuery ] )
 
     req = "SELECT DirID,DirName FROM FC_DirectoryLevelTree WHERE DirID in ( %s )" % dirListString
     result = self.db._query(req)
     if not result['OK']:
       return result
-    if not result['Value']:
+    if not result['Value'] and not resultDict:
       return S_ERROR('Directories not found: %s' % dirListString )
 
-    resultDict = {}
     for row in result['Value']:
       resultDict[int(row[0])] = row[1]
+      self._cacheDir( row[1], int(row[0]) )
 
     return S_OK(resultDict) 
  
@@ -280,6 +323,10 @@ class DirectoryLevelTree(DirectoryTreeBase):
         specified by its path
     """    
     
+    pathIDs = self._getCachedPathIDs( path )
+    if pathIDs is not None:
+      return S_OK( pathIDs )
+
     elements = path.split('/')
     pelements = []
     dPath = ''
@@ -296,7 +343,9 @@ class DirectoryLevelTree(DirectoryTreeBase):
     if not result['Value']:
       return S_ERROR('Directory %s not found' % path)
        
-    return S_OK([ x[0] for x in result['Value'] ])
+    pathIDs = [ x[0] for x in result['Value'] ]
+    self._cacheDir( path, None, pathIDs )
+    return S_OK( pathIDs )
   
   def getPathIDsByID_old(self,dirID):
     """ Get IDs of all the directories in the parent hierarchy for a directory
@@ -468,6 +517,9 @@ class DirectoryLevelTree(DirectoryTreeBase):
     if not result['OK']:
       return result
 
+    # Directory IDs and parents are going to change
+    self.dirCache.clear()
+
     parentDict = {}
     for dirID,parentID,level in result['Value']:
 
@@ -531,6 +583,7 @@ class DirectoryLevelTree(DirectoryTreeBase):
       result = self.__rebuildLevelIndexes( parentID, connection)
       resUnlock = self.db._query("UNLOCK TABLES", connection )       
       
+    self.dirCache.clear()
     return S_OK()
 
   def _getConnection( self, connection=False ):
@@ -23,6 +23,9 @@ class DirectoryNodeTree( DirectoryTreeBase ):
   def findDir( self, path ):
     """ Find the identifier of a directory specified by its path
     """
+    dirID = self._getCachedDirID( path )
+    if dirID:
+      return S_OK( dirID )
     dpath = path
     if path[0] == "/":
       dpath = path[1:]
@@ -43,6 +46,7 @@ class DirectoryNodeTree( DirectoryTreeBase ):
     if not result['Value']:
       return S_OK( 0 )
 
+    self._cacheDir( path, result['Value'][0][0] )
     return S_OK( result['Value'][0][0] )
 
   def makeDir( self, path ):
@@ -72,6 +76,8 @@ class DirectoryNodeTree( DirectoryTreeBase ):
     result = self.db._insert( 'FC_DirectoryTreeM', names, values )
     if not result['OK']:
       return result
+    self._invalidateCachedDir( path )
+    self._cacheDir( path, result['lastRowId'] )
     return S_OK( result['lastRowId'] )
 
   def existsDir( self, path ):
@@ -136,6 +142,10 @@ class DirectoryNodeTree( DirectoryTreeBase ):
     """ Get directory path by directory ID
     """
 
+    dirPath = self._getCachedPath( dirID )
+    if dirPath is not None:
+      return S_OK( '/' + dirPath )
+
     dirPath = ''
     dID = dirID
     while 1:
@@ -151,6 +161,7 @@ class DirectoryNodeTree( DirectoryTreeBase ):
       else:
         dID = result['Value']
 
+    self._cacheDir( dirPath, dirID )
     return S_OK( '/' + dirPath )
 
   def getPathIDs( self, path ):
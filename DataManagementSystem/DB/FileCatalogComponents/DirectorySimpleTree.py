@@ -20,6 +20,9 @@ class DirectorySimpleTree( DirectoryTreeBase ):
 
   def findDir( self, path ):
     
+    dirID = self._getCachedDirID( path )
+    if dirID:
+      return S_OK( dirID )
     req = "SELECT DirID from FC_DirectoryTree WHERE DirName='%s'" % path
     result = self.db._query(req)
     if not result['OK']:
@@ -28,6 +31,7 @@ class DirectorySimpleTree( DirectoryTreeBase ):
     if not result['Value']:
       return S_OK('')
     
+    self._cacheDir( path, result['Value'][0][0] )
     return S_OK( result['Value'][0][0] )
   
   def removeDir( self, path ):
@@ -43,6 +47,7 @@ class DirectorySimpleTree( DirectoryTreeBase ):
     dirID = result['Value']
     req = "DELETE FROM FC_DirectoryTree WHERE DirID=%d" % dirID
     result = self.db._update(req)
+    self._invalidateCachedDir( path )
     return result
 
   def makeDir( self, path ):
@@ -58,6 +63,8 @@ class DirectorySimpleTree( DirectoryTreeBase ):
     result = self.db._insert( 'FC_DirectoryTree', names, values )
     if not result['OK']:
       return result
+    self._invalidateCachedDir( path )
+    self._cacheDir( path, result['lastRowId'] )
     return S_OK(result['lastRowId'])
   
   def existsDir( self, path ):
@@ -97,6 +104,9 @@ class DirectorySimpleTree( DirectoryTreeBase ):
   def getDirectoryPath( self, dirID ):
     """ Get directory name by directory ID
     """
+    dirPath = self._getCachedPath( int(dirID) )
+    if dirPath is not None:
+      return S_OK( dirPath )
     req = "SELECT DirName FROM FC_DirectoryTree WHERE DirID=%d" % int(dirID)
     result = self.db._query(req)
     if not result['OK']:
@@ -104,6 +114,7 @@ class DirectorySimpleTree( DirectoryTreeBase ):
     if not result['Value']:
       return S_ERROR('Directory with id %d not found' % int(dirID) )
     
+    self._cacheDir( result['Value'][0][0], int(dirID) )
     return S_OK(result['Value'][0][0])
   
   def getDirectoryName( self, dirID ):
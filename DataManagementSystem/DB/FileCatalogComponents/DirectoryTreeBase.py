@@ -6,7 +6,8 @@
 __RCSID__ = "$Id$"
 
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.Utilities  import checkArgumentFormat
-from DIRAC                                                          import S_OK, S_ERROR, gLogger
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryCache import DirectoryCache
+from DIRAC                                                          import S_OK, S_ERROR, gLogger, gMonitor
 import time, threading, os
 from types import StringTypes, ListType
 import stat
@@ -20,6 +21,12 @@ class DirectoryTreeBase:
     self.db = database
     self.lock = threading.Lock()
     self.treeTable = ''
+    self.dirCache = DirectoryCache( getattr( database, 'directoryCacheSize', 0 ),
+                                    getattr( database, 'directoryCacheLifetime', 600 ) )
+    gMonitor.registerActivity( "DirectoryCacheHits", "Directory lookups served from the cache",
+                               "FileCatalogHandler", "lookups/min", gMonitor.OP_SUM )
+    gMonitor.registerActivity( "DirectoryCacheMisses", "Directory lookups not found in the cache",
+                               "FileCatalogHandler", "lookups/min", gMonitor.OP_SUM )
 
 ############################################################################
 #
@@ -61,6 +68,44 @@ class DirectoryTreeBase:
     """
     return S_ERROR( "To be implemented on derived class" )
 
+##########################################################################
+#
+# Directory path and ID cache shared by all the tree implementations
+#
+##########################################################################
+
+  def __markCacheLookup( self, value ):
+    if value is None:
+      gMonitor.addMark( "DirectoryCacheMisses", 1 )
+    else:
+      gMonitor.addMark( "DirectoryCacheHits", 1 )
+    return value
+
+  def _getCachedDirID( self, path ):
+    """ Get the DirID of a path from the cache, None if not there
+    """
+    return self.__markCacheLookup( self.dirCache.getDirID( path ) )
+
+  def _getCachedPath( self, dirID ):
+    """ Get the path of a DirID from the cache, None if not there
+    """
+    return self.__markCacheLookup( self.dirCache.getPath( dirID ) )
+
+  def _getCachedPathIDs( self, path ):
+    """ Get the DirIDs of the parent hierarchy of a path from the cache, None if not there
+    """
+    return self.__markCacheLookup( self.dirCache.getPathIDs( path ) )
+
+  def _cacheDir( self, path, dirID, pathIDs = None ):
+    """ Keep the DirID and optionally the parent hierarchy of an existing directory
+    """
+    self.dirCache.add( path, dirID, pathIDs )
+
+  def _invalidateCachedDir( self, path ):
+    """ To be called whenever a directory is created, removed or moved
+    """
+    self.dirCache.removePath( path )
+
 ##########################################################################
 
 
@@ -59,6 +59,10 @@ class FileCatalogDB( DB ):
     self.validReplicaStatus = databaseConfig['ValidReplicaStatus']
     self.visibleFileStatus = databaseConfig['VisibleFileStatus']
     self.visibleReplicaStatus = databaseConfig['VisibleReplicaStatus']
+    # Maximum number of directories kept in the path <-> DirID cache of the directory tree.
+    # Disabled by default: it is only safe when a single catalog instance changes the directories
+    self.directoryCacheSize = databaseConfig.get( 'DirectoryCacheSize', 0 )
+    self.directoryCacheLifetime = databaseConfig.get( 'DirectoryCacheLifetime', 600 )
 
     try:
       # Obtain the plugins to be used for DB interaction
@@ -0,0 +1,78 @@
+""" :mod: Test_DirectoryCache
+    =======================
+
+    .. module: Test_DirectoryCache
+    :synopsis: test cases for the file catalog directory cache
+"""
+
+__RCSID__ = "$Id $"
+
+import unittest
+## SUT
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryCache import DirectoryCache
+
+########################################################################
+class DirectoryCacheTestCase( unittest.TestCase ):
+  """
+  .. class:: DirectoryCacheTestCase
+
+  """
+
+  def setUp( self ):
+    self.cache = DirectoryCache( 10 )
+    self.cache.add( '/vo', 1, [ 1 ] )
+    self.cache.add( '/vo/user', 2, [ 1, 2 ] )
+    self.cache.add( '/vo/user/a', 3 )
+    self.cache.add( '/vo/users', 4 )
+
+  def test01_lookup( self ):
+    """ both directions and parent hierarchy """
+    self.assertEqual( self.cache.getDirID( '/vo/user' ), 2 )
+    self.assertEqual( self.cache.getPath( 3 ), '/vo/user/a' )
+    self.assertEqual( self.cache.getPathIDs( '/vo/user' ), [ 1, 2 ] )
+    self.assertEqual( self.cache.getPathIDs( '/vo/user/a' ), None )
+    self.assertEqual( self.cache.getDirID( '/vo/data' ), None )
+    self.assertEqual( self.cache.getPath( 5 ), None )
+
+  def test02_invalidation( self ):
+    """ removing a directory drops its subtree only """
+    self.cache.removePath( '/vo/user' )
+    self.assertEqual( self.cache.getDirID( '/vo/user' ), None )
+    self.assertEqual( self.cache.getDirID( '/vo/user/a' ), None )
+    self.assertEqual( self.cache.getPath( 3 ), None )
+    self.assertEqual( self.cache.getDirID( '/vo/users' ), 4 )
+    self.assertEqual( self.cache.getDirID( '/vo' ), 1 )
+    self.cache.removeDirID( 1 )
+    self.assertEqual( self.cache.getSize(), 0 )
+
+  def test03_changedID( self ):
+    """ a path or an ID seen again with a different association replaces the old one """
+    self.cache.add( '/vo/user', 7 )
+    self.assertEqual( self.cache.getPath( 2 ), None )
+    self.assertEqual( self.cache.getPathIDs( '/vo/user' ), None )
+    self.cache.add( '/vo/other', 3 )
+    self.assertEqual( self.cache.getDirID( '/vo/user/a' ), None )
+    self.assertEqual( self.cache.getPath( 3 ), '/vo/other' )
+
+  def test04_eviction( self ):
+    """ least recently used entries are dropped first """
+    self.cache.getDirID( '/vo' )
+    for i in range( 10 ):
+      self.cache.add( '/vo/dir%s' % i, 10 + i )
+    self.assertTrue( self.cache.getSize() <= 10 )
+    self.assertEqual( self.cache.getDirID( '/vo/user' ), None )
+    self.assertEqual( self.cache.getDirID( '/vo/dir9' ), 19 )
+
+  def test05_expiration( self ):
+    """ expired entries are not returned """
+    cache = DirectoryCache( 10, -1 )
+    cache.add( '/vo', 1 )
+    self.assertEqual( cache.getDirID( '/vo' ), None )
+    self.assertEqual( cache.getSize(), 0 )
+
+
+## test execution
+if __name__ == "__main__":
+  TESTLOADER = unittest.TestLoader()
+  SUITE = TESTLOADER.loadTestsFromTestCase( DirectoryCacheTestCase )
+  unittest.TextTestRunner( verbosity = 3 ).run( SUITE )
@@ -59,12 +59,18 @@ def initializeFileCatalogHandler( serviceInfo ):
                     'ValidFileStatus'     : ['AprioriGood','Trash','Removing','Probing'],
                     'ValidReplicaStatus'  : ['AprioriGood','Trash','Removing','Probing'],
                     'VisibleFileStatus'   : ['AprioriGood'],
-                    'VisibleReplicaStatus': ['AprioriGood']}
+                    'VisibleReplicaStatus': ['AprioriGood'],
+                    'DirectoryCacheSize'  : 0,
+                    'DirectoryCacheLifetime' : 600 }
   for configKey in sortList( defaultConfig.keys() ):
     defaultValue = defaultConfig[configKey]
     configValue = getServiceOption( serviceInfo, configKey, defaultValue )
     gLogger.info( "%-20s : %-20s" % ( str( configKey ), str( configValue ) ) )
     databaseConfig[configKey] = configValue
+  if serviceInfo.get( 'numClones', 1 ) > 1:
+    # The clone processes can't invalidate each other's directory cache
+    gLogger.info( "Served by %s processes: directory cache disabled" % serviceInfo[ 'numClones' ] )
+    databaseConfig['DirectoryCacheSize'] = 0
   res = gFileCatalogDB.setConfig( databaseConfig )
 
   gMonitor.registerActivity( "AddFile", "Amount of addFile calls",
@@ -1,7 +1,7 @@
 # $HeadURL$
 __RCSID__ = "b7db10b (2013-03-06 01:10:41 +0100) Andrei Tsaregorodtsev <atsareg@in2p3.fr>"
 
-#import threading
+import threading
 import time
 import types
 import DIRAC
@@ -72,7 +72,9 @@ class MonitoringClient(object):
     self.sourceDict[ 'componentName' ] = "unknown"
     self.sourceDict[ 'componentLocation' ] = "unknown"
     self.activitiesDefinitions = {}
-    self.activitiesMarks = {}
+    #Marks are aggregated per thread and merged when flushing
+    self.__threadMarks = threading.local()
+    self.__threadMarksList = []
     self.definitionsToSend = {}
     self.marksToSend = {}
     self.__compRegistrationExtraDict = {}
@@ -163,6 +165,22 @@ class MonitoringClient(object):
     """
     self.sourceDict[ 'componentType' ] = componentType
 
+  def resetRegistration( self ):
+    """
+    Drop the marks not sent yet and register again as a new component on the next
+    flush. To be called by forked processes that must not report as their parent
+    """
+    self.activitiesLock.acquire()
+    try:
+      self.sourceId = 0
+      self.definitionsToSend = dict( [ ( name, dict( self.activitiesDefinitions[ name ] ) )
+                                       for name in self.activitiesDefinitions ] )
+      self.marksToSend = {}
+      self.__threadMarks = threading.local()
+      self.__threadMarksList = []
+    finally:
+      self.activitiesLock.release()
+
   def registerActivity( self, name, description, category, unit, operation, bucketLength = 60 ):
     """
     Register new activity. Before reporting information to the server, the activity
@@ -194,7 +212,6 @@ class MonitoringClient(object):
                                                "type" : operation,
                                                "bucketLength" : bucketLength
                                               }
-        self.activitiesMarks[ name ] = {}
         self.definitionsToSend[ name ] = dict( self.activitiesDefinitions[ name ] )
     finally:
       self.activitiesLock.release()
@@ -204,6 +221,24 @@ class MonitoringClient(object):
     nowEpoch = int( Time.toEpoch() )
     return nowEpoch - nowEpoch % stepLength
 
+  def __getThreadMarks( self ):
+    """
+    Get the marks of the current thread. Marks are stored as
+    { activity : { bucket : [ count, sum, min, max ] } } and protected by a lock
+    only shared with the flushing thread
+    """
+    try:
+      return self.__threadMarks.marks
+    except AttributeError:
+      threadMarks = ( threading.currentThread(), threading.Lock(), {} )
+      self.activitiesLock.acquire()
+      try:
+        self.__threadMarksList.append( threadMarks )
+      finally:
+        self.activitiesLock.release()
+      self.__threadMarks.marks = threadMarks
+      return threadMarks
+
   def addMark( self, name, value = 1 ):
     """
     Add a new mark to the specified activity
@@ -223,47 +258,97 @@ class MonitoringClient(object):
     if type( value ) not in self.__validMonitoringValues:
       raise MonitoringClientActivityValueTypeError( "Activity '%s' value's type (%s) is not valid" % ( name, type(value) ) )
       #raise Exception( "Value's type %s is not valid" % value )
-    self.activitiesLock.acquire()
+    markTime = self.__UTCStepTime( name )
+    dummy, marksLock, marks = self.__getThreadMarks()
+    marksLock.acquire()
     try:
-      self.logger.debug( "Adding mark to %s" % name )
-      markTime = self.__UTCStepTime( name )
-      if markTime in self.activitiesMarks[ name ]:
-        self.activitiesMarks[ name ][ markTime ].append( value )
+      try:
+        aggregate = marks[ name ][ markTime ]
+      except KeyError:
+        marks.setdefault( name, {} )[ markTime ] = [ 1, value, value, value ]
+        return
+      aggregate[0] += 1
+      aggregate[1] += value
+      if value < aggregate[2]:
+        aggregate[2] = value
+      if value > aggregate[3]:
+        aggregate[3] = value
+    finally:
+      marksLock.release()
+
+  def __collectMarks( self, allData, activitiesDefinitions ):
+    """
+      Take the marks of all the threads except the last step ones
+      and merge them in { activity : { bucket : [ count, sum, min, max ] } }
+      Marks of activities registered after the definitions were copied are left
+      for the next flush
+    """
+    now = int( Time.toEpoch() )
+    lastStepToSend = {}
+    for key in activitiesDefinitions:
+      if allData:
+        lastStepToSend[ key ] = now
       else:
-        self.activitiesMarks[ name ][ markTime ] = [ value ]
+        stepLength = activitiesDefinitions[ key ][ 'bucketLength' ]
+        lastStepToSend[ key ] = now - now % stepLength
+    collectedMarks = {}
+    self.activitiesLock.acquire()
+    try:
+      threadMarksList = list( self.__threadMarksList )
     finally:
       self.activitiesLock.release()
+    deadThreads = []
+    for threadMarks in threadMarksList:
+      thread, marksLock, marks = threadMarks
+      marksLock.acquire()
+      try:
+        for key in marks.keys():
+          if key not in lastStepToSend:
+            continue
+          acMarks = marks[ key ]
+          for markTime in [ markTime for markTime in acMarks if markTime < lastStepToSend[ key ] ]:
+            aggregate = acMarks.pop( markTime )
+            acCollected = collectedMarks.setdefault( key, {} )
+            if markTime not in acCollected:
+              acCollected[ markTime ] = aggregate
+              continue
+            collected = acCollected[ markTime ]
+            collected[0] += aggregate[0]
+            collected[1] += aggregate[1]
+            collected[2] = min( collected[2], aggregate[2] )
+            collected[3] = max( collected[3], aggregate[3] )
+          if not acMarks:
+            del( marks[ key ] )
+        if not marks and not thread.isAlive():
+          deadThreads.append( threadMarks )
+      finally:
+        marksLock.release()
+    if deadThreads:
+      self.activitiesLock.acquire()
+      try:
+        for threadMarks in deadThreads:
+          self.__threadMarksList.remove( threadMarks )
+      finally:
+        self.activitiesLock.release()
+    return collectedMarks
 
   def __consolidateMarks( self, allData ):
     """
-      Copies all marks except last step ones
+      Takes all marks except last step ones
       and consolidates them
     """
-    consolidatedMarks = {}
-    remainderMarks = {}
-    for key in self.activitiesMarks:
-      if allData:
-        lastStepToSend = int( Time.toEpoch() )
-      else:
-        lastStepToSend = self.__UTCStepTime( key )
-      consolidatedMarks[ key ] = {}
-      remainderMarks [ key ] = {}
-      for markTime in self.activitiesMarks[ key ]:
-        markValue = self.activitiesMarks[ key ][ markTime ]
-        if markTime >= lastStepToSend:
-          remainderMarks[ key ][ markTime ] = markValue
-        else:
-          consolidatedMarks[ key ][ markTime ] = markValue
-          #Consolidate the copied ones
-          totalValue = 0
-          for mark in consolidatedMarks[ key ][ markTime ]:
-            totalValue += mark
-          if self.activitiesDefinitions[ key ][ 'type' ] == self.OP_MEAN:
-            totalValue /= len( consolidatedMarks[ key ][ markTime ] )
-          consolidatedMarks[ key ][ markTime ] = totalValue
-      if len( consolidatedMarks[ key ] ) == 0:
-        del( consolidatedMarks[ key ] )
-    self.activitiesMarks = remainderMarks
+    self.activitiesLock.acquire()
+    try:
+      activitiesDefinitions = dict( self.activitiesDefinitions )
+    finally:
+      self.activitiesLock.release()
+    consolidatedMarks = self.__collectMarks( allData, activitiesDefinitions )
+    for key in consolidatedMarks:
+      for markTime in consolidatedMarks[ key ]:
+        count, totalValue, dummy, dummy = consolidatedMarks[ key ][ markTime ]
+        if activitiesDefinitions[ key ][ 'type' ] == self.OP_MEAN:
+          totalValue /= count
+        consolidatedMarks[ key ][ markTime ] = totalValue
     return consolidatedMarks
 
   def flush( self, allData = False ):
@@ -272,12 +357,8 @@ class MonitoringClient(object):
     self.flushingLock.acquire()
     self.logger.debug( "Sending information to server" )
     try:
-      self.activitiesLock.acquire()
-      try:
-        self.logger.debug( "Consolidating data..." )
-        self.__appendMarksToSend( self.__consolidateMarks( allData ) )
-      finally:
-        self.activitiesLock.release()
+      self.logger.debug( "Consolidating data..." )
+      self.__appendMarksToSend( self.__consolidateMarks( allData ) )
       #Commit new activities
       if self.__dataToSend():
         if not self.__disabled():
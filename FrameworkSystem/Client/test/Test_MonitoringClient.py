@@ -0,0 +1,123 @@
+""" Test for the per thread aggregation of the marks of the MonitoringClient
+"""
+
+import threading
+import unittest
+
+from mock import MagicMock, patch
+
+from DIRAC.FrameworkSystem.Client import MonitoringClient as MonitoringClientModule
+from DIRAC.FrameworkSystem.Client.MonitoringClient import MonitoringClient
+
+NOW = 1000 * 3600
+
+class MonitoringClientTestCase( unittest.TestCase ):
+  """ Marks added from several threads and flushed without a server
+  """
+  def setUp( self ):
+    #In the middle of the bucket starting at NOW
+    self.now = NOW + 30
+    patcher = patch.object( MonitoringClientModule.Time, 'toEpoch', side_effect = lambda: self.now )
+    patcher.start()
+    self.addCleanup( patcher.stop )
+    self.client = MonitoringClient()
+    self.client.logger = MagicMock()
+    self.client.cfgSection = "/Systems/Test"
+    self.client._MonitoringClient__initialized = True
+    self.client._MonitoringClient__disabled = MagicMock( return_value = False )
+    self.client._MonitoringClient__sendData = MagicMock( side_effect = self.sendData )
+    self.sent = []
+    self.client.registerActivity( "mean", "Mean", "Test", "s", MonitoringClient.OP_MEAN )
+    self.client.registerActivity( "sum", "Sum", "Test", "jobs", MonitoringClient.OP_SUM )
+
+  def sendData( self ):
+    self.client.definitionsToSend = {}
+    if self.client.marksToSend:
+      self.sent.append( self.client.marksToSend )
+    self.client.marksToSend = {}
+
+  def addMarks( self, name, values ):
+    for value in values:
+      self.client.addMark( name, value )
+
+  def runThreads( self, name, valuesList ):
+    threads = [ threading.Thread( target = self.addMarks, args = ( name, values ) ) for values in valuesList ]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+  def collect( self ):
+    return self.client._MonitoringClient__collectMarks( True, dict( self.client.activitiesDefinitions ) )
+
+  def test_aggregation( self ):
+    valuesList = [ range( iThread, 1000, 7 ) for iThread in range( 7 ) ]
+    self.runThreads( "mean", valuesList )
+    self.runThreads( "sum", valuesList )
+    self.addMarks( "sum", [ 2000 ] )
+    collected = self.collect()
+    self.assertEqual( collected[ "mean" ], { NOW : [ 1000, sum( range( 1000 ) ), 0, 999 ] } )
+    self.assertEqual( collected[ "sum" ], { NOW : [ 1001, sum( range( 1000 ) ) + 2000, 0, 2000 ] } )
+
+  def test_flush( self ):
+    self.runThreads( "mean", [ [ 2, 4 ], [ 6 ] ] )
+    self.runThreads( "sum", [ [ 2, 4 ], [ 6 ] ] )
+    #The current bucket is not complete
+    self.client.flush()
+    self.assertEqual( self.sent, [] )
+    self.now += 60
+    self.addMarks( "sum", [ 10 ] )
+    self.client.flush()
+    self.client.flush( allData = True )
+    self.assertEqual( self.sent, [ { "mean" : { NOW : 4 }, "sum" : { NOW : 12 } }, { "sum" : { NOW + 60 : 10 } } ] )
+
+  def test_deadThreads( self ):
+    self.runThreads( "sum", [ [ 1 ], [ 2 ] ] )
+    self.addMarks( "sum", [ 3 ] )
+    threadMarksList = self.client._MonitoringClient__threadMarksList
+    self.assertEqual( len( threadMarksList ), 3 )
+    self.client.flush( allData = True )
+    #The storage of the finished threads goes once flushed, the one of this thread stays
+    self.assertEqual( [ threadMarks[0] for threadMarks in threadMarksList ], [ threading.currentThread() ] )
+    self.addMarks( "sum", [ 4 ] )
+    self.client.flush( allData = True )
+    self.assertEqual( self.sent, [ { "sum" : { NOW : 6 } }, { "sum" : { NOW : 4 } } ] )
+
+  def test_registerDuringFlush( self ):
+    activitiesDefinitions = dict( self.client.activitiesDefinitions )
+    #Registered and marked once the flush copied the definitions
+    self.client.registerActivity( "new", "New", "Test", "jobs", MonitoringClient.OP_SUM )
+    self.addMarks( "new", [ 5 ] )
+    self.addMarks( "sum", [ 1 ] )
+    collected = self.client._MonitoringClient__collectMarks( True, activitiesDefinitions )
+    self.assertEqual( collected, { "sum" : { NOW : [ 1, 1, 1, 1 ] } } )
+    #Left for the next flush
+    self.client.flush( allData = True )
+    self.assertEqual( self.sent, [ { "new" : { NOW : 5 } } ] )
+
+  def test_concurrentRegistrations( self ):
+    errors = []
+    def register():
+      try:
+        for iActivity in range( 300 ):
+          name = "activity%s" % iActivity
+          self.client.registerActivity( name, name, "Test", "jobs", MonitoringClient.OP_SUM )
+          self.client.addMark( name, 1 )
+      except Exception, excp:
+        errors.append( excp )
+    registering = threading.Thread( target = register )
+    registering.start()
+    while registering.isAlive():
+      self.client.flush( allData = True )
+    registering.join()
+    self.client.flush( allData = True )
+    self.assertEqual( errors, [] )
+    sentMarks = {}
+    for marksToSend in self.sent:
+      for name in marksToSend:
+        sentMarks[ name ] = sentMarks.get( name, 0 ) + marksToSend[ name ][ NOW ]
+    self.assertEqual( sentMarks, dict( [ ( "activity%s" % iActivity, 1 ) for iActivity in range( 300 ) ] ) )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( MonitoringClientTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
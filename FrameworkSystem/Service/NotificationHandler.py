@@ -30,7 +30,8 @@ def initializeNotificationHandler( serviceInfo ):
 
   global gNotDB
   gNotDB = NotificationDB()
-  gThreadScheduler.addPeriodicTask( 3600, gNotDB.purgeExpiredNotifications() )
+  if serviceInfo.get( 'cloneId', 0 ) == 0:
+    gThreadScheduler.addPeriodicTask( 3600, gNotDB.purgeExpiredNotifications() )
   return S_OK()
 
 class NotificationHandler( RequestHandler ):
@@ -24,10 +24,12 @@ class ProxyManagerHandler( RequestHandler ):
       cls.__proxyDB = ProxyDB( useMyProxy = useMyProxy )
     except RuntimeError, excp:
       return S_ERROR( "Can't connect to ProxyDB: %s" % excp )
-    gThreadScheduler.addPeriodicTask( 900, cls.__proxyDB.purgeExpiredTokens, elapsedTime = 900 )
-    gThreadScheduler.addPeriodicTask( 900, cls.__proxyDB.purgeExpiredRequests, elapsedTime = 900 )
-    gThreadScheduler.addPeriodicTask( 21600, cls.__proxyDB.purgeLogs )
-    gThreadScheduler.addPeriodicTask( 3600, cls.__proxyDB.purgeExpiredProxies )
+    #The purges are done by one of the clone processes
+    if cls.srv_getCloneId() == 0:
+      gThreadScheduler.addPeriodicTask( 900, cls.__proxyDB.purgeExpiredTokens, elapsedTime = 900 )
+      gThreadScheduler.addPeriodicTask( 900, cls.__proxyDB.purgeExpiredRequests, elapsedTime = 900 )
+      gThreadScheduler.addPeriodicTask( 21600, cls.__proxyDB.purgeLogs )
+      gThreadScheduler.addPeriodicTask( 3600, cls.__proxyDB.purgeExpiredProxies )
     gLogger.info( "MyProxy: %s\n MyProxy Server: %s" % ( useMyProxy, cls.__proxyDB.getMyProxyServer() ) )
     return S_OK()
 
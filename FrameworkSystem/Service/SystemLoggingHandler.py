@@ -5,14 +5,17 @@ in the DISET framework.
 The following methods are available in the Service interface::
 
     addMessages()
+    addCompressedMessages()
 
 """
 __RCSID__ = "$Id$"
 
+import zlib
 from types import ListType, StringTypes
 
 from DIRAC                                            import S_OK, S_ERROR, gLogger
 from DIRAC.Core.DISET.RequestHandler                  import RequestHandler
+from DIRAC.Core.Utilities                             import DEncode
 from DIRAC.FrameworkSystem.private.logging.Message    import tupleToMessage
 from DIRAC.FrameworkSystem.DB.SystemLoggingDB         import SystemLoggingDB
 
@@ -80,3 +83,15 @@ class SystemLoggingHandler( RequestHandler ):
         return S_ERROR( result['Message'] )
     return S_OK()
 
+  types_addCompressedMessages = [ StringTypes, StringTypes, StringTypes ]
+  def export_addCompressedMessages( self, compressedMessages, site, nodeFQDN ):
+    """
+    Same as addMessages but the list of messages comes DEncoded and zlib compressed
+    """
+    try:
+      messagesList = DEncode.decode( zlib.decompress( compressedMessages ) )[0]
+    except Exception, e:
+      return S_ERROR( "Could not decompress the messages: %s" % str( e ) )
+    if type( messagesList ) != ListType:
+      return S_ERROR( "The compressed messages are not a list" )
+    return self.export_addMessages( messagesList, site, nodeFQDN )
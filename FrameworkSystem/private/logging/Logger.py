@@ -4,6 +4,7 @@ __RCSID__ = "$Id$"
    DIRAC Logger client
 """
 
+import re
 import sys
 import traceback
 import inspect
@@ -16,6 +17,9 @@ import DIRAC
 
 DEBUG = 1
 
+#Conversion specifier in a log message, "100% sure" does not have any
+gFormatSpecifier = re.compile( r"%(\([^)]*\))?[-#0+]*(\d+|\*)?(\.(\d+|\*))?[diouxXeEfFgGcrs]" )
+
 class Logger:
 
   defaultLogLevel = 'NOTICE'
@@ -27,6 +31,8 @@ class Logger:
     self._outputList = []
     self._subLoggersDict = {}
     self._logLevels = LogLevels()
+    #Level name -> shown or not with the current minimum level
+    self._enabledLevels = {}
     self.__backendOptions = { 'showHeaders' : True, 'showThreads' : False, 'Color' : False }
     self.__preinitialize()
     self.__initialized = False
@@ -54,6 +60,7 @@ class Logger:
     self._systemName = "Framework"
     self.registerBackends( [ 'stdout' ] )
     self._minLevel = self._logLevels.getLevelValue( "NOTICE" )
+    self._enabledLevels = {}
     #HACK to take into account dev levels before the command line if fully parsed
     debLevs = 0
     for arg in sys.argv:
@@ -125,6 +132,7 @@ class Logger:
     levelName = levelName.upper()
     if levelName in self._logLevels.getLevels():
       self._minLevel = abs( self._logLevels.getLevelValue( levelName ) )
+      self._enabledLevels = {}
       return True
     return False
 
@@ -132,75 +140,78 @@ class Logger:
     return self._logLevels.getLevel( self._minLevel )
 
   def shown( self, levelName ):
-    levelName = levelName.upper()
-    if levelName in self._logLevels.getLevels():
-      return self._logLevels.getLevelValue( levelName ) <= levelName
-    return False
+    return self.isEnabledFor( levelName )
+
+  def isEnabledFor( self, levelName ):
+    """ Check if messages of a given level would be shown. Use it to guard
+        expensive computations done only for logging
+    """
+    try:
+      return self._enabledLevels[ levelName ]
+    except KeyError:
+      levelValue = self._logLevels.getLevelValue( levelName.upper() )
+      enabled = levelValue is not None and abs( levelValue ) >= self._minLevel
+      self._enabledLevels[ levelName ] = enabled
+      return enabled
 
   def getName( self ):
     return self._systemName
 
-  def always( self, sMsg, sVarMsg = '' ):
-    messageObject = Message( self._systemName,
-                             self._logLevels.always,
-                             Time.dateTime(),
-                             sMsg,
-                             sVarMsg,
-                             self.__discoverCallingFrame() )
-    return self.processMessage( messageObject )
+  def always( self, sMsg, *args ):
+    if not self.isEnabledFor( self._logLevels.always ):
+      return True
+    return self.__logMessage( self._logLevels.always, sMsg, args )
 
-  def notice( self, sMsg, sVarMsg = '' ):
-    messageObject = Message( self._systemName,
-                             self._logLevels.notice,
-                             Time.dateTime(),
-                             sMsg,
-                             sVarMsg,
-                             self.__discoverCallingFrame() )
-    return self.processMessage( messageObject )
+  def notice( self, sMsg, *args ):
+    if not self.isEnabledFor( self._logLevels.notice ):
+      return True
+    return self.__logMessage( self._logLevels.notice, sMsg, args )
 
-  def info( self, sMsg, sVarMsg = '' ):
-    messageObject = Message( self._systemName,
-                             self._logLevels.info,
-                             Time.dateTime(),
-                             sMsg,
-                             sVarMsg,
-                             self.__discoverCallingFrame() )
-    return self.processMessage( messageObject )
+  def info( self, sMsg, *args ):
+    if not self.isEnabledFor( self._logLevels.info ):
+      return True
+    return self.__logMessage( self._logLevels.info, sMsg, args )
 
-  def verbose( self, sMsg, sVarMsg = '' ):
-    messageObject = Message( self._systemName,
-                             self._logLevels.verbose,
-                             Time.dateTime(),
-                             sMsg,
-                             sVarMsg,
-                             self.__discoverCallingFrame() )
-    return self.processMessage( messageObject )
+  def verbose( self, sMsg, *args ):
+    if not self.isEnabledFor( self._logLevels.verbose ):
+      return True
+    return self.__logMessage( self._logLevels.verbose, sMsg, args )
 
-  def debug( self, sMsg, sVarMsg = '' ):
-    messageObject = Message( self._systemName,
-                             self._logLevels.debug,
-                             Time.dateTime(),
-                             sMsg,
-                             sVarMsg,
-                             self.__discoverCallingFrame() )
-    return self.processMessage( messageObject )
+  def debug( self, sMsg, *args ):
+    if not self.isEnabledFor( self._logLevels.debug ):
+      return True
+    return self.__logMessage( self._logLevels.debug, sMsg, args )
 
-  def warn( self, sMsg, sVarMsg = '' ):
-    messageObject = Message( self._systemName,
-                             self._logLevels.warn,
-                             Time.dateTime(),
-                             sMsg,
-                             sVarMsg,
-                             self.__discoverCallingFrame() )
-    return self.processMessage( messageObject )
+  def warn( self, sMsg, *args ):
+    if not self.isEnabledFor( self._logLevels.warn ):
+      return True
+    return self.__logMessage( self._logLevels.warn, sMsg, args )
+
+  def error( self, sMsg, *args ):
+    if not self.isEnabledFor( self._logLevels.error ):
+      return True
+    return self.__logMessage( self._logLevels.error, sMsg, args )
 
-  def error( self, sMsg, sVarMsg = '' ):
+  def __logMessage( self, level, sMsg, args ):
+    """ Build the message once the level is known to be shown. A single argument
+        is the variable part of the message unless sMsg has conversion specifiers,
+        in which case sMsg is formatted with the arguments. If the formatting
+        fails the raw message is logged with the arguments as variable part
+    """
+    sVarMsg = ''
+    if len( args ) == 1 and not gFormatSpecifier.search( str( sMsg ).replace( '%%', '' ) ):
+      sVarMsg = args[0]
+    elif args:
+      try:
+        sMsg = sMsg % args
+      except ( TypeError, ValueError ):
+        sVarMsg = " ".join( [ str( arg ) for arg in args ] )
     messageObject = Message( self._systemName,
-                             self._logLevels.error,
+                             level,
                              Time.dateTime(),
                              sMsg,
                              sVarMsg,
-                             self.__discoverCallingFrame() )
+                             self.__discoverCallingFrame( 3 ) )
     return self.processMessage( messageObject )
 
   def exception( self, sMsg = "", sVarMsg = '', lException = False, lExcInfo = False ):
@@ -216,14 +227,10 @@ class Logger:
                              self.__discoverCallingFrame() )
     return self.processMessage( messageObject )
 
-  def fatal( self, sMsg, sVarMsg = '' ):
-    messageObject = Message( self._systemName,
-                             self._logLevels.fatal,
-                             Time.dateTime(),
-                             sMsg,
-                             sVarMsg,
-                             self.__discoverCallingFrame() )
-    return self.processMessage( messageObject )
+  def fatal( self, sMsg, *args ):
+    if not self.isEnabledFor( self._logLevels.fatal ):
+      return True
+    return self.__logMessage( self._logLevels.fatal, sMsg, args )
 
   def showStack( self ):
     messageObject = Message( self._systemName,
@@ -282,11 +289,11 @@ class Logger:
                          stack )
 
 
-  def __discoverCallingFrame( self ):
+  def __discoverCallingFrame( self, depth = 2 ):
     if self.__testLevel( self._logLevels.debug ) and self._showCallingFrame:
       oActualFrame = inspect.currentframe()
       lOuterFrames = inspect.getouterframes( oActualFrame )
-      lCallingFrame = lOuterFrames[2]
+      lCallingFrame = lOuterFrames[ depth ]
       return "%s:%s" % ( lCallingFrame[1].replace( sys.path[0], "" )[1:], lCallingFrame[2] )
     else:
       return ""
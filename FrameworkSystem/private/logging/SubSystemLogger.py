@@ -17,6 +17,10 @@ class SubSystemLogger( Logger ):
     self.__masterLogger = masterLogger
     self._subName = subName
 
+  def isEnabledFor( self, levelName ):
+    #Messages are filtered by the master logger
+    return self.__masterLogger.isEnabledFor( levelName )
+
   def processMessage( self, messageObject ):
     if self.__child:
       messageObject.setSubSystemName( self._subName )
@@ -3,12 +3,20 @@ __RCSID__ = "$Id$"
 """This Backend sends the Log Messages to a Log Server
 It will only report to the server ERROR, EXCEPTION, FATAL
 and ALWAYS messages.
+
+Messages are kept in a bounded buffer until they are shipped. Identical messages
+received between two shipments are sent once with the number of repetitions.
+When the buffer is full new messages are dropped (or the oldest ones with the
+DropOldest OverflowPolicy). Once the buffer is half full only one in SampleRate
+new messages is kept.
 """
 import threading
-import Queue
-from DIRAC.Core.Utilities import Time, Network
+import collections
+import zlib
+from DIRAC.Core.Utilities import Time, Network, DEncode
 from DIRAC.FrameworkSystem.private.logging.backends.BaseBackend import BaseBackend
 from DIRAC.FrameworkSystem.private.logging.LogLevels import LogLevels
+from DIRAC.FrameworkSystem.private.logging.Message import Message
 
 class RemoteBackend( BaseBackend, threading.Thread ):
 
@@ -17,7 +25,17 @@ class RemoteBackend( BaseBackend, threading.Thread ):
     threading.Thread.__init__( self )
     self.__interactive = optionsDictionary[ 'Interactive' ]
     self.__sleep = optionsDictionary[ 'SleepTime' ]
-    self._messageQueue = Queue.Queue()
+    self.__bufferSize = self.__getIntOption( 'BufferSize', 1000 )
+    self.__sampleRate = max( 1, self.__getIntOption( 'SampleRate', 10 ) )
+    self.__dropOldest = optionsDictionary.get( 'OverflowPolicy', 'DropNewest' ) == 'DropOldest'
+    self.__compress = str( optionsDictionary.get( 'Compress', True ) ).lower() not in ( 'false', 'no', '0' )
+    self.__lock = threading.Lock()
+    #[ message, repetitions ] in arrival order and ( level, name, subname, fixed, variable ) -> entry
+    self._messageBuffer = collections.deque()
+    self.__bufferIndex = {}
+    self.__sampleCounter = 0
+    self.__counters = { 'Dropped' : 0, 'Coalesced' : 0, 'Sent' : 0 }
+    self.__reportedDrops = 0
     self._Transactions = []
     self._alive = True
     self._site = optionsDictionary[ 'Site' ]
@@ -25,54 +43,128 @@ class RemoteBackend( BaseBackend, threading.Thread ):
     self._logLevels = LogLevels()
     self._negativeLevel = self._logLevels.getLevelValue( 'ERROR' )
     self._positiveLevel = self._logLevels.getLevelValue( 'ALWAYS' )
-    self._maxBundledMessages = 20
+    self._maxBundledMessages = self.__getIntOption( 'BundleSize', 100 )
+    self.__rpcClient = None
     self.setDaemon(1)
     self.start()
 
+  def __getIntOption( self, optionName, defaultValue ):
+    try:
+      return int( self._optionsDictionary.get( optionName, defaultValue ) )
+    except ( TypeError, ValueError ):
+      return defaultValue
+
+  def getCounters( self ):
+    """ Number of messages dropped, coalesced into a previous identical one and sent
+    """
+    return dict( self.__counters )
+
   def doMessage( self, messageObject ):
-    self._messageQueue.put( messageObject )
+    if not self._testLevel( messageObject.getLevel() ):
+      return
+    msgKey = ( messageObject.getLevel(), messageObject.getName(), messageObject.getSubSystemName(),
+               messageObject.getFixedMessage(), messageObject.getVariableMessage() )
+    self.__lock.acquire()
+    try:
+      if msgKey in self.__bufferIndex:
+        self.__bufferIndex[ msgKey ][1] += 1
+        self.__counters[ 'Coalesced' ] += 1
+        return
+      if len( self._messageBuffer ) * 2 >= self.__bufferSize:
+        self.__sampleCounter += 1
+        if self.__sampleCounter % self.__sampleRate:
+          self.__counters[ 'Dropped' ] += 1
+          return
+      if len( self._messageBuffer ) >= self.__bufferSize:
+        self.__counters[ 'Dropped' ] += 1
+        if not self.__dropOldest:
+          return
+        oldMessage = self._messageBuffer.popleft()[0]
+        self.__bufferIndex.pop( ( oldMessage.getLevel(), oldMessage.getName(), oldMessage.getSubSystemName(),
+                                  oldMessage.getFixedMessage(), oldMessage.getVariableMessage() ), None )
+      entry = [ messageObject, 1 ]
+      self._messageBuffer.append( entry )
+      self.__bufferIndex[ msgKey ] = entry
+    finally:
+      self.__lock.release()
 
   def run( self ):
     import time
     while self._alive:
-      self._bundleMessages()
       time.sleep( self.__sleep )
+      self._bundleMessages()
 
-  def _bundleMessages( self ):
-    while not self._messageQueue.empty():
-      bundle = []
-      while ( len( bundle ) < self._maxBundledMessages ) and \
-                ( not self._messageQueue.empty() ):
-        message = self._messageQueue.get()
-        if self._testLevel( message.getLevel() ):
-          bundle.append( message.toTuple() )
+  def _getBundles( self ):
+    """ Empty the buffer and return its contents as bundles of message tuples
+    """
+    self.__lock.acquire()
+    try:
+      entries = self._messageBuffer
+      self._messageBuffer = collections.deque()
+      self.__bufferIndex = {}
+      self.__sampleCounter = 0
+      dropped = self.__counters[ 'Dropped' ] - self.__reportedDrops
+      self.__reportedDrops = self.__counters[ 'Dropped' ]
+    finally:
+      self.__lock.release()
+    messageTuples = []
+    for messageObject, repetitions in entries:
+      messageTuple = messageObject.toTuple()
+      if repetitions > 1:
+        messageTuple = list( messageTuple )
+        messageTuple[4] = ( "%s (repeated %s times)" % ( messageTuple[4], repetitions ) ).strip()
+        messageTuple = tuple( messageTuple )
+      messageTuples.append( messageTuple )
+    if dropped:
+      messageTuples.append( Message( "Framework", self._logLevels.error, Time.dateTime(),
+                                     "Log messages dropped by the remote backend",
+                                     "%s messages" % dropped, "", "RemoteBackend" ).toTuple() )
+    return [ messageTuples[ iPos : iPos + self._maxBundledMessages ]
+             for iPos in range( 0, len( messageTuples ), self._maxBundledMessages ) ]
 
-      if len( bundle ):
-        self._sendMessageToServer( bundle )
+  def _bundleMessages( self ):
+    for bundle in self._getBundles():
+      self._sendMessageToServer( bundle )
 
     if len( self._Transactions ):
       self._sendMessageToServer()
 
+  def __getClient( self ):
+    if not self.__rpcClient:
+      from DIRAC.Core.DISET.RPCClient import RPCClient
+      self.__rpcClient = RPCClient( "Framework/SystemLogging", persistentConnection = True )
+    return self.__rpcClient
+
+  def __sendBundle( self, oSock, bundle ):
+    if self.__compress:
+      result = oSock.addCompressedMessages( zlib.compress( DEncode.encode( bundle ) ),
+                                            self._site, self._hostname )
+      if result[ 'OK' ] or result[ 'Message' ].find( "Unknown method" ) == -1:
+        return result
+      #Old server
+      self.__compress = False
+    return oSock.addMessages( bundle, self._site, self._hostname )
+
   def _sendMessageToServer( self, messageBundle=None ):
-    from DIRAC.Core.DISET.RPCClient import RPCClient
     if messageBundle:
       self._Transactions.append( messageBundle )
     TransactionsLength = len( self._Transactions )
     if TransactionsLength > 100:
+      for bundle in self._Transactions[:TransactionsLength-100]:
+        self.__counters[ 'Dropped' ] += len( bundle )
       del self._Transactions[:TransactionsLength-100]
       TransactionsLength = 100
 
     try:
-      oSock = RPCClient( "Framework/SystemLogging" )
+      oSock = self.__getClient()
     except Exception,v:
       return False
 
     while TransactionsLength:
-      result = oSock.addMessages( self._Transactions[0],
-                                  self._site, self._hostname )
+      result = self.__sendBundle( oSock, self._Transactions[0] )
       if result['OK']:
         TransactionsLength = TransactionsLength - 1
-        self._Transactions.pop(0) 
+        self.__counters[ 'Sent' ] += len( self._Transactions.pop(0) )
       else:
         return False
     return True
@@ -84,7 +176,5 @@ class RemoteBackend( BaseBackend, threading.Thread ):
 
   def flush( self ):
     self._alive = False
-    if not self.__interactive and self._sendMessageToServer():
-      while not self._messageQueue.empty():
-        self._bundleMessages()
-
+    if not self.__interactive:
+      self._bundleMessages()
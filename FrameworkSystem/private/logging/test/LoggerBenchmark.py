@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+""" :mod: LoggerBenchmark
+    =======================
+
+    .. module: LoggerBenchmark
+    :synopsis: per call cost of the gLogger methods
+
+    Measures the cost of calling the logger for levels that are not shown,
+    with eagerly formatted messages, with deferred formatting arguments and
+    guarded by isEnabledFor, directly and through a sub logger.
+"""
+
+__RCSID__ = "$Id $"
+
+import sys
+import time
+from DIRAC.FrameworkSystem.private.logging.Logger import Logger
+
+def timeIt( func, calls, repeat = 3 ):
+  best = None
+  for dummy in range( repeat ):
+    start = time.time()
+    func( calls )
+    elapsed = time.time() - start
+    if best is None or elapsed < best:
+      best = elapsed
+  return best * 1000000. / calls
+
+def runBenchmark( calls = 100000 ):
+  logger = Logger()
+  logger.registerBackends( [] )
+  logger.setLevel( "INFO" )
+  subLogger = logger.getSubLogger( "Benchmark" )
+  jobID = 1234
+  tqID = 56
+
+  def noop( calls ):
+    for dummy in xrange( calls ):
+      pass
+
+  def eager( calls ):
+    for dummy in xrange( calls ):
+      log.debug( "Trying to extract job %s from TQ %s" % ( jobID, tqID ) )
+
+  def deferred( calls ):
+    for dummy in xrange( calls ):
+      log.debug( "Trying to extract job %s from TQ %s", jobID, tqID )
+
+  def guarded( calls ):
+    for dummy in xrange( calls ):
+      if log.isEnabledFor( 'DEBUG' ):
+        log.debug( "Trying to extract job %s from TQ %s" % ( jobID, tqID ) )
+
+  print "%-12s %10s %10s %10s %10s" % ( "logger", "loop", "eager", "deferred", "guarded" )
+  for name, log in ( ( "gLogger", logger ), ( "subLogger", subLogger ) ):
+    print "%-12s %10.3f %10.3f %10.3f %10.3f" % ( name, timeIt( noop, calls ), timeIt( eager, calls ),
+                                                  timeIt( deferred, calls ), timeIt( guarded, calls ) )
+  print "(microseconds per disabled debug call)"
+  return 0
+
+if __name__ == "__main__":
+  calls = 100000
+  if len( sys.argv ) > 1:
+    calls = int( sys.argv[1] )
+  sys.exit( runBenchmark( calls ) )
@@ -0,0 +1,58 @@
+""" Test for the level checks and the deferred formatting of the Logger
+"""
+
+import unittest
+
+from DIRAC.FrameworkSystem.private.logging.Logger import Logger
+
+class LoggerTestCase( unittest.TestCase ):
+  """ Messages are captured instead of being sent to the backends
+  """
+  def setUp( self ):
+    self.logger = Logger()
+    self.logger.registerBackends( [] )
+    self.logger.setLevel( "INFO" )
+    self.messages = []
+    self.logger._processMessage = self.messages.append
+
+  def test_levels( self ):
+    self.assertTrue( self.logger.isEnabledFor( 'INFO' ) )
+    self.assertTrue( self.logger.isEnabledFor( 'ERROR' ) )
+    self.assertFalse( self.logger.isEnabledFor( 'VERB' ) )
+    self.assertFalse( self.logger.shown( 'VERBOSE' ) )
+    self.assertFalse( self.logger.isEnabledFor( 'UNKNOWN' ) )
+    self.logger.setLevel( "DEBUG" )
+    self.assertTrue( self.logger.isEnabledFor( 'VERB' ) )
+    subLogger = self.logger.getSubLogger( "Sub" )
+    self.assertTrue( subLogger.isEnabledFor( 'DEBUG' ) )
+    self.logger.setLevel( "NOTICE" )
+    self.assertFalse( subLogger.isEnabledFor( 'INFO' ) )
+
+  def test_formatting( self ):
+    self.logger.debug( "Not shown %s", 1 )
+    self.assertEqual( self.messages, [] )
+    self.logger.info( "Fixed", "variable" )
+    self.logger.info( "Job %s in TQ %s", 1, 2 )
+    self.logger.info( "Job %s", 3 )
+    self.logger.info( "Done 100%", "variable" )
+    self.logger.getSubLogger( "Sub" ).warn( "Sub %s", "logger" )
+    self.assertEqual( [ ( msg.getFixedMessage(), msg.getVariableMessage() ) for msg in self.messages ],
+                      [ ( "Fixed", "variable" ), ( "Job 1 in TQ 2", "" ), ( "Job 3", "" ),
+                        ( "Done 100%", "variable" ), ( "Sub logger", "" ) ] )
+
+  def test_literalPercent( self ):
+    #"% s" would be a conversion specifier with a space flag
+    self.logger.info( "100% sure", "variable" )
+    self.logger.info( "Done 50%% of %s", "jobs" )
+    self.logger.info( "Done 100%%", "variable" )
+    #Formatting errors log the raw message
+    self.logger.info( "Job %s in TQ %s", 1 )
+    self.logger.info( "Job %d", "one" )
+    self.logger.info( "Job %s", 1, 2 )
+    self.assertEqual( [ ( msg.getFixedMessage(), msg.getVariableMessage() ) for msg in self.messages ],
+                      [ ( "100% sure", "variable" ), ( "Done 50% of jobs", "" ), ( "Done 100%%", "variable" ),
+                        ( "Job %s in TQ %s", "1" ), ( "Job %d", "one" ), ( "Job %s", "1 2" ) ] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( LoggerTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
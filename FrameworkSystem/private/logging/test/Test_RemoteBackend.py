@@ -0,0 +1,55 @@
+""" Test for the buffering of the remote logging backend
+"""
+
+import unittest
+
+from DIRAC.Core.Utilities import Time
+from DIRAC.FrameworkSystem.private.logging.Message import Message
+from DIRAC.FrameworkSystem.private.logging.backends.RemoteBackend import RemoteBackend
+
+def makeMessage( fixed, variable = '', level = 'ERROR' ):
+  return Message( 'Test', level, Time.dateTime(), fixed, variable, '' )
+
+class RemoteBackendTestCase( unittest.TestCase ):
+  """ Messages are never shipped, the buffer is inspected instead
+  """
+  def getBackend( self, **options ):
+    backendOptions = { 'Interactive' : True, 'SleepTime' : 100000, 'Site' : 'Test', 'BufferSize' : 4 }
+    backendOptions.update( options )
+    return RemoteBackend( backendOptions )
+
+  def test_coalesce( self ):
+    backend = self.getBackend()
+    for dummy in range( 3 ):
+      backend.doMessage( makeMessage( "Failed", "reason" ) )
+    backend.doMessage( makeMessage( "Failed", "other reason" ) )
+    backend.doMessage( makeMessage( "Not sent", level = 'INFO' ) )
+    bundles = backend._getBundles()
+    self.assertEqual( len( bundles ), 1 )
+    self.assertEqual( [ msg[4] for msg in bundles[0] ], [ "reason (repeated 3 times)", "other reason" ] )
+    self.assertEqual( backend.getCounters()[ 'Coalesced' ], 2 )
+    self.assertEqual( backend._getBundles(), [] )
+
+  def test_overflow( self ):
+    backend = self.getBackend( SampleRate = 1 )
+    for i in range( 6 ):
+      backend.doMessage( makeMessage( "Error %s" % i ) )
+    self.assertEqual( backend.getCounters()[ 'Dropped' ], 2 )
+    bundle = backend._getBundles()[0]
+    self.assertEqual( [ msg[3] for msg in bundle ], [ "Error 0", "Error 1", "Error 2", "Error 3",
+                                                      "Log messages dropped by the remote backend" ] )
+    backend = self.getBackend( SampleRate = 1, OverflowPolicy = 'DropOldest' )
+    for i in range( 6 ):
+      backend.doMessage( makeMessage( "Error %s" % i ) )
+    self.assertEqual( [ msg[3] for msg in backend._getBundles()[0][:4] ], [ "Error 2", "Error 3", "Error 4", "Error 5" ] )
+
+  def test_sampling( self ):
+    backend = self.getBackend( BufferSize = 100, SampleRate = 10 )
+    for i in range( 140 ):
+      backend.doMessage( makeMessage( "Error %s" % i ) )
+    #50 to reach half of the buffer and then one in ten
+    self.assertEqual( len( backend._getBundles()[0] ), 50 + 9 + 1 )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( RemoteBackendTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
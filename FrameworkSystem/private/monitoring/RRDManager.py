@@ -1,19 +1,30 @@
-"""
+""" Storage and plotting of the monitoring activities
+
+    The activities are kept in rrd files handled through the rrdtool command by
+    default. With TimeSeriesBackend = Embedded in the Framework/Monitoring
+    service section they are kept in the in process TimeSeriesStore and plots
+    are drawn with the DIRAC Graphs package, without forking any process.
 """
 
 __RCSID__ = "$Id$"
 
 import os.path
 import hashlib
+import threading
 from DIRAC import gLogger, gConfig, S_OK, S_ERROR
 from DIRAC.ConfigurationSystem.Client.PathFinder import getServiceSection
 from DIRAC.FrameworkSystem.private.monitoring.ColorGenerator import ColorGenerator
+from DIRAC.FrameworkSystem.private.monitoring.TimeSeriesStore import TimeSeriesStore
 from DIRAC.Core.Utilities import Subprocess, Time
 
 class RRDManager( object ):
 
   __sizesList = [ [ 200, 50 ], [ 400, 100 ], [ 600, 150 ], [ 800, 200 ] ]
+  __graphSizes = [ "small", "small", "normal", "large" ]
   __logRRDCommands = False
+  #Embedded stores shared by all the managers, one per location
+  __storesLock = threading.Lock()
+  __stores = {}
 
   def __init__( self, rrdLocation, graphLocation ):
     """
@@ -22,14 +33,36 @@ class RRDManager( object ):
     self.rrdLocation = rrdLocation
     self.graphLocation = graphLocation
     self.log = gLogger.getSubLogger( "RRDManager" )
-    self.rrdExec = gConfig.getValue( "%s/RRDExec" % getServiceSection( "Framework/Monitoring" ), "rrdtool" )
+    serviceSection = getServiceSection( "Framework/Monitoring" )
+    self.rrdExec = gConfig.getValue( "%s/RRDExec" % serviceSection, "rrdtool" )
     for path in ( self.rrdLocation, self.graphLocation ):
       try:
         os.makedirs( path )
       except:
         pass
+    self.store = None
+    if gConfig.getValue( "%s/TimeSeriesBackend" % serviceSection, "rrdtool" ).lower() == "embedded":
+      self.store = self.__getStore( self.rrdLocation )
+
+  @classmethod
+  def __getStore( cls, location ):
+    cls.__storesLock.acquire()
+    try:
+      if location not in cls.__stores:
+        cls.__stores[ location ] = TimeSeriesStore( location )
+      return cls.__stores[ location ]
+    finally:
+      cls.__storesLock.release()
+
+  def __storeFile( self, rrdFile ):
+    """
+    Embedded store files live next to the rrd ones so switching backends does not mix them up
+    """
+    return "%s.ts" % rrdFile
 
   def existsRRDFile( self, rrdFile ):
+    if self.store:
+      return self.store.exists( self.__storeFile( rrdFile ) )
     rrdFilePath = "%s/%s" % ( self.rrdLocation, rrdFile )
     return os.path.isfile( rrdFilePath )
 
@@ -80,6 +113,10 @@ class RRDManager( object ):
     """
     Create an rrd file
     """
+    if self.store:
+      self.log.info( "Creating time series file %s" % rrdFile )
+      return self.store.create( type, self.__storeFile( rrdFile ), bucketLength,
+                                self.getCurrentBucketTime( bucketLength ) - 86400 )
     rrdFilePath = "%s/%s" % ( self.rrdLocation, rrdFile )
     if os.path.isfile( rrdFilePath ):
       return S_OK()
@@ -133,6 +170,8 @@ class RRDManager( object ):
     """
     Add marks to an rrd
     """
+    if self.store:
+      return self.updateMany( [ ( type, rrdFile, bucketLength, valuesList, lastUpdate ) ] )[ rrdFile ]
     rrdFilePath = "%s/%s" % ( self.rrdLocation, rrdFile )
     self.log.info( "Updating rrd file", rrdFilePath )
     if lastUpdate == 0:
@@ -156,6 +195,27 @@ class RRDManager( object ):
         self.log.warn( "Error updating rrd file", "%s rrd: %s" % ( rrdFile, retVal[ 'Message' ] ) )
     return S_OK( valuesList[-1][0] )
 
+  def updateMany( self, updatesList ):
+    """
+    Add marks to several activities at once. updatesList is a list of
+    ( type, rrdFile, bucketLength, valuesList, lastUpdate ) and the result
+    a dict rrdFile -> S_OK( last update time ) or S_ERROR
+    """
+    if not self.store:
+      results = {}
+      for type, rrdFile, bucketLength, valuesList, lastUpdate in updatesList:
+        results[ rrdFile ] = self.update( type, rrdFile, bucketLength, valuesList, lastUpdate )
+      return results
+    self.log.info( "Updating %s time series files" % len( updatesList ) )
+    storeResults = self.store.update( [ ( self.__storeFile( rrdFile ), valuesList )
+                                        for _type, rrdFile, _bl, valuesList, _lu in updatesList ] )
+    results = {}
+    for _type, rrdFile, _bucketLength, _valuesList, _lastUpdate in updatesList:
+      results[ rrdFile ] = storeResults[ self.__storeFile( rrdFile ) ]
+      if not results[ rrdFile ][ 'OK' ]:
+        self.log.warn( "Error updating time series file", results[ rrdFile ][ 'Message' ] )
+    return results
+
   def __generateName( self, *args, **kwargs ):
     """
     Generate a random name
@@ -198,6 +258,63 @@ class RRDManager( object ):
     else:
       return float( timeSpan ) / expectedTimeSpan
 
+  def getPlotData( self, activity, fromSecs, toSecs, plotWidth ):
+    """
+    Get { time : value } for an activity as it is plotted. Only for the embedded store
+    """
+    bucketLength = activity.getBucketLength()
+    yScaleFactor = self.__getYScalingFactor( toSecs - fromSecs, bucketLength, plotWidth )
+    activity.setBucketScaleFactor( yScaleFactor )
+    retVal = self.store.fetch( self.__storeFile( activity.getFile() ), fromSecs, toSecs, plotWidth )
+    if not retVal[ 'OK' ]:
+      return retVal
+    rrdType = activity.getType()
+    plotData = {}
+    total = 0
+    for pointTime, value in retVal[ 'Value' ][2]:
+      if value is None:
+        value = 0
+      if rrdType in ( "sum", "acum" ):
+        value = value * yScaleFactor * bucketLength
+      if rrdType == "acum":
+        total += value
+        value = total
+      plotData[ pointTime ] = value
+    return S_OK( plotData )
+
+  def __storePlot( self, fromSecs, toSecs, activitiesList, stackActivities, size, graphFilename, title, unit = "" ):
+    """
+    Draw the plot of a list of activities out of the embedded store
+    """
+    plotWidth = self.__sizesList[ size ][0]
+    data = {}
+    for activity in activitiesList:
+      retVal = self.getPlotData( activity, fromSecs, toSecs, plotWidth )
+      if not retVal[ 'OK' ]:
+        return retVal
+      data[ activity.getLabel() ] = retVal[ 'Value' ]
+    metadata = { 'title' : title,
+                 'starttime' : fromSecs,
+                 'endtime' : toSecs,
+                 'span' : max( self.__getYScalingFactor( toSecs - fromSecs, activitiesList[0].getBucketLength(),
+                                                         plotWidth ) * activitiesList[0].getBucketLength(), 1 ),
+                 'graph_size' : self.__graphSizes[ size ],
+                 'ylabel' : unit,
+                 'limit_labels' : 9999999 }
+    try:
+      from DIRAC.Core.Utilities.Graphs import lineGraph, curveGraph
+      fd = file( "%s/%s" % ( self.graphLocation, graphFilename ), "wb" )
+      try:
+        if stackActivities:
+          lineGraph( data, fd, **metadata )
+        else:
+          curveGraph( data, fd, **metadata )
+      finally:
+        fd.close()
+    except Exception, e:
+      return S_ERROR( "Failed to draw plot: %s" % str( e ) )
+    return S_OK( graphFilename )
+
   def groupPlot( self, fromSecs, toSecs, activitiesList, stackActivities, size, graphFilename = "" ):
     """
     Generate a group plot
@@ -209,6 +326,10 @@ class RRDManager( object ):
                                                     activitiesList,
                                                     stackActivities
                                                     )
+    if self.store:
+      activitiesList.sort()
+      return self.__storePlot( fromSecs, toSecs, activitiesList, stackActivities, size, graphFilename,
+                               activitiesList[ 0 ].getGroupLabel() )
     rrdCmd = "%s graph %s/%s" % ( self.rrdExec, self.graphLocation, graphFilename )
     rrdCmd += " -s %s" % fromSecs
     rrdCmd += " -e %s" % toSecs
@@ -241,6 +362,9 @@ class RRDManager( object ):
                                                     activity,
                                                     stackActivities
                                                     )
+    if self.store:
+      return self.__storePlot( fromSecs, toSecs, [ activity ], stackActivities, size, graphFilename,
+                               activity.getLabel(), activity.getUnit() )
     graphVar = self.__generateRRDGraphVar( 0, activity, plotTimeSpan, self.__sizesList[ size ][0] )
     rrdCmd = "%s graph %s/%s" % ( self.rrdExec, self.graphLocation, graphFilename )
     rrdCmd += " -s %s" % fromSecs
@@ -261,6 +385,12 @@ class RRDManager( object ):
     return S_OK( graphFilename )
 
   def deleteRRD( self, rrdFile ):
+    if self.store:
+      try:
+        self.store.delete( self.__storeFile( rrdFile ) )
+      except Exception, e:
+        self.log.error( "Could not delete time series file", "%s: %s" % ( rrdFile, str( e ) ) )
+      return
     try:
       os.unlink( "%s/%s" % ( self.rrdLocation, rrdFile ) )
     except Exception, e:
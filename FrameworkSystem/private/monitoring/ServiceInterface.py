@@ -124,6 +124,9 @@ class ServiceInterface( object ):
     acCatalog = self.__createCatalog()
     rrdManager = self.__createRRDManager()
     unregisteredActivities = []
+    #rrdFile -> activity name and list of updates to do at once
+    updatedActivities = {}
+    updatesList = []
     for acName in activitiesDict:
       acData = activitiesDict[ acName ]
       acInfo = acCatalog.findActivity( sourceId, acName )
@@ -144,7 +147,12 @@ class ServiceInterface( object ):
         entries.append( ( instant , acData[ instant ] ) )
       if len( entries ) > 0:
         gLogger.verbose( "There are %s entries for %s" % ( len( entries ), acName ) )
-        retDict = rrdManager.update( acInfo[4], rrdFile, acInfo[7], entries, long( acInfo[8] ) )
+        updatedActivities[ rrdFile ] = acName
+        updatesList.append( ( acInfo[4], rrdFile, acInfo[7], entries, long( acInfo[8] ) ) )
+    if updatesList:
+      results = rrdManager.updateMany( updatesList )
+      for rrdFile, acName in updatedActivities.items():
+        retDict = results[ rrdFile ]
         if not retDict[ 'OK' ]:
           gLogger.error( "There was an error updating", "%s:%s activity [%s]" % ( sourceId, acName, rrdFile ) )
         else:
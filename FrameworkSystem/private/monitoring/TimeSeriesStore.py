@@ -0,0 +1,311 @@
+""" Embedded time series store used by the RRDManager instead of rrdtool
+
+    Each activity is kept in a fixed size file holding one circular archive per
+    consolidation level (the bucket length, 15 minutes and one day by default).
+    Files are memory mapped so updating an activity or extracting the data of a
+    plot only touches the rows involved and never forks a process. Several processes
+    may share the files, so every update or read of a file holds a flock on it.
+
+    Every row holds its start time and the sum of the values of the buckets
+    falling in it. A row whose start time does not match the one expected for
+    its slot belongs to a previous turn of the archive and is unknown. Buckets
+    that were not updated count as zeros in the consolidated rows, the same as
+    the zero filling done for rrdtool.
+"""
+
+__RCSID__ = "$Id$"
+
+import os
+import mmap
+import fcntl
+import struct
+import threading
+
+from DIRAC import S_OK, S_ERROR
+
+class TimeSeriesFile( object ):
+
+  #magic, type, bucket length, number of archives, creation time, last update
+  __headerFormat = "<4sHIHqq"
+  __archiveFormat = "<II"
+  __rowFormat = "<qd"
+  __magic = "DTSF"
+  #type -> ( type code, values are stored per second like rrdtool ABSOLUTE data sources )
+  __types = { 'mean' : ( 1, False ), 'sum' : ( 2, True ), 'acum' : ( 3, True ), 'rate' : ( 4, True ) }
+  #( seconds per row, seconds kept )
+  defaultArchives = ( ( 0, 7 * 86400 ), ( 900, 90 * 86400 ), ( 86400, 2 * 366 * 86400 ) )
+
+  def __init__( self, filePath ):
+    self.filePath = filePath
+    #Kept open for the locks
+    self.__fd = open( filePath, "r+b" )
+    try:
+      self.__map = mmap.mmap( self.__fd.fileno(), 0 )
+    except Exception:
+      self.__fd.close()
+      raise
+    magic, typeCode, self.bucketLength, numArchives, self.creationTime, self.lastUpdate = struct.unpack_from( self.__headerFormat, self.__map, 0 )
+    if magic != self.__magic:
+      self.close()
+      raise ValueError( "%s is not a time series file" % filePath )
+    self.type = None
+    self.__perSecond = False
+    for typeName, ( code, perSecond ) in self.__types.items():
+      if code == typeCode:
+        self.type = typeName
+        self.__perSecond = perSecond
+    #[ ( steps per row, rows, data offset ), ... ] from the finest to the coarsest
+    self.__archives = []
+    offset = struct.calcsize( self.__headerFormat )
+    dataOffset = offset + numArchives * struct.calcsize( self.__archiveFormat )
+    for _i in range( numArchives ):
+      steps, rows = struct.unpack_from( self.__archiveFormat, self.__map, offset )
+      offset += struct.calcsize( self.__archiveFormat )
+      self.__archives.append( ( steps, rows, dataOffset ) )
+      dataOffset += rows * struct.calcsize( self.__rowFormat )
+
+  @classmethod
+  def create( cls, filePath, type, bucketLength, startTime, archives = None ):
+    """
+    Create the file of an activity. All the rows are allocated at once
+    """
+    if type not in cls.__types:
+      raise ValueError( "Unknown activity type %s" % type )
+    if archives is None:
+      archives = cls.defaultArchives
+    archiveList = []
+    for rowLength, timeSpan in archives:
+      steps = max( 1, rowLength / bucketLength )
+      if archiveList and steps <= archiveList[-1][0]:
+        continue
+      archiveList.append( ( steps, max( 1, timeSpan / ( steps * bucketLength ) ) ) )
+    header = struct.pack( cls.__headerFormat, cls.__magic, cls.__types[ type ][0], bucketLength,
+                          len( archiveList ), startTime, startTime )
+    for archive in archiveList:
+      header += struct.pack( cls.__archiveFormat, *archive )
+    fileSize = len( header ) + sum( [ rows for _steps, rows in archiveList ] ) * struct.calcsize( cls.__rowFormat )
+    tmpPath = "%s.tmp" % filePath
+    fd = open( tmpPath, "wb" )
+    try:
+      fd.write( header )
+      fd.truncate( fileSize )
+    finally:
+      fd.close()
+    os.rename( tmpPath, filePath )
+
+  def close( self ):
+    self.__map.close()
+    self.__fd.close()
+
+  def __lock( self, exclusive ):
+    if exclusive:
+      fcntl.flock( self.__fd, fcntl.LOCK_EX )
+    else:
+      fcntl.flock( self.__fd, fcntl.LOCK_SH )
+    #Another process may have updated the file
+    self.lastUpdate = struct.unpack_from( "<q", self.__map, struct.calcsize( self.__headerFormat ) - 8 )[0]
+
+  def __unlock( self ):
+    fcntl.flock( self.__fd, fcntl.LOCK_UN )
+
+  def flush( self ):
+    self.__map.flush()
+
+  def getArchives( self ):
+    """
+    ( seconds per row, rows ) of each archive
+    """
+    return [ ( steps * self.bucketLength, rows ) for steps, rows, _offset in self.__archives ]
+
+  def __rowOffset( self, archive, rowStart ):
+    steps, rows, dataOffset = archive
+    return dataOffset + ( rowStart / ( steps * self.bucketLength ) ) % rows * struct.calcsize( self.__rowFormat )
+
+  def update( self, valuesList ):
+    """
+    Add a list of ( bucket time, value ) sorted by time. Buckets not newer
+    than the last update are ignored, as rrdtool does
+    """
+    self.__lock( True )
+    try:
+      return self.__update( valuesList )
+    finally:
+      self.__unlock()
+
+  def __update( self, valuesList ):
+    lastUpdate = self.lastUpdate
+    for bucketTime, value in valuesList:
+      bucketTime = int( bucketTime )
+      if bucketTime <= lastUpdate:
+        continue
+      value = float( value )
+      if self.__perSecond:
+        value /= self.bucketLength
+      for archive in self.__archives:
+        rowLength = archive[0] * self.bucketLength
+        rowStart = bucketTime - bucketTime % rowLength
+        offset = self.__rowOffset( archive, rowStart )
+        storedStart, storedSum = struct.unpack_from( self.__rowFormat, self.__map, offset )
+        if storedStart != rowStart:
+          storedSum = 0.0
+        struct.pack_into( self.__rowFormat, self.__map, offset, rowStart, storedSum + value )
+      lastUpdate = bucketTime
+    if lastUpdate != self.lastUpdate:
+      self.lastUpdate = lastUpdate
+      struct.pack_into( "<q", self.__map, struct.calcsize( self.__headerFormat ) - 8, lastUpdate )
+    return lastUpdate
+
+  def __selectArchive( self, fromSecs ):
+    """
+    Finest archive still holding fromSecs, the coarsest one otherwise
+    """
+    for archive in self.__archives:
+      steps, rows, _offset = archive
+      if self.lastUpdate - steps * self.bucketLength * rows < fromSecs:
+        return archive
+    return self.__archives[-1]
+
+  def fetch( self, fromSecs, toSecs, maxPoints = 0 ):
+    """
+    Get the mean of the values for the time span as [ ( time, value or None ), ... ]
+    with at most maxPoints entries. Values of sum, acum and rate activities are per second
+    """
+    self.__lock( False )
+    try:
+      return self.__fetch( fromSecs, toSecs, maxPoints )
+    finally:
+      self.__unlock()
+
+  def __fetch( self, fromSecs, toSecs, maxPoints ):
+    archive = self.__selectArchive( fromSecs )
+    steps = archive[0]
+    rowLength = steps * self.bucketLength
+    rowsPerPoint = 1
+    if maxPoints:
+      rowsPerPoint = max( 1, ( toSecs - fromSecs ) / ( rowLength * maxPoints ) + 1 )
+    step = rowLength * rowsPerPoint
+    firstBucket = self.creationTime + self.bucketLength
+    points = []
+    pointStart = fromSecs - fromSecs % step
+    while pointStart < toSecs:
+      pointSum = 0.0
+      pointBuckets = 0
+      known = False
+      for rowStart in range( pointStart, pointStart + step, rowLength ):
+        storedStart, storedSum = struct.unpack_from( self.__rowFormat, self.__map,
+                                                     self.__rowOffset( archive, rowStart ) )
+        #Buckets of the row that may have a value
+        rowBuckets = min( rowStart + rowLength - self.bucketLength, self.lastUpdate ) - max( rowStart, firstBucket )
+        if rowBuckets < 0:
+          continue
+        pointBuckets += rowBuckets / self.bucketLength + 1
+        if storedStart == rowStart:
+          known = True
+          pointSum += storedSum
+      if known:
+        points.append( ( pointStart, pointSum / pointBuckets ) )
+      else:
+        points.append( ( pointStart, None ) )
+      pointStart += step
+    return points
+
+class TimeSeriesStore( object ):
+  """ Set of the activity files under a directory with a bounded number of them kept mapped
+  """
+
+  def __init__( self, location, maxOpenFiles = 256 ):
+    self.location = location
+    self.maxOpenFiles = maxOpenFiles
+    self.__lock = threading.RLock()
+    self.__openFiles = {}
+    self.__tick = 0
+
+  def getFilePath( self, fileName ):
+    return "%s/%s" % ( self.location, fileName )
+
+  def exists( self, fileName ):
+    return os.path.isfile( self.getFilePath( fileName ) )
+
+  def __getFile( self, fileName ):
+    self.__tick += 1
+    if fileName in self.__openFiles:
+      entry = self.__openFiles[ fileName ]
+      entry[1] = self.__tick
+      return entry[0]
+    if len( self.__openFiles ) >= self.maxOpenFiles:
+      byAge = sorted( self.__openFiles, key = lambda fName: self.__openFiles[ fName ][1] )
+      for fName in byAge[ : max( 1, self.maxOpenFiles / 10 ) ]:
+        self.__close( fName )
+    tsFile = TimeSeriesFile( self.getFilePath( fileName ) )
+    self.__openFiles[ fileName ] = [ tsFile, self.__tick ]
+    return tsFile
+
+  def __close( self, fileName ):
+    entry = self.__openFiles.pop( fileName, None )
+    if entry:
+      entry[0].close()
+
+  def create( self, type, fileName, bucketLength, startTime ):
+    filePath = self.getFilePath( fileName )
+    self.__lock.acquire()
+    try:
+      if os.path.isfile( filePath ):
+        return S_OK()
+      try:
+        os.makedirs( os.path.dirname( filePath ) )
+      except OSError:
+        pass
+      try:
+        TimeSeriesFile.create( filePath, type, bucketLength, startTime )
+      except Exception, e:
+        return S_ERROR( "Cannot create %s: %s" % ( fileName, str( e ) ) )
+      return S_OK()
+    finally:
+      self.__lock.release()
+
+  def update( self, updatesList ):
+    """
+    Apply a list of ( file name, [ ( bucket time, value ), ... ] ) and flush the
+    changed files once. Return a dict file name -> S_OK( last update time )
+    """
+    results = {}
+    self.__lock.acquire()
+    try:
+      touched = set()
+      for fileName, valuesList in updatesList:
+        try:
+          results[ fileName ] = S_OK( self.__getFile( fileName ).update( valuesList ) )
+          touched.add( fileName )
+        except Exception, e:
+          self.__close( fileName )
+          results[ fileName ] = S_ERROR( "Cannot update %s: %s" % ( fileName, str( e ) ) )
+      #Files closed in between were already written back when unmapped
+      for fileName in touched:
+        if fileName in self.__openFiles:
+          self.__openFiles[ fileName ][0].flush()
+    finally:
+      self.__lock.release()
+    return results
+
+  def fetch( self, fileName, fromSecs, toSecs, maxPoints = 0 ):
+    """
+    Get ( type, bucket length, [ ( time, value or None ), ... ] ) for a time span
+    """
+    self.__lock.acquire()
+    try:
+      try:
+        tsFile = self.__getFile( fileName )
+        return S_OK( ( tsFile.type, tsFile.bucketLength, tsFile.fetch( fromSecs, toSecs, maxPoints ) ) )
+      except Exception, e:
+        self.__close( fileName )
+        return S_ERROR( "Cannot read %s: %s" % ( fileName, str( e ) ) )
+    finally:
+      self.__lock.release()
+
+  def delete( self, fileName ):
+    self.__lock.acquire()
+    try:
+      self.__close( fileName )
+      os.unlink( self.getFilePath( fileName ) )
+    finally:
+      self.__lock.release()
@@ -0,0 +1,96 @@
+""" Test for the embedded time series store of the monitoring
+"""
+
+import os
+import fcntl
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from DIRAC.FrameworkSystem.private.monitoring.TimeSeriesStore import TimeSeriesFile, TimeSeriesStore
+
+class TimeSeriesStoreTestCase( unittest.TestCase ):
+  """ Updating and reading activities kept in a temporary directory
+  """
+  def setUp( self ):
+    self.location = tempfile.mkdtemp()
+    self.store = TimeSeriesStore( self.location, maxOpenFiles = 1 )
+    self.start = 86400 * 1000
+
+  def tearDown( self ):
+    shutil.rmtree( self.location )
+
+  def test_archives( self ):
+    self.assertTrue( self.store.create( 'mean', 'a/mean.ts', 60, self.start )[ 'OK' ] )
+    tsFile = TimeSeriesFile( "%s/a/mean.ts" % self.location )
+    self.assertEqual( tsFile.getArchives(), [ ( 60, 10080 ), ( 900, 8640 ), ( 86400, 732 ) ] )
+    self.assertEqual( tsFile.type, 'mean' )
+    tsFile.close()
+
+  def test_update( self ):
+    self.store.create( 'mean', 'mean.ts', 60, self.start )
+    self.store.create( 'sum', 'sum.ts', 60, self.start )
+    values = [ ( self.start + 60, 4 ), ( self.start + 120, 2 ), ( self.start + 300, 6 ) ]
+    results = self.store.update( [ ( 'mean.ts', values ), ( 'sum.ts', values ), ( 'missing.ts', values ) ] )
+    self.assertEqual( results[ 'mean.ts' ][ 'Value' ], self.start + 300 )
+    self.assertFalse( results[ 'missing.ts' ][ 'OK' ] )
+    #Old buckets are ignored
+    self.assertEqual( self.store.update( [ ( 'mean.ts', [ ( self.start + 60, 100 ) ] ) ] )[ 'mean.ts' ][ 'Value' ],
+                      self.start + 300 )
+    series = self.store.fetch( 'mean.ts', self.start + 60, self.start + 360 )[ 'Value' ]
+    self.assertEqual( series[0:2], ( 'mean', 60 ) )
+    self.assertEqual( series[2], [ ( self.start + 60, 4 ), ( self.start + 120, 2 ), ( self.start + 180, None ),
+                                   ( self.start + 240, None ), ( self.start + 300, 6 ) ] )
+    #Consolidated with the missing buckets counting as zeros
+    series = self.store.fetch( 'mean.ts', self.start + 60, self.start + 360, maxPoints = 1 )[ 'Value' ][2]
+    self.assertEqual( series, [ ( self.start, 12. / 5 ) ] )
+    #Values of sum activities are kept per second
+    series = self.store.fetch( 'sum.ts', self.start + 60, self.start + 120 )[ 'Value' ][2]
+    self.assertEqual( series, [ ( self.start + 60, 4. / 60 ) ] )
+
+  def test_wrap( self ):
+    self.store.create( 'mean', 'wrap.ts', 60, self.start )
+    self.store.update( [ ( 'wrap.ts', [ ( self.start + 60, 1 ) ] ) ] )
+    later = self.start + 60 + 8 * 86400
+    self.store.update( [ ( 'wrap.ts', [ ( later, 3 ) ] ) ] )
+    #The first value was overwritten in the finest archive but is still in the coarser ones,
+    #averaged over the 14 buckets of the row after the creation time
+    series = self.store.fetch( 'wrap.ts', later, later + 60 )[ 'Value' ][2]
+    self.assertEqual( series, [ ( later, 3 ) ] )
+    series = self.store.fetch( 'wrap.ts', self.start, self.start + 900 )[ 'Value' ][2]
+    self.assertEqual( series, [ ( self.start, 1. / 14 ) ] )
+    self.store.delete( 'wrap.ts' )
+    self.assertFalse( self.store.exists( 'wrap.ts' ) )
+    self.assertFalse( os.path.exists( "%s/wrap.ts" % self.location ) )
+
+  def test_sharedFiles( self ):
+    #Two stores with their own descriptors, as in two clones of the service
+    otherStore = TimeSeriesStore( self.location )
+    self.store.create( 'sum', 'shared.ts', 60, self.start )
+    otherStore.fetch( 'shared.ts', self.start, self.start + 60 )
+    self.store.update( [ ( 'shared.ts', [ ( self.start + 60, 60 ) ] ) ] )
+    #The bucket written by the other store is not added twice
+    result = otherStore.update( [ ( 'shared.ts', [ ( self.start + 60, 60 ), ( self.start + 120, 120 ) ] ) ] )
+    self.assertEqual( result[ 'shared.ts' ][ 'Value' ], self.start + 120 )
+    series = self.store.fetch( 'shared.ts', self.start + 60, self.start + 180 )[ 'Value' ][2]
+    self.assertEqual( series, [ ( self.start + 60, 1 ), ( self.start + 120, 2 ) ] )
+
+  def test_locked( self ):
+    self.store.create( 'mean', 'locked.ts', 60, self.start )
+    lockFile = open( "%s/locked.ts" % self.location, "r+b" )
+    fcntl.flock( lockFile, fcntl.LOCK_EX )
+    updater = threading.Thread( target = self.store.update, args = ( [ ( 'locked.ts', [ ( self.start + 60, 1 ) ] ) ], ) )
+    updater.start()
+    time.sleep( 0.2 )
+    self.assertTrue( updater.isAlive() )
+    fcntl.flock( lockFile, fcntl.LOCK_UN )
+    lockFile.close()
+    updater.join()
+    series = self.store.fetch( 'locked.ts', self.start + 60, self.start + 120 )[ 'Value' ][2]
+    self.assertEqual( series, [ ( self.start + 60, 1 ) ] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( TimeSeriesStoreTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
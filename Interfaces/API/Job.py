@@ -23,10 +23,10 @@
    Note that several executables can be provided and wil be executed sequentially.
 """
 __RCSID__ = "$Id$"
-import re, os, types, urllib
+import re, os, types, urllib, copy
 
 from DIRAC                                                    import S_OK, S_ERROR, gLogger
-from DIRAC.Core.Workflow.Parameter                            import Parameter
+from DIRAC.Core.Workflow.Parameter                            import Parameter, ParameterCollection
 from DIRAC.Core.Workflow.Workflow                             import Workflow
 from DIRAC.Core.Base.API                                      import API
 from DIRAC.Core.Utilities.ClassAd.ClassAdLight                import ClassAd
@@ -991,6 +991,24 @@ class Job( API ):
     """
     return self.workflow.toXML()
 
+  #############################################################################
+  def _clone( self ):
+    """Internal Function. Cheap copy of the job, used to create many jobs out of one template.
+
+       Only the workflow parameters and attributes are copied, the step and module
+       definitions are shared with the original job. The copy must therefore only be
+       modified through the setters acting on the workflow parameters.
+    """
+    newJob = copy.copy( self )
+    newJob.workflow = copy.copy( self.workflow )
+    newJob.workflow.parameters = ParameterCollection( self.workflow.parameters )
+    newJob.workflow.workflow_commons = {}
+    newJob.addToInputSandbox = list( self.addToInputSandbox )
+    newJob.addToOutputSandbox = list( self.addToOutputSandbox )
+    newJob.addToInputData = list( self.addToInputData )
+    newJob.parametric = dict( self.parametric )
+    return newJob
+
   #############################################################################
   def _toJDL( self, xmlFile = '' ): #messy but need to account for xml file being in /tmp/guid dir
     """Creates a JDL representation of itself as a Job.
@@ -88,6 +88,23 @@ from DIRAC.Workflow.Modules.Script import Script
 
     self.assertEqual( xml, expected )
 
+  def test_clone( self ):
+    self.job.setName( 'template' )
+    self.job.setExecutable( 'someExe' )
+    templateXML = self.job._toXML()
+
+    clone = self.job._clone()
+    clone.setName( 'task' )
+    clone.setInputData( [ '/a/lfn' ] )
+    clone._setParamValue( 'LogLevel', 'debug' )
+
+    self.assertEqual( self.job._toXML(), templateXML )
+    self.assertEqual( clone.workflow.findParameter( 'JobName' ).getValue(), 'task' )
+    self.assertEqual( clone.workflow.findParameter( 'LogLevel' ).getValue(), 'debug' )
+    self.assertEqual( clone.workflow.step_instances, self.job.workflow.step_instances )
+    self.assertTrue( 'task' in clone._toJDL() )
+    self.assertFalse( 'task' in self.job._toJDL() )
+
 
 
 #############################################################################
@@ -47,7 +47,9 @@ def initializeReqProxyHandler( serviceInfo ):
   :param serviceInfo: whatever
   """
   gLogger.info( "Initalizing ReqProxyHandler" )
-  gThreadScheduler.addPeriodicTask( 120, ReqProxyHandler.sweeper )
+  # The request cache is shared by the clone processes, only one sweeps it
+  if serviceInfo.get( 'cloneId', 0 ) == 0:
+    gThreadScheduler.addPeriodicTask( 120, ReqProxyHandler.sweeper )
   return S_OK()
 
 ########################################################################
@@ -5,6 +5,8 @@ from types import ListType
 __RCSID__ = "$Id$"
 # # custom duty
 import re
+import Queue
+import threading
 # # from DIRAC
 from DIRAC import gLogger, gConfig
 from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR, returnSingleResult
@@ -16,6 +18,7 @@ from DIRAC.ConfigurationSystem.Client.Helpers.Operations import Operations
 from DIRAC.Core.Utilities.DictCache import DictCache
 from DIRAC.Resources.Utilities import checkArgumentFormat
 from DIRAC.Resources.Catalog.FileCatalog import FileCatalog
+from DIRAC.Core.DISET.ThreadConfig import ThreadConfig
 
 class StorageElementCache( object ):
 
@@ -113,6 +116,14 @@ class StorageElementItem( object ):
                          "getDirectory" : { "localPath" : False },
                          }
 
+  # Methods that only act on the given urls, so they can be split in chunks executed in parallel
+  __parallelMethods = [ "exists", "isFile", "getFileMetadata", "getFileSize", "removeFile",
+                        "prestageFile", "prestageFileStatus", "pinFile", "releaseFile",
+                        "isDirectory", "getDirectoryMetadata", "getTransportURL" ]
+  # SE name -> semaphore bounding the parallel plugin calls to the SE in this process
+  __seSemaphores = {}
+  __seSemaphoresLock = threading.Lock()
+
   def __init__( self, name, plugins = None, vo = None ):
     """ c'tor
 
@@ -141,6 +152,13 @@ class StorageElementItem( object ):
     if not useProxy:
       useProxy = self.opHelper.getValue( '/Services/StorageElements/%s/UseProxy' % name, False )
 
+    # Number of urls per plugin call and concurrent plugin calls for the parallel methods.
+    # Defined per SE or for all of them in the Operations section
+    self.chunkSize = int( gConfig.getValue( '/Resources/StorageElements/%s/ChunkSize' % name,
+                                            self.opHelper.getValue( 'DataManagement/SEChunkSize', 500 ) ) )
+    self.maxParallelRequests = int( gConfig.getValue( '/Resources/StorageElements/%s/MaxParallelRequests' % name,
+                                                      self.opHelper.getValue( 'DataManagement/SEMaxParallelRequests', 1 ) ) )
+
     self.valid = True
     if plugins == None:
       res = StorageFactory( useProxy = useProxy, vo = self.vo ).getStorages( name, pluginList = [] )
@@ -602,7 +620,7 @@ class StorageElementItem( object ):
     """
 
     removedArgs = {}
-    self.log.verbose( "StorageElement.__executeMethod : preparing the execution of %s" % ( self.methodName ) )
+    self.log.verbose( "StorageElement.__executeMethod : preparing the execution of %s", self.methodName )
 
     # args should normaly be empty to avoid problem...
     if len( args ):
@@ -629,7 +647,7 @@ class StorageElementItem( object ):
     for argName in methDefaultArgs:
       if argName not in kwargs:
         self.log.debug( "StorageElement.__executeMethod : default argument %s for %s not present.\
-         Setting value %s." % ( argName, self.methodName, methDefaultArgs[argName] ) )
+         Setting value %s.", argName, self.methodName, methDefaultArgs[argName] )
         kwargs[argName] = methDefaultArgs[argName]
 
     res = checkArgumentFormat( lfn )
@@ -639,8 +657,8 @@ class StorageElementItem( object ):
       return S_ERROR( errStr )
     lfnDict = res['Value']
 
-    self.log.verbose( "StorageElement.__executeMethod: Attempting to perform '%s' operation with %s lfns." % ( self.methodName,
-                                                                                                               len( lfnDict ) ) )
+    self.log.verbose( "StorageElement.__executeMethod: Attempting to perform '%s' operation with %s lfns.", self.methodName,
+                      len( lfnDict ) )
 
     res = self.isValid( operation = self.methodName )
     if not res['OK']:
@@ -662,15 +680,14 @@ class StorageElementItem( object ):
         continue
       pluginName = storageParameters['PluginName']
       if not lfnDict:
-        self.log.debug( "StorageElement.__executeMethod: No lfns to be attempted for %s protocol." % pluginName )
+        self.log.debug( "StorageElement.__executeMethod: No lfns to be attempted for %s protocol.", pluginName )
         continue
       if not ( pluginName in self.remotePlugins ) and not localSE and not storage.pluginName == "Proxy":
         # If the SE is not local then we can't use local protocols
-        self.log.debug( "StorageElement.__executeMethod: Local protocol not appropriate for remote use: %s." % pluginName )
+        self.log.debug( "StorageElement.__executeMethod: Local protocol not appropriate for remote use: %s.", pluginName )
         continue
 
-      self.log.verbose( "StorageElement.__executeMethod: Generating %s protocol URLs for %s." % ( len( lfnDict ),
-                                                                                                  pluginName ) )
+      self.log.verbose( "StorageElement.__executeMethod: Generating %s protocol URLs for %s.", len( lfnDict ), pluginName )
       replicaDict = kwargs.pop( 'replicaDict', {} )
       if storage.pluginName != "Proxy":
         res = self.__generateURLDict( lfnDict, storage, replicaDict = replicaDict )
@@ -679,10 +696,10 @@ class StorageElementItem( object ):
       else:
         urlDict = dict( [ ( lfn, lfn ) for lfn in lfnDict ] )
       if not len( urlDict ):
-        self.log.verbose( "StorageElement.__executeMethod No urls generated for protocol %s." % pluginName )
+        self.log.verbose( "StorageElement.__executeMethod No urls generated for protocol %s.", pluginName )
       else:
-        self.log.verbose( "StorageElement.__executeMethod: Attempting to perform '%s' for %s physical files" % ( self.methodName,
-                                                                                                    len( urlDict ) ) )
+        self.log.verbose( "StorageElement.__executeMethod: Attempting to perform '%s' for %s physical files", self.methodName,
+                          len( urlDict ) )
         fcn = None
         if hasattr( storage, self.methodName ) and callable( getattr( storage, self.methodName ) ):
           fcn = getattr( storage, self.methodName )
@@ -693,7 +710,7 @@ class StorageElementItem( object ):
         for url in urlDict:
           urlsToUse[url] = lfnDict[urlDict[url]]
 
-        res = fcn( urlsToUse, *args, **kwargs )
+        res = self.__executePluginMethod( fcn, urlsToUse, *args, **kwargs )
         if not res['OK']:
           errStr = "StorageElement.__executeMethod: Completely failed to perform %s." % self.methodName
           self.log.debug( errStr, '%s with plugin %s: %s' % ( self.name, pluginName, res['Message'] ) )
@@ -720,6 +737,89 @@ class StorageElementItem( object ):
     return S_OK( { 'Failed': failed, 'Successful': successful } )
 
 
+  def __getSESemaphore( self ):
+    """ The semaphore shared by all the calls to this SE
+    """
+    StorageElementItem.__seSemaphoresLock.acquire()
+    try:
+      if self.name not in StorageElementItem.__seSemaphores:
+        StorageElementItem.__seSemaphores[self.name] = threading.Semaphore( self.maxParallelRequests )
+      return StorageElementItem.__seSemaphores[self.name]
+    finally:
+      StorageElementItem.__seSemaphoresLock.release()
+
+  def __executePluginMethod( self, fcn, urlsToUse, *args, **kwargs ):
+    """ Call a plugin method. For the methods allowing it, big sets of urls are split in chunks
+        executed concurrently with at most self.maxParallelRequests calls at a time to the SE,
+        whatever the number of callers. The chunks are executed with the identity of the caller.
+        The urls of a chunk that completely failed are put in the Failed dictionary
+        :param fcn : plugin method
+        :param urlsToUse : dictionary { url : lfn value }
+        :returns S_OK( { 'Failed': {url : reason} , 'Successful': {url : value} } )
+    """
+    chunkSize = max( 1, self.chunkSize )
+    if self.methodName not in StorageElementItem.__parallelMethods or self.maxParallelRequests <= 1 \
+        or len( urlsToUse ) <= chunkSize:
+      return fcn( urlsToUse, *args, **kwargs )
+
+    urls = urlsToUse.keys()
+    chunks = []
+    for i in range( 0, len( urls ), chunkSize ):
+      chunks.append( dict( [ ( url, urlsToUse[url] ) for url in urls[i:i + chunkSize] ] ) )
+    self.log.verbose( "StorageElement.__executePluginMethod: Executing %s in %s chunks with %s threads",
+                      self.methodName, len( chunks ), self.maxParallelRequests )
+    results = [ None ] * len( chunks )
+    chunkQueue = Queue.Queue()
+    for chunkPos in range( len( chunks ) ):
+      chunkQueue.put( chunkPos )
+    seSemaphore = self.__getSESemaphore()
+    # The delegated identity of the caller, plain threads don't inherit it
+    threadConfig = ThreadConfig()
+    callerConfig = threadConfig.dump()
+    callerDecorator = threadConfig.getDecorator()
+
+    def executeChunks():
+      threadConfig.load( callerConfig )
+      threadConfig.setDecorator( callerDecorator )
+      while True:
+        try:
+          chunkPos = chunkQueue.get_nowait()
+        except Queue.Empty:
+          return
+        seSemaphore.acquire()
+        try:
+          results[chunkPos] = fcn( chunks[chunkPos], *args, **kwargs )
+        except Exception, error:
+          results[chunkPos] = S_ERROR( "Exception while calling plugin: %s" % str( error ) )
+        finally:
+          seSemaphore.release()
+
+    threads = []
+    for _i in range( min( self.maxParallelRequests, len( chunks ) ) ):
+      thread = threading.Thread( target = executeChunks )
+      thread.setDaemon( True )
+      thread.start()
+      threads.append( thread )
+    for thread in threads:
+      thread.join()
+
+    successful = {}
+    failed = {}
+    errors = []
+    for chunkPos in range( len( chunks ) ):
+      res = results[chunkPos]
+      if not res['OK']:
+        errors.append( res['Message'] )
+        for url in chunks[chunkPos]:
+          failed[url] = res['Message']
+      else:
+        successful.update( res['Value']['Successful'] )
+        failed.update( res['Value']['Failed'] )
+    # Keep the contract of a single call when everything failed
+    if len( errors ) == len( chunks ):
+      return S_ERROR( errors[0] )
+    return S_OK( { 'Successful' : successful, 'Failed' : failed } )
+
   def __getattr__( self, name ):
     """ Forwards the equivalent Storage calls to StorageElement.__executeMethod"""
     # We take either the equivalent name, or the name itself
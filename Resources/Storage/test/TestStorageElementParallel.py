@@ -0,0 +1,90 @@
+""" Test for the parallel execution of the plugin calls of the StorageElement with a fake plugin
+"""
+
+import threading
+import time
+import unittest
+
+from DIRAC import S_OK, S_ERROR, gLogger
+from DIRAC.Core.DISET.ThreadConfig import ThreadConfig
+from DIRAC.Resources.Storage.StorageElement import StorageElementItem
+
+class FakePlugin( object ):
+  """ Plugin recording the identity and the number of concurrent calls
+  """
+  def __init__( self, failingUrl = None ):
+    self.failingUrl = failingUrl
+    self.lock = threading.Lock()
+    self.running = 0
+    self.maxRunning = 0
+    self.identities = set()
+
+  def exists( self, urls ):
+    self.lock.acquire()
+    try:
+      self.running += 1
+      self.maxRunning = max( self.maxRunning, self.running )
+      self.identities.add( ThreadConfig().getID() )
+    finally:
+      self.lock.release()
+    time.sleep( 0.05 )
+    self.lock.acquire()
+    try:
+      self.running -= 1
+    finally:
+      self.lock.release()
+    if self.failingUrl in urls:
+      return S_ERROR( "Connection refused" )
+    return S_OK( { 'Successful' : dict( [ ( url, True ) for url in urls ] ), 'Failed' : {} } )
+
+def getSE( name, chunkSize, maxParallelRequests ):
+  storageElement = StorageElementItem.__new__( StorageElementItem )
+  storageElement.name = name
+  storageElement.log = gLogger.getSubLogger( "SE[%s]" % name )
+  storageElement.methodName = "exists"
+  storageElement.chunkSize = chunkSize
+  storageElement.maxParallelRequests = maxParallelRequests
+  return storageElement
+
+class StorageElementParallelTestCase( unittest.TestCase ):
+  """ Chunked plugin calls
+  """
+  def tearDown( self ):
+    ThreadConfig().reset()
+
+  def test_chunks( self ):
+    plugin = FakePlugin( failingUrl = "url3" )
+    storageElement = getSE( "ChunksSE", 2, 3 )
+    urls = dict( [ ( "url%s" % i, False ) for i in range( 10 ) ] )
+    res = storageElement._StorageElementItem__executePluginMethod( plugin.exists, urls )
+    self.assertTrue( res[ 'OK' ] )
+    self.assertEqual( len( res[ 'Value' ][ 'Successful' ] ) + len( res[ 'Value' ][ 'Failed' ] ), 10 )
+    self.assertEqual( res[ 'Value' ][ 'Failed' ][ "url3" ], "Connection refused" )
+    self.assertEqual( len( res[ 'Value' ][ 'Failed' ] ), 2 )
+    self.assertTrue( 1 < plugin.maxRunning <= 3 )
+
+  def test_identity( self ):
+    plugin = FakePlugin()
+    storageElement = getSE( "IdentitySE", 1, 4 )
+    ThreadConfig().setID( "/DN=user", "user_group" )
+    res = storageElement._StorageElementItem__executePluginMethod( plugin.exists, { "url1" : False, "url2" : False } )
+    self.assertTrue( res[ 'OK' ] )
+    self.assertEqual( plugin.identities, set( [ ( "/DN=user", "user_group" ) ] ) )
+
+  def test_limitPerSE( self ):
+    plugin = FakePlugin()
+    urls = dict( [ ( "url%s" % i, False ) for i in range( 8 ) ] )
+    callers = []
+    for _i in range( 3 ):
+      storageElement = getSE( "LimitedSE", 1, 2 )
+      caller = threading.Thread( target = storageElement._StorageElementItem__executePluginMethod,
+                                 args = ( plugin.exists, urls ) )
+      caller.start()
+      callers.append( caller )
+    for caller in callers:
+      caller.join()
+    self.assertEqual( plugin.maxRunning, 2 )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( StorageElementParallelTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
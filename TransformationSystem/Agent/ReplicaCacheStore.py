@@ -0,0 +1,168 @@
+""" On disk replica cache of the TransformationAgent
+
+    Replicas are kept in a sqlite file with one row per transformation and LFN,
+    stamped with the time they were inserted. Only the LFNs being processed are
+    read back, and every update or removal only writes the rows involved, so
+    neither the memory used nor the time spent writing depend on the total
+    number of cached files.
+"""
+
+__RCSID__ = "$Id$"
+
+import os
+import time
+import pickle
+import calendar
+import sqlite3
+import threading
+
+from DIRAC import gLogger, S_OK, S_ERROR
+
+class ReplicaCacheStore( object ):
+
+  # sqlite does not accept more than 999 parameters per statement
+  __chunkSize = 500
+
+  def __init__( self, filePath ):
+    self.filePath = filePath
+    self.log = gLogger.getSubLogger( "ReplicaCacheStore" )
+    self.__lock = threading.Lock()
+    self.__conn = sqlite3.connect( filePath, check_same_thread = False )
+    # The cache can be rebuilt from the catalog, don't wait for the disk on every commit
+    self.__conn.execute( "PRAGMA synchronous = OFF" )
+    self.__conn.execute( "CREATE TABLE IF NOT EXISTS Replicas ( TransformationID INTEGER NOT NULL, "
+                         "LFN TEXT NOT NULL, SEs TEXT NOT NULL, InsertTime REAL NOT NULL, "
+                         "PRIMARY KEY ( TransformationID, LFN ) )" )
+    self.__conn.execute( "CREATE INDEX IF NOT EXISTS InsertTimeIndex ON Replicas ( TransformationID, InsertTime )" )
+    self.__conn.commit()
+
+  def __execute( self, queriesList ):
+    """
+    Run a list of ( query, parameters ) in one transaction and return the cursors
+    """
+    self.__lock.acquire()
+    try:
+      try:
+        cursors = [ self.__conn.execute( query, params ) for query, params in queriesList ]
+        self.__conn.commit()
+        return S_OK( cursors )
+      except sqlite3.Error, e:
+        self.__conn.rollback()
+        return S_ERROR( "Replica cache error: %s" % str( e ) )
+    finally:
+      self.__lock.release()
+
+  def __chunks( self, lfns ):
+    lfns = list( lfns )
+    return [ lfns[ iPos : iPos + self.__chunkSize ] for iPos in range( 0, len( lfns ), self.__chunkSize ) ]
+
+  def getReplicas( self, transID, lfns ):
+    """
+    Get the cached replicas of some LFNs of a transformation as { lfn : [ SE, ... ] }
+    """
+    replicas = {}
+    self.__lock.acquire()
+    try:
+      try:
+        for chunk in self.__chunks( lfns ):
+          cursor = self.__conn.execute( "SELECT LFN, SEs FROM Replicas WHERE TransformationID = ? AND LFN IN ( %s )"
+                                        % ", ".join( [ "?" ] * len( chunk ) ), [ transID ] + chunk )
+          for lfn, ses in cursor:
+            replicas[ lfn ] = ses.split( ',' )
+      except sqlite3.Error, e:
+        return S_ERROR( "Replica cache error: %s" % str( e ) )
+    finally:
+      self.__lock.release()
+    return S_OK( replicas )
+
+  def setReplicas( self, transID, replicas, insertTime = None ):
+    """
+    Insert or replace the replicas { lfn : [ SE, ... ] } of a transformation
+    """
+    if not replicas:
+      return S_OK( 0 )
+    if insertTime is None:
+      insertTime = time.time()
+    rows = [ ( transID, lfn, ','.join( ses ), insertTime ) for lfn, ses in replicas.items() if ses ]
+    self.__lock.acquire()
+    try:
+      try:
+        self.__conn.executemany( "INSERT OR REPLACE INTO Replicas ( TransformationID, LFN, SEs, InsertTime ) "
+                                 "VALUES ( ?, ?, ?, ? )", rows )
+        self.__conn.commit()
+      except sqlite3.Error, e:
+        self.__conn.rollback()
+        return S_ERROR( "Replica cache error: %s" % str( e ) )
+    finally:
+      self.__lock.release()
+    return S_OK( len( rows ) )
+
+  def removeReplicas( self, transID, lfns ):
+    """
+    Remove some LFNs of a transformation, return how many were cached
+    """
+    queriesList = [ ( "DELETE FROM Replicas WHERE TransformationID = ? AND LFN IN ( %s )"
+                      % ", ".join( [ "?" ] * len( chunk ) ), [ transID ] + chunk ) for chunk in self.__chunks( lfns ) ]
+    result = self.__execute( queriesList )
+    if not result[ 'OK' ]:
+      return result
+    return S_OK( sum( [ cursor.rowcount for cursor in result[ 'Value' ] ] ) )
+
+  def removeExpired( self, transID, validity ):
+    """
+    Remove the replicas of a transformation inserted more than validity seconds ago
+    """
+    result = self.__execute( [ ( "DELETE FROM Replicas WHERE TransformationID = ? AND InsertTime < ?",
+                                 ( transID, time.time() - validity ) ) ] )
+    if not result[ 'OK' ]:
+      return result
+    return S_OK( result[ 'Value' ][0].rowcount )
+
+  def clear( self, transID ):
+    """
+    Remove all the replicas of a transformation
+    """
+    result = self.__execute( [ ( "DELETE FROM Replicas WHERE TransformationID = ?", ( transID, ) ) ] )
+    if not result[ 'OK' ]:
+      return result
+    return S_OK( result[ 'Value' ][0].rowcount )
+
+  def getNumberOfReplicas( self, transID ):
+    result = self.__execute( [ ( "SELECT COUNT(*) FROM Replicas WHERE TransformationID = ?", ( transID, ) ) ] )
+    if not result[ 'OK' ]:
+      return result
+    return S_OK( result[ 'Value' ][0].fetchone()[0] )
+
+  def importPickle( self, fileName, transID = None ):
+    """
+    Load a cache file written by previous versions of the agent, either holding
+    { updateTime : { lfn : [ SE, ... ] } } for transID or the same for every
+    transformation, keyed by transformation, and remove it
+    """
+    try:
+      cacheFile = open( fileName, 'r' )
+      try:
+        cache = pickle.load( cacheFile )
+      finally:
+        cacheFile.close()
+    except Exception, e:
+      return S_ERROR( "Failed to read %s: %s" % ( fileName, str( e ) ) )
+    if transID is not None:
+      cache = { transID : cache }
+    imported = 0
+    for t_id, replicaSets in cache.items():
+      for updateTime in sorted( replicaSets ):
+        result = self.setReplicas( t_id, replicaSets[ updateTime ],
+                                   insertTime = calendar.timegm( updateTime.utctimetuple() ) )
+        if not result[ 'OK' ]:
+          return result
+        imported += result[ 'Value' ]
+    os.unlink( fileName )
+    return S_OK( imported )
+
+  def close( self ):
+    self.__lock.acquire()
+    try:
+      self.__conn.close()
+    finally:
+      self.__lock.release()
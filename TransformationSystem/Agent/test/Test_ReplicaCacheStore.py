@@ -0,0 +1,59 @@
+""" Test for the replica cache of the TransformationAgent
+"""
+
+import os
+import time
+import shutil
+import pickle
+import datetime
+import tempfile
+import unittest
+
+from DIRAC.TransformationSystem.Agent.ReplicaCacheStore import ReplicaCacheStore
+
+class ReplicaCacheStoreTestCase( unittest.TestCase ):
+  """ Caching replicas in a temporary file
+  """
+  def setUp( self ):
+    self.location = tempfile.mkdtemp()
+    self.store = ReplicaCacheStore( os.path.join( self.location, 'ReplicaCache.db' ) )
+
+  def tearDown( self ):
+    self.store.close()
+    shutil.rmtree( self.location )
+
+  def test_replicas( self ):
+    lfns = [ '/lfn/%d' % i for i in range( 1200 ) ]
+    self.assertEqual( self.store.setReplicas( 1, dict( [ ( lfn, [ 'SE1', 'SE2' ] ) for lfn in lfns ] ) )[ 'Value' ], 1200 )
+    self.store.setReplicas( 1, { '/lfn/0' : [ 'SE3' ], '/lfn/noReplica' : [] } )
+    self.store.setReplicas( 2, { '/lfn/1' : [ 'SE4' ] } )
+    replicas = self.store.getReplicas( 1, [ '/lfn/0', '/lfn/1', '/lfn/unknown' ] + lfns[1100:] )[ 'Value' ]
+    self.assertEqual( len( replicas ), 102 )
+    self.assertEqual( replicas[ '/lfn/0' ], [ 'SE3' ] )
+    self.assertEqual( replicas[ '/lfn/1' ], [ 'SE1', 'SE2' ] )
+    self.assertEqual( self.store.removeReplicas( 1, lfns[:1000] + [ '/lfn/unknown' ] )[ 'Value' ], 1000 )
+    self.assertEqual( self.store.getNumberOfReplicas( 1 )[ 'Value' ], 200 )
+    self.assertEqual( self.store.clear( 1 )[ 'Value' ], 200 )
+    self.assertEqual( self.store.getReplicas( 2, [ '/lfn/1' ] )[ 'Value' ], { '/lfn/1' : [ 'SE4' ] } )
+
+  def test_expiry( self ):
+    self.store.setReplicas( 1, { '/lfn/old' : [ 'SE1' ] }, insertTime = time.time() - 3 * 86400 )
+    self.store.setReplicas( 1, { '/lfn/new' : [ 'SE1' ] } )
+    self.assertEqual( self.store.removeExpired( 1, 2 * 86400 )[ 'Value' ], 1 )
+    self.assertEqual( self.store.getReplicas( 1, [ '/lfn/old', '/lfn/new' ] )[ 'Value' ].keys(), [ '/lfn/new' ] )
+
+  def test_importPickle( self ):
+    fileName = os.path.join( self.location, 'ReplicaCache_5.pkl' )
+    oldTime = datetime.datetime.utcnow() - datetime.timedelta( days = 3 )
+    cacheFile = open( fileName, 'w' )
+    pickle.dump( { oldTime : { '/lfn/old' : [ 'SE1' ] },
+                   datetime.datetime.utcnow() : { '/lfn/new' : [ 'SE2' ] } }, cacheFile )
+    cacheFile.close()
+    self.assertEqual( self.store.importPickle( fileName, 5 )[ 'Value' ], 2 )
+    self.assertFalse( os.path.exists( fileName ) )
+    self.assertEqual( self.store.getNumberOfReplicas( 5 )[ 'Value' ], 2 )
+    self.assertEqual( self.store.removeExpired( 5, 2 * 86400 )[ 'Value' ], 1 )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( ReplicaCacheStoreTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -7,10 +7,13 @@ COMPONENT_NAME = 'TaskManager'
 import time
 import types
 import os
+import shutil
+import tempfile
 
 from DIRAC                                                      import S_OK, S_ERROR, gLogger
 from DIRAC.Core.Security.ProxyInfo                              import getProxyInfo
 from DIRAC.Core.Utilities.List                                  import fromChar
+from DIRAC.Core.Utilities.ClassAd.ClassAdLight                  import ClassAd
 from DIRAC.Core.Utilities.ModuleFactory                         import ModuleFactory
 from DIRAC.Interfaces.API.Job                                   import Job
 from DIRAC.RequestManagementSystem.Client.ReqClient             import ReqClient
@@ -331,6 +334,8 @@ class WorkflowTasks( TaskBase ):
 
     self.destinationPlugin_o = None
 
+    self.bulkSubmission = self.opsH.getValue( 'Transformations/BulkSubmission', False )
+
   def prepareTransformationTasks( self, transBody, taskDict, owner = '', ownerGroup = '', ownerDN = '' ):
     """ Prepare tasks, given a taskDict, that is created (with some manipulation) by the DB
         jobClass is by default "DIRAC.Interfaces.API.Job.Job". An extension of it also works.
@@ -349,12 +354,16 @@ class WorkflowTasks( TaskBase ):
         return res
       ownerDN = res['Value'][0]
 
+    # The transformation body is parsed once, each task gets a copy of it
+    templateJob = self.jobClass( transBody )
+    site = templateJob.workflow.findParameter( 'Site' ).getValue()
+    jobType = templateJob.workflow.findParameter( 'JobType' ).getValue()
+    hospitalTrans = [int( x ) for x in self.opsH.getValue( "Hospital/Transformations", [] )]
+
     for taskNumber in sorted( taskDict ):
-      oJob = self.jobClass( transBody )
+      oJob = templateJob._clone()
       paramsDict = taskDict[taskNumber]
-      site = oJob.workflow.findParameter( 'Site' ).getValue()
       paramsDict['Site'] = site
-      jobType = oJob.workflow.findParameter( 'JobType' ).getValue()
       paramsDict['JobType'] = jobType
       transID = paramsDict['TransformationID']
       self._logVerbose( 'Setting job owner:group to %s:%s' % ( owner, ownerGroup ) )
@@ -389,7 +398,6 @@ class WorkflowTasks( TaskBase ):
       self._handleInputs( oJob, paramsDict )
       self._handleRest( oJob, paramsDict )
 
-      hospitalTrans = [int( x ) for x in self.opsH.getValue( "Hospital/Transformations", [] )]
       if int( transID ) in hospitalTrans:
         self._handleHospital( oJob )
 
@@ -403,7 +411,7 @@ class WorkflowTasks( TaskBase ):
           continue
         for name, output in res['Value'].items():
           oJob._addJDLParameter( name, ';'.join( output ) )
-      taskDict[taskNumber]['TaskObject'] = self.jobClass( oJob._toXML() )
+      taskDict[taskNumber]['TaskObject'] = oJob
     return S_OK( taskDict )
 
   #############################################################################
@@ -498,8 +506,10 @@ class WorkflowTasks( TaskBase ):
     return module.execute()
 
   def submitTransformationTasks( self, taskDict ):
-    """ Submit jobs one by one
+    """ Submit jobs one by one, or all at once if Transformations/BulkSubmission is set
     """
+    if self.bulkSubmission:
+      return self.__submitTransformationTasksBulk( taskDict )
     submitted = 0
     failed = 0
     startTime = time.time()
@@ -523,6 +533,85 @@ class WorkflowTasks( TaskBase ):
       self._logError( 'submitTransformationTasks: Failed to submit %d tasks to WMS.' % ( failed ) )
     return S_OK( taskDict )
 
+  def __submitTransformationTasksBulk( self, taskDict ):
+    """ Submit all the jobs with one call to the WMS. Each task ships its own
+        jobDescription.xml, kept in a temporary directory. The other local input
+        sandbox files, the same for all the tasks, are uploaded once as a separate sandbox
+    """
+    submitted = 0
+    failed = 0
+    startTime = time.time()
+    taskIDs = []
+    jdls = []
+    # Sandbox location of the shared local input sandbox files
+    sharedSandboxes = {}
+    tmpDir = tempfile.mkdtemp( prefix = 'TaskSubmission.' )
+    try:
+      for taskID in sorted( taskDict ):
+        taskDict[taskID]['Success'] = False
+        job = taskDict[taskID]['TaskObject']
+        if not job:
+          failed += 1
+          continue
+        if type( job ) in types.StringTypes:
+          try:
+            job = self.jobClass( job )
+          except Exception, x:
+            self._logException( "Failed to create job object", '', x )
+            failed += 1
+            continue
+        taskDir = os.path.join( tmpDir, str( taskID ) )
+        os.mkdir( taskDir )
+        workflowFile = open( os.path.join( taskDir, "jobDescription.xml" ), 'w' )
+        workflowFile.write( job._toXML() )
+        workflowFile.close()
+        classAdJob = ClassAd( '[%s]' % job._toJDL() )
+        inputSandbox = []
+        sharedFiles = []
+        for isFile in classAdJob.getListFromExpression( 'InputSandbox' ):
+          if isFile == 'jobDescription.xml':
+            inputSandbox.append( os.path.join( taskDir, isFile ) )
+          elif isFile.lower().startswith( 'lfn:' ) or isFile.startswith( 'SB:' ):
+            inputSandbox.append( isFile )
+          else:
+            sharedFiles.append( isFile )
+        if sharedFiles:
+          sharedKey = tuple( sorted( sharedFiles ) )
+          if sharedKey not in sharedSandboxes:
+            res = self.submissionClient.uploadSandbox( sharedFiles )
+            if not res['OK']:
+              self._logError( "Failed to upload the input sandbox", "%s: %s" % ( taskID, res['Message'] ) )
+              failed += 1
+              continue
+            sharedSandboxes[sharedKey] = res['Value']
+          inputSandbox.append( sharedSandboxes[sharedKey] )
+        classAdJob.insertAttributeVectorString( 'InputSandbox', inputSandbox )
+        taskIDs.append( taskID )
+        jdls.append( classAdJob.asJDL() )
+
+      if jdls:
+        res = self.submissionClient.submitJobs( jdls )
+        if not res['OK']:
+          self._logError( "Failed to submit tasks to WMS", res['Message'] )
+        else:
+          errors = res.get( 'Errors', {} )
+          for iPos, message in errors.items():
+            self._logError( "Failed to submit task to WMS", "%s: %s" % ( taskIDs[iPos], message ) )
+          for iPos, ( taskID, jobID ) in enumerate( zip( taskIDs, res['Value'] ) ):
+            if iPos in errors or not jobID:
+              continue
+            taskDict[taskID]['ExternalID'] = jobID
+            taskDict[taskID]['Success'] = True
+            submitted += 1
+        failed += len( jdls ) - submitted
+    finally:
+      shutil.rmtree( tmpDir, ignore_errors = True )
+    self._logInfo( 'submitTransformationTasks: Submitted %d tasks to WMS in %.1f seconds' % ( submitted,
+                                                                                            time.time() - startTime ) )
+    if failed:
+      self._logError( 'submitTransformationTasks: Failed to submit %d tasks to WMS.' % ( failed ) )
+    return S_OK( taskDict )
+
   def submitTaskToExternal( self, job ):
     """ Submits a single job to the WMS.
     """
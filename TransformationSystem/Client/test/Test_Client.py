@@ -214,6 +214,32 @@ class WorkflowTasksSuccess( ClientsTestCase ):
     res = self.wfTasks.submitTransformationTasks( taskDict )
     self.assertEqual( res['OK'], True, res['Message'] if 'Message' in res else 'OK' )
 
+  def test_submitTransformationTasksBulk( self ):
+    self.wfTasks.bulkSubmission = True
+    taskDict = {}
+    for taskID in ( 1, 2, 3 ):
+      job = MagicMock()
+      job._toXML.return_value = '<Workflow>%d</Workflow>' % taskID
+      job._toJDL.return_value = 'InputSandbox = {"jobDescription.xml","lib.tar.gz","LFN:/a/lfn/1.txt"};'
+      taskDict[taskID] = { 'TaskObject' : job }
+    self.WMSClientMock.uploadSandbox.return_value = S_OK( 'SB:Store|/a/shared.tar.bz2' )
+    # The second job is a partly failed parametric job: it has an error and some job IDs
+    res = S_OK( [ 11, [ 12, 13 ], 14 ] )
+    res['Errors'] = { 1 : 'Rejected' }
+    self.WMSClientMock.submitJobs.return_value = res
+
+    res = self.wfTasks.submitTransformationTasks( taskDict )
+    self.assertTrue( res['OK'] )
+    self.assertEqual( [ taskDict[taskID]['Success'] for taskID in ( 1, 2, 3 ) ], [ True, False, True ] )
+    self.assertEqual( taskDict[3]['ExternalID'], 14 )
+    # The shared files are uploaded once, each task keeps its own jobDescription.xml
+    self.assertEqual( self.WMSClientMock.uploadSandbox.call_count, 1 )
+    self.WMSClientMock.uploadSandbox.assert_called_with( [ 'lib.tar.gz' ] )
+    for jdl in self.WMSClientMock.submitJobs.call_args[0][0]:
+      self.assertTrue( 'SB:Store|/a/shared.tar.bz2' in jdl )
+      self.assertTrue( 'jobDescription.xml' in jdl )
+      self.assertFalse( '"lib.tar.gz"' in jdl )
+
 
 #############################################################################
 
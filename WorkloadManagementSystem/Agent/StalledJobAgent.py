@@ -4,17 +4,22 @@
 """ The StalledJobAgent hunts for stalled jobs in the Job database. Jobs in "running"
 state not receiving a heart beat signal for more than stalledTime
 seconds will be assigned the "Stalled" state.
+
+Jobs are selected, updated and accounted by sets of at most chunkSize jobs
+with a few queries each, not one job at a time.
 """
 
 __RCSID__ = "$Id$"
 
 from DIRAC.WorkloadManagementSystem.DB.JobDB import JobDB
 from DIRAC.WorkloadManagementSystem.DB.JobLoggingDB import JobLoggingDB
+from DIRAC.WorkloadManagementSystem.DB.PilotAgentsDB import PilotAgentsDB
 from DIRAC.Core.Base.AgentModule import AgentModule
-from DIRAC.Core.Utilities.Time import fromString, toEpoch, dateTime, second
+from DIRAC.Core.Utilities.Time import fromString, dateTime, second
+from DIRAC.Core.Utilities.List import breakListIntoChunks
 from DIRAC import S_OK, S_ERROR, gConfig
-from DIRAC.Core.DISET.RPCClient import RPCClient
 from DIRAC.AccountingSystem.Client.Types.Job import Job
+from DIRAC.AccountingSystem.Client.DataStoreClient import gDataStoreClient
 from DIRAC.Core.Utilities.ClassAd.ClassAdLight import ClassAd
 from DIRAC.ConfigurationSystem.Client.Helpers import cfgPath
 from DIRAC.ConfigurationSystem.Client.PathFinder import getSystemInstance
@@ -32,6 +37,8 @@ for the agent restart
 """
   jobDB = None
   logDB = None
+  pilotDB = None
+  chunkSize = 1000
   matchedTime = 7200
   rescheduledTime = 600
   completedTime = 86400
@@ -42,6 +49,7 @@ for the agent restart
 """
     self.jobDB = JobDB()
     self.logDB = JobLoggingDB()
+    self.pilotDB = PilotAgentsDB()
     self.am_setOption( 'PollingTime', 60 * 60 )
     if not self.am_getOption( 'Enable', True ):
       self.log.info( 'Stalled Job Agent running in disabled mode' )
@@ -64,6 +72,7 @@ for the agent restart
     self.matchedTime = self.am_getOption( 'MatchedTime', self.matchedTime )
     self.rescheduledTime = self.am_getOption( 'RescheduledTime', self.rescheduledTime )
     self.completedTime = self.am_getOption( 'CompletedTime', self.completedTime )
+    self.chunkSize = self.am_getOption( 'ChunkSize', self.chunkSize )
 
     self.log.verbose( 'StalledTime = %s cycles' % ( stalledTime ) )
     self.log.verbose( 'FailedTime = %s cycles' % ( failedTime ) )
@@ -101,29 +110,21 @@ for the agent restart
   def __markStalledJobs( self, stalledTime ):
     """ Identifies stalled jobs running without update longer than stalledTime.
 """
-    stalledCounter = 0
-    runningCounter = 0
-    result = self.jobDB.selectJobs( {'Status':'Running'} )
+    result = self.jobDB.selectJobsWithoutUpdate( 'Running', stalledTime )
     if not result['OK']:
       return result
-    if not result['Value']:
-      return S_OK()
     jobs = result['Value']
-    self.log.info( '%s Running jobs will be checked for being stalled' % ( len( jobs ) ) )
+    if not jobs:
+      return S_OK()
+    self.log.info( '%s Running jobs are identified as stalled with last update > %s secs ago' %
+                   ( len( jobs ), stalledTime ) )
     jobs.sort()
-# jobs = jobs[:10] #for debugging
-    for job in jobs:
-      result = self.__getStalledJob( job, stalledTime )
-      if result['OK']:
-        self.log.verbose( 'Updating status to Stalled for job %s' % ( job ) )
-        self.__updateJobStatus( job, 'Stalled' )
-        stalledCounter += 1
-      else:
-        self.log.verbose( result['Message'] )
-        runningCounter += 1
 
-    self.log.info( 'Total jobs: %s, Stalled job count: %s, Running job count: %s' %
-                   ( len( jobs ), stalledCounter, runningCounter ) )
+    result = self.__updateJobStatus( jobs, 'Running', 'Stalled' )
+    if not result['OK']:
+      return result
+
+    self.log.info( 'Stalled job count: %s' % len( result['Value'] ) )
     return S_OK()
 
   #############################################################################
@@ -136,59 +137,52 @@ for the agent restart
       return result
 
     failedCounter = 0
+    pilotMinor = "Job stalled: pilot not running"
+    stalledMinor = 'Stalling for more than %d sec' % failedTime
 
     if result['Value']:
-      jobs = result['Value']
+      jobs = [ int( job ) for job in result['Value'] ]
       self.log.info( '%s Stalled jobs will be checked for failure' % ( len( jobs ) ) )
 
-      for job in jobs:
-
-        # Check if the job pilot is lost
-        result = self.__getJobPilotStatus( job )
-        if result['OK']:
-          pilotStatus = result['Value']
-          if pilotStatus != "Running":
-            result = self.__updateJobStatus( job, 'Failed',
-                                             "Job stalled: pilot not running" )
-            failedCounter += 1
-            result = self.__sendAccounting( job )
-            if not result['OK']:
-              self.log.error( 'Failed to send accounting', result['Message'] )
-              break
-            continue
-
-        result = self.__getLatestUpdateTime( job )
-        if not result['OK']:
-          return result
-        currentTime = toEpoch()
-        lastUpdate = result['Value']
-        elapsedTime = currentTime - lastUpdate
-        if elapsedTime > failedTime:
-          self.__updateJobStatus( job, 'Failed', 'Stalling for more than %d sec' % failedTime )
-          failedCounter += 1
-          result = self.__sendAccounting( job )
-          if not result['OK']:
-            self.log.error( 'Failed to send accounting', result['Message'] )
-            break
+      # Check if the job pilots are lost
+      result = self.__getJobPilotStatus( jobs )
+      if not result['OK']:
+        self.log.error( 'Failed to get the pilot status of the jobs', result['Message'] )
+        pilotStatus = {}
+      else:
+        pilotStatus = result['Value']
+      lostJobs = [ job for job in jobs if job in pilotStatus and pilotStatus[job] != "Running" ]
+      result = self.__updateJobStatus( lostJobs, 'Stalled', 'Failed', pilotMinor )
+      if not result['OK']:
+        return result
+      failedCounter += len( result['Value'] )
+
+      result = self.jobDB.selectJobsWithoutUpdate( 'Stalled', failedTime )
+      if not result['OK']:
+        return result
+      lostJobs = set( lostJobs )
+      oldJobs = [ job for job in result['Value'] if job not in lostJobs ]
+      result = self.__updateJobStatus( oldJobs, 'Stalled', 'Failed', stalledMinor )
+      if not result['OK']:
+        return result
+      failedCounter += len( result['Value'] )
 
+    # The jobs just failed are accounted with the ones not accounted in previous cycles
     recoverCounter = 0
 
-    for minor in ["Job stalled: pilot not running", 'Stalling for more than %d sec' % failedTime]:
+    jobs = []
+    for minor in [pilotMinor, stalledMinor]:
       result = self.jobDB.selectJobs( {'Status':'Failed', 'MinorStatus': minor, 'AccountedFlag': 'False' } )
       if not result['OK']:
         return result
-      if result['Value']:
-        jobs = result['Value']
-        self.log.info( '%s Stalled jobs will be Accounted' % ( len( jobs ) ) )
-        for job in jobs:
-          result = self.__sendAccounting( job )
-          if not result['OK']:
-            self.log.error( 'Failed to send accounting', result['Message'] )
-            continue
-
-          recoverCounter += 1
+      jobs.extend( result['Value'] )
+    if jobs:
+      self.log.info( '%s Stalled jobs will be Accounted' % ( len( jobs ) ) )
+      result = self.__sendAccounting( jobs )
       if not result['OK']:
-        break
+        self.log.error( 'Failed to send accounting', result['Message'] )
+      else:
+        recoverCounter = result['Value']
 
     if failedCounter:
       self.log.info( '%d jobs set to Failed' % failedCounter )
@@ -197,151 +191,158 @@ for the agent restart
     return S_OK( failedCounter )
 
   #############################################################################
-  def __getJobPilotStatus( self, jobID ):
-    """ Get the job pilot status
+  def __getJobPilotStatus( self, jobIDs ):
+    """ Get the status of the pilots of the jobs as a dictionary jobID -> status,
+with 'NoPilot' for the pilots not known any more
 """
-    result = self.jobDB.getJobParameter( jobID, 'Pilot_Reference' )
-    if not result['OK']:
-      return result
-    if not result['Value']:
-      return S_ERROR( 'Failed to get the pilot reference' )
-
-    pilotReference = result['Value']
-    wmsAdminClient = RPCClient( 'WorkloadManagement/WMSAdministrator' )
-    result = wmsAdminClient.getPilotInfo( pilotReference )
-    if not result['OK']:
-      if "No pilots found" in result['Message']:
-        self.log.warn( result['Message'] )
-        return S_OK( 'NoPilot' )
-      self.log.error( 'Failed to get pilot information', result['Message'] )
-      return S_ERROR( 'Failed to get the pilot status' )
-    pilotStatus = result['Value'][pilotReference]['Status']
+    pilotStatus = {}
+    for jobChunk in breakListIntoChunks( jobIDs, self.chunkSize ):
+      result = self.pilotDB.getPilotStatusForJobs( jobChunk )
+      if not result['OK']:
+        self.log.error( 'Failed to get pilot information', result['Message'] )
+        return S_ERROR( 'Failed to get the pilot status' )
+      for jobID, status in result['Value'].items():
+        if status is None:
+          self.log.warn( 'No pilots found for job %s' % jobID )
+          status = 'NoPilot'
+        pilotStatus[jobID] = status
 
     return S_OK( pilotStatus )
 
-
-  #############################################################################
-  def __getStalledJob( self, job, stalledTime ):
-    """ Compares the most recent of LastUpdateTime and HeartBeatTime against
-the stalledTime limit.
-"""
-    result = self.__getLatestUpdateTime( job )
-    if not result['OK']:
-      return result
-
-    currentTime = toEpoch()
-    lastUpdate = result['Value']
-
-    elapsedTime = currentTime - lastUpdate
-    self.log.verbose( '(CurrentTime-LastUpdate) = %s secs' % ( elapsedTime ) )
-    if elapsedTime > stalledTime:
-      self.log.info( 'Job %s is identified as stalled with last update > %s secs ago' % ( job, elapsedTime ) )
-      return S_OK( 'Stalled' )
-
-    return S_ERROR( 'Job %s is running and will be ignored' % job )
-
   #############################################################################
-  def __getLatestUpdateTime( self, job ):
-    """ Returns the most recent of HeartBeatTime and LastUpdateTime
+  def __updateJobStatus( self, jobs, expectedStatus, status, minorstatus = None ):
+    """ This method updates the status of a list of jobs in the JobDB, this should only be
+used to fail jobs due to the optimizer chain. Only the jobs still in expectedStatus are
+changed, their list is returned
 """
-    result = self.jobDB.getJobAttributes( job, ['HeartBeatTime', 'LastUpdateTime'] )
-    if not result['OK']:
-      self.log.error( 'Failed to get job attributes', result['Message'] )
-    if not result['OK'] or not result['Value']:
-      self.log.error( 'Could not get attributes for job', '%s' % job )
-      return S_ERROR( 'Could not get attributes for job' )
-
-    self.log.verbose( result )
-    latestUpdate = 0
-    if not result['Value']['HeartBeatTime'] or result['Value']['HeartBeatTime'] == 'None':
-      self.log.verbose( 'HeartBeatTime is null for job %s' % job )
-    else:
-      latestUpdate = toEpoch( fromString( result['Value']['HeartBeatTime'] ) )
-
-    if not result['Value']['LastUpdateTime'] or result['Value']['LastUpdateTime'] == 'None':
-      self.log.verbose( 'LastUpdateTime is null for job %s' % job )
-    else:
-      lastUpdate = toEpoch( fromString( result['Value']['LastUpdateTime'] ) )
-      if latestUpdate < lastUpdate:
-        latestUpdate = lastUpdate
-
-    if not latestUpdate:
-      return S_ERROR( 'LastUpdate and HeartBeat times are null for job %s' % job )
-    else:
-      self.log.verbose( 'Latest update time from epoch for job %s is %s' % ( job, latestUpdate ) )
-      return S_OK( latestUpdate )
-
-  #############################################################################
-  def __updateJobStatus( self, job, status, minorstatus = None ):
-    """ This method updates the job status in the JobDB, this should only be
-used to fail jobs due to the optimizer chain.
-"""
-    self.log.verbose( "self.jobDB.setJobAttribute(%s,'Status','%s',update=True)" % ( job, status ) )
-
-    if self.am_getOption( 'Enable', True ):
-      result = self.jobDB.setJobAttribute( job, 'Status', status, update = True )
-    else:
-      result = S_OK( 'DisabledMode' )
-
-    if result['OK']:
+    updatedJobs = []
+    for jobChunk in breakListIntoChunks( jobs, self.chunkSize ):
+      self.log.verbose( "self.jobDB.setJobAttributesBulk(%s,'Status','%s',update=True,expectedStatus='%s')",
+                        jobChunk, status, expectedStatus )
+
+      attrNames = []
+      attrValues = []
+      if self.am_getOption( 'Enable', True ):
+        attrNames.append( 'Status' )
+        attrValues.append( status )
       if minorstatus:
-        self.log.verbose( "self.jobDB.setJobAttribute(%s,'MinorStatus','%s',update=True)" % ( job, minorstatus ) )
-        result = self.jobDB.setJobAttribute( job, 'MinorStatus', minorstatus, update = True )
+        attrNames.append( 'MinorStatus' )
+        attrValues.append( minorstatus )
+      if attrNames:
+        result = self.jobDB.setJobAttributesBulk( jobChunk, attrNames, attrValues, update = True,
+                                                  expectedStatus = expectedStatus )
+        if not result['OK']:
+          return result
+        #Jobs that changed status since they were selected are left alone
+        jobChunk = result['Value']
+        if not jobChunk:
+          continue
 
-    if not minorstatus: #Retain last minor status for stalled jobs
-      result = self.jobDB.getJobAttributes( job, ['MinorStatus'] )
-      if result['OK']:
-        minorstatus = result['Value']['MinorStatus']
+      if minorstatus:
+        records = [ ( job, status, minorstatus, 'idem' ) for job in jobChunk ]
+      else:
+        #Retain last minor status for stalled jobs
+        result = self.jobDB.getAttributesForJobList( jobChunk, ['MinorStatus'] )
+        if not result['OK']:
+          return result
+        jobDicts = result['Value']
+        records = [ ( job, status, jobDicts[job]['MinorStatus'], 'idem' ) for job in jobChunk if job in jobDicts ]
 
-    logStatus = status
-    result = self.logDB.addLoggingRecord( job, status = logStatus, minor = minorstatus, source = 'StalledJobAgent' )
-    if not result['OK']:
-      self.log.warn( result )
+      result = self.logDB.addLoggingRecordsBulk( records, source = 'StalledJobAgent' )
+      if not result['OK']:
+        self.log.warn( result )
+      updatedJobs.extend( jobChunk )
 
-    return result
+    return S_OK( updatedJobs )
 
-  def __getProcessingType( self, jobID ):
+  def __getProcessingType( self, jdl ):
     """ Get the Processing Type from the JDL, until it is promoted to a real Attribute
 """
     processingType = 'unknown'
-    result = self.jobDB.getJobJDL( jobID, original = True )
-    if not result['OK']:
+    if not jdl:
       return processingType
-    classAdJob = ClassAd( result['Value'] )
+    classAdJob = ClassAd( jdl )
     if classAdJob.lookupAttribute( 'ProcessingType' ):
       processingType = classAdJob.getAttributeString( 'ProcessingType' )
     return processingType
 
 
   #############################################################################
-  def __sendAccounting( self, jobID ):
-    """ Send WMS accounting data for the given job
+  def __sendAccounting( self, jobIDs ):
+    """ Send WMS accounting data for the given jobs in one commit
+"""
+    jobIDs = [ int( jobID ) for jobID in jobIDs ]
+    accountedJobs = []
+    for jobChunk in breakListIntoChunks( jobIDs, self.chunkSize ):
+      result = self.jobDB.getAttributesForJobList( jobChunk )
+      if not result['OK']:
+        return result
+      jobDicts = result['Value']
+      result = self.logDB.getJobLoggingInfoBulk( jobChunk )
+      if not result['OK']:
+        return result
+      logLists = result['Value']
+      result = self.jobDB.getHeartBeatDataBulk( jobChunk )
+      if not result['OK']:
+        return result
+      heartBeats = result['Value']
+      result = self.jobDB.getJobParametersBulk( jobChunk, ['CPUNormalizationFactor'] )
+      if not result['OK']:
+        return result
+      jobParameters = result['Value']
+      result = self.jobDB.getJobJDLsBulk( jobChunk, original = True )
+      if not result['OK']:
+        return result
+      jdls = result['Value']
+
+      for jobID in jobChunk:
+        if jobID not in jobDicts:
+          self.log.error( 'Could not get attributes for job', '%s' % jobID )
+          continue
+        accountingReport = self.__getAccountingReport( jobID, jobDicts[jobID], logLists.get( jobID, [] ),
+                                                       heartBeats.get( jobID, [] ),
+                                                       jobParameters.get( jobID, {} ), jdls.get( jobID ) )
+        if not accountingReport:
+          continue
+        result = gDataStoreClient.addRegister( accountingReport )
+        if not result['OK']:
+          self.log.error( 'Failed to add accounting report', 'Job: %d, Error: %s' % ( jobID, result['Message'] ) )
+          continue
+        accountedJobs.append( jobID )
+
+    if not accountedJobs:
+      return S_OK( 0 )
+    result = gDataStoreClient.commit()
+    if not result['OK']:
+      self.log.error( 'Failed to send accounting reports', 'Jobs: %d, Error: %s' % ( len( accountedJobs ),
+                                                                                    result['Message'] ) )
+      return result
+    for jobChunk in breakListIntoChunks( accountedJobs, self.chunkSize ):
+      self.jobDB.setJobAttributesBulk( jobChunk, ['AccountedFlag'], ['True'] )
+    return S_OK( len( accountedJobs ) )
+
+  def __getAccountingReport( self, jobID, jobDict, logList, heartBeatData, jobParameters, jdl ):
+    """ Build the WMS accounting report of a job, None if it can't be built
 """
     try:
       accountingReport = Job()
       endTime = 'Unknown'
       lastHeartBeatTime = 'Unknown'
 
-      result = self.jobDB.getJobAttributes( jobID )
-      if not result['OK']:
-        return result
-      jobDict = result['Value']
-
-      startTime, endTime = self.__checkLoggingInfo( jobID, jobDict )
-      lastCPUTime, lastWallTime, lastHeartBeatTime = self.__checkHeartBeat( jobID, jobDict )
+      startTime, endTime = self.__checkLoggingInfo( jobID, jobDict, logList )
+      lastCPUTime, lastWallTime, lastHeartBeatTime = self.__checkHeartBeat( jobID, jobDict, heartBeatData )
       lastHeartBeatTime = fromString( lastHeartBeatTime )
       if lastHeartBeatTime is not None and lastHeartBeatTime > endTime:
         endTime = lastHeartBeatTime
 
-      cpuNormalization = self.jobDB.getJobParameter( jobID, 'CPUNormalizationFactor' )
-      if not cpuNormalization['OK'] or not cpuNormalization['Value']:
+      try:
+        cpuNormalization = float( jobParameters['CPUNormalizationFactor'] )
+      except ( KeyError, ValueError ):
         cpuNormalization = 0.0
-      else:
-        cpuNormalization = float( cpuNormalization['Value'] )
     except Exception:
       self.log.exception( "Exception in __sendAccounting for job %s: endTime=%s, lastHBTime %s" % ( str( jobID ), str( endTime ), str( lastHeartBeatTime ) ), '' , False )
-      return S_ERROR( "Exception" )
-    processingType = self.__getProcessingType( jobID )
+      return None
+    processingType = self.__getProcessingType( jdl )
 
     accountingReport.setStartTime( startTime )
     accountingReport.setEndTime( endTime )
@@ -378,53 +379,40 @@ used to fail jobs due to the optimizer chain.
     self.log.verbose( 'Accounting Report is:' )
     self.log.verbose( acData )
     accountingReport.setValuesFromDict( acData )
+    return accountingReport
 
-    result = accountingReport.commit()
-    if result['OK']:
-      self.jobDB.setJobAttribute( jobID, 'AccountedFlag', 'True' )
-    else:
-      self.log.error( 'Failed to send accounting report', 'Job: %d, Error: %s' % ( int( jobID ), result['Message'] ) )
-    return result
-
-  def __checkHeartBeat( self, jobID, jobDict ):
+  def __checkHeartBeat( self, jobID, jobDict, heartBeatData ):
     """ Get info from HeartBeat
 """
-    result = self.jobDB.getHeartBeatData( jobID )
     lastCPUTime = 0
     lastWallTime = 0
     lastHeartBeatTime = jobDict['StartExecTime']
     if lastHeartBeatTime == "None":
       lastHeartBeatTime = 0
 
-    if result['OK']:
-      for name, value, heartBeatTime in result['Value']:
-        if 'CPUConsumed' == name:
-          try:
-            value = int( float( value ) )
-            if value > lastCPUTime:
-              lastCPUTime = value
-          except ValueError:
-            pass
-        if 'WallClockTime' == name:
-          try:
-            value = int( float( value ) )
-            if value > lastWallTime:
-              lastWallTime = value
-          except ValueError:
-            pass
-        if heartBeatTime > lastHeartBeatTime:
-          lastHeartBeatTime = heartBeatTime
+    for name, value, heartBeatTime in heartBeatData:
+      if 'CPUConsumed' == name:
+        try:
+          value = int( float( value ) )
+          if value > lastCPUTime:
+            lastCPUTime = value
+        except ValueError:
+          pass
+      if 'WallClockTime' == name:
+        try:
+          value = int( float( value ) )
+          if value > lastWallTime:
+            lastWallTime = value
+        except ValueError:
+          pass
+      if heartBeatTime > lastHeartBeatTime:
+        lastHeartBeatTime = heartBeatTime
 
     return lastCPUTime, lastWallTime, lastHeartBeatTime
 
-  def __checkLoggingInfo( self, jobID, jobDict ):
+  def __checkLoggingInfo( self, jobID, jobDict, logList ):
     """ Get info from JobLogging
 """
-    logList = []
-    result = self.logDB.getJobLoggingInfo( jobID )
-    if result['OK']:
-      logList = result['Value']
-
     startTime = jobDict['StartExecTime']
     if not startTime or startTime == 'None':
       # status, minor, app, stime, source
@@ -510,22 +498,31 @@ used to fail jobs due to the optimizer chain.
       return S_OK()
 
     # Remove those with Minor Status "Pending Requests"
-    for jobID in jobIDs:
-      result = self.jobDB.getJobAttributes( jobID, ['Status','MinorStatus'] )
+    failedJobs = []
+    for jobChunk in breakListIntoChunks( jobIDs, self.chunkSize ):
+      result = self.jobDB.getAttributesForJobList( jobChunk, ['Status','MinorStatus'] )
       if not result['OK']:
         self.log.error( 'Failed to get job attributes', result['Message'] )
         continue
-      if result['Value']['Status'] != "Completed":
-        continue
-      if result['Value']['MinorStatus'] == "Pending Requests":
-        continue
-
-      result = self.__updateJobStatus( jobID, 'Failed',
-                                       "Job died during finalization" )
-      result = self.__sendAccounting( jobID )
-      if not result['OK']:
-        self.log.error( 'Failed to send accounting', result['Message'] )
-        continue
+      for jobID, jobDict in result['Value'].items():
+        if jobDict['Status'] != "Completed":
+          continue
+        if jobDict['MinorStatus'] == "Pending Requests":
+          continue
+        failedJobs.append( jobID )
+
+    if not failedJobs:
+      return S_OK()
+    result = self.__updateJobStatus( failedJobs, 'Completed', 'Failed',
+                                     "Job died during finalization" )
+    if not result['OK']:
+      return result
+    failedJobs = result['Value']
+    if not failedJobs:
+      return S_OK()
+    result = self.__sendAccounting( failedJobs )
+    if not result['OK']:
+      self.log.error( 'Failed to send accounting', result['Message'] )
 
     return S_OK()
 
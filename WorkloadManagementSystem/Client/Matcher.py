@@ -6,7 +6,7 @@
 __RCSID__ = "$Id"
 
 import time
-from types import StringTypes
+from types import StringTypes, ListType, TupleType
 
 from DIRAC import gLogger, gMonitor
 
@@ -26,7 +26,8 @@ class Matcher( object ):
   """ Logic for matching
   """
 
-  def __init__( self, pilotAgentsDB = None, jobDB = None, tqDB = None, jlDB = None, opsHelper = None ):
+  def __init__( self, pilotAgentsDB = None, jobDB = None, tqDB = None, jlDB = None, opsHelper = None,
+                tqMatchIndex = None ):
     """ c'tor
     """
     if pilotAgentsDB:
@@ -51,6 +52,8 @@ class Matcher( object ):
     else:
       self.opsHelper = Operations()
 
+    self.tqMatchIndex = tqMatchIndex
+
     self.log = gLogger.getSubLogger( "Matcher" )
 
     self.limiter = Limiter( jobDB = self.jobDB, opsHelper = self.opsHelper )
@@ -65,7 +68,7 @@ class Matcher( object ):
     resourceDict = self._getResourceDict( resourceDescription, credDict )
 
     negativeCond = self.limiter.getNegativeCondForSite( resourceDict['Site'] )
-    result = self.tqDB.matchAndGetJob( resourceDict, negativeCond = negativeCond )
+    result = self.tqDB.matchAndGetJob( resourceDict, negativeCond = negativeCond, matchIndex = self.tqMatchIndex )
 
     if not result['OK']:
       return result
@@ -75,6 +78,65 @@ class Matcher( object ):
       raise RuntimeError( "No match found" )
 
     jobID = result['jobId']
+    resultDict = self._getMatchedJobDict( resourceDict, jobID )
+
+    matchTime = time.time() - startTime
+    self.log.info( "Match time: [%s]" % str( matchTime ) )
+    gMonitor.addMark( "matchTime", matchTime )
+
+    pilotInfoReportedFlag = resourceDict.get( 'PilotInfoReportedFlag', False )
+    if not pilotInfoReportedFlag:
+      self._updatePilotInfo( resourceDict, jobID )
+
+    resultDict['PilotInfoReportedFlag'] = True
+
+    return resultDict
+
+  def selectJobs( self, resourceDescription, credDict, numJobs ):
+    """ Select up to numJobs jobs matching the resource capacity in one go. Credentials, mask
+        and limits are evaluated once for all of them
+    """
+
+    startTime = time.time()
+
+    resourceDict = self._getResourceDict( resourceDescription, credDict )
+
+    negativeCond = self.limiter.getNegativeCondForSite( resourceDict['Site'] )
+    result = self.tqDB.matchAndGetJobs( resourceDict, numJobs, negativeCond = negativeCond,
+                                        matchIndex = self.tqMatchIndex )
+
+    if not result['OK']:
+      raise RuntimeError( result['Message'] )
+    result = result['Value']
+    if not result['matchFound']:
+      self.log.info( "No match found" )
+      raise RuntimeError( "No match found" )
+
+    jobsList = []
+    for jobID, _tqID in result['jobs']:
+      try:
+        jobsList.append( self._getMatchedJobDict( resourceDict, jobID ) )
+      except RuntimeError, rte:
+        self.log.error( "Discarding matched job", "%s: %s" % ( jobID, rte ) )
+    if not jobsList:
+      raise RuntimeError( "No match found" )
+
+    matchTime = time.time() - startTime
+    self.log.info( "Match time for %s jobs: [%s]", len( jobsList ), matchTime )
+    gMonitor.addMark( "matchTime", matchTime )
+
+    pilotInfoReportedFlag = resourceDict.get( 'PilotInfoReportedFlag', False )
+    if not pilotInfoReportedFlag:
+      self._updatePilotInfo( resourceDict, [ jobDict['JobID'] for jobDict in jobsList ] )
+
+    for jobDict in jobsList:
+      jobDict['PilotInfoReportedFlag'] = True
+
+    return jobsList
+
+  def _getMatchedJobDict( self, resourceDict, jobID ):
+    """ Check a job taken out from the TQs, flag it as matched and get what the pilot needs to run it
+    """
     resAtt = self.jobDB.getJobAttributes( jobID, ['OwnerDN', 'OwnerGroup', 'Status'] )
     if not resAtt['OK']:
       raise RuntimeError( 'Could not retrieve job attributes' )
@@ -84,7 +146,7 @@ class Matcher( object ):
       self.log.error( 'Job matched by the TQ is not in Waiting state', str( jobID ) )
       result = self.tqDB.deleteJob( jobID )
       if not result[ 'OK' ]:
-        return result
+        raise RuntimeError( result['Message'] )
       raise RuntimeError( "Job %s is not in Waiting state" % str( jobID ) )
 
     self._reportStatus( resourceDict, jobID )
@@ -97,31 +159,17 @@ class Matcher( object ):
     resultDict['JDL'] = result['Value']
     resultDict['JobID'] = jobID
 
-    matchTime = time.time() - startTime
-    self.log.info( "Match time: [%s]" % str( matchTime ) )
-    gMonitor.addMark( "matchTime", matchTime )
-
     # Get some extra stuff into the response returned
     resOpt = self.jobDB.getJobOptParameters( jobID )
     if resOpt['OK']:
       for key, value in resOpt['Value'].items():
         resultDict[key] = value
-    resAtt = self.jobDB.getJobAttributes( jobID, ['OwnerDN', 'OwnerGroup'] )
-    if not resAtt['OK']:
-      raise RuntimeError( 'Could not retrieve job attributes' )
-    if not resAtt['Value']:
-      raise RuntimeError( 'No attributes returned for job' )
 
     if self.opsHelper.getValue( "JobScheduling/CheckMatchingDelay", True ):
       self.limiter.updateDelayCounters( resourceDict['Site'], jobID )
 
-    pilotInfoReportedFlag = resourceDict.get( 'PilotInfoReportedFlag', False )
-    if not pilotInfoReportedFlag:
-      self._updatePilotInfo( resourceDict, jobID )
-
     resultDict['DN'] = resAtt['Value']['OwnerDN']
     resultDict['Group'] = resAtt['Value']['OwnerGroup']
-    resultDict['PilotInfoReportedFlag'] = True
 
     return resultDict
 
@@ -248,6 +296,10 @@ class Matcher( object ):
         FIXME:  this part should not be done here, by the matcher. Instead, it should be done by the pilot itself.
                 Also, updating the job for pilot should be done by the JobAgent, since the jobAgent knows what job is running
     """
+    if type( jobID ) in ( ListType, TupleType ):
+      jobIDs = jobID
+    else:
+      jobIDs = [ jobID ]
     pilotReference = resourceDict.get( 'PilotReference', '' )
     if pilotReference:
       gridCE = resourceDict.get( 'GridCE', 'Unknown' )
@@ -260,14 +312,15 @@ class Matcher( object ):
       if not result['OK']:
         self.log.error( "Problem updating pilot information",
                         "; setPilotStatus. pilotReference: %s; %s" % ( pilotReference, result['Message'] ) )
-      result = self.pilotAgentsDB.setCurrentJobID( pilotReference, jobID )
+      result = self.pilotAgentsDB.setCurrentJobID( pilotReference, jobIDs[-1] )
       if not result['OK']:
         self.log.error( "Problem updating pilot information",
                         ";setCurrentJobID. pilotReference: %s; %s" % ( pilotReference, result['Message'] ) )
-      result = self.pilotAgentsDB.setJobForPilot( jobID, pilotReference, updateStatus = False )
-      if not result['OK']:
-        self.log.error( "Problem updating pilot information",
-                        "; setJobForPilot. pilotReference: %s; %s" % ( pilotReference, result['Message'] ) )
+      for jobID in jobIDs:
+        result = self.pilotAgentsDB.setJobForPilot( jobID, pilotReference, updateStatus = False )
+        if not result['OK']:
+          self.log.error( "Problem updating pilot information",
+                          "; setJobForPilot. pilotReference: %s; %s" % ( pilotReference, result['Message'] ) )
 
   def _checkCredentials( self, resourceDict, credDict ):
     """ Check if we can get a job given the passed credentials
@@ -47,10 +47,12 @@ class WMSClient( object ):
 
     return inputSandbox
 
-  def __uploadInputSandbox( self, classAdJob ):
+  def __uploadInputSandbox( self, classAdJob, sandboxCache = None ):
     """Checks the validity of the job Input Sandbox.
        The function returns the list of Input Sandbox files.
-       The total volume of the input sandbox is evaluated
+       The total volume of the input sandbox is evaluated.
+       If a sandboxCache dictionary is given, sandboxes with the same files
+       and contents as one already uploaded are not uploaded again
     """
     inputSandbox = self.__getInputSandboxEntries( classAdJob )
 
@@ -85,20 +87,44 @@ class WMSClient( object ):
       return result
 
     if okFiles:
-      if not self.sandboxClient:
-        self.sandboxClient = SandboxStoreClient( useCertificates = self.useCertificates )
-      result = self.sandboxClient.uploadFilesAsSandbox( okFiles )
-      if not result[ 'OK' ]:
+      result = self.uploadSandbox( okFiles, sandboxCache )
+      if not result['OK']:
         return result
-      inputSandbox.append( result[ 'Value' ] )
+      inputSandbox.append( result['Value'] )
       classAdJob.insertAttributeVectorString( "InputSandbox", inputSandbox )
 
     return S_OK()
 
-  def submitJob( self, jdl ):
-    """ Submit one job specified by its JDL to WMS
+  def uploadSandbox( self, fileList, sandboxCache = None ):
+    """ Upload the local files as one sandbox and return its location.
+        If a sandboxCache dictionary is given, a sandbox with the same files
+        and contents as one already uploaded is not uploaded again
     """
+    sandboxKey = None
+    if sandboxCache is not None:
+      # Each file is keyed by its own checksum, directories are not checksummed,
+      # they are only shared if they are the same
+      sandboxKey = []
+      for isFile in fileList:
+        if os.path.isdir( isFile ):
+          sandboxKey.append( ( os.path.basename( isFile ), 'dir', os.path.realpath( isFile ) ) )
+        else:
+          sandboxKey.append( ( os.path.basename( isFile ), 'file', File.getMD5ForFiles( [ isFile ] ) ) )
+      sandboxKey = tuple( sorted( sandboxKey ) )
+      if sandboxKey in sandboxCache:
+        return S_OK( sandboxCache[ sandboxKey ] )
+    if not self.sandboxClient:
+      self.sandboxClient = SandboxStoreClient( useCertificates = self.useCertificates )
+    result = self.sandboxClient.uploadFilesAsSandbox( fileList )
+    if not result[ 'OK' ]:
+      return result
+    if sandboxKey is not None:
+      sandboxCache[ sandboxKey ] = result[ 'Value' ]
+    return result
 
+  def __prepareJob( self, jdl, sandboxCache = None ):
+    """ Get the ClassAd of a job specified by its JDL or JDL file and upload its input sandbox
+    """
     if os.path.exists( jdl ):
       fic = open ( jdl, "r" )
       jdlString = fic.read()
@@ -116,9 +142,18 @@ class WMSClient( object ):
       return S_ERROR( 'Invalid job JDL' )
 
     # Check the size and the contents of the input sandbox
-    result = self.__uploadInputSandbox( classAdJob )
+    result = self.__uploadInputSandbox( classAdJob, sandboxCache )
+    if not result['OK']:
+      return result
+    return S_OK( classAdJob )
+
+  def submitJob( self, jdl ):
+    """ Submit one job specified by its JDL to WMS
+    """
+    result = self.__prepareJob( jdl )
     if not result['OK']:
       return result
+    classAdJob = result['Value']
 
     # Submit the job now and get the new job ID
     if not self.jobManager:
@@ -130,6 +165,50 @@ class WMSClient( object ):
       gLogger.warn( "Need to upload the proxy" )
     return result
 
+  def submitJobs( self, jdlList, bulkSize = 100 ):
+    """ Submit many jobs specified by their JDLs to WMS, bulkSize of them per call.
+        Input sandboxes with identical contents are uploaded only once.
+        The value is the list of the JobIDs in the same order as the JDLs: the
+        list of JobIDs for a parametric job and None for a job not submitted.
+        The reasons of the failures are in the 'Errors' dictionary, by position
+    """
+    sandboxCache = {}
+    jobIDs = [ None ] * len( jdlList )
+    errors = {}
+    requireProxyUpload = False
+    if not self.jobManager:
+      self.jobManager = RPCClient( 'WorkloadManagement/JobManager',
+                                    useCertificates = self.useCertificates,
+                                    timeout = self.timeout )
+    for iStart in range( 0, len( jdlList ), bulkSize ):
+      positions = []
+      jdls = []
+      for iPos in range( iStart, min( iStart + bulkSize, len( jdlList ) ) ):
+        result = self.__prepareJob( jdlList[ iPos ], sandboxCache )
+        if not result['OK']:
+          errors[ iPos ] = result['Message']
+          continue
+        positions.append( iPos )
+        jdls.append( result['Value'].asJDL() )
+      if not jdls:
+        continue
+      result = self.jobManager.submitJobs( jdls )
+      if not result['OK']:
+        for iPos in positions:
+          errors[ iPos ] = result['Message']
+        continue
+      for iJDL, jobID in enumerate( result['Value'] ):
+        jobIDs[ positions[ iJDL ] ] = jobID
+      for iJDL, message in result.get( 'Errors', {} ).items():
+        errors[ positions[ int( iJDL ) ] ] = message
+      requireProxyUpload = requireProxyUpload or result.get( 'requireProxyUpload', False )
+    if requireProxyUpload:
+      gLogger.warn( "Need to upload the proxy" )
+    result = S_OK( jobIDs )
+    result['Errors'] = errors
+    result['requireProxyUpload'] = requireProxyUpload
+    return result
+
   def killJob( self, jobID ):
     """ Kill running job.
         jobID can be an integer representing a single DIRAC job ID or a list of IDs
@@ -2,6 +2,8 @@
 """
 
 import os
+import shutil
+import tempfile
 import unittest
 import importlib
 
@@ -10,6 +12,7 @@ from mock import MagicMock
 from DIRAC import S_OK
 from DIRAC.WorkloadManagementSystem.Client.DownloadInputData import DownloadInputData
 from DIRAC.WorkloadManagementSystem.Client.Matcher import Matcher
+from DIRAC.WorkloadManagementSystem.Client.WMSClient import WMSClient
 
 class ClientsTestCase( unittest.TestCase ):
   """ Base class for the clients test cases
@@ -141,6 +144,81 @@ class MatcherTestCase( ClientsTestCase ):
 
     self.assertEqual( res, resExpected )
 
+  def test_selectJobs( self ):
+
+    self.matcher._getResourceDict = MagicMock( return_value = { 'Site' : 'DIRAC.Jenkins.ch',
+                                                                'PilotReference' : 'somePilotReference' } )
+    self.matcher.limiter = MagicMock()
+    self.matcher.limiter.getNegativeCondForSite.return_value = {}
+    self.tqDBMock.matchAndGetJobs.return_value = S_OK( { 'matchFound' : True, 'jobs' : [ ( 1, 10 ), ( 2, 10 ) ] } )
+    self.jobDBMock.getJobAttributes.return_value = S_OK( { 'OwnerDN' : 'dn', 'OwnerGroup' : 'group',
+                                                           'Status' : 'Waiting' } )
+    self.jobDBMock.getJobJDL.return_value = S_OK( '[]' )
+    self.jobDBMock.getJobOptParameters.return_value = S_OK( {} )
+
+    res = self.matcher.selectJobs( {}, {}, 2 )
+    self.assertEqual( [ jobDict['JobID'] for jobDict in res ], [ 1, 2 ] )
+    self.matcher.limiter.getNegativeCondForSite.assert_called_once_with( 'DIRAC.Jenkins.ch' )
+    self.assertEqual( self.pilotAgentsDBMock.setPilotStatus.call_count, 1 )
+    self.assertEqual( self.pilotAgentsDBMock.setJobForPilot.call_count, 2 )
+
+
+class WMSClientTestCase( ClientsTestCase ):
+
+  def test_submitJobs( self ):
+    tmpDir = tempfile.mkdtemp()
+    try:
+      sandboxFiles = []
+      for name, content in ( ( 'a', 'same' ), ( 'b', 'same' ), ( 'c', 'other' ) ):
+        os.mkdir( os.path.join( tmpDir, name ) )
+        sandboxFiles.append( os.path.join( tmpDir, name, 'jobDescription.xml' ) )
+        open( sandboxFiles[-1], 'w' ).write( content )
+      jobManager = MagicMock()
+      # The server accepts the first job of each call only
+      jobManager.submitJobs.side_effect = lambda jdls: { 'OK' : True, 'Value' : [ 11 ] + [ None ] * ( len( jdls ) - 1 ),
+                                                         'Errors' : dict( [ ( i, 'Rejected' ) for i in range( 1, len( jdls ) ) ] ) }
+      wmsClient = WMSClient( jobManagerClient = jobManager )
+      wmsClient.sandboxClient = MagicMock()
+      wmsClient.sandboxClient.uploadFilesAsSandbox.return_value = S_OK( 'SB:Store|/a/sandbox.tar.bz2' )
+
+      jdls = [ 'InputSandbox = {"%s"};' % sbFile for sbFile in sandboxFiles ] + [ '[' ]
+      res = wmsClient.submitJobs( jdls, bulkSize = 2 )
+      self.assertEqual( res['Value'], [ 11, None, 11, None ] )
+      self.assertEqual( sorted( res['Errors'] ), [ 1, 3 ] )
+      # The first two jobs have identical sandboxes
+      self.assertEqual( wmsClient.sandboxClient.uploadFilesAsSandbox.call_count, 2 )
+      self.assertEqual( jobManager.submitJobs.call_count, 2 )
+      self.assertEqual( len( jobManager.submitJobs.call_args[0][0] ), 1 )
+    finally:
+      shutil.rmtree( tmpDir )
+
+  def test_submitJobsSandboxKey( self ):
+    tmpDir = tempfile.mkdtemp()
+    try:
+      # Same file names and same concatenated contents, split differently between the files
+      jdls = []
+      for name, contents in ( ( 'a', ( 'ab', 'c' ) ), ( 'b', ( 'a', 'bc' ) ) ):
+        os.mkdir( os.path.join( tmpDir, name ) )
+        sandboxFiles = []
+        for fileName, content in zip( ( 'x.txt', 'y.txt' ), contents ):
+          sandboxFiles.append( os.path.join( tmpDir, name, fileName ) )
+          open( sandboxFiles[-1], 'w' ).write( content )
+        jdls.append( 'InputSandbox = {%s};' % ','.join( [ '"%s"' % sbFile for sbFile in sandboxFiles ] ) )
+      jobManager = MagicMock()
+      jobManager.submitJobs.side_effect = lambda jdls: { 'OK' : True, 'Value' : range( 1, len( jdls ) + 1 ) }
+      wmsClient = WMSClient( jobManagerClient = jobManager )
+      wmsClient.sandboxClient = MagicMock()
+      wmsClient.sandboxClient.uploadFilesAsSandbox.side_effect = [ S_OK( 'SB:Store|/a/sb1.tar.bz2' ),
+                                                                   S_OK( 'SB:Store|/a/sb2.tar.bz2' ) ]
+
+      res = wmsClient.submitJobs( jdls )
+      self.assertEqual( res['Value'], [ 1, 2 ] )
+      self.assertEqual( wmsClient.sandboxClient.uploadFilesAsSandbox.call_count, 2 )
+      submittedJDLs = jobManager.submitJobs.call_args[0][0]
+      self.assertTrue( 'sb1.tar.bz2' in submittedJDLs[0] )
+      self.assertTrue( 'sb2.tar.bz2' in submittedJDLs[1] )
+    finally:
+      shutil.rmtree( tmpDir )
 
 #############################################################################
 # Test Suite run
@@ -150,6 +228,7 @@ if __name__ == '__main__':
   suite = unittest.defaultTestLoader.loadTestsFromTestCase( ClientsTestCase )
   suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( MatcherTestCase ) )
   suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( DownloadInputDataSuccess ) )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( WMSClientTestCase ) )
   testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
 
 # EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#EOF#
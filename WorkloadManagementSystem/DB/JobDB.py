@@ -71,6 +71,11 @@ JOB_VARIABLE_ATTRIBUTES = [ 'Site', 'RescheduleTime', 'StartExecTime', 'EndExecT
 JOB_DYNAMIC_ATTRIBUTES = [ 'LastUpdateTime', 'HeartBeatTime',
                            'Status', 'MinorStatus', 'ApplicationStatus', 'ApplicationNumStatus', 'CPUTime']
 
+# New jobs written per statement and rows per statement for their parameters and input data,
+# to stay well below max_allowed_packet
+INSERT_CHUNK_JOBS = 100
+INSERT_CHUNK_ROWS = 1000
+
 #############################################################################
 class JobDB( DB ):
 
@@ -319,6 +324,37 @@ class JobDB( DB ):
 
         return S_OK( resultDict )
 
+#############################################################################
+  def getJobParametersBulk( self, jobIDList, paramList ):
+    """ Get the given Job Parameters of a list of jobs.
+        Returns a dictionary JobID -> { name : value }
+    """
+    if not jobIDList:
+      return S_OK( {} )
+
+    paramNameList = []
+    for x in paramList:
+      ret = self._escapeString( x )
+      if not ret['OK']:
+        return ret
+      paramNameList.append( ret['Value'] )
+    jobList = ','.join( [ str( int( jobID ) ) for jobID in jobIDList ] )
+    cmd = "SELECT JobID, Name, Value from JobParameters WHERE JobID in (%s) and Name in (%s)" % ( jobList,
+                                                                                              ','.join( paramNameList ) )
+    result = self._query( cmd )
+    if not result['OK']:
+      return S_ERROR( 'JobDB.getJobParametersBulk: failed to retrieve parameters' )
+
+    resultDict = {}
+    for jobID, name, value in result['Value']:
+      try:
+        value = value.tostring()
+      except Exception:
+        pass
+      resultDict.setdefault( int( jobID ), {} )[name] = value
+
+    return S_OK( resultDict )
+
 #############################################################################
   def getAtticJobParameters( self, jobID, paramList = None, rescheduleCounter = -1 ):
     """ Get Attic Job Parameters defined for a job with jobID.
@@ -601,6 +637,26 @@ class JobDB( DB ):
       return S_OK( [] )
     return S_OK( [ self._to_value( i ) for i in  res['Value'] ] )
 
+#############################################################################
+  def selectJobsWithoutUpdate( self, status, seconds ):
+    """ Select the jobs in the given status whose most recent of HeartBeatTime and
+        LastUpdateTime is older than the given number of seconds. Jobs with none
+        of them set are not selected
+    """
+    ret = self._escapeString( status )
+    if not ret['OK']:
+      return ret
+    e_status = ret['Value']
+
+    cmd = "SELECT JobID FROM Jobs WHERE Status=%s AND " % e_status
+    cmd += "GREATEST( COALESCE( HeartBeatTime, LastUpdateTime ), COALESCE( LastUpdateTime, HeartBeatTime ) ) < "
+    cmd += "DATE_SUB( UTC_TIMESTAMP(), INTERVAL %d SECOND )" % int( seconds )
+    result = self._query( cmd )
+    if not result['OK']:
+      return result
+
+    return S_OK( [ int( row[0] ) for row in result['Value'] ] )
+
 #############################################################################
   def setJobAttribute( self, jobID, attrName, attrValue, update = False, myDate = None ):
     """ Set an attribute value for job specified by jobID.
@@ -671,6 +727,65 @@ class JobDB( DB ):
     else:
       return S_ERROR( 'JobDB.setAttributes: failed to set attribute' )
 
+#############################################################################
+  def setJobAttributesBulk( self, jobIDList, attrNames, attrValues, update = False, expectedStatus = None ):
+    """ Set the same attribute values for all the jobs in jobIDList with one query.
+        The LastUpdate time stamp is refreshed if explicitely requested.
+        If expectedStatus is given only the jobs still in that status are changed
+        and the list of their IDs is returned
+    """
+    if not jobIDList:
+      if expectedStatus:
+        return S_OK( [] )
+      return S_OK()
+
+    if len( attrNames ) != len( attrValues ):
+      return S_ERROR( 'JobDB.setAttributesBulk: incompatible Argument length' )
+
+    attr = []
+    for i in range( len( attrNames ) ):
+      ret = self._escapeString( attrValues[i] )
+      if not ret['OK']:
+        return ret
+      attr.append( "%s=%s" % ( attrNames[i], ret['Value'] ) )
+    if update:
+      attr.append( "LastUpdateTime=UTC_TIMESTAMP()" )
+    if len( attr ) == 0:
+      return S_ERROR( 'JobDB.setAttributesBulk: Nothing to do' )
+
+    jobList = ','.join( [ str( int( jobID ) ) for jobID in jobIDList ] )
+    if not expectedStatus:
+      cmd = 'UPDATE Jobs SET %s WHERE JobID in (%s)' % ( ', '.join( attr ), jobList )
+      res = self._update( cmd )
+      if res['OK']:
+        return res
+      else:
+        return S_ERROR( 'JobDB.setAttributesBulk: failed to set attributes' )
+
+    ret = self._escapeString( expectedStatus )
+    if not ret['OK']:
+      return ret
+    statusCond = 'Status=%s' % ret['Value']
+    res = self.transactionStart()
+    if not res['OK']:
+      return S_ERROR( 'JobDB.setAttributesBulk: failed to set attributes' )
+    #Lock the jobs still in the expected status so that the ones returned are the ones changed
+    res = self._query( 'SELECT JobID FROM Jobs WHERE JobID in (%s) AND %s FOR UPDATE' % ( jobList, statusCond ) )
+    if res['OK']:
+      changed = [ int( row[0] ) for row in res['Value'] ]
+      if changed:
+        cmd = 'UPDATE Jobs SET %s WHERE JobID in (%s) AND %s' % ( ', '.join( attr ),
+                                                                 ','.join( [ str( jobID ) for jobID in changed ] ),
+                                                                 statusCond )
+        res = self._update( cmd )
+    if not res['OK']:
+      self.transactionRollback()
+      return S_ERROR( 'JobDB.setAttributesBulk: failed to set attributes' )
+    res = self.transactionCommit()
+    if not res['OK']:
+      return S_ERROR( 'JobDB.setAttributesBulk: failed to set attributes' )
+    return S_OK( changed )
+
 #############################################################################
   def setJobStatus( self, jobID, status = '', minor = '', application = '', appCounter = None ):
     """ Set status of the job specified by its jobID
@@ -985,12 +1100,63 @@ class JobDB( DB ):
     else:
       return result
 
+#############################################################################
+  def getJobJDLsBulk( self, jobIDList, original = False ):
+    """ Get the JDLs of a list of jobs as a dictionary JobID -> JDL. By default
+        the current job JDLs are returned, the original ones if 'original' is True
+    """
+    if not jobIDList:
+      return S_OK( {} )
+
+    jdlField = 'JDL'
+    if original:
+      jdlField = 'OriginalJDL'
+    jobList = ','.join( [ str( int( jobID ) ) for jobID in jobIDList ] )
+    cmd = "SELECT JobID, %s FROM JobJDLs WHERE JobID in (%s)" % ( jdlField, jobList )
+    result = self._query( cmd )
+    if not result['OK']:
+      return result
+
+    return S_OK( dict( [ ( int( jobID ), jdl ) for jobID, jdl in result['Value'] ] ) )
+
 #############################################################################
   def insertNewJobIntoDB( self, jdl, owner, ownerDN, ownerGroup, diracSetup ):
     """ Insert the initial JDL into the Job database,
         Do initial JDL crosscheck,
         Set Initial job Attributes and Status
     """
+    result = self.insertNewJobsIntoDB( [ jdl ], owner, ownerDN, ownerGroup, diracSetup )
+    if not result['OK']:
+      return result
+    return result['Value'][0]
+
+  def insertNewJobsIntoDB( self, jdlList, owner, ownerDN, ownerGroup, diracSetup ):
+    """ Insert several jobs of the same owner. Each job gets its JobID on its own,
+        the JDLs, attributes, parameters and input data of the jobs are then
+        written with one statement per table and chunk of jobs.
+        The value is the list of the results of each job as returned by insertNewJobIntoDB
+    """
+    results = []
+    newJobs = []
+    for jdl in jdlList:
+      result = self.__prepareNewJob( jdl, owner, ownerDN, ownerGroup, diracSetup )
+      if result['OK'] and 'NewJob' in result:
+        newJobs.append( result.pop( 'NewJob' ) )
+      results.append( result )
+    if newJobs:
+      failed = self.__insertNewJobs( newJobs )
+      if failed:
+        for iPos in range( len( results ) ):
+          jobID = results[iPos].get( 'JobID' )
+          if results[iPos]['OK'] and jobID in failed:
+            results[iPos] = S_ERROR( 'Can not insert job in to DB: %s' % failed[jobID] )
+            results[iPos]['JobID'] = jobID
+    return S_OK( results )
+
+  def __prepareNewJob( self, jdl, owner, ownerDN, ownerGroup, diracSetup ):
+    """ Check the JDL of a new job, get its JobID and prepare its rows. These are
+        returned in the 'NewJob' key of the result
+    """
     jobManifest = JobManifest()
     result = jobManifest.load( jdl )
     if not result['OK']:
@@ -1042,6 +1208,9 @@ class JobDB( DB ):
     classAdReq = ClassAd( '[]' )
     retVal = S_OK( jobID )
     retVal['JobID'] = jobID
+    # JobID, attribute names and values, JDL, parameters, input data
+    newJob = { 'JobID' : jobID, 'AttrNames' : jobAttrNames, 'AttrValues' : jobAttrValues,
+               'JDL' : '', 'Parameters' : [], 'InputData' : [] }
     if not classAdJob.isOK():
       jobAttrNames.append( 'Status' )
       jobAttrValues.append( 'Failed' )
@@ -1049,12 +1218,9 @@ class JobDB( DB ):
       jobAttrNames.append( 'MinorStatus' )
       jobAttrValues.append( 'Error in JDL syntax' )
 
-      result = self.insertFields( 'Jobs', jobAttrNames, jobAttrValues )
-      if not result['OK']:
-        return result
-
       retVal['Status'] = 'Failed'
       retVal['MinorStatus'] = 'Error in JDL syntax'
+      retVal['NewJob'] = newJob
       return retVal
 
     classAdJob.insertAttributeInt( 'JobID', jobID )
@@ -1101,53 +1267,104 @@ class JobDB( DB ):
     # Replace the JobID placeholder if any
     if jobJDL.find( '%j' ) != -1:
       jobJDL = jobJDL.replace( '%j', str( jobID ) )
-
-    result = self.setJobJDL( jobID, jobJDL )
-    if not result['OK']:
-      return result
-
-    # Adding the job in the Jobs table
-    result = self.insertFields( 'Jobs', jobAttrNames, jobAttrValues )
-    if not result['OK']:
-      return result
+    newJob['JDL'] = jobJDL
 
     # Setting the Job parameters
-    result = self.__setInitialJobParameters( classAdJob, jobID )
-    if not result['OK']:
-      return result
+    if classAdJob.lookupAttribute( "Parameters" ):
+      newJob['Parameters'] = classAdJob.getDictionaryFromSubJDL( "Parameters" ).items()
 
     # Looking for the Input Data
-    inputData = []
     if classAdJob.lookupAttribute( 'InputData' ):
-      inputData = classAdJob.getListFromExpression( 'InputData' )
-    values = []
+      # some jobs are setting empty string as InputData
+      newJob['InputData'] = [ lfn.strip() for lfn in classAdJob.getListFromExpression( 'InputData' ) if lfn ]
 
-    ret = self._escapeString( jobID )
-    if not ret['OK']:
-      return ret
-    e_jobID = ret['Value']
+    retVal['Status'] = 'Received'
+    retVal['MinorStatus'] = 'Job accepted'
+    retVal['NewJob'] = newJob
 
-    for lfn in inputData:
-      # some jobs are setting empty string as InputData
-      if not lfn:
+    return retVal
+
+  def __insertNewJobs( self, newJobs ):
+    """ Write the rows prepared for new jobs in chunks of INSERT_CHUNK_JOBS jobs. The jobs
+        of a chunk that can not be written are removed. Returns a dictionary JobID -> error
+        with the jobs that were not inserted
+    """
+    failed = {}
+    for iPos in range( 0, len( newJobs ), INSERT_CHUNK_JOBS ):
+      chunk = newJobs[ iPos : iPos + INSERT_CHUNK_JOBS ]
+      result = self.__insertNewJobsChunk( chunk )
+      if result['OK']:
         continue
-      ret = self._escapeString( lfn.strip() )
+      jobIDs = [ newJob['JobID'] for newJob in chunk ]
+      self.log.error( 'Failed to insert %s new jobs' % len( jobIDs ), result['Message'] )
+      # Don't leave the jobs half written
+      ret = self.removeJobFromDB( jobIDs )
+      if not ret['OK']:
+        self.log.error( 'Failed to remove the jobs not inserted', '%s: %s' % ( jobIDs, ret['Message'] ) )
+      for jobID in jobIDs:
+        failed[jobID] = result['Message']
+    return failed
+
+  def __insertNewJobsChunk( self, newJobs ):
+    """ Write the rows prepared for new jobs with one statement per table, or per
+        INSERT_CHUNK_ROWS rows for the parameters and input data
+    """
+    jdlCases = []
+    jdlJobIDs = []
+    # Jobs rows grouped by their columns, the jobs failing the JDL check have less of them
+    jobsRows = {}
+    parameterRows = []
+    inputDataRows = []
+    for newJob in newJobs:
+      jobID = int( newJob['JobID'] )
+      if newJob['JDL']:
+        ret = self._escapeString( newJob['JDL'] )
+        if not ret['OK']:
+          return ret
+        jdlCases.append( 'WHEN %d THEN %s' % ( jobID, ret['Value'] ) )
+        jdlJobIDs.append( str( jobID ) )
+      ret = self._escapeValues( newJob['AttrValues'] )
       if not ret['OK']:
         return ret
-      lfn = ret['Value']
+      jobsRows.setdefault( tuple( newJob['AttrNames'] ), [] ).append( '(%s)' % ', '.join( ret['Value'] ) )
+      for name, value in newJob['Parameters']:
+        ret = self._escapeValues( [ name, value ] )
+        if not ret['OK']:
+          return ret
+        parameterRows.append( '(%d, %s)' % ( jobID, ', '.join( ret['Value'] ) ) )
+      for lfn in newJob['InputData']:
+        ret = self._escapeString( lfn )
+        if not ret['OK']:
+          return ret
+        inputDataRows.append( '(%d, %s)' % ( jobID, ret['Value'] ) )
 
-      values.append( '(%s, %s )' % ( e_jobID, lfn ) )
+    if jdlCases:
+      cmd = 'UPDATE JobJDLs SET JDL = CASE JobID %s END WHERE JobID IN (%s)' % ( ' '.join( jdlCases ),
+                                                                                ', '.join( jdlJobIDs ) )
+      result = self._update( cmd )
+      if not result['OK']:
+        return result
 
-    if values:
-      cmd = 'INSERT INTO InputData (JobID,LFN) VALUES %s' % ', '.join( values )
+    for attrNames, rows in jobsRows.items():
+      cmd = 'INSERT INTO Jobs (%s) VALUES %s' % ( ', '.join( attrNames ), ', '.join( rows ) )
       result = self._update( cmd )
       if not result['OK']:
         return result
 
-    retVal['Status'] = 'Received'
-    retVal['MinorStatus'] = 'Job accepted'
+    for iPos in range( 0, len( parameterRows ), INSERT_CHUNK_ROWS ):
+      cmd = 'REPLACE JobParameters (JobID,Name,Value) VALUES %s' % \
+            ', '.join( parameterRows[ iPos : iPos + INSERT_CHUNK_ROWS ] )
+      result = self._update( cmd )
+      if not result['OK']:
+        return S_ERROR( 'JobDB.setJobParameters: operation failed.' )
 
-    return retVal
+    for iPos in range( 0, len( inputDataRows ), INSERT_CHUNK_ROWS ):
+      cmd = 'INSERT INTO InputData (JobID,LFN) VALUES %s' % ', '.join( inputDataRows[ iPos : iPos + INSERT_CHUNK_ROWS ] )
+      result = self._update( cmd )
+      if not result['OK']:
+        return result
+
+    return S_OK()
 
   def __checkAndPrepareJob( self, jobID, classAdJob, classAdReq, owner, ownerDN,
                             ownerGroup, diracSetup, jobAttrNames, jobAttrValues ):
@@ -1891,6 +2108,86 @@ class JobDB( DB ):
     else:
       return S_ERROR( 'Failed to store some or all the parameters' )
 
+#####################################################################################
+  def setHeartBeatDataBulk( self, heartBeats ):
+    """ Add the heart beat data of many jobs to the database at once. heartBeats is a
+        dictionary JobID -> ( staticDataDict, [ ( dynamicDataDict, heartBeatTime ), ... ], lastHeartBeatTime ).
+        The HeartBeatTime of the jobs is set to the time their last heart beat was received,
+        the jobs that reached a final state in between are not put back to Running.
+        If the heart beat times were written, a failure has in 'FailedData' the data that
+        was not written: 'Static' for the job parameters, 'Dynamic' for the heart beat log
+    """
+    if not heartBeats:
+      return S_OK()
+
+    jobIDs = []
+    timeCases = []
+    # Static data items are stored as job parameters
+    paramValueList = []
+    logValueList = []
+    for jobID, ( staticDataDict, dynamicDataList, heartBeatTime ) in heartBeats.items():
+      jobID = int( jobID )
+      result = self._escapeString( Time.toString( heartBeatTime ) )
+      if not result['OK']:
+        return result
+      jobIDs.append( str( jobID ) )
+      timeCases.append( 'WHEN %s THEN %s' % ( jobID, result['Value'] ) )
+      for key, value in staticDataDict.items():
+        result = self._escapeString( key )
+        if not result['OK']:
+          return result
+        e_key = result['Value']
+        result = self._escapeString( value )
+        if not result['OK']:
+          return result
+        paramValueList.append( '(%s,%s,%s)' % ( jobID, e_key, result['Value'] ) )
+      # Dynamic data goes to the job heart beat log with the time it was received
+      for dynamicDataDict, dynamicTime in dynamicDataList:
+        result = self._escapeString( Time.toString( dynamicTime ) )
+        if not result['OK']:
+          return result
+        e_time = result['Value']
+        for key, value in dynamicDataDict.items():
+          result = self._escapeString( key )
+          if not result['OK']:
+            self.log.warn( 'Failed to escape string ' + key )
+            continue
+          e_key = result['Value']
+          result = self._escapeString( value )
+          if not result['OK']:
+            self.log.warn( 'Failed to escape string ' + value )
+            continue
+          logValueList.append( "( %s, %s,%s,%s)" % ( jobID, e_key, result['Value'], e_time ) )
+
+    finalStates = ','.join( [ "'%s'" % status for status in ( 'Done', 'Completed', 'Failed', 'Killed', 'Deleted' ) ] )
+    req = "UPDATE Jobs SET HeartBeatTime = CASE JobID %s END, " % ' '.join( timeCases )
+    req += "Status = IF( Status IN (%s), Status, 'Running' ) WHERE JobID IN (%s)" % ( finalStates, ','.join( jobIDs ) )
+    result = self._update( req )
+    if not result['OK']:
+      return S_ERROR( 'Failed to set the heart beat time: ' + result['Message'] )
+
+    failedData = []
+    if paramValueList:
+      req = 'REPLACE JobParameters (JobID,Name,Value) VALUES %s' % ', '.join( paramValueList )
+      result = self._update( req )
+      if not result['OK']:
+        failedData.append( 'Static' )
+        self.log.warn( result['Message'] )
+
+    if logValueList:
+      req = "INSERT INTO HeartBeatLoggingInfo (JobID,Name,Value,HeartBeatTime) VALUES "
+      req += ','.join( logValueList )
+      result = self._update( req )
+      if not result['OK']:
+        failedData.append( 'Dynamic' )
+        self.log.warn( result['Message'] )
+
+    if not failedData:
+      return S_OK()
+    result = S_ERROR( 'Failed to store some or all the parameters' )
+    result['FailedData'] = failedData
+    return result
+
 #####################################################################################
   def getHeartBeatData( self, jobID ):
     """ Retrieve the job's heart beat data
@@ -1915,6 +2212,31 @@ class JobDB( DB ):
 
     return S_OK( result )
 
+#####################################################################################
+  def getHeartBeatDataBulk( self, jobIDList ):
+    """ Retrieve the heart beat data of a list of jobs as a dictionary
+        JobID -> [ ( name, value, heartBeatTime ), ... ]
+    """
+    if not jobIDList:
+      return S_OK( {} )
+
+    jobList = ','.join( [ str( int( jobID ) ) for jobID in jobIDList ] )
+    cmd = 'SELECT JobID,Name,Value,HeartBeatTime from HeartBeatLoggingInfo WHERE JobID in (%s)' % jobList
+    res = self._query( cmd )
+    if not res['OK']:
+      return res
+
+    resultDict = {}
+    for jobID, name, value, heartBeatTime in res['Value']:
+      try:
+        value = '%.01f' % ( float( value.replace( '"', '' ) ) )
+      except ValueError:
+        self.log.warn( 'Wrong heart beat value for job %s: %s=%s' % ( jobID, name, value ) )
+        continue
+      resultDict.setdefault( int( jobID ), [] ).append( ( str( name ), value, str( heartBeatTime ) ) )
+
+    return S_OK( resultDict )
+
 #####################################################################################
   def setJobCommand( self, jobID, command, arguments = None ):
     """ Store a command to be passed to the job together with the
@@ -1971,6 +2293,27 @@ class JobDB( DB ):
 
     return S_OK( resultDict )
 
+#####################################################################################
+  def getJobCommandsBulk( self, status = 'Received' ):
+    """ Get the commands in a given status of all the jobs as a dictionary
+        JobID -> { command : arguments }
+    """
+    ret = self._escapeString( status )
+    if not ret['OK']:
+      return ret
+    status = ret['Value']
+
+    req = "SELECT JobID, Command, Arguments FROM JobCommands WHERE Status=%s" % status
+    result = self._query( req )
+    if not result['OK']:
+      return result
+
+    resultDict = {}
+    for jobID, command, arguments in result['Value']:
+      resultDict.setdefault( int( jobID ), {} )[command] = arguments
+
+    return S_OK( resultDict )
+
 #####################################################################################
   def setJobCommandStatus( self, jobID, command, status ):
     """ Set the command status
@@ -2,7 +2,9 @@
     The following methods are provided
 
     addLoggingRecord()
+    addLoggingRecordsBulk()
     getJobLoggingInfo()
+    getJobLoggingInfoBulk()
     getWMSTimeStamps()
 """
 
@@ -83,6 +85,54 @@ class JobLoggingDB( DB ):
 
     return self._update( cmd )
 
+#############################################################################
+  def addLoggingRecordsBulk( self, recordList, source = 'Unknown' ):
+    """ Add the records of many jobs with one query. recordList is a list of
+        ( jobID, status, minor, application ) tuples, all of them get the
+        current UTC time as time stamp
+    """
+    if not recordList:
+      return S_OK()
+
+    self.gLogger.info( "Adding %d logging records from %s" % ( len( recordList ), source ) )
+    _date = Time.dateTime()
+    epoc = time.mktime( _date.timetuple() ) + _date.microsecond / 1000000. - MAGIC_EPOC_NUMBER
+    time_order = round( epoc, 3 )
+
+    valueList = []
+    for jobID, status, minor, application in recordList:
+      escapedValues = []
+      for value in ( status, minor, application, str( _date ), source ):
+        result = self._escapeString( value )
+        if not result['OK']:
+          return result
+        escapedValues.append( result['Value'] )
+      valueList.append( "(%d,%s,%s,%s,%s,%f,%s)" % tuple( [ int( jobID ) ] + escapedValues[:4] +
+                                                       [ time_order, escapedValues[4] ] ) )
+
+    cmd = "INSERT INTO LoggingInfo (JobId, Status, MinorStatus, ApplicationStatus, " + \
+          "StatusTime, StatusTimeOrder, StatusSource) VALUES %s" % ','.join( valueList )
+
+    return self._update( cmd )
+
+#############################################################################
+  def __getLoggingRecords( self, rows ):
+    """ Resolve the 'idem' values of the logging rows of a job, sorted in historical order
+    """
+    return_value = []
+    status, minor, app = rows[0][:3]
+    if app == "idem":
+      app = "Unknown"
+    for row in rows:
+      if row[0] != "idem":
+        status = row[0];
+      if row[1] != "idem":
+        minor = row[1];
+      if row[2] != "idem":
+        app = row[2];
+      return_value.append( ( status, minor, app, str( row[3] ), row[4] ) )
+    return return_value
+
 #############################################################################
   def getJobLoggingInfo( self, jobID ):
     """ Returns a Status,MinorStatus,ApplicationStatus,StatusTime,StatusSource tuple
@@ -98,20 +148,30 @@ class JobLoggingDB( DB ):
     if result['OK'] and not result['Value']:
       return S_ERROR( 'No Logging information for job %d' % int( jobID ) )
 
-    return_value = []
-    status, minor, app = result['Value'][0][:3]
-    if app == "idem":
-      app = "Unknown"
+    return S_OK( self.__getLoggingRecords( result['Value'] ) )
+
+#############################################################################
+  def getJobLoggingInfoBulk( self, jobIDList ):
+    """ Returns a dictionary JobID -> list of Status,MinorStatus,ApplicationStatus,
+        StatusTime,StatusSource tuples in historical order for the jobs in jobIDList.
+        Jobs without logging information are not in the dictionary
+    """
+    if not jobIDList:
+      return S_OK( {} )
+
+    jobList = ','.join( [ str( int( jobID ) ) for jobID in jobIDList ] )
+    cmd = 'SELECT JobId,Status,MinorStatus,ApplicationStatus,StatusTime,StatusSource FROM' \
+          ' LoggingInfo WHERE JobId IN (%s) ORDER BY JobId,StatusTimeOrder,StatusTime' % jobList
+
+    result = self._query( cmd )
+    if not result['OK']:
+      return result
+
+    jobRows = {}
     for row in result['Value']:
-      if row[0] != "idem":
-        status = row[0];
-      if row[1] != "idem":
-        minor = row[1];
-      if row[2] != "idem":
-        app = row[2];
-      return_value.append( ( status, minor, app, str( row[3] ), row[4] ) )
+      jobRows.setdefault( int( row[0] ), [] ).append( row[1:] )
 
-    return S_OK( return_value )
+    return S_OK( dict( [ ( jobID, self.__getLoggingRecords( rows ) ) for jobID, rows in jobRows.items() ] ) )
 
 #############################################################################
   def deleteJob( self, jobID ):
@@ -521,6 +521,26 @@ class PilotAgentsDB( DB ):
     else:
       return S_ERROR( 'PilotID for job %d not found' % jobID )
 
+##########################################################################################
+  def getPilotStatusForJobs( self, jobIDList ):
+    """ Get the status of the last pilot that started each of the jobs in jobIDList
+        as a dictionary JobID -> status. The status is None if the pilot is not in
+        the PilotAgents table any more. Jobs never started by a pilot are not in the dictionary
+    """
+    if not jobIDList:
+      return S_OK( {} )
+
+    jobList = ','.join( [ str( int( jobID ) ) for jobID in jobIDList ] )
+    req = "SELECT m.JobID, p.Status FROM JobToPilotMapping m LEFT JOIN PilotAgents p ON m.PilotID = p.PilotID"
+    req += " WHERE m.JobID IN (%s) ORDER BY m.StartTime, m.PilotID" % jobList
+    result = self._query( req )
+    if not result['OK']:
+      return result
+
+    # The latest mapping of each job is the last one, the pilot submitted last
+    # if several of them started the job within the same second
+    return S_OK( dict( [ ( int( jobID ), status ) for jobID, status in result['Value'] ] ) )
+
 ##########################################################################################
   def getPilotCurrentJob( self, pilotRef ):
     """ The the job ID currently executed by the pilot
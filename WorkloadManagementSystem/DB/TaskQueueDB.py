@@ -491,12 +491,17 @@ class TaskQueueDB( DB ):
     return S_OK( { 'found' : True, 'tqId' : data[0][1], 'enabled' : data[0][2], 'jobs' : data[0][0] } )
 
 
-  def matchAndGetJob( self, tqMatchDict, numJobsPerTry = 50, numQueuesPerTry = 10, negativeCond = {} ):
+  def matchAndGetJob( self, tqMatchDict, numJobsPerTry = 50, numQueuesPerTry = 10, negativeCond = {},
+                     matchIndex = None ):
     """
-    Match a job
+    Match a job. If a TaskQueueMatchIndex is given the matching task queues
+    are resolved in memory and the DB is only used to extract the job
     """
     #Make a copy to avoid modification of original if escaping needs to be done
     tqMatchDict = dict( tqMatchDict )
+    rawMatchDict = dict( tqMatchDict )
+    if matchIndex and not matchIndex.isLoaded():
+      matchIndex = None
     self.log.info( "Starting match for requirements", self.__strDict( tqMatchDict ) )
     retVal = self._checkMatchDefinition( tqMatchDict )
     if not retVal[ 'OK' ]:
@@ -517,6 +522,10 @@ class TaskQueueDB( DB ):
                                             skipMatchDictDef = True,
                                             connObj = connObj )
         preJobSQL = "%s AND `tq_Jobs`.JobId = %s " % ( preJobSQL, tqMatchDict['JobID'] )
+      elif matchIndex:
+        retVal = matchIndex.matchTaskQueues( rawMatchDict,
+                                             numQueuesToGet = numQueuesPerTry,
+                                             negativeCond = negativeCond )
       else:
         retVal = self.matchAndGetTaskQueue( tqMatchDict,
                                             numQueuesToGet = numQueuesPerTry,
@@ -530,11 +539,13 @@ class TaskQueueDB( DB ):
         self.log.info( "No TQ matches requirements" )
         return S_OK( { 'matchFound' : False, 'tqMatch' : tqMatchDict } )
       for tqId, tqOwnerDN, tqOwnerGroup in tqList:
-        self.log.info( "Trying to extract jobs from TQ %s" % tqId )
+        self.log.info( "Trying to extract jobs from TQ %s", tqId )
         retVal = self._query( prioSQL % tqId, conn = connObj )
         if not retVal[ 'OK' ]:
           return S_ERROR( "Can't retrieve winning priority for matching job: %s" % retVal[ 'Message' ] )
         if len( retVal[ 'Value' ] ) == 0:
+          if matchIndex:
+            matchIndex.discardTaskQueue( tqId )
           continue
         prio = retVal[ 'Value' ][0][0]
         retVal = self._query( "%s %s" % ( preJobSQL % ( tqId, prio ), postJobSQL ), conn = connObj )
@@ -546,7 +557,7 @@ class TaskQueueDB( DB ):
           self.__deleteTQWithDelay.add( tqId, 300, ( tqId, tqOwnerDN, tqOwnerGroup ) )
         while len( jobTQList ) > 0:
           jobId, tqId = jobTQList.pop( random.randint( 0, len( jobTQList ) - 1 ) )
-          self.log.info( "Trying to extract job %s from TQ %s" % ( jobId, tqId ) )
+          self.log.info( "Trying to extract job %s from TQ %s", jobId, tqId )
           retVal = self.deleteJob( jobId, connObj = connObj )
           if not retVal[ 'OK' ]:
             msgFix = "Could not take job"
@@ -554,12 +565,107 @@ class TaskQueueDB( DB ):
             self.log.error( msgFix, msgVar )
             return S_ERROR( msgFix + msgVar )
           if retVal[ 'Value' ] == True :
-            self.log.info( "Extracted job %s with prio %s from TQ %s" % ( jobId, prio, tqId ) )
+            self.log.info( "Extracted job %s with prio %s from TQ %s", jobId, prio, tqId )
             return S_OK( { 'matchFound' : True, 'jobId' : jobId, 'taskQueueId' : tqId, 'tqMatch' : tqMatchDict } )
-        self.log.info( "No jobs could be extracted from TQ %s" % tqId )
+        self.log.info( "No jobs could be extracted from TQ %s", tqId )
     self.log.info( "Could not find a match after %s match retries" % self.__maxMatchRetry )
     return S_ERROR( "Could not find a match after %s match retries" % self.__maxMatchRetry )
 
+  def matchAndGetJobs( self, tqMatchDict, numJobs, numQueuesPerTry = 10, negativeCond = {}, matchIndex = None ):
+    """
+    Match up to numJobs jobs for the same resource. The jobs of each matching TQ
+    are taken out in one transaction
+      Returns S_OK( { 'matchFound' : bool, 'jobs' : [ ( jobId, tqId ) ], 'tqMatch' : dict } )
+    """
+    if 'JobID' in tqMatchDict or numJobs <= 1:
+      result = self.matchAndGetJob( tqMatchDict, negativeCond = negativeCond, matchIndex = matchIndex )
+      if not result[ 'OK' ]:
+        return result
+      match = result[ 'Value' ]
+      if match[ 'matchFound' ]:
+        match[ 'jobs' ] = [ ( match[ 'jobId' ], match[ 'taskQueueId' ] ) ]
+      else:
+        match[ 'jobs' ] = []
+      return S_OK( match )
+    #Make a copy to avoid modification of original if escaping needs to be done
+    tqMatchDict = dict( tqMatchDict )
+    rawMatchDict = dict( tqMatchDict )
+    if matchIndex and not matchIndex.isLoaded():
+      matchIndex = None
+    if self.log.isEnabledFor( 'INFO' ):
+      self.log.info( "Starting match of %s jobs for requirements %s", numJobs, self.__strDict( tqMatchDict ) )
+    retVal = self._checkMatchDefinition( tqMatchDict )
+    if not retVal[ 'OK' ]:
+      self.log.error( "TQ match request check failed", retVal[ 'Message' ] )
+      return retVal
+    jobSQL = "SELECT `tq_Jobs`.JobId FROM `tq_Jobs` WHERE `tq_Jobs`.TQId = %s ORDER BY RAND() / `tq_Jobs`.RealPriority ASC LIMIT %s"
+    jobs = []
+    for _ in range( self.__maxMatchRetry ):
+      if matchIndex:
+        retVal = matchIndex.matchTaskQueues( rawMatchDict,
+                                             numQueuesToGet = numQueuesPerTry,
+                                             negativeCond = negativeCond )
+      else:
+        retVal = self.matchAndGetTaskQueue( tqMatchDict,
+                                            numQueuesToGet = numQueuesPerTry,
+                                            skipMatchDictDef = True,
+                                            negativeCond = negativeCond )
+      if not retVal[ 'OK' ]:
+        return retVal
+      tqList = retVal[ 'Value' ]
+      if len( tqList ) == 0:
+        break
+      for tqId, tqOwnerDN, tqOwnerGroup in tqList:
+        self.log.info( "Trying to extract %s jobs from TQ %s", numJobs - len( jobs ), tqId )
+        retVal = self._query( jobSQL % ( tqId, numJobs - len( jobs ) ) )
+        if not retVal[ 'OK' ]:
+          return S_ERROR( "Can't retrieve jobs to match: %s" % retVal[ 'Message' ] )
+        jobIDs = [ row[0] for row in retVal[ 'Value' ] ]
+        if not jobIDs:
+          self.log.info( "Task queue %s seems to be empty, triggering a cleaning", tqId )
+          if matchIndex:
+            matchIndex.discardTaskQueue( tqId )
+          self.__deleteTQWithDelay.add( tqId, 300, ( tqId, tqOwnerDN, tqOwnerGroup ) )
+          continue
+        retVal = self.__extractJobs( jobIDs )
+        if not retVal[ 'OK' ]:
+          return retVal
+        extracted = retVal[ 'Value' ]
+        if extracted:
+          self.log.info( "Extracted jobs %s from TQ %s", extracted, tqId )
+          jobs.extend( [ ( jobId, tqId ) for jobId in extracted ] )
+          self.__deleteTQWithDelay.add( tqId, 300, ( tqId, tqOwnerDN, tqOwnerGroup ) )
+        if len( jobs ) >= numJobs:
+          break
+      if len( jobs ) >= numJobs:
+        break
+    if not jobs:
+      self.log.info( "No TQ matches requirements" )
+    return S_OK( { 'matchFound' : len( jobs ) > 0, 'jobs' : jobs, 'tqMatch' : tqMatchDict } )
+
+  def __extractJobs( self, jobIDs ):
+    """
+    Take out a list of jobs from the task queues in one transaction
+    Return S_OK( list of jobs that were extracted ) / S_ERROR
+    """
+    jobList = ", ".join( [ str( jobId ) for jobId in jobIDs ] )
+    result = self.transactionStart()
+    if not result[ 'OK' ]:
+      return S_ERROR( "Can't begin transaction for matching jobs: %s" % result[ 'Message' ] )
+    #Lock the jobs that are still there, a concurrent deleteJob has to wait for the commit
+    result = self._query( "SELECT JobId FROM `tq_Jobs` WHERE JobId in ( %s ) FOR UPDATE" % jobList )
+    if result[ 'OK' ]:
+      extracted = [ row[0] for row in result[ 'Value' ] ]
+      if extracted:
+        result = self._update( "DELETE FROM `tq_Jobs` WHERE JobId in ( %s )" % ", ".join( [ str( jobId ) for jobId in extracted ] ) )
+    if not result[ 'OK' ]:
+      self.transactionRollback()
+      return S_ERROR( "Could not take jobs out from the TQs: %s" % result[ 'Message' ] )
+    result = self.transactionCommit()
+    if not result[ 'OK' ]:
+      return S_ERROR( "Could not commit matched jobs: %s" % result[ 'Message' ] )
+    return S_OK( extracted )
+
   def matchAndGetTaskQueue( self, tqMatchDict, numQueuesToGet = 1, skipMatchDictDef = False,
                             negativeCond = {}, connObj = False ):
     """ Get a queue that matches the requirements
@@ -692,12 +798,15 @@ class TaskQueueDB( DB ):
           # condition
         sqlMultiCondList.append( "( SELECT COUNT(%s.Value) FROM %s WHERE %s.TQId = tq.TQId ) = 0" % ( fullTableN, fullTableN, fullTableN ) )
         if field in tagMatchFields:
+          #A resource providing Any tag matches whatever the TQ tags are
           if tqMatchDict[field] != '"Any"':
             csql = self.__generateTagSQLSubCond( fullTableN, tqMatchDict[field] )
+            sqlMultiCondList.append( csql )
+            sqlCondList.append( "( %s )" % " OR ".join( sqlMultiCondList ) )
         else:
           csql = self.__generateSQLSubCond( "%%s IN ( SELECT %s.Value FROM %s WHERE %s.TQId = tq.TQId )" % ( fullTableN, fullTableN, fullTableN ), tqMatchDict[ field ] )
-        sqlMultiCondList.append( csql )
-        sqlCondList.append( "( %s )" % " OR ".join( sqlMultiCondList ) )
+          sqlMultiCondList.append( csql )
+          sqlCondList.append( "( %s )" % " OR ".join( sqlMultiCondList ) )
         #In case of Site, check it's not in job banned sites
         if field in bannedJobMatchFields:
           fullTableN = '`tq_TQToBanned%ss`' % field
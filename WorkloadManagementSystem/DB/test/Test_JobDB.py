@@ -0,0 +1,186 @@
+""" Test for the statements built by the JobDB bulk methods
+"""
+
+import re
+import sqlite3
+import unittest
+
+from mock import MagicMock, patch
+
+from DIRAC import S_OK, S_ERROR
+from DIRAC.WorkloadManagementSystem.DB import JobDB as JobDBModule
+from DIRAC.WorkloadManagementSystem.DB.JobDB import JobDB
+
+class FakeJobDB( JobDB ):
+  """ JobDB recording the statements instead of running them. Statements containing
+      any of the failOn strings fail, queries return the given rows
+  """
+  def __init__( self, failOn = None, rows = () ):
+    self.log = MagicMock()
+    self.failOn = failOn or []
+    self.rows = rows
+    self.statements = []
+
+  def _MySQL__escapeString( self, value ):
+    return S_OK( '"%s"' % str( value ).replace( '"', '\\"' ) )
+
+  def _update( self, cmd, conn = None ):
+    self.statements.append( cmd )
+    for failure in self.failOn:
+      if failure in cmd:
+        return S_ERROR( "Got a packet bigger than 'max_allowed_packet' bytes" )
+    return S_OK()
+
+  def _query( self, cmd, conn = None ):
+    self.statements.append( cmd )
+    return S_OK( self.rows )
+
+  def transactionStart( self ):
+    self.statements.append( 'START TRANSACTION' )
+    return S_OK()
+
+  def transactionCommit( self ):
+    self.statements.append( 'COMMIT' )
+    return S_OK()
+
+  def transactionRollback( self ):
+    self.statements.append( 'ROLLBACK' )
+    return S_OK()
+
+  def getStatements( self, prefix ):
+    return [ cmd for cmd in self.statements if cmd.startswith( prefix ) ]
+
+def newJob( jobID, numInputData = 0 ):
+  return { 'JobID' : jobID, 'AttrNames' : [ 'JobID', 'Status' ], 'AttrValues' : [ jobID, 'Received' ],
+           'JDL' : '[ JobID = %s; ]' % jobID, 'Parameters' : [ ( 'Name', 'job%s' % jobID ) ],
+           'InputData' : [ '/vo/%s/%s' % ( jobID, i ) for i in range( numInputData ) ] }
+
+class InsertNewJobsTestCase( unittest.TestCase ):
+  """ Writing the rows of many new jobs
+  """
+  def setUp( self ):
+    self.chunkPatch = patch.multiple( JobDBModule, INSERT_CHUNK_JOBS = 3, INSERT_CHUNK_ROWS = 4 )
+    self.chunkPatch.start()
+
+  def tearDown( self ):
+    self.chunkPatch.stop()
+
+  def test_chunks( self ):
+    jobDB = FakeJobDB()
+    failed = jobDB._JobDB__insertNewJobs( [ newJob( jobID ) for jobID in range( 1, 8 ) ] + [ newJob( 8, 6 ) ] )
+    self.assertEqual( failed, {} )
+    self.assertEqual( len( jobDB.getStatements( 'UPDATE JobJDLs' ) ), 3 )
+    inserts = jobDB.getStatements( 'INSERT INTO Jobs' )
+    self.assertEqual( len( inserts ), 3 )
+    self.assertEqual( inserts[0], 'INSERT INTO Jobs (JobID, Status) VALUES '
+                                  '("1", "Received"), ("2", "Received"), ("3", "Received")' )
+    self.assertEqual( len( jobDB.getStatements( 'REPLACE JobParameters' ) ), 3 )
+    #The input data of the last chunk takes two statements
+    inputData = jobDB.getStatements( 'INSERT INTO InputData' )
+    self.assertEqual( len( inputData ), 2 )
+    self.assertEqual( inputData[1], 'INSERT INTO InputData (JobID,LFN) VALUES (8, "/vo/8/4"), (8, "/vo/8/5")' )
+
+  def test_failedChunk( self ):
+    jobDB = FakeJobDB( failOn = [ '"4", "Received"' ] )
+    failed = jobDB._JobDB__insertNewJobs( [ newJob( jobID ) for jobID in range( 1, 8 ) ] )
+    self.assertEqual( sorted( failed ), [ 4, 5, 6 ] )
+    #The jobs of the failed chunk are removed, their JobJDLs rows included
+    removals = jobDB.getStatements( 'DELETE FROM' )
+    self.assertTrue( 'DELETE FROM JobJDLs WHERE JobID in (4,5,6)' in removals )
+    self.assertTrue( 'DELETE FROM Jobs WHERE JobID in (4,5,6)' in removals )
+    #The next chunk is still written
+    self.assertEqual( len( jobDB.getStatements( 'INSERT INTO Jobs' ) ), 3 )
+
+class BulkMethodsTestCase( unittest.TestCase ):
+  """ Reading and updating many jobs with one statement
+  """
+  def test_selectJobsWithoutUpdate( self ):
+    jobDB = FakeJobDB( rows = ( ( 1L, ), ( 3L, ) ) )
+    result = jobDB.selectJobsWithoutUpdate( 'Running', 3600 )
+    self.assertEqual( result, S_OK( [ 1, 3 ] ) )
+    self.assertEqual( jobDB.statements, [ 'SELECT JobID FROM Jobs WHERE Status="Running" AND '
+                                          'GREATEST( COALESCE( HeartBeatTime, LastUpdateTime ), '
+                                          'COALESCE( LastUpdateTime, HeartBeatTime ) ) < '
+                                          'DATE_SUB( UTC_TIMESTAMP(), INTERVAL 3600 SECOND )' ] )
+
+  def test_lastUpdateWithNulls( self ):
+    """ The most recent time of a job is taken from whichever of the two times is set
+    """
+    jobDB = FakeJobDB()
+    jobDB.selectJobsWithoutUpdate( 'Running', 3600 )
+    lastUpdate = re.search( r'AND (GREATEST\(.*\)) <', jobDB.statements[0] ).group( 1 )
+    #Evaluated with the MySQL semantics of GREATEST: NULL as soon as one argument is NULL
+    connection = sqlite3.connect( ':memory:' )
+    connection.create_function( 'GREATEST', 2, lambda a, b: None if a is None or b is None else max( a, b ) )
+    connection.execute( 'CREATE TABLE Jobs ( JobID INTEGER, HeartBeatTime TEXT, LastUpdateTime TEXT )' )
+    connection.executemany( 'INSERT INTO Jobs VALUES (?,?,?)', [ ( 1, '2026-01-02', '2026-01-01' ),
+                                                                 ( 2, '2026-01-01', '2026-01-03' ),
+                                                                 ( 3, None, '2026-01-04' ),
+                                                                 ( 4, '2026-01-05', None ),
+                                                                 ( 5, None, None ) ] )
+    rows = connection.execute( 'SELECT JobID, %s FROM Jobs ORDER BY JobID' % lastUpdate ).fetchall()
+    self.assertEqual( rows, [ ( 1, '2026-01-02' ), ( 2, '2026-01-03' ), ( 3, '2026-01-04' ),
+                              ( 4, '2026-01-05' ), ( 5, None ) ] )
+
+  def test_setJobAttributesBulk( self ):
+    jobDB = FakeJobDB()
+    self.assertTrue( jobDB.setJobAttributesBulk( [], [ 'Status' ], [ 'Stalled' ] )[ 'OK' ] )
+    self.assertEqual( jobDB.statements, [] )
+    self.assertFalse( jobDB.setJobAttributesBulk( [ 1 ], [ 'Status' ], [] )[ 'OK' ] )
+    result = jobDB.setJobAttributesBulk( [ 1, '2' ], [ 'Status', 'MinorStatus' ], [ 'Failed', 'Stalled' ],
+                                         update = True )
+    self.assertTrue( result[ 'OK' ] )
+    self.assertEqual( jobDB.statements, [ 'UPDATE Jobs SET Status="Failed", MinorStatus="Stalled", '
+                                          'LastUpdateTime=UTC_TIMESTAMP() WHERE JobID in (1,2)' ] )
+    self.assertFalse( FakeJobDB( failOn = [ 'UPDATE' ] ).setJobAttributesBulk( [ 1 ], [ 'Status' ],
+                                                                               [ 'Failed' ] )[ 'OK' ] )
+
+  def test_setJobAttributesBulkExpectedStatus( self ):
+    #Job 2 is not Running any more
+    jobDB = FakeJobDB( rows = ( ( 1L, ), ( 3L, ) ) )
+    result = jobDB.setJobAttributesBulk( [ 1, 2, 3 ], [ 'Status' ], [ 'Stalled' ], expectedStatus = 'Running' )
+    self.assertEqual( result, S_OK( [ 1, 3 ] ) )
+    self.assertEqual( jobDB.statements, [ 'START TRANSACTION',
+                                          'SELECT JobID FROM Jobs WHERE JobID in (1,2,3) AND Status="Running" FOR UPDATE',
+                                          'UPDATE Jobs SET Status="Stalled" WHERE JobID in (1,3) AND Status="Running"',
+                                          'COMMIT' ] )
+    jobDB = FakeJobDB()
+    self.assertEqual( jobDB.setJobAttributesBulk( [ 1 ], [ 'Status' ], [ 'Stalled' ], expectedStatus = 'Running' ),
+                      S_OK( [] ) )
+    self.assertEqual( jobDB.getStatements( 'UPDATE' ), [] )
+    jobDB = FakeJobDB( failOn = [ 'UPDATE' ], rows = ( ( 1L, ), ) )
+    self.assertFalse( jobDB.setJobAttributesBulk( [ 1 ], [ 'Status' ], [ 'Stalled' ], expectedStatus = 'Running' )[ 'OK' ] )
+    self.assertEqual( jobDB.statements[-1], 'ROLLBACK' )
+
+  def test_getJobParametersBulk( self ):
+    value = MagicMock()
+    value.tostring.return_value = 'blob'
+    jobDB = FakeJobDB( rows = ( ( 1L, 'CPU', '10' ), ( 1L, 'Mem', value ), ( 2L, 'CPU', '20' ) ) )
+    result = jobDB.getJobParametersBulk( [ 1, 2, 3 ], [ 'CPU', 'Mem' ] )
+    self.assertEqual( result, S_OK( { 1 : { 'CPU' : '10', 'Mem' : 'blob' }, 2 : { 'CPU' : '20' } } ) )
+    self.assertEqual( jobDB.statements, [ 'SELECT JobID, Name, Value from JobParameters '
+                                          'WHERE JobID in (1,2,3) and Name in ("CPU","Mem")' ] )
+
+  def test_getJobJDLsBulk( self ):
+    jobDB = FakeJobDB( rows = ( ( 1L, '[ A = 1; ]' ), ) )
+    self.assertEqual( jobDB.getJobJDLsBulk( [ 1, 2 ] ), S_OK( { 1 : '[ A = 1; ]' } ) )
+    jobDB.getJobJDLsBulk( [ 1 ], original = True )
+    self.assertEqual( jobDB.statements, [ 'SELECT JobID, JDL FROM JobJDLs WHERE JobID in (1,2)',
+                                          'SELECT JobID, OriginalJDL FROM JobJDLs WHERE JobID in (1)' ] )
+    self.assertEqual( jobDB.getJobJDLsBulk( [] ), S_OK( {} ) )
+    self.assertEqual( len( jobDB.statements ), 2 )
+
+  def test_getHeartBeatDataBulk( self ):
+    jobDB = FakeJobDB( rows = ( ( 1L, 'CPUConsumed', '"12.34"', '2026-01-01 00:00:00' ),
+                                ( 1L, 'MemoryUsed', 'bad', '2026-01-01 00:00:00' ),
+                                ( 2L, 'CPUConsumed', '5', '2026-01-01 00:01:00' ) ) )
+    result = jobDB.getHeartBeatDataBulk( [ 1, 2 ] )
+    self.assertEqual( result, S_OK( { 1 : [ ( 'CPUConsumed', '12.3', '2026-01-01 00:00:00' ) ],
+                                      2 : [ ( 'CPUConsumed', '5.0', '2026-01-01 00:01:00' ) ] } ) )
+    self.assertEqual( jobDB.statements, [ 'SELECT JobID,Name,Value,HeartBeatTime from HeartBeatLoggingInfo '
+                                          'WHERE JobID in (1,2)' ] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( InsertNewJobsTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( BulkMethodsTestCase ) )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
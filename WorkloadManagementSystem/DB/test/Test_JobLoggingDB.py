@@ -0,0 +1,88 @@
+""" Test for the statements built by the JobLoggingDB bulk methods
+"""
+
+import datetime
+import re
+import unittest
+
+from mock import MagicMock, patch
+
+from DIRAC import S_OK
+from DIRAC.Core.Utilities import Time
+from DIRAC.WorkloadManagementSystem.DB.JobLoggingDB import JobLoggingDB
+
+class FakeJobLoggingDB( JobLoggingDB ):
+  """ JobLoggingDB recording the statements instead of running them, queries return the given rows
+  """
+  def __init__( self, rows = () ):
+    self.log = MagicMock()
+    self.gLogger = MagicMock()
+    self.rows = rows
+    self.statements = []
+
+  def _MySQL__escapeString( self, value ):
+    return S_OK( '"%s"' % str( value ).replace( '"', '\\"' ) )
+
+  def _update( self, cmd, conn = None ):
+    self.statements.append( cmd )
+    return S_OK()
+
+  def _query( self, cmd, conn = None ):
+    self.statements.append( cmd )
+    return S_OK( self.rows )
+
+class BulkMethodsTestCase( unittest.TestCase ):
+  """ Logging records of many jobs with one statement
+  """
+  def test_addLoggingRecordsBulk( self ):
+    loggingDB = FakeJobLoggingDB()
+    self.assertTrue( loggingDB.addLoggingRecordsBulk( [] )[ 'OK' ] )
+    self.assertEqual( loggingDB.statements, [] )
+    dateTime = datetime.datetime( 2026, 1, 1, 12, 0, 0 )
+    dateTimePatch = patch.object( Time, 'dateTime', return_value = dateTime )
+    dateTimePatch.start()
+    try:
+      result = loggingDB.addLoggingRecordsBulk( [ ( 1, 'Failed', 'Stalling for more than 7200 sec', 'idem' ),
+                                                  ( '2', 'Stalled', 'Job stalled', 'a "quoted" status' ) ],
+                                                source = 'StalledJobAgent' )
+    finally:
+      dateTimePatch.stop()
+    self.assertTrue( result[ 'OK' ] )
+    self.assertEqual( len( loggingDB.statements ), 1 )
+    statement = loggingDB.statements[0]
+    prefix = 'INSERT INTO LoggingInfo (JobId, Status, MinorStatus, ApplicationStatus, ' \
+             'StatusTime, StatusTimeOrder, StatusSource) VALUES '
+    self.assertTrue( statement.startswith( prefix ) )
+    rows = re.findall( r'\((\d+),"(.*?)","(.*?)","(.*?)","(.*?)",([\d.]+),"(.*?)"\)', statement[ len( prefix ): ] )
+    self.assertEqual( [ row[:5] + row[6:] for row in rows ],
+                      [ ( '1', 'Failed', 'Stalling for more than 7200 sec', 'idem', '2026-01-01 12:00:00',
+                          'StalledJobAgent' ),
+                        ( '2', 'Stalled', 'Job stalled', 'a \\"quoted\\" status', '2026-01-01 12:00:00',
+                          'StalledJobAgent' ) ] )
+    #All the records get the same time order
+    self.assertEqual( rows[0][5], rows[1][5] )
+
+  def test_getJobLoggingInfoBulk( self ):
+    loggingDB = FakeJobLoggingDB( rows = ( ( 1L, 'Received', 'Job accepted', 'idem', '2026-01-01 00:00:00', 'JobManager' ),
+                                           ( 1L, 'idem', 'Matched', 'idem', '2026-01-01 00:01:00', 'Matcher' ),
+                                           ( 1L, 'Running', 'idem', 'Started', '2026-01-01 00:02:00', 'JobWrapper' ),
+                                           ( 2L, 'Waiting', 'Pilot Agent Submission', 'Done', '2026-01-01 00:03:00',
+                                             'TaskQueue' ) ) )
+    result = loggingDB.getJobLoggingInfoBulk( [ 1, 2, 3 ] )
+    self.assertEqual( loggingDB.statements, [ 'SELECT JobId,Status,MinorStatus,ApplicationStatus,StatusTime,'
+                                              'StatusSource FROM LoggingInfo WHERE JobId IN (1,2,3) '
+                                              'ORDER BY JobId,StatusTimeOrder,StatusTime' ] )
+    #The idem values are resolved job by job and jobs without records are left out
+    self.assertEqual( result, S_OK( { 1 : [ ( 'Received', 'Job accepted', 'Unknown', '2026-01-01 00:00:00',
+                                              'JobManager' ),
+                                            ( 'Received', 'Matched', 'Unknown', '2026-01-01 00:01:00', 'Matcher' ),
+                                            ( 'Running', 'Matched', 'Started', '2026-01-01 00:02:00',
+                                              'JobWrapper' ) ],
+                                      2 : [ ( 'Waiting', 'Pilot Agent Submission', 'Done', '2026-01-01 00:03:00',
+                                              'TaskQueue' ) ] } ) )
+    self.assertEqual( loggingDB.getJobLoggingInfoBulk( [] ), S_OK( {} ) )
+    self.assertEqual( len( loggingDB.statements ), 1 )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( BulkMethodsTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
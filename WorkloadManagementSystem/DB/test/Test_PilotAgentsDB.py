@@ -0,0 +1,44 @@
+""" Test for the statements built by the PilotAgentsDB bulk methods
+"""
+
+import unittest
+
+from DIRAC import S_OK, S_ERROR
+from DIRAC.WorkloadManagementSystem.DB.PilotAgentsDB import PilotAgentsDB
+
+class FakePilotAgentsDB( PilotAgentsDB ):
+  """ PilotAgentsDB recording the queries instead of running them, they return the given result
+  """
+  def __init__( self, result ):
+    self.result = result
+    self.statements = []
+
+  def _query( self, cmd, conn = None ):
+    self.statements.append( cmd )
+    return self.result
+
+class PilotStatusForJobsTestCase( unittest.TestCase ):
+  """ Status of the pilots that started a list of jobs
+  """
+  def test_latestMapping( self ):
+    #Rows in the order of the query: the last mapping of a job is the latest one
+    pilotDB = FakePilotAgentsDB( S_OK( ( ( 1L, 'Done' ), ( 2L, 'Running' ), ( 1L, 'Running' ), ( 3L, None ) ) ) )
+    result = pilotDB.getPilotStatusForJobs( [ 1, '2', 3, 4 ] )
+    self.assertEqual( pilotDB.statements, [ 'SELECT m.JobID, p.Status FROM JobToPilotMapping m '
+                                            'LEFT JOIN PilotAgents p ON m.PilotID = p.PilotID '
+                                            'WHERE m.JobID IN (1,2,3,4) ORDER BY m.StartTime, m.PilotID' ] )
+    #Pilots not in PilotAgents any more give None, jobs never started are left out
+    self.assertEqual( result, S_OK( { 1 : 'Running', 2 : 'Running', 3 : None } ) )
+
+  def test_noJobs( self ):
+    pilotDB = FakePilotAgentsDB( S_OK( () ) )
+    self.assertEqual( pilotDB.getPilotStatusForJobs( [] ), S_OK( {} ) )
+    self.assertEqual( pilotDB.statements, [] )
+
+  def test_failedQuery( self ):
+    pilotDB = FakePilotAgentsDB( S_ERROR( 'Lost connection' ) )
+    self.assertFalse( pilotDB.getPilotStatusForJobs( [ 1 ] )[ 'OK' ] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( PilotStatusForJobsTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
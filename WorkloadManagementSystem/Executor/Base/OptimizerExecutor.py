@@ -43,7 +43,8 @@ class OptimizerExecutor( ExecutorModule ):
     if opName.find( "Agent" ) == len( opName ) - 5:
       opName = opName[ :-5]
     cls.__optimizerName = opName
-    maxTasks = cls.ex_getOption( 'Tasks', 1 )
+    #Job states the optimizer gets in each message from the mind
+    cls.ex_setOption( 'MaxTasks', cls.ex_getOption( 'Tasks', 1 ) )
     cls.__jobData = threading.local()
 
     cls.__jobData.jobState = None
@@ -4,6 +4,7 @@
     The following methods are available in the Service interface
 
     submitJob()
+    submitJobs()
     rescheduleJob()
     deleteJob()
     killJob()
@@ -33,6 +34,7 @@ gJobLoggingDB = False
 gtaskQueueDB = False
 
 MAX_PARAMETRIC_JOBS = 20
+MAX_BULK_JOBS = 1000
 
 def initializeJobManagerHandler( serviceInfo ):
 
@@ -68,6 +70,7 @@ class JobManagerHandler( RequestHandler ):
     self.peerUsesLimitedProxy = credDict[ 'isLimitedProxy' ]
     self.diracSetup = self.serviceInfoDict['clientSetup']
     self.maxParametricJobs = self.srv_getCSOption( 'MaxParametricJobs', MAX_PARAMETRIC_JOBS )
+    self.maxBulkJobs = self.srv_getCSOption( 'MaxBulkJobs', MAX_BULK_JOBS )
     self.jobPolicy = JobPolicy( self.ownerDN, self.ownerGroup, self.userProperties )
     self.jobPolicy.setJobDB( gJobDB )
     return S_OK()
@@ -88,11 +91,7 @@ class JobManagerHandler( RequestHandler ):
     self.log.info( "Optimize msg sent for %s jobs" % len( jids ) )
 
   ###########################################################################
-  types_submitJob = [ StringType ]
-  def export_submitJob( self, jobDesc ):
-    """ Submit a single job to DIRAC WMS
-    """
-
+  def __checkSubmissionRights( self ):
     if self.peerUsesLimitedProxy:
       return S_ERROR( "Can't submit using a limited proxy! (bad boy!)" )
 
@@ -103,7 +102,12 @@ class JobManagerHandler( RequestHandler ):
     policyDict = result['Value']
     if not policyDict[ RIGHT_SUBMIT ]:
       return S_ERROR( 'Job submission not authorized' )
+    return S_OK()
 
+  def __getJobDescList( self, jobDesc ):
+    """ Get the JDLs of the jobs described by jobDesc. There is more than one if the job
+        is a parametric one, in which case the 'Parametric' key of the result is True
+    """
     #jobDesc is JDL for now
     jobDesc = jobDesc.strip()
     if jobDesc[0] != "[":
@@ -164,8 +168,10 @@ class JobManagerHandler( RequestHandler ):
       jobDescList = []
       nParam = len( parameterList ) - 1
       for n, p in enumerate( parameterList ):
-        newJobDesc = jobDesc.replace( '%s', str( p ) ).replace( '%n', str( n ).zfill( len( str( nParam ) ) ) )
-        newClassAd = ClassAd( newJobDesc )
+        # Substitute in the parsed attributes rather than parsing each expanded JDL again
+        newClassAd = ClassAd( '[]' )
+        for name, value in jobClassAd.contents.items():
+          newClassAd.contents[name] = value.replace( '%s', str( p ) ).replace( '%n', str( n ).zfill( len( str( nParam ) ) ) )
         for attr in ['Parameters', 'ParameterStep', 'ParameterFactor']:
           newClassAd.deleteAttribute( attr )
         if type( p ) == type ( ' ' ) and p.startswith( '{' ):
@@ -178,6 +184,31 @@ class JobManagerHandler( RequestHandler ):
     else:
       jobDescList = [ jobDesc ]
 
+    result = S_OK( jobDescList )
+    result['Parametric'] = parametricJob
+    return result
+
+  def __setProxyPersistency( self ):
+    #Set persistency flag
+    retVal = gProxyManager.getUserPersistence( self.ownerDN, self.ownerGroup )
+    if 'Value' not in retVal or not retVal[ 'Value' ]:
+      gProxyManager.setPersistency( self.ownerDN, self.ownerGroup, True )
+
+  ###########################################################################
+  types_submitJob = [ StringType ]
+  def export_submitJob( self, jobDesc ):
+    """ Submit a single job to DIRAC WMS
+    """
+    result = self.__checkSubmissionRights()
+    if not result['OK']:
+      return result
+
+    result = self.__getJobDescList( jobDesc )
+    if not result['OK']:
+      return result
+    parametricJob = result['Parametric']
+    jobDescList = result['Value']
+
     jobIDList = []
     for jobDescription in jobDescList:
       result = gJobDB.insertNewJobIntoDB( jobDescription, self.owner, self.ownerDN, self.ownerGroup, self.diracSetup )
@@ -191,10 +222,7 @@ class JobManagerHandler( RequestHandler ):
 
       jobIDList.append( jobID )
 
-    #Set persistency flag
-    retVal = gProxyManager.getUserPersistence( self.ownerDN, self.ownerGroup )
-    if 'Value' not in retVal or not retVal[ 'Value' ]:
-      gProxyManager.setPersistency( self.ownerDN, self.ownerGroup, True )
+    self.__setProxyPersistency()
 
     if parametricJob:
       result = S_OK( jobIDList )
@@ -206,6 +234,84 @@ class JobManagerHandler( RequestHandler ):
     self.__sendJobsToOptimizationMind( [ jobID ] )
     return result
 
+  ###########################################################################
+  types_submitJobs = [ ListType ]
+  def export_submitJobs( self, jobDescs ):
+    """ Submit many jobs to DIRAC WMS at once. The value is the list of the
+        results for each job description, in the same order: the JobID, the
+        list of JobIDs of a parametric job or None if the job was not accepted.
+        The reasons of the failures are in the 'Errors' dictionary, by position.
+        A parametric job is accepted as a whole or not at all. The job descriptions
+        beyond MaxBulkJobs jobs, counting the parametric jobs, are not accepted
+    """
+    result = self.__checkSubmissionRights()
+    if not result['OK']:
+      return result
+    if len( jobDescs ) > self.maxBulkJobs:
+      return S_ERROR( 'The number of jobs exceeded the limit of %d' % self.maxBulkJobs )
+
+    errors = {}
+    # Position of the job description of every JDL to insert
+    positions = []
+    allJobDescs = []
+    parametric = {}
+    for iPos, jobDesc in enumerate( jobDescs ):
+      if type( jobDesc ) != StringType:
+        errors[ iPos ] = 'Job description is not a string'
+        continue
+      result = self.__getJobDescList( jobDesc )
+      if not result['OK']:
+        errors[ iPos ] = result['Message']
+        continue
+      # The limit is on the number of jobs written, after the parametric expansion
+      if len( allJobDescs ) + len( result['Value'] ) > self.maxBulkJobs:
+        errors[ iPos ] = 'The number of jobs exceeded the limit of %d' % self.maxBulkJobs
+        continue
+      parametric[ iPos ] = result['Parametric']
+      allJobDescs.extend( result['Value'] )
+      positions.extend( [ iPos ] * len( result['Value'] ) )
+
+    jobIDs = [ None ] * len( jobDescs )
+    newJobIDs = []
+    if allJobDescs:
+      result = gJobDB.insertNewJobsIntoDB( allJobDescs, self.owner, self.ownerDN, self.ownerGroup, self.diracSetup )
+      if not result['OK']:
+        return result
+      # Results of the jobs of each job description
+      jobResults = {}
+      for iPos, jobResult in zip( positions, result['Value'] ):
+        jobResults.setdefault( iPos, [] ).append( jobResult )
+      for iPos, posResults in jobResults.items():
+        failedResults = [ jobResult for jobResult in posResults if not jobResult['OK'] ]
+        if failedResults:
+          errors[ iPos ] = failedResults[0]['Message']
+          # Don't leave a parametric job partly submitted
+          createdIDs = [ jobResult['JobID'] for jobResult in posResults if jobResult['OK'] ]
+          if createdIDs:
+            ret = gJobDB.removeJobFromDB( createdIDs )
+            if not ret['OK']:
+              gLogger.error( 'Failed to remove the jobs of a failed parametric job', '%s: %s' % ( createdIDs, ret['Message'] ) )
+          continue
+        for jobResult in posResults:
+          gJobLoggingDB.addLoggingRecord( jobResult['JobID'], jobResult['Status'], jobResult['MinorStatus'],
+                                          source = 'JobManager' )
+        posJobIDs = [ jobResult['JobID'] for jobResult in posResults ]
+        newJobIDs.extend( posJobIDs )
+        if parametric[ iPos ]:
+          jobIDs[ iPos ] = posJobIDs
+        else:
+          jobIDs[ iPos ] = posJobIDs[0]
+      gLogger.info( '%s jobs added to the JobDB for %s/%s' % ( len( newJobIDs ), self.ownerDN, self.ownerGroup ) )
+
+    if newJobIDs:
+      self.__setProxyPersistency()
+      self.__sendJobsToOptimizationMind( newJobIDs )
+
+    result = S_OK( jobIDs )
+    result['Errors'] = errors
+    result[ 'requireProxyUpload' ] = bool( newJobIDs ) and self.__checkIfProxyUploadIsRequired()
+    return result
+
 ###########################################################################
   def __checkIfProxyUploadIsRequired( self ):
     result = gProxyManager.userHasProxy( self.ownerDN, self.ownerGroup, validSeconds = 18000 )
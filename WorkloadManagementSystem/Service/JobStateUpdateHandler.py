@@ -16,14 +16,17 @@ __RCSID__ = "$Id$"
 from types import StringType, IntType, LongType, ListType, DictType
 # from types import *
 import time
-from DIRAC.Core.DISET.RequestHandler import RequestHandler
+from DIRAC.Core.DISET.RequestHandler import RequestHandler, getServiceOption
+from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
 from DIRAC import gLogger, S_OK, S_ERROR
 from DIRAC.WorkloadManagementSystem.DB.JobDB import JobDB
 from DIRAC.WorkloadManagementSystem.DB.JobLoggingDB import JobLoggingDB
+from DIRAC.WorkloadManagementSystem.private.HeartBeatBuffer import HeartBeatBuffer
 
 # This is a global instance of the JobDB class
 jobDB = False
 logDB = False
+heartBeatBuffer = None
 
 JOB_FINAL_STATES = ['Done', 'Completed', 'Failed']
 
@@ -31,10 +34,30 @@ def initializeJobStateUpdateHandler( serviceInfo ):
 
   global jobDB
   global logDB
+  global heartBeatBuffer
   jobDB = JobDB()
   logDB = JobLoggingDB()
+
+  # Acknowledge the heart beats at once and write them to the DB periodically
+  if getServiceOption( serviceInfo, "UseHeartBeatBuffer", False ):
+    heartBeatBuffer = HeartBeatBuffer( jobDB )
+    refreshJobCommands()
+    gThreadScheduler.addPeriodicTask( getServiceOption( serviceInfo, "HeartBeatFlushPeriod", 30 ),
+                                      flushHeartBeats )
+    gThreadScheduler.addPeriodicTask( getServiceOption( serviceInfo, "JobCommandsRefreshPeriod", 60 ),
+                                      refreshJobCommands )
   return S_OK()
 
+def flushHeartBeats():
+  result = heartBeatBuffer.flush()
+  if not result['OK']:
+    gLogger.error( "Cannot flush the heart beats", result['Message'] )
+
+def refreshJobCommands():
+  result = heartBeatBuffer.refreshCommands()
+  if not result['OK']:
+    gLogger.error( "Cannot refresh the job commands", result['Message'] )
+
 class JobStateUpdateHandler( RequestHandler ):
 
   ###########################################################################
@@ -316,6 +339,10 @@ class JobStateUpdateHandler( RequestHandler ):
     """ Send a heart beat sign of life for a job jobID
     """
 
+    if heartBeatBuffer:
+      heartBeatBuffer.add( int( jobID ), staticData, dynamicData )
+      return S_OK( heartBeatBuffer.getJobCommands( int( jobID ) ) )
+
     result = jobDB.setHeartBeatData( int( jobID ), staticData, dynamicData )
     if not result['OK']:
       gLogger.warn( 'Failed to set the heart beat data for job %d ' % int( jobID ) )
@@ -5,12 +5,12 @@
 
 __RCSID__ = "$Id$"
 
-from types import StringType, DictType, StringTypes
+from types import StringType, DictType, StringTypes, IntType, LongType
 
 from DIRAC                                             import gLogger, S_OK, S_ERROR
 
 from DIRAC.Core.Utilities.ThreadScheduler              import gThreadScheduler
-from DIRAC.Core.DISET.RequestHandler                   import RequestHandler
+from DIRAC.Core.DISET.RequestHandler                   import RequestHandler, getServiceOption
 
 from DIRAC.FrameworkSystem.Client.MonitoringClient     import gMonitor
 
@@ -18,9 +18,11 @@ from DIRAC.WorkloadManagementSystem.DB.JobDB           import JobDB
 from DIRAC.WorkloadManagementSystem.DB.TaskQueueDB     import TaskQueueDB
 from DIRAC.WorkloadManagementSystem.Client.Matcher     import Matcher
 from DIRAC.WorkloadManagementSystem.Client.Limiter     import Limiter
+from DIRAC.WorkloadManagementSystem.private.TaskQueueMatchIndex import TaskQueueMatchIndex
 
 gJobDB = False
 gTaskQueueDB = False
+gTQMatchIndex = None
 
 def initializeMatcherHandler( serviceInfo ):
   """  Matcher Service initialization
@@ -28,6 +30,7 @@ def initializeMatcherHandler( serviceInfo ):
 
   global gJobDB
   global gTaskQueueDB
+  global gTQMatchIndex
 
   gJobDB = JobDB()
   gTaskQueueDB = TaskQueueDB()
@@ -41,14 +44,28 @@ def initializeMatcherHandler( serviceInfo ):
   gMonitor.registerActivity( 'numTQs', "Number of Task Queues",
                              'Matching', "tqsk queues" , gMonitor.OP_MEAN, 300 )
 
-  gTaskQueueDB.recalculateTQSharesForAll()
-  gThreadScheduler.addPeriodicTask( 120, gTaskQueueDB.recalculateTQSharesForAll )
-  gThreadScheduler.addPeriodicTask( 60, sendNumTaskQueues )
+  #Shares and the number of task queues are the same for all the clone processes
+  if serviceInfo.get( 'cloneId', 0 ) == 0:
+    gTaskQueueDB.recalculateTQSharesForAll()
+    gThreadScheduler.addPeriodicTask( 120, gTaskQueueDB.recalculateTQSharesForAll )
+    gThreadScheduler.addPeriodicTask( 60, sendNumTaskQueues )
 
-  sendNumTaskQueues()
+    sendNumTaskQueues()
+
+  #Resolve the matching task queues in memory
+  if getServiceOption( serviceInfo, "UseTaskQueueIndex", False ):
+    gTQMatchIndex = TaskQueueMatchIndex( gTaskQueueDB )
+    refreshTaskQueueIndex()
+    gThreadScheduler.addPeriodicTask( getServiceOption( serviceInfo, "TaskQueueIndexRefreshPeriod", 5 ),
+                                      refreshTaskQueueIndex )
 
   return S_OK()
 
+def refreshTaskQueueIndex():
+  result = gTQMatchIndex.refresh()
+  if not result[ 'OK' ]:
+    gLogger.error( "Cannot refresh the task queue index", result[ 'Message' ] )
+
 def sendNumTaskQueues():
   result = gTaskQueueDB.getNumTaskQueues()
   if result[ 'OK' ]:
@@ -59,7 +76,7 @@ def sendNumTaskQueues():
 class MatcherHandler( RequestHandler ):
 
   def initialize( self ):
-    self.matcher = Matcher( jobDB = gJobDB, tqDB = gTaskQueueDB )
+    self.matcher = Matcher( jobDB = gJobDB, tqDB = gTaskQueueDB, tqMatchIndex = gTQMatchIndex )
     self.limiter = Limiter()
 
 ##############################################################################
@@ -81,6 +98,26 @@ class MatcherHandler( RequestHandler ):
     gMonitor.addMark( "matchesOK" )
     return S_OK( result )
 
+##############################################################################
+  types_requestJobs = [ [StringType, DictType], [IntType, LongType] ]
+  def export_requestJobs( self, resourceDescription, numJobs ):
+    """ Serve up to numJobs jobs at once to a resource with several slots.
+        Returns the list of matched jobs
+    """
+
+    resourceDescription['Setup'] = self.serviceInfoDict['clientSetup']
+    credDict = self.getRemoteCredentials()
+    numJobs = max( 1, min( numJobs, self.srv_getCSOption( "MaxJobsPerRequest", 20 ) ) )
+
+    try:
+      result = self.matcher.selectJobs( resourceDescription, credDict, numJobs )
+    except RuntimeError, rte:
+      self.log.error( "Error requesting jobs: ", rte )
+      return S_ERROR( "Error requesting jobs" )
+    gMonitor.addMark( "matchesDone" )
+    gMonitor.addMark( "matchesOK", len( result ) )
+    return S_OK( result )
+
 ##############################################################################
   types_getActiveTaskQueues = []
   def export_getActiveTaskQueues( self ):
@@ -54,7 +54,7 @@ class SandboxStoreHandler( RequestHandler ):
     SandboxStoreHandler.__purgeCount += 1
     if SandboxStoreHandler.__purgeCount > self.getCSOption( "QueriesBeforePurge", 1000 ):
       SandboxStoreHandler.__purgeCount = 0
-    if SandboxStoreHandler.__purgeCount == 0:
+    if SandboxStoreHandler.__purgeCount == 0 and self.srv_getCloneId() == 0:
       threading.Thread( target = self.purgeUnusedSandboxes ).start()
 
   def __getSandboxPath( self, md5 ):
@@ -0,0 +1,172 @@
+""" Write behind buffer for the job heart beats received by the JobStateUpdate service.
+
+    Heart beats are acknowledged as soon as they are received and coalesced per
+    job in memory. They are periodically flushed to the JobDB with a few multi row
+    statements. The commands pending for the jobs are served out of a cache that
+    is refreshed in bulk, so a heart beat does not hit the DB at all unless a
+    command has to be delivered.
+"""
+
+__RCSID__ = "$Id$"
+
+import threading
+
+from DIRAC import gLogger, S_OK, S_ERROR, Time
+
+class HeartBeatBuffer( object ):
+
+  def __init__( self, jobDB, flushSize = 1000, maxRetries = 5 ):
+    self.__jobDB = jobDB
+    self.__flushSize = flushSize
+    self.__maxRetries = maxRetries
+    self.log = gLogger.getSubLogger( "HeartBeatBuffer" )
+    self.__lock = threading.Lock()
+    self.__flushLock = threading.Lock()
+    #JobID -> [ staticDataDict, [ ( dynamicDataDict, heartBeatTime ), ... ], lastHeartBeatTime ]
+    self.__pending = {}
+    #JobID -> number of failed flushes of its heart beats
+    self.__failedFlushes = {}
+    #JobID -> { command : arguments }
+    self.__commands = {}
+    #( JobID, command ) sent -> whether its Sent status was written to the DB
+    self.__sentCommands = {}
+
+  def getNumPending( self ):
+    return len( self.__pending )
+
+  def add( self, jobID, staticData, dynamicData ):
+    """
+    Queue the heart beat of a job
+    """
+    heartBeatTime = Time.dateTime()
+    self.__lock.acquire()
+    try:
+      if jobID not in self.__pending:
+        self.__pending[ jobID ] = [ {}, [], heartBeatTime ]
+      entry = self.__pending[ jobID ]
+      entry[0].update( staticData )
+      entry[2] = heartBeatTime
+      if dynamicData:
+        entry[1].append( ( dynamicData, heartBeatTime ) )
+    finally:
+      self.__lock.release()
+
+  def flush( self ):
+    """
+    Write all the queued heart beats to the DB
+    """
+    self.__flushLock.acquire()
+    try:
+      self.__lock.acquire()
+      try:
+        pending = self.__pending
+        self.__pending = {}
+      finally:
+        self.__lock.release()
+      if not pending:
+        return S_OK( 0 )
+      jobIDs = pending.keys()
+      failed = {}
+      for iPos in range( 0, len( jobIDs ), self.__flushSize ):
+        chunk = dict( [ ( jobID, pending[ jobID ] ) for jobID in jobIDs[ iPos : iPos + self.__flushSize ] ] )
+        result = self.__jobDB.setHeartBeatDataBulk( chunk )
+        if result[ 'OK' ]:
+          for jobID in chunk:
+            self.__failedFlushes.pop( jobID, None )
+          continue
+        self.log.error( "Failed to flush heart beats", result[ 'Message' ] )
+        #Only put back the data that was not written
+        failedData = result.get( 'FailedData' )
+        for jobID, ( staticData, dynamicList, heartBeatTime ) in chunk.items():
+          if failedData is not None:
+            if 'Static' not in failedData:
+              staticData = {}
+            if 'Dynamic' not in failedData:
+              dynamicList = []
+            if not staticData and not dynamicList:
+              self.__failedFlushes.pop( jobID, None )
+              continue
+          failed[ jobID ] = ( staticData, dynamicList, heartBeatTime )
+      if failed:
+        self.__requeue( failed )
+        return S_ERROR( "Failed to flush the heart beats of %s jobs" % len( failed ) )
+      return S_OK( len( pending ) )
+    finally:
+      self.__flushLock.release()
+
+  def __requeue( self, heartBeats ):
+    """
+    Put back heart beats that could not be flushed. Static data received since wins.
+    The heart beats of a job failing to be flushed maxRetries times are dropped
+    """
+    self.__lock.acquire()
+    try:
+      for jobID, ( staticData, dynamicList, heartBeatTime ) in heartBeats.items():
+        numFailed = self.__failedFlushes.get( jobID, 0 ) + 1
+        if numFailed > self.__maxRetries:
+          self.log.error( "Dropping heart beat data that could not be flushed",
+                          "job %s, %s static and %s dynamic records" % ( jobID, len( staticData ), len( dynamicList ) ) )
+          self.__failedFlushes.pop( jobID, None )
+          continue
+        self.__failedFlushes[ jobID ] = numFailed
+        if jobID in self.__pending:
+          entry = self.__pending[ jobID ]
+          staticData.update( entry[0] )
+          entry[0] = staticData
+          entry[1] = dynamicList + entry[1]
+        else:
+          self.__pending[ jobID ] = [ staticData, dynamicList, heartBeatTime ]
+    finally:
+      self.__lock.release()
+
+  def refreshCommands( self ):
+    """
+    Reload the commands waiting to be sent to the jobs
+    """
+    self.__lock.acquire()
+    try:
+      #The commands already marked as Sent in the DB are not returned by the query
+      confirmed = [ sentCommand for sentCommand, written in self.__sentCommands.items() if written ]
+    finally:
+      self.__lock.release()
+    result = self.__jobDB.getJobCommandsBulk()
+    if not result[ 'OK' ]:
+      return result
+    commands = result[ 'Value' ]
+    self.__lock.acquire()
+    try:
+      #Don't resend the commands delivered but maybe not yet marked as Sent when the query was done
+      for jobID, command in self.__sentCommands:
+        if jobID in commands:
+          commands[ jobID ].pop( command, None )
+          if not commands[ jobID ]:
+            del commands[ jobID ]
+      for sentCommand in confirmed:
+        self.__sentCommands.pop( sentCommand, None )
+      self.__commands = commands
+    finally:
+      self.__lock.release()
+    return S_OK( len( commands ) )
+
+  def getJobCommands( self, jobID ):
+    """
+    Get the commands to deliver with the heart beat reply and mark them as sent
+    """
+    self.__lock.acquire()
+    try:
+      jobCommands = self.__commands.pop( jobID, {} )
+      for command in jobCommands:
+        self.__sentCommands[ ( jobID, command ) ] = False
+    finally:
+      self.__lock.release()
+    for command in jobCommands:
+      result = self.__jobDB.setJobCommandStatus( jobID, command, 'Sent' )
+      if not result[ 'OK' ]:
+        self.log.warn( "Failed to set the command status", "%s %s: %s" % ( jobID, command, result[ 'Message' ] ) )
+      self.__lock.acquire()
+      try:
+        if ( jobID, command ) in self.__sentCommands:
+          self.__sentCommands[ ( jobID, command ) ] = True
+      finally:
+        self.__lock.release()
+    return jobCommands
@@ -0,0 +1,309 @@
+""" In memory mirror of the task queue definitions used to resolve which task
+    queues match a resource without running the matching SQL.
+
+    Task queue definitions never change once the queue has been created, only
+    the priority does. The index loads the definitions of the new task queues,
+    drops the deleted ones and updates the priorities on each refresh. The MySQL
+    DB is then only hit for the atomic job extraction.
+
+    Task queues are created disabled and their definition is complete once they
+    have been enabled or hold a job. Until then they are left out of the index,
+    so that a half written definition is never indexed. Afterwards the enabled
+    counter only tracks the job insertions in flight and is ignored, as in the
+    matching SQL.
+"""
+
+__RCSID__ = "$Id$"
+
+import types
+import random
+import threading
+
+from DIRAC import gLogger, S_OK, S_ERROR
+from DIRAC.Core.Security import Properties, CS
+from DIRAC.WorkloadManagementSystem.DB.TaskQueueDB import multiValueDefFields, multiValueMatchFields, \
+                                                          tagMatchFields, bannedJobMatchFields, \
+                                                          strictRequireMatchFields
+
+class TaskQueueMatchIndex( object ):
+
+  def __init__( self, tqDB, chunkSize = 1000 ):
+    self.__tqDB = tqDB
+    self.__chunkSize = chunkSize
+    self.log = gLogger.getSubLogger( "TaskQueueMatchIndex" )
+    self.__refreshLock = threading.Lock()
+    self.__dataLock = threading.Lock()
+    #TQId -> { 'OwnerDN', 'OwnerGroup', 'Setup', 'CPUTime', <multi value field> : frozenset }
+    self.__tqDefs = {}
+    #TQId -> Priority
+    self.__tqPrio = {}
+    #Inverted indexes
+    self.__bySetup = {}
+    self.__byValue = dict( [ ( field, {} ) for field in multiValueDefFields ] )
+    self.__withoutValues = dict( [ ( field, set() ) for field in multiValueDefFields ] )
+    self.__loaded = False
+
+  def isLoaded( self ):
+    return self.__loaded
+
+  def getNumTaskQueues( self ):
+    return len( self.__tqDefs )
+
+  def refresh( self ):
+    """
+    Synchronize the index with the DB
+    """
+    self.__refreshLock.acquire()
+    try:
+      return self.__refresh()
+    finally:
+      self.__refreshLock.release()
+
+  def __refresh( self ):
+    result = self.__tqDB._query( "SELECT TQId, Priority, Enabled FROM `tq_TaskQueues`" )
+    if not result[ 'OK' ]:
+      return S_ERROR( "Can't refresh task queue index: %s" % result[ 'Message' ] )
+    tqPrio = {}
+    newTQs = []
+    disabledTQs = {}
+    for tqId, priority, enabled in result[ 'Value' ]:
+      if tqId in self.__tqDefs or enabled >= 1:
+        tqPrio[ tqId ] = priority
+        if tqId not in self.__tqDefs:
+          newTQs.append( tqId )
+      else:
+        disabledTQs[ tqId ] = priority
+    deletedTQs = [ tqId for tqId in self.__tqDefs if tqId not in tqPrio ]
+    #A disabled TQ with jobs has a complete definition, the insertion of a job is in flight
+    if disabledTQs:
+      result = self.__getTQsWithJobs( disabledTQs.keys() )
+      if not result[ 'OK' ]:
+        return result
+      for tqId in result[ 'Value' ]:
+        tqPrio[ tqId ] = disabledTQs[ tqId ]
+        newTQs.append( tqId )
+
+    newDefs = {}
+    for iPos in range( 0, len( newTQs ), self.__chunkSize ):
+      result = self.__loadDefinitions( newTQs[ iPos : iPos + self.__chunkSize ] )
+      if not result[ 'OK' ]:
+        return result
+      newDefs.update( result[ 'Value' ] )
+    for tqId in newTQs:
+      if tqId not in newDefs:
+        #Deleted since the first query
+        tqPrio.pop( tqId )
+
+    self.__dataLock.acquire()
+    try:
+      for tqId in deletedTQs:
+        self.__unindex( tqId )
+      for tqId in newDefs:
+        self.__index( tqId, newDefs[ tqId ] )
+      self.__tqPrio = tqPrio
+      self.__loaded = True
+    finally:
+      self.__dataLock.release()
+    if newDefs or deletedTQs:
+      self.log.verbose( "Task queue index refreshed", "%s new, %s deleted, %s total" % ( len( newDefs ),
+                                                                                         len( deletedTQs ),
+                                                                                         len( self.__tqDefs ) ) )
+    return S_OK()
+
+  def __getTQsWithJobs( self, tqIdList ):
+    tqsWithJobs = []
+    for iPos in range( 0, len( tqIdList ), self.__chunkSize ):
+      tqCond = "TQId in ( %s )" % ", ".join( [ str( tqId ) for tqId in tqIdList[ iPos : iPos + self.__chunkSize ] ] )
+      result = self.__tqDB._query( "SELECT DISTINCT TQId FROM `tq_Jobs` WHERE %s" % tqCond )
+      if not result[ 'OK' ]:
+        return S_ERROR( "Can't check the jobs of the disabled task queues: %s" % result[ 'Message' ] )
+      tqsWithJobs.extend( [ row[0] for row in result[ 'Value' ] ] )
+    return S_OK( tqsWithJobs )
+
+  def __loadDefinitions( self, tqIdList ):
+    tqCond = "TQId in ( %s )" % ", ".join( [ str( tqId ) for tqId in tqIdList ] )
+    result = self.__tqDB._query( "SELECT TQId, OwnerDN, OwnerGroup, Setup, CPUTime FROM `tq_TaskQueues` WHERE %s" % tqCond )
+    if not result[ 'OK' ]:
+      return S_ERROR( "Can't load task queue definitions: %s" % result[ 'Message' ] )
+    tqDefs = {}
+    for tqId, ownerDN, ownerGroup, setup, cpuTime in result[ 'Value' ]:
+      tqDefs[ tqId ] = { 'OwnerDN' : ownerDN, 'OwnerGroup' : ownerGroup, 'Setup' : setup, 'CPUTime' : cpuTime }
+    for field in multiValueDefFields:
+      result = self.__tqDB._query( "SELECT TQId, Value FROM `tq_TQTo%s` WHERE %s" % ( field, tqCond ) )
+      if not result[ 'OK' ]:
+        return S_ERROR( "Can't load task queue %s definitions: %s" % ( field, result[ 'Message' ] ) )
+      values = {}
+      for tqId, value in result[ 'Value' ]:
+        values.setdefault( tqId, set() ).add( value )
+      for tqId in tqDefs:
+        tqDefs[ tqId ][ field ] = frozenset( values.get( tqId, () ) )
+    return S_OK( tqDefs )
+
+  def __index( self, tqId, tqDef ):
+    self.__tqDefs[ tqId ] = tqDef
+    self.__bySetup.setdefault( tqDef[ 'Setup' ], set() ).add( tqId )
+    for field in multiValueDefFields:
+      if not tqDef[ field ]:
+        self.__withoutValues[ field ].add( tqId )
+      for value in tqDef[ field ]:
+        self.__byValue[ field ].setdefault( value, set() ).add( tqId )
+
+  def __unindex( self, tqId ):
+    tqDef = self.__tqDefs.pop( tqId )
+    self.__discard( self.__bySetup, tqDef[ 'Setup' ], tqId )
+    for field in multiValueDefFields:
+      self.__withoutValues[ field ].discard( tqId )
+      for value in tqDef[ field ]:
+        self.__discard( self.__byValue[ field ], value, tqId )
+
+  def __discard( self, index, key, tqId ):
+    tqIds = index.get( key )
+    if tqIds is None:
+      return
+    tqIds.discard( tqId )
+    if not tqIds:
+      del( index[ key ] )
+
+  def discardTaskQueue( self, tqId ):
+    """
+    Forget a task queue that has been found to be gone
+    """
+    self.__dataLock.acquire()
+    try:
+      if tqId in self.__tqDefs:
+        self.__unindex( tqId )
+        self.__tqPrio.pop( tqId, None )
+    finally:
+      self.__dataLock.release()
+
+  def matchTaskQueues( self, tqMatchDict, numQueuesToGet = 1, negativeCond = {} ):
+    """
+    Get the task queues that match a resource with the same semantics as the
+    TaskQueueDB matching SQL. tqMatchDict must NOT be escaped.
+    Returns S_OK( [ ( tqId, ownerDN, ownerGroup ) ] ) ordered by priority
+    """
+    tqMatchDict = dict( tqMatchDict )
+    if 'LHCbPlatform' in tqMatchDict and not "Platform" in tqMatchDict:
+      tqMatchDict[ 'Platform' ] = tqMatchDict[ 'LHCbPlatform' ]
+    if 'SystemConfig' in tqMatchDict and not "Platform" in tqMatchDict:
+      tqMatchDict[ 'Platform' ] = tqMatchDict[ 'SystemConfig' ]
+    self.__dataLock.acquire()
+    try:
+      try:
+        tqIds = self.__match( tqMatchDict, negativeCond )
+      except RuntimeError, excp:
+        return S_ERROR( str( excp ) )
+      tqList = [ ( random.random() / max( self.__tqPrio.get( tqId, 0 ), 0.0001 ), tqId ) for tqId in tqIds ]
+      tqList.sort()
+      if numQueuesToGet:
+        tqList = tqList[ :numQueuesToGet ]
+      return S_OK( [ ( tqId, self.__tqDefs[ tqId ][ 'OwnerDN' ], self.__tqDefs[ tqId ][ 'OwnerGroup' ] )
+                     for _, tqId in tqList ] )
+    finally:
+      self.__dataLock.release()
+
+  def __toSet( self, value ):
+    if type( value ) not in ( types.ListType, types.TupleType ):
+      value = [ value ]
+    return set( [ str( v ).strip() for v in value ] )
+
+  def __match( self, tqMatchDict, negativeCond ):
+    if 'Setup' in tqMatchDict:
+      candidates = set()
+      for setup in self.__toSet( tqMatchDict[ 'Setup' ] ):
+        candidates.update( self.__bySetup.get( setup, () ) )
+    else:
+      candidates = set( self.__tqDefs )
+
+    for field in multiValueMatchFields:
+      tqField = "%ss" % field
+      if field in tqMatchDict and tqMatchDict[ field ]:
+        values = self.__toSet( tqMatchDict[ field ] )
+        if field in tagMatchFields:
+          #All the TQ tags have to be provided by the resource
+          if values != set( [ 'Any' ] ):
+            candidates = set( [ tqId for tqId in candidates if self.__tqDefs[ tqId ][ tqField ] <= values ] )
+        else:
+          fieldMatch = set( self.__withoutValues[ tqField ] )
+          for value in values:
+            fieldMatch.update( self.__byValue[ tqField ].get( value, () ) )
+          candidates &= fieldMatch
+        if field in bannedJobMatchFields:
+          bannedField = "Banned%s" % tqField
+          candidates = set( [ tqId for tqId in candidates
+                              if not values <= self.__tqDefs[ tqId ][ bannedField ] ] )
+      bannedField = "Banned%s" % field
+      if bannedField in tqMatchDict and tqMatchDict[ bannedField ]:
+        banned = self.__toSet( tqMatchDict[ bannedField ] )
+        candidates = set( [ tqId for tqId in candidates if not banned <= self.__tqDefs[ tqId ][ tqField ] ] )
+
+    #For certain fields, the require is strict. If it is not in the tqMatchDict, the job cannot require it
+    for field in strictRequireMatchFields:
+      if field not in tqMatchDict:
+        candidates &= self.__withoutValues[ "%ss" % field ]
+
+    if 'CPUTime' in tqMatchDict:
+      maxCPU = max( [ long( cpu ) for cpu in self.__toList( tqMatchDict[ 'CPUTime' ] ) ] )
+      candidates = set( [ tqId for tqId in candidates if self.__tqDefs[ tqId ][ 'CPUTime' ] <= maxCPU ] )
+
+    ownerFilter = self.__getOwnerFilter( tqMatchDict )
+    if ownerFilter:
+      candidates = set( [ tqId for tqId in candidates if ownerFilter( self.__tqDefs[ tqId ] ) ] )
+
+    if negativeCond:
+      candidates = set( [ tqId for tqId in candidates if self.__passesNegativeCond( self.__tqDefs[ tqId ],
+                                                                                    negativeCond ) ] )
+    return candidates
+
+  def __toList( self, value ):
+    if type( value ) not in ( types.ListType, types.TupleType ):
+      return [ value ]
+    return value
+
+  def __getOwnerFilter( self, tqMatchDict ):
+    """
+    Generate a function that checks the owner of a TQ definition
+    """
+    if 'OwnerDN' in tqMatchDict and 'OwnerGroup' in tqMatchDict:
+      dns = self.__toSet( tqMatchDict[ 'OwnerDN' ] )
+      sharingGroups = set()
+      owners = set()
+      for group in self.__toSet( tqMatchDict[ 'OwnerGroup' ] ):
+        if Properties.JOB_SHARING in CS.getPropertiesForGroup( group ):
+          sharingGroups.add( group )
+        else:
+          for dn in dns:
+            owners.add( ( dn, group ) )
+      return lambda tqDef: tqDef[ 'OwnerGroup' ] in sharingGroups or \
+                           ( tqDef[ 'OwnerDN' ], tqDef[ 'OwnerGroup' ] ) in owners
+    fieldFilters = []
+    for field in ( 'OwnerGroup', 'OwnerDN' ):
+      if field in tqMatchDict:
+        fieldFilters.append( ( field, self.__toSet( tqMatchDict[ field ] ) ) )
+    if not fieldFilters:
+      return False
+    return lambda tqDef: min( [ tqDef[ field ] in values for field, values in fieldFilters ] )
+
+  def __passesNegativeCond( self, tqDef, negativeCond ):
+    """
+    A TQ is eligible if for any of the fields none of the values apply.
+    A list of conditions is an OR of the conditions
+    """
+    condType = type( negativeCond )
+    if condType in ( types.ListType, types.TupleType ):
+      for condDict in negativeCond:
+        if self.__passesNegativeCond( tqDef, condDict ):
+          return True
+      return False
+    elif condType != types.DictType:
+      raise RuntimeError( "negativeCond has to be either a list or a dict and it's %s" % condType )
+    for field in negativeCond:
+      values = self.__toSet( negativeCond[ field ] )
+      if field in multiValueMatchFields:
+        if not values & tqDef[ "%ss" % field ]:
+          return True
+      elif field in tqDef:
+        for value in values:
+          if str( tqDef[ field ] ) != value:
+            return True
+    return not negativeCond
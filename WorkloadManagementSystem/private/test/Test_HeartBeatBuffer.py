@@ -0,0 +1,136 @@
+""" Test for the heart beat write behind buffer
+"""
+
+import datetime
+import unittest
+
+from mock import MagicMock, patch
+
+from DIRAC import S_OK, S_ERROR, Time
+from DIRAC.WorkloadManagementSystem.DB.JobDB import JobDB
+from DIRAC.WorkloadManagementSystem.private.HeartBeatBuffer import HeartBeatBuffer
+
+class FakeJobDB( JobDB ):
+  """ JobDB recording the statements instead of running them
+  """
+  def __init__( self ):
+    self.log = MagicMock()
+    self.statements = []
+
+  def _escapeString( self, value, conn = None ):
+    return S_OK( "'%s'" % value )
+
+  def _update( self, cmd, conn = None ):
+    self.statements.append( cmd )
+    return S_OK()
+
+class HeartBeatBufferTestCase( unittest.TestCase ):
+  """ Buffering and flushing heart beats against a fake JobDB
+  """
+  def setUp( self ):
+    self.jobDB = MagicMock()
+    self.jobDB.setHeartBeatDataBulk.return_value = S_OK()
+    self.jobDB.setJobCommandStatus.return_value = S_OK()
+    self.jobDB.getJobCommandsBulk.return_value = S_OK( { 1 : { 'Kill' : '' } } )
+    self.buffer = HeartBeatBuffer( self.jobDB, flushSize = 2 )
+
+  def test_coalesce( self ):
+    self.buffer.add( 1, { 'CPU' : 'x' }, { 'Load' : 1 } )
+    self.buffer.add( 1, { 'CPU' : 'y' }, { 'Load' : 2 } )
+    self.buffer.add( 2, {}, {} )
+    self.buffer.add( 3, {}, { 'Load' : 3 } )
+    self.assertEqual( self.buffer.getNumPending(), 3 )
+    self.assertEqual( self.buffer.flush()[ 'Value' ], 3 )
+    self.assertEqual( self.jobDB.setHeartBeatDataBulk.call_count, 2 )
+    flushed = {}
+    for call in self.jobDB.setHeartBeatDataBulk.call_args_list:
+      flushed.update( call[0][0] )
+    self.assertEqual( sorted( flushed ), [ 1, 2, 3 ] )
+    self.assertEqual( flushed[1][0], { 'CPU' : 'y' } )
+    self.assertEqual( [ dyn for dyn, _hbTime in flushed[1][1] ], [ { 'Load' : 1 }, { 'Load' : 2 } ] )
+    self.assertEqual( flushed[2][1], [] )
+    self.assertEqual( self.buffer.getNumPending(), 0 )
+
+  def test_requeue( self ):
+    self.jobDB.setHeartBeatDataBulk.return_value = S_ERROR( "DB down" )
+    self.buffer.add( 1, { 'CPU' : 'x', 'Mem' : 'm' }, { 'Load' : 1 } )
+    self.assertFalse( self.buffer.flush()[ 'OK' ] )
+    self.buffer.add( 1, { 'CPU' : 'y' }, { 'Load' : 2 } )
+    self.jobDB.setHeartBeatDataBulk.return_value = S_OK()
+    self.assertTrue( self.buffer.flush()[ 'OK' ] )
+    staticData, dynamicList, _hbTime = self.jobDB.setHeartBeatDataBulk.call_args[0][0][1]
+    self.assertEqual( staticData, { 'CPU' : 'y', 'Mem' : 'm' } )
+    self.assertEqual( len( dynamicList ), 2 )
+
+  def test_partialFailure( self ):
+    jobDB = FakeJobDB()
+    heartBeats = HeartBeatBuffer( jobDB )
+    heartBeats.add( 1, { 'CPU' : 'x' }, { 'Load' : 1 } )
+    #The job parameters are written, the heart beat log is not
+    jobDB._update = MagicMock( side_effect = [ S_OK(), S_OK(), S_ERROR( "Lost connection" ) ] )
+    self.assertFalse( heartBeats.flush()[ 'OK' ] )
+    jobDB._update = MagicMock( return_value = S_OK() )
+    self.assertTrue( heartBeats.flush()[ 'OK' ] )
+    statements = [ call[0][0] for call in jobDB._update.call_args_list ]
+    self.assertEqual( len( statements ), 2 )
+    self.assertTrue( statements[0].startswith( "UPDATE Jobs SET HeartBeatTime" ) )
+    self.assertTrue( statements[1].startswith( "INSERT INTO HeartBeatLoggingInfo" ) )
+
+  def test_maxRetries( self ):
+    self.jobDB.setHeartBeatDataBulk.return_value = S_ERROR( "DB down" )
+    heartBeats = HeartBeatBuffer( self.jobDB, maxRetries = 2 )
+    heartBeats.add( 1, {}, { 'Load' : 1 } )
+    for _i in range( 2 ):
+      self.assertFalse( heartBeats.flush()[ 'OK' ] )
+      self.assertEqual( heartBeats.getNumPending(), 1 )
+    self.assertFalse( heartBeats.flush()[ 'OK' ] )
+    self.assertEqual( heartBeats.getNumPending(), 0 )
+
+  def test_commands( self ):
+    self.assertEqual( self.buffer.getJobCommands( 1 ), {} )
+    self.buffer.refreshCommands()
+    self.assertEqual( self.buffer.getJobCommands( 1 ), { 'Kill' : '' } )
+    self.jobDB.setJobCommandStatus.assert_called_once_with( 1, 'Kill', 'Sent' )
+    self.assertEqual( self.buffer.getJobCommands( 1 ), {} )
+
+  def test_commandsRefreshedWhileSending( self ):
+    waitingCommands = { 1 : { 'Kill' : '' } }
+    self.jobDB.getJobCommandsBulk.side_effect = lambda: S_OK( dict( [ ( jobID, dict( commands ) )
+                                                                      for jobID, commands in waitingCommands.items() ] ) )
+    self.buffer.refreshCommands()
+    #The refresh query runs after the command is delivered but before it is marked as Sent
+    def setJobCommandStatus( jobID, command, status ):
+      self.assertEqual( self.buffer.refreshCommands()[ 'Value' ], 0 )
+      del waitingCommands[ jobID ][ command ]
+      return S_OK()
+    self.jobDB.setJobCommandStatus.side_effect = setJobCommandStatus
+    self.assertEqual( self.buffer.getJobCommands( 1 ), { 'Kill' : '' } )
+    self.assertEqual( self.buffer.getJobCommands( 1 ), {} )
+    self.assertEqual( self.buffer.refreshCommands()[ 'Value' ], 0 )
+    #A new command with the same name is delivered
+    waitingCommands[ 1 ][ 'Kill' ] = ''
+    self.assertEqual( self.buffer.refreshCommands()[ 'Value' ], 1 )
+
+  def test_finalStatus( self ):
+    jobDB = FakeJobDB()
+    heartBeats = HeartBeatBuffer( jobDB )
+    with patch.object( Time, 'dateTime' ) as dateTime:
+      dateTime.return_value = datetime.datetime( 2026, 1, 1, 10 )
+      heartBeats.add( 1, {}, { 'Load' : 1 } )
+      dateTime.return_value = datetime.datetime( 2026, 1, 1, 10, 20 )
+      heartBeats.add( 2, {}, {} )
+    #Job 1 reports Done before its heart beat is flushed, the flush must not put it back to Running
+    self.assertTrue( heartBeats.flush()[ 'OK' ] )
+    update = jobDB.statements[0]
+    self.assertTrue( update.startswith( "UPDATE Jobs SET HeartBeatTime = CASE JobID " ) )
+    self.assertTrue( "WHEN 1 THEN '2026-01-01 10:00:00'" in update )
+    self.assertTrue( "WHEN 2 THEN '2026-01-01 10:20:00'" in update )
+    self.assertFalse( "UTC_TIMESTAMP()" in update )
+    self.assertTrue( "Status = IF( Status IN ('Done','Completed','Failed','Killed','Deleted'), Status, 'Running' )"
+                     in update )
+    self.assertTrue( update.endswith( "WHERE JobID IN (1,2)" ) or update.endswith( "WHERE JobID IN (2,1)" ) )
+    self.assertTrue( "'2026-01-01 10:00:00'" in jobDB.statements[1] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( HeartBeatBufferTestCase )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
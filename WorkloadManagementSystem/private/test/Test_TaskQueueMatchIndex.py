@@ -0,0 +1,187 @@
+""" Test for the in memory task queue match index
+"""
+
+import random
+import sqlite3
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK
+from DIRAC.WorkloadManagementSystem.DB.TaskQueueDB import TaskQueueDB, multiValueDefFields
+from DIRAC.WorkloadManagementSystem.private.TaskQueueMatchIndex import TaskQueueMatchIndex
+
+class FakeTaskQueueDB( object ):
+  """ Answers the queries of the index out of a dict of TQ definitions
+  """
+
+  def __init__( self, tqDefs ):
+    self.tqDefs = tqDefs
+    self._query = MagicMock( side_effect = self.query )
+
+  def query( self, sqlCmd ):
+    if sqlCmd.startswith( "SELECT TQId, Priority, Enabled" ):
+      return S_OK( [ ( tqId, self.tqDefs[ tqId ].get( 'Priority', 1 ), 1 ) for tqId in self.tqDefs ] )
+    tqIds = [ int( tqId ) for tqId in sqlCmd.split( "(" )[1].split( ")" )[0].split( "," ) ]
+    if sqlCmd.find( "tq_TaskQueues" ) > -1:
+      return S_OK( [ ( tqId, self.tqDefs[ tqId ][ 'OwnerDN' ], self.tqDefs[ tqId ][ 'OwnerGroup' ],
+                       'Setup', self.tqDefs[ tqId ][ 'CPUTime' ] ) for tqId in tqIds ] )
+    field = sqlCmd.split( "`tq_TQTo" )[1].split( "`" )[0]
+    return S_OK( [ ( tqId, value ) for tqId in tqIds for value in self.tqDefs[ tqId ].get( field, [] ) ] )
+
+class SQLiteTaskQueueDB( TaskQueueDB ):
+  """ TaskQueueDB running the queries of the index and the matching SQL on sqlite
+  """
+  def __init__( self ):
+    self.log = MagicMock()
+    self.connection = sqlite3.connect( ':memory:' )
+    self.connection.create_function( 'RAND', 0, random.random )
+    self.connection.execute( 'CREATE TABLE `tq_TaskQueues` ( TQId INTEGER, OwnerDN TEXT, OwnerGroup TEXT, Setup TEXT,'
+                             ' CPUTime INTEGER, Priority REAL, Enabled INTEGER )' )
+    self.connection.execute( 'CREATE TABLE `tq_Jobs` ( TQId INTEGER, JobId INTEGER, Priority INTEGER, RealPriority REAL )' )
+    for field in multiValueDefFields:
+      self.connection.execute( 'CREATE TABLE `tq_TQTo%s` ( TQId INTEGER, Value TEXT )' % field )
+
+  def _MySQL__escapeString( self, value ):
+    return S_OK( '"%s"' % str( value ).replace( '"', '\\"' ) )
+
+  def _query( self, cmd, conn = None ):
+    return S_OK( self.connection.execute( cmd ).fetchall() )
+
+  def _update( self, cmd, conn = None ):
+    return S_OK( self.connection.execute( cmd ).rowcount )
+
+  def addTaskQueue( self, tqId, tqDef, enabled = 1, jobIds = () ):
+    self.connection.execute( 'INSERT INTO `tq_TaskQueues` VALUES ( ?, ?, ?, ?, ?, 1, ? )',
+                             ( tqId, tqDef[ 'OwnerDN' ], tqDef[ 'OwnerGroup' ], 'Production', tqDef[ 'CPUTime' ], enabled ) )
+    for field in multiValueDefFields:
+      for value in tqDef.get( field, [] ):
+        self.connection.execute( 'INSERT INTO `tq_TQTo%s` VALUES ( ?, ? )' % field, ( tqId, value ) )
+    for jobId in jobIds:
+      self.connection.execute( 'INSERT INTO `tq_Jobs` VALUES ( ?, ?, 1, 1 )', ( tqId, jobId ) )
+
+  def setEnabled( self, tqId, enabled ):
+    """ Enable or disable a TQ as insertJob does, the Enabled counter is changed by one
+    """
+    return self._TaskQueueDB__setTaskQueueEnabled( tqId, enabled )
+
+
+class TaskQueueMatchIndexTestCase( unittest.TestCase ):
+  """ Matching against a few task queues
+  """
+  def setUp( self ):
+    self.tqDB = FakeTaskQueueDB( { 1 : { 'OwnerDN' : 'dn1', 'OwnerGroup' : 'g1', 'CPUTime' : 1000 },
+                                   2 : { 'OwnerDN' : 'dn1', 'OwnerGroup' : 'g1', 'CPUTime' : 1000,
+                                         'Sites' : [ 'S1', 'S2' ], 'JobTypes' : [ 'MC' ] },
+                                   3 : { 'OwnerDN' : 'dn2', 'OwnerGroup' : 'g2', 'CPUTime' : 100000,
+                                         'BannedSites' : [ 'S1' ], 'Platforms' : [ 'x86' ] },
+                                   4 : { 'OwnerDN' : 'dn2', 'OwnerGroup' : 'g2', 'CPUTime' : 1000,
+                                         'Tags' : [ 'GPU', 'MultiCore' ] } } )
+    self.index = TaskQueueMatchIndex( self.tqDB )
+    self.assertTrue( self.index.refresh()[ 'OK' ] )
+
+  def __match( self, tqMatchDict, negativeCond = {} ):
+    tqMatchDict = dict( tqMatchDict )
+    tqMatchDict.setdefault( 'Setup', 'Setup' )
+    tqMatchDict.setdefault( 'CPUTime', 50000 )
+    result = self.index.matchTaskQueues( tqMatchDict, numQueuesToGet = 0, negativeCond = negativeCond )
+    self.assertTrue( result[ 'OK' ] )
+    return sorted( [ tqTuple[0] for tqTuple in result[ 'Value' ] ] )
+
+  def test_match( self ):
+    self.assertEqual( self.__match( {} ), [ 1, 2 ] )
+    self.assertEqual( self.__match( { 'Setup' : 'Other' } ), [] )
+    self.assertEqual( self.__match( { 'Site' : 'S1' } ), [ 1, 2 ] )
+    self.assertEqual( self.__match( { 'Site' : 'S3', 'Platform' : 'x86', 'CPUTime' : 200000 } ), [ 1, 3 ] )
+    self.assertEqual( self.__match( { 'Site' : 'S1', 'Platform' : 'x86', 'CPUTime' : 200000 } ), [ 1, 2 ] )
+    self.assertEqual( self.__match( { 'Tag' : [ 'GPU' ] } ), [ 1, 2 ] )
+    self.assertEqual( self.__match( { 'Tag' : [ 'GPU', 'MultiCore', 'Other' ] } ), [ 1, 2, 4 ] )
+    self.assertEqual( self.__match( { 'BannedSite' : 'S2' } ), [ 1 ] )
+    self.assertEqual( self.__match( { 'Site' : 'S2', 'BannedJobType' : 'MC' } ), [ 1 ] )
+    self.assertEqual( self.__match( { 'OwnerGroup' : 'g2', 'Tag' : 'Any' } ), [ 4 ] )
+
+  def test_negativeCond( self ):
+    self.assertEqual( self.__match( { 'Site' : 'S1' }, negativeCond = { 'JobType' : [ 'MC' ] } ), [ 1 ] )
+    self.assertEqual( self.__match( { 'Site' : 'S1' }, negativeCond = [ { 'JobType' : 'MC' },
+                                                                         { 'Site' : 'S3' } ] ), [ 1, 2 ] )
+
+  def test_refresh( self ):
+    del self.tqDB.tqDefs[ 1 ]
+    self.tqDB.tqDefs[ 5 ] = { 'OwnerDN' : 'dn3', 'OwnerGroup' : 'g3', 'CPUTime' : 10 }
+    self.assertTrue( self.index.refresh()[ 'OK' ] )
+    self.assertEqual( self.__match( { 'Site' : 'S1' } ), [ 2, 5 ] )
+    self.assertEqual( self.index.getNumTaskQueues(), 4 )
+
+class IndexVersusSQLTestCase( unittest.TestCase ):
+  """ The index and the matching SQL select the same task queues
+  """
+  def setUp( self ):
+    self.tqDB = SQLiteTaskQueueDB()
+    tqDefs = { 1 : { 'OwnerDN' : 'dn1', 'OwnerGroup' : 'g1', 'CPUTime' : 1000 },
+               2 : { 'OwnerDN' : 'dn1', 'OwnerGroup' : 'g1', 'CPUTime' : 1000,
+                     'Sites' : [ 'S1', 'S2' ], 'JobTypes' : [ 'MC' ] },
+               3 : { 'OwnerDN' : 'dn2', 'OwnerGroup' : 'g2', 'CPUTime' : 100000,
+                     'BannedSites' : [ 'S1' ], 'Platforms' : [ 'x86' ] },
+               4 : { 'OwnerDN' : 'dn2', 'OwnerGroup' : 'g2', 'CPUTime' : 1000,
+                     'Tags' : [ 'GPU', 'MultiCore' ] },
+               5 : { 'OwnerDN' : 'dn3', 'OwnerGroup' : 'g3', 'CPUTime' : 10,
+                     'Sites' : [ 'S3' ] } }
+    for tqId in tqDefs:
+      self.tqDB.addTaskQueue( tqId, tqDefs[ tqId ], jobIds = [ tqId * 10 ] )
+    #Created but not completely defined yet
+    self.tqDB.addTaskQueue( 6, { 'OwnerDN' : 'dn1', 'OwnerGroup' : 'g1', 'CPUTime' : 10 }, enabled = 0 )
+    self.index = TaskQueueMatchIndex( self.tqDB )
+    self.assertTrue( self.index.refresh()[ 'OK' ] )
+
+  def __compare( self, halfCreated = ( 6, ) ):
+    """ The SQL also matches the TQs being created, the index never has them
+    """
+    for tqMatchDict, negativeCond in ( ( {}, {} ),
+                                       ( { 'Site' : 'S1' }, {} ),
+                                       ( { 'Site' : 'S3', 'Platform' : 'x86', 'CPUTime' : 200000 }, {} ),
+                                       ( { 'Site' : [ 'S1', 'S3' ], 'Platform' : 'x86', 'CPUTime' : 200000 }, {} ),
+                                       ( { 'Tag' : [ 'GPU', 'MultiCore', 'Other' ] }, {} ),
+                                       ( { 'BannedSite' : 'S2' }, {} ),
+                                       ( { 'Site' : 'S2', 'BannedJobType' : 'MC' }, {} ),
+                                       ( { 'OwnerGroup' : 'g2', 'Tag' : 'Any' }, {} ),
+                                       ( { 'Site' : 'S1' }, { 'JobType' : [ 'MC' ] } ),
+                                       ( { 'Site' : [ 'S1', 'S3' ] }, [ { 'JobType' : 'MC' }, { 'Site' : 'S3' } ] ) ):
+      tqMatchDict = dict( tqMatchDict )
+      tqMatchDict.setdefault( 'Setup', 'Production' )
+      tqMatchDict.setdefault( 'CPUTime', 50000 )
+      result = self.index.matchTaskQueues( tqMatchDict, numQueuesToGet = 0, negativeCond = negativeCond )
+      self.assertTrue( result[ 'OK' ] )
+      indexMatch = sorted( result[ 'Value' ] )
+      result = self.tqDB.matchAndGetTaskQueue( tqMatchDict, numQueuesToGet = 0, negativeCond = negativeCond )
+      self.assertTrue( result[ 'OK' ] )
+      sqlMatch = sorted( [ tqTuple for tqTuple in result[ 'Value' ] if tqTuple[0] not in halfCreated ] )
+      self.assertEqual( indexMatch, sqlMatch, str( ( tqMatchDict, negativeCond ) ) )
+
+  def test_sameMatches( self ):
+    self.__compare()
+    self.assertEqual( self.index.getNumTaskQueues(), 5 )
+    #Definition completed
+    self.tqDB.setEnabled( 6, True )
+    self.assertTrue( self.index.refresh()[ 'OK' ] )
+    self.assertEqual( self.index.getNumTaskQueues(), 6 )
+    self.__compare( halfCreated = () )
+
+  def test_concurrentInsert( self ):
+    #Two jobs being inserted in TQ 1, one by a process that dies before enabling it back
+    self.tqDB.setEnabled( 1, False )
+    self.tqDB.setEnabled( 1, False )
+    #A new TQ with its first job inserted but not enabled yet
+    self.tqDB.addTaskQueue( 7, { 'OwnerDN' : 'dn1', 'OwnerGroup' : 'g1', 'CPUTime' : 10, 'Sites' : [ 'S1' ] },
+                            enabled = 0, jobIds = [ 70 ] )
+    self.assertTrue( self.index.refresh()[ 'OK' ] )
+    self.assertEqual( self.index.getNumTaskQueues(), 6 )
+    self.__compare()
+    self.tqDB.setEnabled( 1, True )
+    self.tqDB.setEnabled( 7, True )
+    self.assertTrue( self.index.refresh()[ 'OK' ] )
+    self.__compare()
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( TaskQueueMatchIndexTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( IndexVersusSQLTestCase ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )